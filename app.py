@@ -145,6 +145,38 @@ if not database_url.startswith("sqlite"):
 app.config["MAX_CONTENT_LENGTH"] = 100 * 1024 * 1024  # 100 MB - Increased for file uploads
 app.config["UPLOAD_FOLDER"] = "uploads"
 
+# المهام الخلفية: مجلد الملفات الناتجة، وتشغيل المهام في خيط داخل نفس العملية عند عدم تشغيل عامل منفصل
+app.config["JOB_ARTIFACTS_FOLDER"] = os.environ.get("JOB_ARTIFACTS_FOLDER")
+app.config["JOBS_RUN_IN_THREAD"] = os.environ.get("JOBS_RUN_IN_THREAD", "").lower() in ("1", "true", "yes")
+
+# تخزين ملفات PDF المولدة: المجلد (افتراضياً instance/pdf_cache) والحد الأقصى لحجمه بالميجابايت
+app.config["PDF_CACHE_FOLDER"] = os.environ.get("PDF_CACHE_FOLDER")
+app.config["PDF_CACHE_MAX_BYTES"] = int(os.environ.get("PDF_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# عدد عمليات توليد PDF المهيأة مسبقاً (0 = التوليد داخل عملية الويب)
+app.config["PDF_RENDER_PROCESSES"] = int(os.environ.get("PDF_RENDER_PROCESSES", "2"))
+
+# عدد عمليات توليد النسخ المصغرة للصور المرفوعة (0 = التوليد داخل الطلب)
+app.config["IMAGE_PIPELINE_PROCESSES"] = int(os.environ.get("IMAGE_PIPELINE_PROCESSES", "2"))
+
+# تقديم الملفات المرفوعة: مدة التخزين في المتصفح للأسماء غير العشوائية، وترك إرسال الملف لـ nginx
+# (UPLOAD_OFFLOAD = x-accel) أو Apache (x-sendfile) مع بادئة المواقع الداخلية في nginx
+app.config["UPLOAD_CACHE_MAX_AGE"] = int(os.environ.get("UPLOAD_CACHE_MAX_AGE", "3600"))
+app.config["UPLOAD_OFFLOAD"] = os.environ.get("UPLOAD_OFFLOAD", "")
+app.config["UPLOAD_ACCEL_PREFIX"] = os.environ.get("UPLOAD_ACCEL_PREFIX", "/_protected")
+
+# الحد الأقصى لحجم كل توقيع ومخطط أضرار في نموذج التسليم والاستلام (بالكيلوبايت)
+app.config["HANDOVER_SIGNATURE_MAX_BYTES"] = int(os.environ.get("HANDOVER_SIGNATURE_MAX_KB", "2048")) * 1024
+app.config["HANDOVER_DIAGRAM_MAX_BYTES"] = int(os.environ.get("HANDOVER_DIAGRAM_MAX_KB", "10240")) * 1024
+
+# أقصى عدد لاتصالات بث عدادات العمليات (SSE) في كل عملية ويب، بعده تعود الصفحات للاستطلاع الدوري
+# كل اتصال يشغل خيطاً من خيوط العامل طوال مدته، لذا يجب أن يبقى أقل من --threads في gunicorn
+# (8 في Procfile و cloudpanel_deploy.sh) حتى تبقى خيوط متاحة لبقية الطلبات
+app.config["OPERATIONS_SSE_MAX_STREAMS"] = int(os.environ.get("OPERATIONS_SSE_MAX_STREAMS", "4"))
+
+# توزيع إشعارات العمليات الجديدة على المديرين في عامل المهام بدلاً من طلب الإرسال
+app.config["NOTIFICATION_FANOUT_ASYNC"] = os.environ.get("NOTIFICATION_FANOUT_ASYNC", "").lower() in ("1", "true", "yes")
+
 # Initialize SQLAlchemy with the app
 db.init_app(app)
 
@@ -240,6 +272,30 @@ def days_remaining_filter(date, from_date=None):
 
     return (date - from_date).days
 
+# فلتر رابط الصورة بالحجم المطلوب (thumb / medium / print) من النسخ المولدة
+@app.template_filter('image_url')
+def image_url_filter(path, size='medium'):
+    """
+    رابط النسخة المصغرة من الصورة، أو رابط الأصل إذا لم تُولد النسخة بعد
+
+    :param path: مسار الصورة كما هو مخزن في قاعدة البيانات
+    :param size: الحجم المطلوب (افتراضياً medium)
+    """
+    from services.image_pipeline_service import ImagePipelineService
+    return ImagePipelineService.image_url(path, size)
+
+# فلتر مسار ملف الصورة بالحجم المطلوب لقوالب HTML التي تُحوَّل إلى PDF
+@app.template_filter('image_file')
+def image_file_filter(path, size='print'):
+    """
+    المسار المطلق لنسخة الطباعة (JPEG) من الصورة، أو مسار الأصل إذا لم تُولد النسخة بعد
+
+    :param path: مسار الصورة كما هو مخزن في قاعدة البيانات
+    :param size: الحجم المطلوب (افتراضياً print)
+    """
+    from services.image_pipeline_service import ImagePipelineService
+    return ImagePipelineService.image_file(path, size) or ''
+
 # Context processor to add variables to all templates
 @app.context_processor
 def inject_now():
@@ -338,6 +394,14 @@ with app.app_context():
     # Import models before creating tables
     import models  # noqa: F401
     import models_accounting  # noqa: F401
+    import services.attendance_rollup_service  # noqa: F401 - تسجيل مستمعي تحديث ملخص الحضور
+    import services.vehicle_assignment_service  # noqa: F401 - تسجيل مستمعي تحديث السائق الحالي للمركبات
+    import services.background_jobs  # noqa: F401 - تسجيل معالجات المهام الخلفية
+    import services.pdf_cache_service  # noqa: F401 - تسجيل مستمع إبطال ملفات PDF المخزنة
+    import services.operation_counters_service  # noqa: F401 - تسجيل مستمع تحديث عدادات العمليات
+    import services.notification_fanout_service  # noqa: F401 - تسجيل مستمع قائمة المديرين ومعالج توزيع الإشعارات
+    import services.ledger_balance_service  # noqa: F401 - تسجيل مستمع تحديث أرصدة الحسابات الشهرية
+    import services.permission_cache_service  # noqa: F401 - تسجيل مستمع إصدار صلاحيات المستخدمين
 
     # Import and register route blueprints
     from routes.dashboard import dashboard_bp
@@ -376,6 +440,7 @@ with app.app_context():
     from routes.integrated_simple import integrated_bp
     from routes.ai_services_simple import ai_services_bp
     from routes.email_queue import email_queue_bp
+    from routes.jobs import jobs_bp
 
     # تعطيل حماية CSRF لطرق معينة
     csrf.exempt(auth_bp)
@@ -411,6 +476,7 @@ with app.app_context():
     app.register_blueprint(analytics_simple_bp)
     app.register_blueprint(integrated_bp, url_prefix='/integrated')
     app.register_blueprint(ai_services_bp, url_prefix='/ai')
+    app.register_blueprint(jobs_bp, url_prefix='/jobs')
     app.register_blueprint(email_queue_bp)
     
     # استيراد وتسجيل مسار صفحة الهبوط - مسار منفصل عن النظام
@@ -425,64 +491,17 @@ with app.app_context():
     from routes.landing_admin import landing_admin_bp
     app.register_blueprint(landing_admin_bp, url_prefix='/landing-admin')
 
-    # إضافة route لخدمة الصور من مجلد uploads
+    # إضافة route لخدمة الصور من مجلد uploads (مع static/uploads كنسخة احتياطية)
+    from services.upload_serving_service import UploadServingService
+
     @app.route('/uploads/<path:filename>')
     def uploaded_file(filename):
-        from flask import send_from_directory
-        from flask import send_from_directory, abort
-        import os
-        
-        # البحث أولاً في uploads
-        file_path = os.path.join("uploads", filename)
-        if os.path.exists(file_path):
-            dir_parts = filename.split("/")
-            if len(dir_parts) > 1:
-                subdir = "/".join(dir_parts[:-1])
-                file_name = dir_parts[-1]
-                return send_from_directory(f"uploads/{subdir}", file_name)
-            else:
-                return send_from_directory("uploads", filename)
-        
-        # البحث في static/uploads كنسخة احتياطية
-        static_file_path = os.path.join("static", "uploads", filename)
-        if os.path.exists(static_file_path):
-            dir_parts = filename.split("/")
-            if len(dir_parts) > 1:
-                subdir = "/".join(dir_parts[:-1])
-                file_name = dir_parts[-1]
-                return send_from_directory(f"static/uploads/{subdir}", file_name)
-            else:
-                return send_from_directory("static/uploads", filename)
-        
-        # في حالة عدم وجود الصورة، إرجاع صورة بديلة
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-            return send_from_directory('static/images', 'image-not-found.svg')
-        
-        abort(404)
+        return UploadServingService.serve(filename, ('uploads', 'static-uploads'))
 
     # مسار إضافي لخدمة صور static/uploads مع معالجة الأخطاء
     @app.route('/static/uploads/<path:filename>')
     def static_uploaded_file(filename):
-        from flask import send_from_directory, abort
-        import os
-        
-        # البحث في static/uploads
-        file_path = os.path.join('static', 'uploads', filename)
-        if os.path.exists(file_path):
-            # استخراج اسم الملف والمجلد
-            dir_parts = filename.split('/')
-            if len(dir_parts) > 1:
-                subdir = '/'.join(dir_parts[:-1])
-                file_name = dir_parts[-1]
-                return send_from_directory(f'static/uploads/{subdir}', file_name)
-            else:
-                return send_from_directory('static/uploads', filename)
-        
-        # في حالة عدم وجود الصورة، إرجاع صورة بديلة
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-            return send_from_directory('static/images', 'image-not-found.svg')
-        
-        abort(404)
+        return UploadServingService.serve(filename, ('static-uploads',))
 
     # إضافة دوال مساعدة لقوالب Jinja
     from utils.user_helpers import get_role_display_name, get_module_display_name, format_permissions, check_module_access
@@ -544,6 +563,7 @@ def before_request():
 
 from models import User, UserRole # استيراد النماذج اللازمة
 import click
+import commands  # noqa: F401 - تسجيل أوامر CLI الإضافية (مثل rebuild-attendance-rollup)
 
 @app.cli.command("make-all-admins")
 def make_all_users_admins_command():
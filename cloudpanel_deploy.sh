@@ -59,7 +59,26 @@ Type=simple
 User=www-data
 WorkingDirectory=/home/cloudpanel/htdocs/nuzum.yourdomain.com
 Environment=PATH=/home/cloudpanel/htdocs/nuzum.yourdomain.com/venv/bin
-ExecStart=/home/cloudpanel/htdocs/nuzum.yourdomain.com/venv/bin/gunicorn --bind 127.0.0.1:8000 --workers 3 --timeout 120 main:app
+ExecStart=/home/cloudpanel/htdocs/nuzum.yourdomain.com/venv/bin/gunicorn --bind 127.0.0.1:8000 --workers 3 --worker-class gthread --threads 8 --timeout 120 main:app
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+# عامل المهام الخلفية (التصدير، الاستيراد، تقارير PDF، الإشعارات المجمعة)
+echo "إنشاء خدمة عامل المهام الخلفية..."
+sudo tee /etc/systemd/system/nuzum-worker.service > /dev/null <<EOF
+[Unit]
+Description=Nuzum Background Job Worker
+After=network.target
+
+[Service]
+Type=simple
+User=www-data
+WorkingDirectory=/home/cloudpanel/htdocs/nuzum.yourdomain.com
+Environment=PATH=/home/cloudpanel/htdocs/nuzum.yourdomain.com/venv/bin
+ExecStart=/home/cloudpanel/htdocs/nuzum.yourdomain.com/venv/bin/flask --app main run-job-worker --processes 2
 Restart=always
 
 [Install]
@@ -110,8 +129,8 @@ sudo chmod -R 755 static/uploads
 # Enable and start service
 echo "تشغيل الخدمة..."
 sudo systemctl daemon-reload
-sudo systemctl enable nuzum
-sudo systemctl start nuzum
+sudo systemctl enable nuzum nuzum-worker
+sudo systemctl start nuzum nuzum-worker
 
 echo "=== تم النشر بنجاح ==="
 echo "يرجى تحديث متغيرات البيئة في ملف .env"
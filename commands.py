@@ -1,6 +1,7 @@
 # seeder.py
 
 import os
+import click
 from app import db, app
 from models import Nationality
 
@@ -234,6 +235,109 @@ def seed_nationalities():
         print(f"An error occurred: {e}")
         db.session.rollback()
 
+@app.cli.command("rebuild-attendance-rollup")
+@click.option('--start', 'start_date', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='تاريخ البداية (YYYY-MM-DD)، افتراضياً كامل السجل')
+@click.option('--end', 'end_date', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='تاريخ النهاية (YYYY-MM-DD)، افتراضياً كامل السجل')
+def rebuild_attendance_rollup_command(start_date, end_date):
+    """
+    إعادة بناء جدول الملخص اليومي للحضور (attendance_daily_rollup) لفترة محددة.
+    """
+    from services.attendance_rollup_service import AttendanceRollupService
+
+    start_date = start_date.date() if start_date else None
+    end_date = end_date.date() if end_date else None
+
+    try:
+        inserted = AttendanceRollupService.rebuild(db.session.connection(), start_date, end_date)
+        db.session.commit()
+        print(f"تمت إعادة بناء ملخص الحضور بنجاح: {inserted} صف.")
+    except Exception as e:
+        db.session.rollback()
+        print(f"حدث خطأ أثناء إعادة بناء ملخص الحضور: {e}")
+
+
+@app.cli.command("rebuild-ledger-balances")
+def rebuild_ledger_balances_command():
+    """
+    إعادة بناء جدول أرصدة الحسابات الشهرية (account_period_balances) من القيود المعتمدة.
+    """
+    from services.ledger_balance_service import LedgerBalanceService
+
+    try:
+        inserted = LedgerBalanceService.rebuild(db.session.connection())
+        db.session.commit()
+        print(f"تمت إعادة بناء أرصدة الحسابات الشهرية بنجاح: {inserted} صف.")
+    except Exception as e:
+        db.session.rollback()
+        print(f"حدث خطأ أثناء إعادة بناء أرصدة الحسابات الشهرية: {e}")
+
+
+@app.cli.command("reconcile-vehicle-assignments")
+def reconcile_vehicle_assignments_command():
+    """
+    إعادة مطابقة بيانات السائق والمشرف الحاليين للمركبات مع سجلات التسليم المعتمدة.
+    """
+    from services.vehicle_assignment_service import VehicleAssignmentService
+
+    try:
+        fixed = VehicleAssignmentService.reconcile(db.session.connection())
+        db.session.commit()
+        print(f"تمت مطابقة بيانات التسليم الحالية بنجاح: تم إصلاح {fixed} مركبة.")
+    except Exception as e:
+        db.session.rollback()
+        print(f"حدث خطأ أثناء مطابقة بيانات التسليم الحالية: {e}")
+
+
+@app.cli.command("run-job-worker")
+@click.option('--processes', default=1, show_default=True, help='عدد عمليات العامل')
+@click.option('--once', is_flag=True, help='تنفيذ المهام المنتظرة حالياً ثم الخروج')
+def run_job_worker_command(processes, once):
+    """
+    تشغيل عامل المهام الخلفية (التصدير، الاستيراد، الإشعارات المجمعة).
+    """
+    from services.job_queue_service import JobQueueService
+
+    if once:
+        count = JobQueueService.run_pending(f'cli:{os.getpid()}')
+        print(f"تم تنفيذ {count} مهمة.")
+        return
+
+    print(f"بدء عامل المهام الخلفية بعدد {processes} عملية...")
+    JobQueueService.run_worker(processes)
+
+
+@app.cli.command("purge-jobs")
+@click.option('--days', default=7, show_default=True, help='حذف المهام المنتهية الأقدم من هذا العدد من الأيام')
+def purge_jobs_command(days):
+    """
+    حذف المهام الخلفية المنتهية القديمة وملفاتها الناتجة.
+    """
+    from services.job_queue_service import JobQueueService
+
+    try:
+        deleted = JobQueueService.purge_finished(days)
+        print(f"تم حذف {deleted} مهمة منتهية.")
+    except Exception as e:
+        db.session.rollback()
+        print(f"حدث خطأ أثناء حذف المهام القديمة: {e}")
+
+
+
+@app.cli.command("retry-whatsapp-batch")
+@click.argument('batch_id')
+def retry_whatsapp_batch_command(batch_id):
+    """
+    إعادة إرسال رسائل دفعة واتساب المنتظرة والفاشلة.
+    """
+    from services.whatsapp_delivery_service import WhatsAppDeliveryService
+
+    result = WhatsAppDeliveryService.deliver(batch_id, retry_failed=True)
+    print(f"الدفعة {batch_id}: {result.sent} رسالة مرسلة، {result.failed} فاشلة.")
+    for employee_id, employee_name, error in result.failures[:10]:
+        print(f"  - {employee_name or employee_id}: {error}")
+
 if __name__ == '__main__':
     # إنشاء التطبيق باستخدام إعدادات الإنتاج أو التطوير
     # اختر `DevelopmentConfig` أو `ProductionConfig` حسب الحاجة
@@ -0,0 +1,26 @@
+"""Add index on document expiry_date
+
+Revision ID: 3d8f2b6c91e4
+Revises: a7c41d9e3b58
+Create Date: 2026-10-18 12:40:51.207316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d8f2b6c91e4'
+down_revision = 'a7c41d9e3b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_document_expiry_date'), ['expiry_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_document_expiry_date'))
@@ -0,0 +1,28 @@
+"""Add updated_at to vehicle_handover
+
+Revision ID: 5e7b3c1a9d24
+Revises: 8c6e2a4f1d37
+Create Date: 2026-10-18 15:20:37.418206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7b3c1a9d24'
+down_revision = '8c6e2a4f1d37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('vehicle_handover', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    op.execute('UPDATE vehicle_handover SET updated_at = created_at')
+
+
+def downgrade():
+    with op.batch_alter_table('vehicle_handover', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,36 @@
+"""Add operation request and notification indexes
+
+Revision ID: a4c9e2f7b813
+Revises: 5e7b3c1a9d24
+Create Date: 2026-10-18 16:05:12.284610
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c9e2f7b813'
+down_revision = '5e7b3c1a9d24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # قيم الترتيب الفارغة تكسر مؤشر التقسيم إلى صفحات
+    op.execute("UPDATE operation_requests SET priority = 'normal' WHERE priority IS NULL")
+    op.execute("UPDATE operation_requests SET requested_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE requested_at IS NULL")
+
+    with op.batch_alter_table('operation_requests', schema=None) as batch_op:
+        batch_op.create_index('ix_operation_requests_status_priority_requested', ['status', 'priority', 'requested_at'], unique=False)
+
+    with op.batch_alter_table('operation_notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_operation_notifications_user_is_read', ['user_id', 'is_read'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('operation_notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_operation_notifications_user_is_read')
+
+    with op.batch_alter_table('operation_requests', schema=None) as batch_op:
+        batch_op.drop_index('ix_operation_requests_status_priority_requested')
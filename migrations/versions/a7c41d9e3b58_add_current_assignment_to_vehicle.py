@@ -0,0 +1,37 @@
+"""Add current driver/supervisor and last handover to vehicle
+
+بعد الترقية يجب تعبئة الأعمدة الجديدة من سجلات التسليم الحالية عبر:
+    flask reconcile-vehicle-assignments
+
+Revision ID: a7c41d9e3b58
+Revises: e19752b42420
+Create Date: 2026-10-18 11:03:27.514902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c41d9e3b58'
+down_revision = 'e19752b42420'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('vehicle', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('current_driver_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('current_supervisor_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('last_handover_at', sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key('fk_vehicle_current_driver_id', 'employee', ['current_driver_id'], ['id'], ondelete='SET NULL')
+        batch_op.create_foreign_key('fk_vehicle_current_supervisor_id', 'employee', ['current_supervisor_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade():
+    with op.batch_alter_table('vehicle', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_vehicle_current_supervisor_id', type_='foreignkey')
+        batch_op.drop_constraint('fk_vehicle_current_driver_id', type_='foreignkey')
+        batch_op.drop_column('last_handover_at')
+        batch_op.drop_column('current_supervisor_id')
+        batch_op.drop_column('current_driver_id')
@@ -0,0 +1,26 @@
+"""Add permissions_version to user
+
+Revision ID: b7d3f1e6c052
+Revises: a4c9e2f7b813
+Create Date: 2026-10-18 17:20:41.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3f1e6c052'
+down_revision = 'a4c9e2f7b813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('permissions_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('permissions_version')
@@ -0,0 +1,35 @@
+"""Add unique (employee_id, date) constraint to attendance
+
+Revision ID: c2a8d5f4e719
+Revises: b7d3f1e6c052
+Create Date: 2026-10-18 18:02:37.914520
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2a8d5f4e719'
+down_revision = 'b7d3f1e6c052'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # حذف السجلات المكررة لنفس الموظف واليوم مع الإبقاء على أحدثها
+    result = op.get_bind().execute(sa.text(
+        "DELETE FROM attendance WHERE id NOT IN ("
+        "SELECT keep_id FROM (SELECT MAX(id) AS keep_id FROM attendance GROUP BY employee_id, date) AS latest)"
+    ))
+    if result.rowcount:
+        # ملخص الحضور كان يحسب السجلات المكررة: يُفرغ ليُعاد بناؤه تلقائياً عند أول استخدام
+        op.execute("DELETE FROM attendance_daily_rollup")
+
+    with op.batch_alter_table('attendance', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_attendance_employee_date', ['employee_id', 'date'])
+
+
+def downgrade():
+    with op.batch_alter_table('attendance', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_attendance_employee_date', type_='unique')
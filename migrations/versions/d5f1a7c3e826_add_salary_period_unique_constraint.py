@@ -0,0 +1,57 @@
+"""Add unique (employee_id, year, month) constraint to salary
+
+Revision ID: d5f1a7c3e826
+Revises: c2a8d5f4e719
+Create Date: 2026-10-18 18:46:12.307284
+
+"""
+from alembic import op
+import logging
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f1a7c3e826'
+down_revision = 'c2a8d5f4e719'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+# جدول تُنقل إليه رواتب الفترة المكررة بدلاً من حذفها نهائياً
+BACKUP_TABLE = 'salary_duplicate_backup'
+
+DUPLICATES_CONDITION = (
+    "id NOT IN (SELECT keep_id FROM (SELECT MAX(id) AS keep_id FROM salary GROUP BY employee_id, year, month) AS latest)"
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    duplicates = bind.execute(sa.text(
+        f"SELECT id, employee_id, year, month FROM salary WHERE {DUPLICATES_CONDITION} ORDER BY employee_id, year, month, id"
+    )).all()
+
+    if duplicates:
+        # نقل رواتب الفترة المكررة للموظف نفسه إلى جدول احتياطي مع الإبقاء على أحدثها في salary
+        bind.execute(sa.text(f"CREATE TABLE {BACKUP_TABLE} AS SELECT * FROM salary WHERE {DUPLICATES_CONDITION}"))
+        bind.execute(sa.text(f"DELETE FROM salary WHERE id IN (SELECT id FROM {BACKUP_TABLE})"))
+        logger.warning(
+            "تم نقل %d راتب مكرر (نفس الموظف والشهر) إلى جدول %s، وبقي أحدث راتب لكل فترة في salary",
+            len(duplicates), BACKUP_TABLE
+        )
+        for salary_id, employee_id, year, month in duplicates:
+            logger.warning("راتب مكرر منقول: id=%s employee_id=%s الفترة=%s/%s", salary_id, employee_id, month, year)
+
+    with op.batch_alter_table('salary', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_salary_employee_period', ['employee_id', 'year', 'month'])
+
+
+def downgrade():
+    with op.batch_alter_table('salary', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_salary_employee_period', type_='unique')
+
+    # إعادة الرواتب المكررة المنقولة إلى salary
+    if sa.inspect(op.get_bind()).has_table(BACKUP_TABLE):
+        op.execute(f"INSERT INTO salary SELECT * FROM {BACKUP_TABLE}")
+        op.drop_table(BACKUP_TABLE)
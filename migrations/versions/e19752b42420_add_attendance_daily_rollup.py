@@ -0,0 +1,38 @@
+"""Add attendance_daily_rollup table
+
+Revision ID: e19752b42420
+Revises: 5b2255ca9383
+Create Date: 2026-10-18 09:12:40.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e19752b42420'
+down_revision = '5b2255ca9383'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('attendance_daily_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('department_id', sa.Integer(), nullable=False),
+    sa.Column('project', sa.String(length=100), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('date', 'department_id', 'project', 'status', name='uq_attendance_daily_rollup_key')
+    )
+    with op.batch_alter_table('attendance_daily_rollup', schema=None) as batch_op:
+        batch_op.create_index('ix_attendance_daily_rollup_dept_date', ['department_id', 'date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('attendance_daily_rollup', schema=None) as batch_op:
+        batch_op.drop_index('ix_attendance_daily_rollup_dept_date')
+
+    op.drop_table('attendance_daily_rollup')
@@ -0,0 +1,47 @@
+"""Add whatsapp_message delivery status table
+
+Revision ID: e8b4c6d2f137
+Revises: d5f1a7c3e826
+Create Date: 2026-10-18 19:31:08.642195
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b4c6d2f137'
+down_revision = 'd5f1a7c3e826'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('whatsapp_message',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('batch_id', sa.String(length=32), nullable=False),
+    sa.Column('kind', sa.String(length=30), nullable=False),
+    sa.Column('employee_id', sa.Integer(), nullable=True),
+    sa.Column('salary_id', sa.Integer(), nullable=True),
+    sa.Column('recipient', sa.String(length=30), nullable=True),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('provider_message_id', sa.String(length=128), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['employee_id'], ['employee.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['salary_id'], ['salary.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('whatsapp_message', schema=None) as batch_op:
+        batch_op.create_index('ix_whatsapp_message_batch_status', ['batch_id', 'status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('whatsapp_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_whatsapp_message_batch_status')
+
+    op.drop_table('whatsapp_message')
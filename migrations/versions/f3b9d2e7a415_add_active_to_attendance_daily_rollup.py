@@ -0,0 +1,33 @@
+"""Add active to attendance_daily_rollup key
+
+Revision ID: f3b9d2e7a415
+Revises: e8b4c6d2f137
+Create Date: 2026-10-18 15:20:11.402913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d2e7a415'
+down_revision = 'e8b4c6d2f137'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # الصفوف الحالية لا تميز الموظفين غير النشطين: تُحذف ويُعاد بناء الملخص تلقائياً عند أول استخدام
+    op.execute('DELETE FROM attendance_daily_rollup')
+    with op.batch_alter_table('attendance_daily_rollup', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('active', sa.Boolean(), nullable=False, server_default=sa.true()))
+        batch_op.drop_constraint('uq_attendance_daily_rollup_key', type_='unique')
+        batch_op.create_unique_constraint('uq_attendance_daily_rollup_key', ['date', 'department_id', 'project', 'active', 'status'])
+
+
+def downgrade():
+    op.execute('DELETE FROM attendance_daily_rollup')
+    with op.batch_alter_table('attendance_daily_rollup', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_attendance_daily_rollup_key', type_='unique')
+        batch_op.create_unique_constraint('uq_attendance_daily_rollup_key', ['date', 'department_id', 'project', 'status'])
+        batch_op.drop_column('active')
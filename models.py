@@ -179,10 +179,42 @@ class Attendance(db.Model):
     
     # Relationships
     employee = db.relationship('Employee', back_populates='attendances')
+
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'date', name='uq_attendance_employee_date'),
+    )
     
     def __repr__(self):
         return f'<Attendance {self.employee.name} on {self.date}>'
 
+class AttendanceDailyRollup(db.Model):
+    """ملخص يومي مجمّع لسجلات الحضور حسب (التاريخ، القسم، المشروع، نشاط الموظف، الحالة)
+
+    يُصنَّف كل سجل حسب أقسام الموظف ومشروعه وحالته الحالية، ويُنقل عند تغيرها.
+    """
+    __tablename__ = 'attendance_daily_rollup'
+
+    # department_id = 0 يمثل إجمالي جميع الأقسام، و project = '' يمثل بدون مشروع
+    ALL_DEPARTMENTS = 0
+    NO_PROJECT = ''
+
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    department_id = db.Column(db.Integer, nullable=False, default=0)
+    project = db.Column(db.String(100), nullable=False, default='')
+    # هل الموظف نشط (status = 'active')
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    status = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('date', 'department_id', 'project', 'active', 'status', name='uq_attendance_daily_rollup_key'),
+        db.Index('ix_attendance_daily_rollup_dept_date', 'department_id', 'date'),
+    )
+
+    def __repr__(self):
+        return f'<AttendanceDailyRollup {self.date} {self.department_id} {self.status}={self.count}>'
+
 class Salary(db.Model):
     """Employee salary information"""
     id = db.Column(db.Integer, primary_key=True)
@@ -202,6 +234,10 @@ class Salary(db.Model):
     
     # Relationships
     employee = db.relationship('Employee', back_populates='salaries')
+
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'year', 'month', name='uq_salary_employee_period'),
+    )
     
     def __repr__(self):
         return f'<Salary {self.employee.name} for {self.month}/{self.year}>'
@@ -213,7 +249,7 @@ class Document(db.Model):
     document_type = db.Column(db.String(50), nullable=False)  # national_id, passport, health_certificate, etc.
     document_number = db.Column(db.String(100), nullable=False)
     issue_date = db.Column(db.Date, nullable=True)  # تم تعديلها للسماح بقيم NULL
-    expiry_date = db.Column(db.Date, nullable=True)  # تم تعديلها للسماح بقيم NULL
+    expiry_date = db.Column(db.Date, nullable=True, index=True)  # تم تعديلها للسماح بقيم NULL
     file_path = db.Column(db.String(255), nullable=True)  # مسار الملف المرفق
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -299,6 +335,7 @@ class User(UserMixin, db.Model):
     
     # العلاقة مع صلاحيات المستخدم
     permissions = db.relationship('UserPermission', back_populates='user', cascade='all, delete-orphan')
+    permissions_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # يُزاد عند تعديل الصلاحيات
 
     # العلاقة مع المركبات التي يمكن للمستخدم الوصول إليها
     accessible_vehicles = db.relationship('Vehicle',
@@ -330,11 +367,7 @@ class User(UserMixin, db.Model):
             return True
             
         # التحقق من صلاحيات القسم المحدد
-        for user_permission in self.permissions:
-            if user_permission.module == module:
-                return user_permission.permissions & permission
-                
-        return False
+        return self.permission_map.get(module, 0) & permission
 
     def can_access_department(self, department_id):
         if self.role == UserRole.ADMIN:
@@ -357,7 +390,17 @@ class User(UserMixin, db.Model):
         if self.role == UserRole.ADMIN:
             return True
             
-        return any(p.module == module for p in self.permissions)
+        return module in self.permission_map
+
+    @property
+    def permission_map(self):
+        """خريطة الصلاحيات المجمّعة {Module: بتات الصلاحيات}، تُحفظ مع المستخدم طوال الطلب"""
+        cached = self.__dict__.get('_permission_map')
+        if cached is None or cached[0] != self.permissions_version:
+            from services.permission_cache_service import PermissionCacheService
+            cached = (self.permissions_version, PermissionCacheService.module_map(self))
+            self.__dict__['_permission_map'] = cached
+        return cached[1]
     
     def can_access_department(self, department_id):
         """التحقق مما إذا كان المستخدم يمكنه الوصول إلى قسم معين"""
@@ -541,9 +584,81 @@ class SystemAudit(db.Model):
         from app import db
         db.session.add(audit)
         db.session.commit()
-        
+
         return audit
 
+class BackgroundJob(db.Model):
+    """مهمة خلفية (تصدير، استيراد، إشعارات مجمعة) تُنفذ في عملية العامل بدلاً من طلب HTTP"""
+    __tablename__ = 'background_job'
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(100), nullable=False)  # اسم معالج المهمة المسجل
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    params = db.Column(db.Text)  # معاملات المهمة (JSON)
+    progress = db.Column(db.Integer, nullable=False, default=0)  # نسبة الإنجاز 0-100
+    progress_message = db.Column(db.String(255))
+    result = db.Column(db.Text)  # نتيجة المهمة (JSON) مثل رسالة الملخص والأعداد
+    result_path = db.Column(db.String(500))  # مسار الملف الناتج إن وجد
+    result_filename = db.Column(db.String(255))  # اسم الملف عند التحميل
+    result_mimetype = db.Column(db.String(100))
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(100))  # معرف العامل الذي نفذ المهمة
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # آخر تحديث للتقدم (نبض العامل)
+
+    user = db.relationship('User', foreign_keys=[user_id])
+
+    __table_args__ = (
+        db.Index('ix_background_job_status_id', 'status', 'id'),
+    )
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    def __repr__(self):
+        return f'<BackgroundJob {self.id} {self.job_type} {self.status}>'
+
+class WhatsAppMessage(db.Model):
+    """رسالة واتساب ضمن دفعة إرسال مجمعة وحالة تسليمها (تُحدّث من محرك الإرسال)"""
+    __tablename__ = 'whatsapp_message'
+
+    STATUS_QUEUED = 'queued'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.String(32), nullable=False)  # معرف دفعة الإرسال
+    kind = db.Column(db.String(30), nullable=False)  # نوع الإشعار (salary, deduction)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id', ondelete='SET NULL'), nullable=True)
+    salary_id = db.Column(db.Integer, db.ForeignKey('salary.id', ondelete='SET NULL'), nullable=True)
+    recipient = db.Column(db.String(30))
+    payload = db.Column(db.Text, nullable=False)  # محتوى طلب API (JSON)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    provider_message_id = db.Column(db.String(128))  # معرف الرسالة في WhatsApp (wamid)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    employee = db.relationship('Employee', foreign_keys=[employee_id])
+
+    __table_args__ = (
+        db.Index('ix_whatsapp_message_batch_status', 'batch_id', 'status'),
+    )
+
+    def __repr__(self):
+        return f'<WhatsAppMessage {self.id} {self.kind} {self.status}>'
+
 # نماذج إدارة السيارات
 class Vehicle(db.Model):
     """نموذج السيارة مع المعلومات الأساسية"""
@@ -577,11 +692,19 @@ class Vehicle(db.Model):
     # إضافة حقل رابط مجلد Google Drive
     drive_folder_link = db.Column(db.String(500), nullable=True)  # رابط مجلد Google Drive
     
+    # بيانات التسليم الحالية (محسوبة من آخر سجل تسليم/استلام معتمد)
+    # تُحدَّث تلقائياً عند إنشاء أو تعديل أو اعتماد أو حذف سجلات التسليم
+    current_driver_id = db.Column(db.Integer, db.ForeignKey('employee.id', name='fk_vehicle_current_driver_id', ondelete='SET NULL'), nullable=True)  # السائق الحالي
+    current_supervisor_id = db.Column(db.Integer, db.ForeignKey('employee.id', name='fk_vehicle_current_supervisor_id', ondelete='SET NULL'), nullable=True)  # المشرف الحالي
+    last_handover_at = db.Column(db.DateTime, nullable=True)  # تاريخ ووقت آخر عملية تسليم/استلام معتمدة
+    
     notes = db.Column(db.Text)  # ملاحظات
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # العلاقات
+    current_driver = db.relationship('Employee', foreign_keys=[current_driver_id])
+    current_supervisor = db.relationship('Employee', foreign_keys=[current_supervisor_id])
     rental_records = db.relationship('VehicleRental', back_populates='vehicle', cascade='all, delete-orphan')
     workshop_records = db.relationship('VehicleWorkshop', back_populates='vehicle', cascade='all, delete-orphan')
     project_assignments = db.relationship('VehicleProject', back_populates='vehicle', cascade='all, delete-orphan')
@@ -785,6 +908,7 @@ class VehicleHandover(db.Model):
     custom_company_name = db.Column(db.String(100), nullable=True)
     custom_logo_path = db.Column(db.String(255), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # --- حقول وعلاقات تم حذفها أو تعديلها ---
     # employee_id: تم حذفه لأنه لم نعد نربط الموظف مباشرةً.
@@ -1497,6 +1621,10 @@ class OperationRequest(db.Model):
         # توجيه جميع العمليات إلى صفحة تعديل تواريخ الوثائق مباشرة
         return f"/vehicles/documents/edit/{self.vehicle_id}"
     
+    __table_args__ = (
+        db.Index('ix_operation_requests_status_priority_requested', 'status', 'priority', 'requested_at'),
+    )
+    
     def __repr__(self):
         return f"<OperationRequest {self.operation_type} for Vehicle {self.vehicle_id}>"
 
@@ -1532,6 +1660,10 @@ class OperationNotification(db.Model):
     operation_request = db.relationship("OperationRequest", backref="notifications")
     user = db.relationship("User", backref="notifications")
     
+    __table_args__ = (
+        db.Index('ix_operation_notifications_user_is_read', 'user_id', 'is_read'),
+    )
+    
     def __repr__(self):
         return f"<OperationNotification {self.title} to {self.user_id}>"
 
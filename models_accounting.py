@@ -240,6 +240,25 @@ class TransactionEntry(db.Model):
     cost_center = db.relationship('CostCenter', backref='transaction_entries')
 
 
+class AccountPeriodBalance(db.Model):
+    """أرصدة الحسابات الشهرية من القيود المعتمدة (حساب × شهر)"""
+    __tablename__ = 'account_period_balances'
+
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('accounts.id', ondelete='CASCADE'), nullable=False)
+    period_start = db.Column(db.Date, nullable=False)  # أول يوم في الشهر
+    debit_total = db.Column(db.Numeric(15, 2), nullable=False, default=0)  # مجموع المدين خلال الشهر
+    credit_total = db.Column(db.Numeric(15, 2), nullable=False, default=0)  # مجموع الدائن خلال الشهر
+    closing_balance = db.Column(db.Numeric(15, 2), nullable=False, default=0)  # الرصيد التراكمي (مدين - دائن) في نهاية الشهر
+
+    __table_args__ = (
+        db.UniqueConstraint('account_id', 'period_start', name='uq_account_period_balances_key'),
+    )
+
+    def __repr__(self):
+        return f'<AccountPeriodBalance {self.account_id} {self.period_start}={self.closing_balance}>'
+
+
 class Budget(db.Model):
     """الموازنات"""
     __tablename__ = 'budgets'
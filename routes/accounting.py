@@ -15,6 +15,7 @@ from models_accounting import *
 from forms.accounting import *
 from utils.helpers import log_activity
 from utils.chart_of_accounts import create_default_chart_of_accounts, get_accounts_tree, get_account_hierarchy, calculate_account_balance
+from services.ledger_balance_service import LedgerBalanceService
 
 # إنشاء البلوبرينت
 accounting_bp = Blueprint('accounting', __name__, url_prefix='/accounting')
@@ -358,34 +359,12 @@ def view_account(account_id):
         .order_by(desc(Transaction.transaction_date))\
         .limit(20).all()
     
-    # الرصيد الشهري للسنة الحالية
+    # الرصيد الشهري للسنة الحالية (من جدول الأرصدة الشهرية)
     current_year = datetime.now().year
-    monthly_balances = []
-    
-    for month in range(1, 13):
-        month_start = date(current_year, month, 1)
-        if month == 12:
-            month_end = date(current_year + 1, 1, 1) - timedelta(days=1)
-        else:
-            month_end = date(current_year, month + 1, 1) - timedelta(days=1)
-        
-        # حساب الرصيد حتى نهاية الشهر
-        debits = db.session.query(func.sum(TransactionEntry.amount)).join(Transaction).filter(
-            TransactionEntry.account_id == account.id,
-            TransactionEntry.entry_type == EntryType.DEBIT,
-            Transaction.transaction_date <= month_end,
-            Transaction.is_approved == True
-        ).scalar() or 0
-        
-        credits = db.session.query(func.sum(TransactionEntry.amount)).join(Transaction).filter(
-            TransactionEntry.account_id == account.id,
-            TransactionEntry.entry_type == EntryType.CREDIT,
-            Transaction.transaction_date <= month_end,
-            Transaction.is_approved == True
-        ).scalar() or 0
-        
-        balance = debits - credits if account.account_type in [AccountType.ASSETS, AccountType.EXPENSES] else credits - debits
-        monthly_balances.append(balance)
+    monthly_balances = [
+        LedgerBalanceService.signed_balance(account.account_type, net)
+        for net in LedgerBalanceService.monthly_closing(account.id, current_year)
+    ]
     
     return render_template('accounting/accounts/view.html',
                          account=account,
@@ -17,6 +17,7 @@ from models import UserRole, Employee, Vehicle, Department, Module, Permission
 from models_accounting import *
 from forms.accounting import *
 from utils.helpers import log_activity
+from services.ledger_balance_service import LedgerBalanceService
 
 # إنشاء البلوبرينت الثاني
 accounting_ext_bp = Blueprint('accounting_ext', __name__, url_prefix='/accounting')
@@ -420,64 +421,35 @@ def trial_balance():
     if not to_date:
         to_date = date.today().strftime('%Y-%m-%d')
     
-    # استعلام أرصدة الحسابات
-    from sqlalchemy import case
-    
-    accounts_balances = db.session.query(
+    # أرصدة الحسابات: صافي الحركة بين التاريخين من جدول الأرصدة الشهرية
+    accounts_list = db.session.query(
         Account.id,
         Account.code,
         Account.name,
-        Account.account_type,
-        func.sum(
-            case(
-                (TransactionEntry.entry_type == EntryType.DEBIT, TransactionEntry.amount),
-                else_=0
-            )
-        ).label('total_debits'),
-        func.sum(
-            case(
-                (TransactionEntry.entry_type == EntryType.CREDIT, TransactionEntry.amount),
-                else_=0
-            )
-        ).label('total_credits')
-    ).outerjoin(TransactionEntry).outerjoin(Transaction).filter(
-        or_(Transaction.is_approved == True, Transaction.id.is_(None)),
-        or_(
-            and_(
-                Transaction.transaction_date >= datetime.strptime(from_date, '%Y-%m-%d').date(),
-                Transaction.transaction_date <= datetime.strptime(to_date, '%Y-%m-%d').date()
-            ),
-            Transaction.id.is_(None)
-        ),
-        Account.is_active == True
-    ).group_by(Account.id, Account.code, Account.name, Account.account_type).order_by(Account.code).all()
+        Account.account_type
+    ).filter(Account.is_active == True).order_by(Account.code).all()
+    
+    movements = LedgerBalanceService.net_movements(
+        datetime.strptime(from_date, '%Y-%m-%d').date(),
+        datetime.strptime(to_date, '%Y-%m-%d').date(),
+        [account.id for account in accounts_list]
+    )
     
     # حساب الأرصدة النهائية
     trial_balance_data = []
     total_debits = Decimal('0')
     total_credits = Decimal('0')
     
-    for account in accounts_balances:
-        debits = account.total_debits or Decimal('0')
-        credits = account.total_credits or Decimal('0')
+    for account in accounts_list:
+        net = movements.get(account.id, Decimal('0'))
         
-        # حساب الرصيد حسب نوع الحساب
-        if account.account_type in [AccountType.ASSETS, AccountType.EXPENSES]:
-            balance = debits - credits
-            if balance > 0:
-                debit_balance = balance
-                credit_balance = Decimal('0')
-            else:
-                debit_balance = Decimal('0')
-                credit_balance = abs(balance)
+        # الرصيد المدين أو الدائن (صافي الحركة = مدين - دائن)
+        if net > 0:
+            debit_balance = net
+            credit_balance = Decimal('0')
         else:
-            balance = credits - debits
-            if balance > 0:
-                credit_balance = balance
-                debit_balance = Decimal('0')
-            else:
-                credit_balance = Decimal('0')
-                debit_balance = abs(balance)
+            debit_balance = Decimal('0')
+            credit_balance = abs(net)
         
         if debit_balance > 0 or credit_balance > 0:
             trial_balance_data.append({
@@ -510,27 +482,26 @@ def balance_sheet():
     
     as_of_date = request.args.get('as_of_date', date.today().strftime('%Y-%m-%d'))
     
-    # أرصدة الحسابات كما في تاريخ محدد
+    # أرصدة الحسابات كما في تاريخ محدد (من جدول الأرصدة الشهرية)
     accounts_query = db.session.query(
+        Account.id,
         Account.code,
         Account.name,
-        Account.account_type,
-        func.sum(
-            func.case(
-                (TransactionEntry.entry_type == EntryType.DEBIT, TransactionEntry.amount),
-                else_=0
-            ) -
-            func.case(
-                (TransactionEntry.entry_type == EntryType.CREDIT, TransactionEntry.amount),
-                else_=0
-            )
-        ).label('balance')
-    ).outerjoin(TransactionEntry).outerjoin(Transaction).filter(
-        Transaction.is_approved == True,
-        Transaction.transaction_date <= datetime.strptime(as_of_date, '%Y-%m-%d').date(),
+        Account.account_type
+    ).filter(
         Account.is_active == True,
         Account.account_type.in_([AccountType.ASSETS, AccountType.LIABILITIES, AccountType.EQUITY])
-    ).group_by(Account.id).order_by(Account.code).all()
+    ).order_by(Account.code).all()
+    
+    income_accounts = db.session.query(Account.id, Account.account_type).filter(
+        Account.is_active == True,
+        Account.account_type.in_([AccountType.REVENUE, AccountType.EXPENSES])
+    ).all()
+    
+    net_balances = LedgerBalanceService.net_balances(
+        datetime.strptime(as_of_date, '%Y-%m-%d').date(),
+        [account.id for account in accounts_query] + [account.id for account in income_accounts]
+    )
     
     # تصنيف الحسابات
     assets = []
@@ -542,7 +513,7 @@ def balance_sheet():
     total_equity = Decimal('0')
     
     for account in accounts_query:
-        balance = account.balance or Decimal('0')
+        balance = net_balances.get(account.id, Decimal('0'))
         
         if account.account_type == AccountType.ASSETS:
             if balance != 0:
@@ -570,15 +541,15 @@ def balance_sheet():
                 total_equity += abs(balance)
     
     # حساب الأرباح المحتجزة
-    revenue_total = db.session.query(func.sum(Account.balance)).filter(
-        Account.account_type == AccountType.REVENUE,
-        Account.is_active == True
-    ).scalar() or Decimal('0')
-    
-    expense_total = db.session.query(func.sum(Account.balance)).filter(
-        Account.account_type == AccountType.EXPENSES,
-        Account.is_active == True
-    ).scalar() or Decimal('0')
+    revenue_total = sum((
+        LedgerBalanceService.signed_balance(account.account_type, net_balances.get(account.id, Decimal('0')))
+        for account in income_accounts if account.account_type == AccountType.REVENUE
+    ), Decimal('0'))
+    
+    expense_total = sum((
+        LedgerBalanceService.signed_balance(account.account_type, net_balances.get(account.id, Decimal('0')))
+        for account in income_accounts if account.account_type == AccountType.EXPENSES
+    ), Decimal('0'))
     
     retained_earnings = revenue_total - expense_total
     total_equity += retained_earnings
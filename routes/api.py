@@ -47,17 +47,13 @@ def get_departments():
 @api_bp.route('/documents/expiring/<int:days>')
 def get_expiring_documents(days):
     """الحصول على المستندات التي ستنتهي خلال عدد محدد من الأيام"""
-    from datetime import datetime, timedelta
+    from datetime import datetime
+    from services.document_expiry_service import DocumentExpiryService
     
-    # حساب تاريخ البداية والنهاية
     today = datetime.now().date()
-    end_date = today + timedelta(days=days)
     
-    # البحث عن المستندات التي تنتهي في هذه الفترة
-    documents = Document.query.filter(
-        Document.expiry_date >= today,
-        Document.expiry_date <= end_date
-    ).all()
+    # البحث عن المستندات التي تنتهي في هذه الفترة مع بيانات الموظف في استعلام واحد
+    documents = DocumentExpiryService.expiring_documents(days, today=today)
     
     documents_list = []
     for doc in documents:
@@ -65,13 +61,13 @@ def get_expiring_documents(days):
         document_data = {
             'id': doc.id,
             'employee_id': doc.employee_id,
-            'employee_name': doc.employee.name,
+            'employee_name': doc.employee_name,
             'document_type': doc.document_type,
             'document_number': doc.document_number,
             'expiry_date': doc.expiry_date.strftime('%Y-%m-%d'),
             'days_remaining': days_remaining,
-            'contract_type': doc.employee.contract_type,
-            'nationality': doc.employee.nationality
+            'contract_type': doc.contract_type,
+            'nationality': doc.nationality
         }
         documents_list.append(document_data)
     
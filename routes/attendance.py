@@ -6,8 +6,11 @@ from app import db
 from models import Attendance, Employee, Department, SystemAudit, VehicleProject, Module, Permission, employee_departments
 from utils.date_converter import parse_date, format_date_hijri, format_date_gregorian
 from utils.excel import export_attendance_by_department
+from utils.excel_stream import xlsx_response
 from utils.user_helpers import check_module_access
 from utils.audit_logger import log_attendance_activity, log_system_activity, log_activity
+from services.attendance_stats_service import AttendanceStatsService
+from services.attendance_upsert_service import AttendanceUpsertService, date_range
 import calendar
 import logging
 import time as time_module  # Renamed to avoid conflict with datetime.time
@@ -375,31 +378,14 @@ def bulk_record():
             if skip_weekends:
                 dates = [d for d in dates if d.weekday() not in [4, 5]]  # الجمعة والسبت
             
-            # تسجيل الحضور
-            count = 0
-            for employee_id in employee_ids:
-                for date_obj in dates:
-                    # التحقق من وجود سجل سابق
-                    existing = Attendance.query.filter_by(
-                        employee_id=employee_id,
-                        date=date_obj
-                    ).first()
-                    
-                    if existing:
-                        if overwrite_existing:
-                            existing.status = default_status
-                            count += 1
-                    else:
-                        attendance = Attendance(
-                            employee_id=employee_id,
-                            date=date_obj,
-                            status=default_status
-                        )
-                        db.session.add(attendance)
-                        count += 1
+            # تسجيل الحضور للموظفين المختارين في جميع الأيام دفعة واحدة
+            result = AttendanceUpsertService.upsert_grid(
+                employee_ids, dates, default_status,
+                overwrite=overwrite_existing, clear_times=False
+            )
             
             db.session.commit()
-            flash(f'تم تسجيل {count} سجل حضور بنجاح', 'success')
+            flash(f'تم تسجيل {result.total} سجل حضور بنجاح ({result.inserted} جديد، {result.updated} محدث)', 'success')
             return redirect(url_for('attendance.index'))
             
         except Exception as e:
@@ -643,83 +629,44 @@ def all_departments_attendance():
             days_count = delta.days + 1  # لتضمين اليوم الأخير
             
             try:
-                # العمل على كل قسم من الأقسام المحددة
+                # جمع الموظفين النشطين في الأقسام المحددة
+                selected_departments = []
+                employee_ids = set()
                 for department_id in department_ids:
                     try:
                         # التحويل إلى عدد صحيح
                         dept_id = int(department_id)
-                        
-                        # الحصول على القسم للتأكد من وجوده
-                        department = Department.query.get(dept_id)
-                        if not department:
-                            continue
-                            
-                        # الحصول على جميع الموظفين في القسم
-                        employees = Employee.query.filter_by(
-                            department_id=dept_id,
-                            status='active'
-                        ).all()
-                        
-                        # عدد موظفي القسم
-                        department_employee_count = len(employees)
-                        total_employees += department_employee_count
-                        
-                        # التحضير لكل يوم في النطاق المحدد
-                        current_date = start_date
-                        department_records = 0
-                        
-                        while current_date <= end_date:
-                            day_count = 0
-                            
-                            for employee in employees:
-                                try:
-                                    # التحقق من وجود سجل حضور مسبق
-                                    existing = Attendance.query.filter_by(
-                                        employee_id=employee.id,
-                                        date=current_date
-                                    ).first()
-                                    
-                                    if existing:
-                                        # تحديث السجل الموجود
-                                        existing.status = status
-                                        if status != 'present':
-                                            existing.check_in = None
-                                            existing.check_out = None
-                                    else:
-                                        # إنشاء سجل حضور جديد
-                                        new_attendance = Attendance(
-                                            employee_id=employee.id,
-                                            date=current_date,
-                                            status=status
-                                        )
-                                        db.session.add(new_attendance)
-                                    
-                                    day_count += 1
-                                except Exception as emp_error:
-                                    # تسجيل الخطأ والاستمرار مع الموظف التالي
-                                    print(f"خطأ مع الموظف {employee.id}: {str(emp_error)}")
-                                    continue
-                            
-                            # الانتقال إلى اليوم التالي
-                            current_date += timedelta(days=1)
-                            department_records += day_count
-                        
-                        total_records += department_records
-                        
-                        # تسجيل العملية للقسم
-                        log_activity('create', 'DepartmentAttendance', department.id, 
-                                   f'تم تسجيل حضور لقسم {department.name} للفترة من {start_date} إلى {end_date} لعدد {department_employee_count} موظف')
+                    except ValueError:
+                        continue
                     
-                    except Exception as dept_error:
-                        # تسجيل الخطأ والاستمرار مع القسم التالي
-                        print(f"خطأ مع القسم {department_id}: {str(dept_error)}")
+                    # الحصول على القسم للتأكد من وجوده
+                    department = Department.query.get(dept_id)
+                    if not department:
                         continue
+                    
+                    department_employee_ids = [employee_id for employee_id, in db.session.query(Employee.id).filter_by(
+                        department_id=dept_id,
+                        status='active'
+                    )]
+                    employee_ids.update(department_employee_ids)
+                    selected_departments.append((department, len(department_employee_ids)))
+                
+                total_employees = len(employee_ids)
+                
+                # تسجيل الحضور لجميع الموظفين في جميع الأيام دفعة واحدة
+                result = AttendanceUpsertService.upsert_grid(employee_ids, date_range(start_date, end_date), status)
+                total_records = result.total
                 
-                # حفظ جميع التغييرات
+                # حفظ جميع التغييرات قبل تسجيل النشاط
                 db.session.commit()
                 
+                for department, department_employee_count in selected_departments:
+                    # تسجيل العملية للقسم
+                    log_activity('create', 'DepartmentAttendance', department.id, 
+                               f'تم تسجيل حضور لقسم {department.name} للفترة من {start_date} إلى {end_date} لعدد {department_employee_count} موظف')
+                
                 # رسالة نجاح مفصلة
-                flash(f'تم تسجيل الحضور لـ {total_departments} قسم و {total_employees} موظف عن {days_count} يوم بنجاح (إجمالي {total_records} سجل)', 'success')
+                flash(f'تم تسجيل الحضور لـ {total_departments} قسم و {total_employees} موظف عن {days_count} يوم بنجاح (إجمالي {total_records} سجل: {result.inserted} جديد، {result.updated} محدث)', 'success')
                 return redirect(url_for('attendance.index', date=start_date_str))
             
             except Exception as e:
@@ -785,40 +732,12 @@ def multi_day_department_attendance():
             delta = end_date - start_date
             days_count = delta.days + 1  # لتضمين اليوم الأخير
             
-            # التحضير لكل يوم في النطاق المحدد
-            total_count = 0
-            current_date = start_date
-            
-            while current_date <= end_date:
-                day_count = 0
-                
-                for employee in employees:
-                    # التحقق من وجود سجل حضور مسبق
-                    existing = Attendance.query.filter_by(
-                        employee_id=employee.id,
-                        date=current_date
-                    ).first()
-                    
-                    if existing:
-                        # تحديث السجل الموجود
-                        existing.status = status
-                        if status != 'present':
-                            existing.check_in = None
-                            existing.check_out = None
-                    else:
-                        # إنشاء سجل حضور جديد
-                        new_attendance = Attendance(
-                            employee_id=employee.id,
-                            date=current_date,
-                            status=status
-                        )
-                        db.session.add(new_attendance)
-                    
-                    day_count += 1
-                
-                # الانتقال إلى اليوم التالي
-                current_date += timedelta(days=1)
-                total_count += day_count
+            # تسجيل الحضور لجميع موظفي القسم في جميع الأيام دفعة واحدة
+            result = AttendanceUpsertService.upsert_grid(
+                [employee.id for employee in employees], date_range(start_date, end_date), status
+            )
+            total_count = result.total
+            db.session.commit()
             
             # تسجيل العملية
             department = Department.query.get(department_id)
@@ -826,7 +745,7 @@ def multi_day_department_attendance():
                 log_activity('create', 'MultiDayDepartmentAttendance', department.id,
                            f'تم تسجيل حضور لقسم {department.name} للفترة من {start_date} إلى {end_date} لعدد {len(employees)} موظف و {days_count} يوم ({total_count} سجل)')
             
-            flash(f'تم تسجيل الحضور لـ {len(employees)} موظف عن {days_count} يوم بنجاح (إجمالي {total_count} سجل)', 'success')
+            flash(f'تم تسجيل الحضور لـ {len(employees)} موظف عن {days_count} يوم بنجاح (إجمالي {total_count} سجل: {result.inserted} جديد، {result.updated} محدث)', 'success')
             return redirect(url_for('attendance.index', date=start_date_str))
         
         except Exception as e:
@@ -893,23 +812,11 @@ def stats():
         start_date = datetime.now().date().replace(day=1)
         end_date = datetime.now().date()
     
-    query = db.session.query(
-        Attendance.status,
-        func.count(Attendance.id).label('count')
-    ).filter(
-        Attendance.date >= start_date,
-        Attendance.date <= end_date
-    )
-    
-    if department_id and department_id != '':
-        query = query.join(Employee).filter(Employee.department_id == department_id)
-    
-    stats = query.group_by(Attendance.status).all()
-    
-    # Convert to a dict for easier consumption by charts
-    result = {'present': 0, 'absent': 0, 'leave': 0, 'sick': 0}
-    for status, count in stats:
-        result[status] = count
+    # قراءة الأعداد من الملخص اليومي المجمّع بدلاً من مسح جدول الحضور
+    department_filter = int(department_id) if department_id and department_id.isdigit() else None
+    result = AttendanceStatsService.aggregate(
+        start_date, end_date, department_id=department_filter
+    ).totals(start_date, end_date)
     
     return jsonify(result)
 
@@ -949,17 +856,26 @@ def export_excel():
             flash('القسم غير موجود', 'danger')
             return redirect(url_for('attendance.export_page'))
         
-        # الحصول على موظفي القسم - استخدام علاقة many-to-many
-        employees = department.employees
-        
-        # الحصول على سجلات الحضور خلال الفترة المحددة
-        if employees:
-            attendances = Attendance.query.filter(
-                Attendance.date.between(start_date, end_date),
-                Attendance.employee_id.in_([emp.id for emp in employees])
-            ).all()
-        else:
-            attendances = []
+        # موظفو القسم (علاقة many-to-many) مرتبين حسب الاسم، تُقرأ على دفعات أثناء الكتابة
+        employees = Employee.query.join(
+            employee_departments, employee_departments.c.employee_id == Employee.id
+        ).filter(
+            employee_departments.c.department_id == department.id
+        ).options(
+            db.selectinload(Employee.departments)
+        ).order_by(Employee.name, Employee.id)
+        
+        # سجلات الحضور خلال الفترة بنفس ترتيب الموظفين ثم حسب التاريخ
+        attendances = db.session.query(
+            Attendance.employee_id, Attendance.date, Attendance.status
+        ).join(
+            Employee, Employee.id == Attendance.employee_id
+        ).join(
+            employee_departments, employee_departments.c.employee_id == Employee.id
+        ).filter(
+            employee_departments.c.department_id == department.id,
+            Attendance.date.between(start_date, end_date)
+        ).order_by(Employee.name, Employee.id, Attendance.date)
         
         # إنشاء ملف Excel وتحميله
         excel_file = export_attendance_by_department(employees, attendances, start_date, end_date)
@@ -970,12 +886,7 @@ def export_excel():
         else:
             filename = f'سجل الحضور - {department.name} - {start_date_str}.xlsx'
         
-        return send_file(
-            excel_file,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return xlsx_response(excel_file, filename)
         
     except Exception as e:
         flash(f'حدث خطأ أثناء تصدير البيانات: {str(e)}', 'danger')
@@ -1078,120 +989,19 @@ def dashboard():
             last_day = calendar.monthrange(current_year, current_month)[1]
             end_of_month = today.replace(day=last_day)
             
-            # 5. إنشاء قاعدة الاستعلام
-            query_base = db.session.query(
-                Attendance.status,
-                func.count(Attendance.id).label('count')
+            # 5. تجميع سجلات الشهر كاملاً حسب (التاريخ × الحالة) في استعلام واحد
+            # نطاق الشهر يغطي إحصائيات اليوم والأسبوع والشهر والمخطط اليومي معاً
+            attendance_grid = AttendanceStatsService.aggregate(
+                start_of_month, end_of_month, project_name=project_name
             )
             
-            # 6. إحصائيات الحضور حسب المشروع أو عامة
-            # تعريف قائمة معرفات الموظفين (سيكون None للكل)
-            employee_ids = None
-            
-            if project_name:
-                # استعلام للموظفين في مشروع محدد
-                # نحتاج للحصول على قائمة الموظفين المرتبطين بالمشروع
-                project_employees = db.session.query(Employee.id).filter(
-                    Employee.project == project_name,
-                    Employee.status == 'active'
-                ).all()
-                
-                # تحويل النتائج إلى قائمة بسيطة من المعرفات
-                employee_ids = [emp[0] for emp in project_employees]
-            
-            # تعريف ونهيئة متغيرات إحصائية
-            daily_stats = []
-            weekly_stats = []
-            monthly_stats = []
-            
-            # إذا كان هناك مشروع محدد ولا يوجد موظفين فيه، نترك الإحصائيات فارغة
-            if project_name and not employee_ids:
-                # لا يوجد موظفين في هذا المشروع، نترك الإحصائيات فارغة
-                pass
-            else:
-                # بناء استعلامات الإحصائيات إما لجميع الموظفين أو لموظفي مشروع محدد
-                if employee_ids:
-                    # إحصائيات الموظفين في المشروع المحدد
-                    
-                    # إحصائيات اليوم
-                    daily_stats = query_base.filter(
-                        Attendance.date == today,
-                        Attendance.employee_id.in_(employee_ids)
-                    ).group_by(Attendance.status).all()
-                    
-                    # إحصائيات الأسبوع
-                    weekly_stats = query_base.filter(
-                        Attendance.date >= start_of_week,
-                        Attendance.date <= end_of_week,
-                        Attendance.employee_id.in_(employee_ids)
-                    ).group_by(Attendance.status).all()
-                    
-                    # إحصائيات الشهر
-                    monthly_stats = query_base.filter(
-                        Attendance.date >= start_of_month,
-                        Attendance.date <= end_of_month,
-                        Attendance.employee_id.in_(employee_ids)
-                    ).group_by(Attendance.status).all()
-                else:
-                    # إحصائيات عامة لجميع الموظفين
-                    
-                    # إحصائيات اليوم
-                    daily_stats = query_base.filter(
-                        Attendance.date == today
-                    ).group_by(Attendance.status).all()
-                    
-                    # إحصائيات الأسبوع
-                    weekly_stats = query_base.filter(
-                        Attendance.date >= start_of_week,
-                        Attendance.date <= end_of_week
-                    ).group_by(Attendance.status).all()
-                    
-                    # إحصائيات الشهر
-                    monthly_stats = query_base.filter(
-                        Attendance.date >= start_of_month,
-                        Attendance.date <= end_of_month
-                    ).group_by(Attendance.status).all()
-            
-            # 7. إحصائيات الحضور اليومي خلال الشهر الحالي لعرضها في المخطط البياني
-            daily_attendance_data = []
+            # 6. إحصائيات اليوم والأسبوع والشهر من نفس نتيجة التجميع
+            daily_stats_dict = attendance_grid.for_day(today)
+            weekly_stats_dict = attendance_grid.totals(start_of_week, end_of_week)
+            monthly_stats_dict = attendance_grid.totals(start_of_month, end_of_month)
             
-            for day in range(1, last_day + 1):
-                current_date = date(current_year, current_month, day)
-                
-                # تخطي التواريخ المستقبلية
-                if current_date > today:
-                    break
-                    
-                # استخدام employee_ids مباشرة بعد التأكد من أنه تم تعريفه في خطوة سابقة
-                if employee_ids:
-                    present_count = db.session.query(func.count(Attendance.id)).filter(
-                        Attendance.date == current_date,
-                        Attendance.status == 'present',
-                        Attendance.employee_id.in_(employee_ids)
-                    ).scalar() or 0
-                    
-                    absent_count = db.session.query(func.count(Attendance.id)).filter(
-                        Attendance.date == current_date,
-                        Attendance.status == 'absent',
-                        Attendance.employee_id.in_(employee_ids)
-                    ).scalar() or 0
-                else:
-                    present_count = db.session.query(func.count(Attendance.id)).filter(
-                        Attendance.date == current_date,
-                        Attendance.status == 'present'
-                    ).scalar() or 0
-                    
-                    absent_count = db.session.query(func.count(Attendance.id)).filter(
-                        Attendance.date == current_date,
-                        Attendance.status == 'absent'
-                    ).scalar() or 0
-                    
-                daily_attendance_data.append({
-                    'date': current_date.strftime('%Y-%m-%d'),
-                    'day': str(day),
-                    'present': present_count,
-                    'absent': absent_count
-                })
+            # 7. إحصائيات الحضور اليومي خلال الشهر الحالي لعرضها في المخطط البياني (حتى اليوم)
+            daily_attendance_data = attendance_grid.daily_series(start_of_month, today)
                 
             # 8. الحصول على قائمة المشاريع النشطة للفلتر
             active_projects = db.session.query(Employee.project).filter(
@@ -1201,17 +1011,6 @@ def dashboard():
             
             active_projects = [project[0] for project in active_projects if project[0]]
             
-            # 9. تحويل البيانات إلى قاموس
-            def stats_to_dict(stats_data):
-                result = {'present': 0, 'absent': 0, 'leave': 0, 'sick': 0}
-                for item in stats_data:
-                    result[item[0]] = item[1]
-                return result
-            
-            daily_stats_dict = stats_to_dict(daily_stats)
-            weekly_stats_dict = stats_to_dict(weekly_stats)
-            monthly_stats_dict = stats_to_dict(monthly_stats)
-            
             # 10. إعداد البيانات للمخططات البيانية
             # 10.أ. مخطط توزيع الحضور اليومي
             daily_chart_data = {
@@ -1295,15 +1094,7 @@ def dashboard():
                 daily_attendance_rate = round((daily_stats_dict['present'] / total_days) * 100)
             
             # حساب إجمالي الموظفين النشطين - استخدام علاقة many-to-many الصحيحة
-            if employee_ids:
-                active_employees_count = len(employee_ids)
-            else:
-                # عد الموظفين النشطين المرتبطين بأقسام عبر علاقة many-to-many
-                active_employees_count = db.session.query(func.count(func.distinct(Employee.id))).join(
-                    employee_departments, Employee.id == employee_departments.c.employee_id
-                ).filter(
-                    Employee.status == 'active'
-                ).scalar() or 0
+            active_employees_count = AttendanceStatsService.count_active_employees(project_name=project_name)
             
             # حساب كامل الأسبوع (7 أيام) × عدد الموظفين النشطين
             # حساب عدد الأيام في الأسبوع (من بداية الأسبوع إلى نهايته)
@@ -1496,40 +1287,28 @@ def department_stats():
         # إذا لم يكن مسجل دخوله، عرض جميع الأقسام (للعرض العام)
         departments = Department.query.all()
     
+    # أعداد الموظفين النشطين وأعداد الحضور لكل الأقسام في استعلامين مجمّعين
+    employees_by_department = AttendanceStatsService.count_active_employees_by_department(project_name)
+    attendance_grid = AttendanceStatsService.aggregate(
+        start_date, end_date, project_name=project_name, dimension='department', active_only=True
+    )
+    
     department_stats = []
     
     for dept in departments:
-        # جلب الموظفين النشطين في القسم - استخدام علاقة many-to-many
-        employees = [emp for emp in dept.employees if emp.status == 'active']
-        
-        # فلترة حسب المشروع إذا تم تحديده
-        if project_name:
-            employees = [emp for emp in employees if emp.project == project_name]
-        
-        total_employees = len(employees)
+        total_employees = employees_by_department.get(dept.id, 0)
         
         # عرض جميع الأقسام حتى لو كانت فارغة لضمان الشمولية
         # if total_employees == 0:
         #     continue
         
-        # حساب الإحصائيات
-        employee_ids = [emp.id for emp in employees]
-        
-        # جلب سجلات الحضور للفترة المحددة
-        attendance_records = []
-        if employee_ids:
-            attendance_records = Attendance.query.filter(
-                Attendance.employee_id.in_(employee_ids),
-                Attendance.date >= start_date,
-                Attendance.date <= end_date
-            ).all()
-        
-        # حساب الإحصائيات
-        present_count = sum(1 for record in attendance_records if record.status == 'present')
-        absent_count = sum(1 for record in attendance_records if record.status == 'absent')
-        leave_count = sum(1 for record in attendance_records if record.status == 'leave')
-        sick_count = sum(1 for record in attendance_records if record.status == 'sick')
-        total_records = len(attendance_records)
+        # حساب الإحصائيات من الملخص اليومي
+        dept_counts = attendance_grid.totals(start_date, end_date, dept.id)
+        present_count = dept_counts['present']
+        absent_count = dept_counts['absent']
+        leave_count = dept_counts['leave']
+        sick_count = dept_counts['sick']
+        total_records = sum(dept_counts.values())
         
         # حساب الأيام والسجلات المتوقعة
         working_days = (end_date - start_date).days + 1
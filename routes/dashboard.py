@@ -5,6 +5,7 @@ from flask_login import login_required, current_user
 from models import Employee, Department, Attendance, Document, Salary, Module, UserRole
 from app import db
 from utils.decorators import module_access_required
+from services.document_expiry_service import DocumentExpiryService
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -25,37 +26,9 @@ def index():
     # Get attendance for today
     today_attendance = Attendance.query.filter_by(date=today).count()
     
-    # Get documents statistics
-    all_documents = Document.query.all()
-    total_documents = len(all_documents)
-    
-    # Calculate document expiry statistics
-    valid_documents = 0
-    expired_documents = 0
-    expiring_documents = 0
-    no_expiry_documents = 0
-    
-    for doc in all_documents:
-        if not doc.expiry_date:
-            no_expiry_documents += 1
-            continue
-            
-        days_remaining = (doc.expiry_date - today).days
-        if days_remaining < 0:
-            expired_documents += 1
-        elif days_remaining <= 30:
-            expiring_documents += 1
-        else:
-            valid_documents += 1
-    
-    # Document statistics for template
-    document_stats = {
-        'total': total_documents,
-        'valid': valid_documents,
-        'expired': expired_documents,
-        'expiring': expiring_documents,
-        'no_expiry': no_expiry_documents
-    }
+    # Get documents statistics (single aggregate query)
+    document_stats = DocumentExpiryService.stats(today=today)
+    expiring_documents = document_stats['expiring']
     
     # Get department statistics - only count active employees using many-to-many relationship
     from models import employee_departments
@@ -6,6 +6,7 @@ from app import db
 from models import Department, Employee, SystemAudit, Module, Permission,employee_departments 
 from utils.excel import parse_employee_excel, export_employees_to_excel
 from utils.user_helpers import require_module_access
+from services.employee_import_service import EmployeeImportService
 import io
 from io import BytesIO
 import os
@@ -233,63 +234,19 @@ def import_employees(id):
                 # Parse Excel file
                 employees_data = parse_employee_excel(file)
                 
-                success_count = 0
-                error_count = 0
-                error_details = []
+                # Sanitize strings to ensure they're valid UTF-8
+                for data in employees_data:
+                    for key, value in data.items():
+                        if isinstance(value, str):
+                            data[key] = value.encode('utf-8', errors='replace').decode('utf-8')
                 
-                for index, data in enumerate(employees_data):
-                    try:
-                        # Add department_id to employee data
-                        data['department_id'] = id
-                        
-                        # Sanitize strings to ensure they're valid UTF-8
-                        for key, value in data.items():
-                            if isinstance(value, str):
-                                # Replace any problematic characters that might cause encoding issues
-                                data[key] = value.encode('utf-8', errors='replace').decode('utf-8')
-                        
-                        # Check if employee with same employee_id already exists - safely
-                        try:
-                            employee_id = data.get('employee_id', '')
-                            existing = Employee.query.filter_by(employee_id=employee_id).first()
-                            if existing:
-                                error_count += 1
-                                error_details.append(f"الموظف برقم {employee_id} موجود مسبقا")
-                                continue
-                        except Exception as e:
-                            print(f"Error checking employee_id: {str(e)}")
-                            # Continue processing even if there's an error here
-                            
-                        # Check if employee with same national_id already exists - safely  
-                        try:
-                            national_id = data.get('national_id', '')
-                            existing = Employee.query.filter_by(national_id=national_id).first()
-                            if existing:
-                                error_count += 1
-                                error_details.append(f"الموظف برقم هوية {national_id} موجود مسبقا")
-                                continue
-                        except Exception as e:
-                            print(f"Error checking national_id: {str(e)}")
-                            # Continue processing even if there's an error here
-                        
-                        # Create and save employee
-                        employee = Employee(**data)
-                        db.session.add(employee)
-                        db.session.commit()
-                        success_count += 1
-                    except Exception as e:
-                        db.session.rollback()
-                        error_count += 1
-                        error_details.append(f"خطأ في السجل {index+1}: {str(e)}")
+                # استيراد جماعي للموظفين وربطهم بهذا القسم
+                report = EmployeeImportService.import_employees(employees_data, department_id=id)
                 
                 # Log the import
-                error_detail_str = ", ".join(error_details[:5])
-                if len(error_details) > 5:
-                    error_detail_str += f" وغيرها من الأخطاء..."
-                
-                details = f'تم استيراد {success_count} موظف بنجاح لقسم {department.name} و {error_count} فشل'
-                if error_details:
-                    details += f". أخطاء: {error_detail_str}"
+                details = f'تم استيراد {report.imported} موظف بنجاح لقسم {department.name} و {report.error_count} فشل'
+                if report.errors:
+                    details += f". أخطاء: {report.summary()}"
                     
                 audit = SystemAudit(
                     action='import',
@@ -300,12 +257,14 @@ def import_employees(id):
                 db.session.add(audit)
                 db.session.commit()
                 
-                if error_count > 0:
-                    flash(f'تم استيراد {success_count} موظف بنجاح و {error_count} فشل. {error_detail_str}', 'warning')
+                if report.error_count > 0:
+                    flash(f'تم استيراد {report.imported} موظف بنجاح و {report.error_count} فشل. {report.summary()}', 'warning')
+                    return render_template('departments/import_employees.html', department=department, import_report=report)
                 else:
-                    flash(f'تم استيراد {success_count} موظف بنجاح', 'success')
+                    flash(f'تم استيراد {report.imported} موظف بنجاح', 'success')
                 return redirect(url_for('departments.view', id=id))
             except Exception as e:
+                db.session.rollback()
                 flash(f'حدث خطأ أثناء استيراد الملف: {str(e)}', 'danger')
         else:
             flash('الملف يجب أن يكون بصيغة Excel (.xlsx, .xls)', 'danger')
@@ -4,6 +4,7 @@ from sqlalchemy import func, or_
 from sqlalchemy.orm import selectinload
 from datetime import datetime, timedelta
 import io
+import os
 from io import BytesIO
 import csv
 import xlsxwriter
@@ -18,14 +19,15 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.units import cm
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from reportlab.platypus import PageBreak
 from app import db
 from models import Document, Employee, Department, SystemAudit
-from utils.excel import parse_document_excel
 from utils.date_converter import parse_date, format_date_hijri, format_date_gregorian
 from utils.audit_logger import log_activity
+from services.document_expiry_service import DocumentExpiryService
+from services.job_queue_service import JobQueueService, new_artifact_path
+from routes.jobs import job_started_response
 import json
 
 documents_bp = Blueprint('documents', __name__)
@@ -153,29 +155,26 @@ def document_template_pdf():
         story = []
         
         # العنوان الرئيسي
-        title_text = arabic_reshaper.reshape("نموذج إدارة الوثائق")
-        title_text = get_display(title_text)
+        title_text = shape_arabic("نموذج إدارة الوثائق")
         story.append(Paragraph(title_text, title_style))
         
         # معلومات الشركة
-        company_text = arabic_reshaper.reshape("شركة نُظم لإدارة الموارد البشرية")
-        company_text = get_display(company_text)
+        company_text = shape_arabic("شركة نُظم لإدارة الموارد البشرية")
         story.append(Paragraph(company_text, subtitle_style))
         
         story.append(Spacer(1, 20))
         
         # جدول معلومات الموظف
-        employee_title = arabic_reshaper.reshape("معلومات الموظف")
-        employee_title = get_display(employee_title)
+        employee_title = shape_arabic("معلومات الموظف")
         story.append(Paragraph(employee_title, subtitle_style))
         
         employee_data = [
-            [get_display(arabic_reshaper.reshape("البيان")), get_display(arabic_reshaper.reshape("القيمة"))],
-            [get_display(arabic_reshaper.reshape("اسم الموظف")), "________________________"],
-            [get_display(arabic_reshaper.reshape("رقم الموظف")), "________________________"],
-            [get_display(arabic_reshaper.reshape("رقم الهوية الوطنية")), "________________________"],
-            [get_display(arabic_reshaper.reshape("القسم")), "________________________"],
-            [get_display(arabic_reshaper.reshape("المنصب")), "________________________"]
+            [shape_arabic("البيان"), shape_arabic("القيمة")],
+            [shape_arabic("اسم الموظف"), "________________________"],
+            [shape_arabic("رقم الموظف"), "________________________"],
+            [shape_arabic("رقم الهوية الوطنية"), "________________________"],
+            [shape_arabic("القسم"), "________________________"],
+            [shape_arabic("المنصب"), "________________________"]
         ]
         
         employee_table = Table(employee_data, colWidths=[8*cm, 8*cm])
@@ -185,17 +184,16 @@ def document_template_pdf():
         story.append(Spacer(1, 30))
         
         # جدول معلومات الوثيقة
-        document_title = arabic_reshaper.reshape("معلومات الوثيقة")
-        document_title = get_display(document_title)
+        document_title = shape_arabic("معلومات الوثيقة")
         story.append(Paragraph(document_title, subtitle_style))
         
         document_data = [
-            [get_display(arabic_reshaper.reshape("البيان")), get_display(arabic_reshaper.reshape("القيمة"))],
-            [get_display(arabic_reshaper.reshape("نوع الوثيقة")), "________________________"],
-            [get_display(arabic_reshaper.reshape("رقم الوثيقة")), "________________________"],
-            [get_display(arabic_reshaper.reshape("تاريخ الإصدار")), "________________________"],
-            [get_display(arabic_reshaper.reshape("تاريخ الانتهاء")), "________________________"],
-            [get_display(arabic_reshaper.reshape("الجهة المصدرة")), "________________________"]
+            [shape_arabic("البيان"), shape_arabic("القيمة")],
+            [shape_arabic("نوع الوثيقة"), "________________________"],
+            [shape_arabic("رقم الوثيقة"), "________________________"],
+            [shape_arabic("تاريخ الإصدار"), "________________________"],
+            [shape_arabic("تاريخ الانتهاء"), "________________________"],
+            [shape_arabic("الجهة المصدرة"), "________________________"]
         ]
         
         document_table = Table(document_data, colWidths=[8*cm, 8*cm])
@@ -205,8 +203,7 @@ def document_template_pdf():
         story.append(Spacer(1, 30))
         
         # حقل الملاحظات
-        notes_title = arabic_reshaper.reshape("الملاحظات")
-        notes_title = get_display(notes_title)
+        notes_title = shape_arabic("الملاحظات")
         story.append(Paragraph(notes_title, subtitle_style))
         
         # مساحة فارغة للملاحظات
@@ -221,10 +218,10 @@ def document_template_pdf():
         
         # التوقيعات
         signature_data = [
-            [get_display(arabic_reshaper.reshape("توقيع الموظف")), get_display(arabic_reshaper.reshape("توقيع المسؤول"))],
+            [shape_arabic("توقيع الموظف"), shape_arabic("توقيع المسؤول")],
             ["", ""],
             ["", ""],
-            [get_display(arabic_reshaper.reshape("التاريخ: ___________")), get_display(arabic_reshaper.reshape("التاريخ: ___________"))]
+            [shape_arabic("التاريخ: ___________"), shape_arabic("التاريخ: ___________")]
         ]
         
         signature_table = Table(signature_data, colWidths=[8*cm, 8*cm], rowHeights=[None, 2*cm, None, None])
@@ -1248,37 +1245,14 @@ def import_excel():
         
         if file and file.filename.endswith(('.xlsx', '.xls')):
             try:
-                # Parse Excel file
-                documents_data = parse_document_excel(file)
-                success_count = 0
-                error_count = 0
-                
-                for data in documents_data:
-                    try:
-                        document = Document(**data)
-                        db.session.add(document)
-                        db.session.commit()
-                        success_count += 1
-                    except Exception:
-                        db.session.rollback()
-                        error_count += 1
-                
-                # Log the import
-                audit = SystemAudit(
-                    action='import',
-                    entity_type='document',
-                    entity_id=0,
-                    details=f'تم استيراد {success_count} وثيقة بنجاح و {error_count} فشل',
+                # حفظ الملف وتنفيذ الاستيراد كمهمة خلفية
+                path = new_artifact_path(os.path.splitext(file.filename)[1])
+                file.save(path)
+                job = JobQueueService.enqueue(
+                    'documents.import', {'path': path},
                     user_id=current_user.id if current_user.is_authenticated else None
                 )
-                db.session.add(audit)
-                db.session.commit()
-                
-                if error_count > 0:
-                    flash(f'تم استيراد {success_count} وثيقة بنجاح و {error_count} فشل', 'warning')
-                else:
-                    flash(f'تم استيراد {success_count} وثيقة بنجاح', 'success')
-                return redirect(url_for('documents.index'))
+                return job_started_response(job, url_for('documents.index'))
             except Exception as e:
                 flash(f'حدث خطأ أثناء استيراد الملف: {str(e)}', 'danger')
         else:
@@ -1370,52 +1344,15 @@ def expiring():
 @documents_bp.route('/expiry_stats')
 def expiry_stats():
     """Get document expiry statistics"""
-    # Calculate expiry date ranges
-    today = datetime.now().date()
-    thirty_days = today + timedelta(days=30)
-    sixty_days = today + timedelta(days=60)
-    ninety_days = today + timedelta(days=90)
-    
-    # استبعاد الوثائق التي ليس لها تاريخ انتهاء
-    base_query = Document.query.filter(Document.expiry_date.isnot(None))
-    
-    # Get count of documents expiring in different periods
-    expiring_30 = base_query.filter(
-        Document.expiry_date <= thirty_days,
-        Document.expiry_date >= today
-    ).count()
-    
-    expiring_60 = base_query.filter(
-        Document.expiry_date <= sixty_days,
-        Document.expiry_date > thirty_days
-    ).count()
-    
-    expiring_90 = base_query.filter(
-        Document.expiry_date <= ninety_days,
-        Document.expiry_date > sixty_days
-    ).count()
-    
-    expired = base_query.filter(
-        Document.expiry_date < today
-    ).count()
-    
-    # Get document counts by type
-    type_counts = db.session.query(
-        Document.document_type,
-        func.count(Document.id).label('count')
-    ).group_by(Document.document_type).all()
-    
-    # Format for response
-    type_stats = {}
-    for doc_type, count in type_counts:
-        type_stats[doc_type] = count
+    # Count documents expiring in different periods (single aggregate query)
+    stats = DocumentExpiryService.stats(windows=(30, 60, 90))
     
     return jsonify({
-        'expiring_30': expiring_30,
-        'expiring_60': expiring_60,
-        'expiring_90': expiring_90,
-        'expired': expired,
-        'type_stats': type_stats
+        'expiring_30': stats['expiring_30'],
+        'expiring_60': stats['expiring_60'],
+        'expiring_90': stats['expiring_90'],
+        'expired': stats['expired'],
+        'type_stats': DocumentExpiryService.type_counts()
     })
 
 @documents_bp.route('/employee/<int:employee_id>/export_pdf')
@@ -1494,36 +1431,36 @@ def export_employee_documents_pdf(employee_id):
     # إضافة العنوان
     title = f"وثائق الموظف: {employee.name}"
     # تهيئة النص العربي للعرض في PDF
-    title = get_display(arabic_reshaper.reshape(title))
+    title = shape_arabic(title)
     elements.append(Paragraph(title, title_style))
     elements.append(Spacer(1, 20))
     
     # إضافة بيانات الموظف في جدول
     employee_data = [
-        [get_display(arabic_reshaper.reshape("بيانات الموظف")), "", get_display(arabic_reshaper.reshape("معلومات العمل")), ""],
+        [shape_arabic("بيانات الموظف"), "", shape_arabic("معلومات العمل"), ""],
         [
-            get_display(arabic_reshaper.reshape("الاسم:")), 
-            get_display(arabic_reshaper.reshape(employee.name)), 
-            get_display(arabic_reshaper.reshape("المسمى الوظيفي:")), 
-            get_display(arabic_reshaper.reshape(employee.job_title))
+            shape_arabic("الاسم:"), 
+            shape_arabic(employee.name), 
+            shape_arabic("المسمى الوظيفي:"), 
+            shape_arabic(employee.job_title)
         ],
         [
-            get_display(arabic_reshaper.reshape("الرقم الوظيفي:")), 
+            shape_arabic("الرقم الوظيفي:"), 
             employee.employee_id, 
-            get_display(arabic_reshaper.reshape("القسم:")), 
-            get_display(arabic_reshaper.reshape(', '.join([dept.name for dept in employee.departments]) if employee.departments else '-'))
+            shape_arabic("القسم:"), 
+            shape_arabic(', '.join([dept.name for dept in employee.departments]) if employee.departments else '-')
         ],
         [
-            get_display(arabic_reshaper.reshape("رقم الهوية:")), 
+            shape_arabic("رقم الهوية:"), 
             employee.national_id, 
-            get_display(arabic_reshaper.reshape("الحالة:")), 
-            get_display(arabic_reshaper.reshape(employee.status))
+            shape_arabic("الحالة:"), 
+            shape_arabic(employee.status)
         ],
         [
-            get_display(arabic_reshaper.reshape("رقم الجوال:")), 
+            shape_arabic("رقم الجوال:"), 
             employee.mobile, 
-            get_display(arabic_reshaper.reshape("الموقع:")), 
-            get_display(arabic_reshaper.reshape(employee.location or '-'))
+            shape_arabic("الموقع:"), 
+            shape_arabic(employee.location or '-')
         ]
     ]
     
@@ -1554,18 +1491,18 @@ def export_employee_documents_pdf(employee_id):
     elements.append(Spacer(1, 20))
     
     # إضافة عنوان قائمة الوثائق
-    subtitle = get_display(arabic_reshaper.reshape("قائمة الوثائق"))
+    subtitle = shape_arabic("قائمة الوثائق")
     elements.append(Paragraph(subtitle, subtitle_style))
     elements.append(Spacer(1, 10))
     
     # إنشاء جدول الوثائق
     headers = [
-        get_display(arabic_reshaper.reshape("نوع الوثيقة")),
-        get_display(arabic_reshaper.reshape("رقم الوثيقة")),
-        get_display(arabic_reshaper.reshape("تاريخ الإصدار")),
-        get_display(arabic_reshaper.reshape("تاريخ الانتهاء")),
-        get_display(arabic_reshaper.reshape("الحالة")),
-        get_display(arabic_reshaper.reshape("ملاحظات"))
+        shape_arabic("نوع الوثيقة"),
+        shape_arabic("رقم الوثيقة"),
+        shape_arabic("تاريخ الإصدار"),
+        shape_arabic("تاريخ الانتهاء"),
+        shape_arabic("الحالة"),
+        shape_arabic("ملاحظات")
     ]
     
     data = [headers]
@@ -1599,12 +1536,12 @@ def export_employee_documents_pdf(employee_id):
         
         # إضافة صف للجدول
         row = [
-            get_display(arabic_reshaper.reshape(doc_type_ar)),
+            shape_arabic(doc_type_ar),
             doc_item.document_number,
             format_date_gregorian(doc_item.issue_date),
             format_date_gregorian(doc_item.expiry_date),
-            get_display(arabic_reshaper.reshape(status_text)),
-            get_display(arabic_reshaper.reshape(doc_item.notes or '-'))
+            shape_arabic(status_text),
+            shape_arabic(doc_item.notes or '-')
         ]
         data.append(row)
     
@@ -1651,13 +1588,13 @@ def export_employee_documents_pdf(employee_id):
         elements.append(documents_table)
     else:
         # إذا لم تكن هناك وثائق
-        no_data_text = get_display(arabic_reshaper.reshape("لا توجد وثائق مسجلة لهذا الموظف"))
+        no_data_text = shape_arabic("لا توجد وثائق مسجلة لهذا الموظف")
         elements.append(Paragraph(no_data_text, arabic_style))
     
     # إضافة معلومات التقرير في أسفل الصفحة
     elements.append(Spacer(1, 30))
     footer_text = f"تم إنشاء هذا التقرير بتاريخ: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    footer_text = get_display(arabic_reshaper.reshape(footer_text))
+    footer_text = shape_arabic(footer_text)
     elements.append(Paragraph(footer_text, arabic_style))
     
     # بناء المستند
@@ -5,16 +5,21 @@ from datetime import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
 from werkzeug.utils import secure_filename
 from sqlalchemy.exc import IntegrityError
-from flask_login import login_required
+from flask_login import login_required, current_user
 from app import db
 from models import Employee, Department, SystemAudit, Document, Attendance, Salary, Module, Permission, Vehicle, VehicleHandover,User,Nationality, employee_departments, MobileDevice, DeviceAssignment
 from sqlalchemy import func, or_
 from utils.excel import parse_employee_excel, generate_employee_excel, export_employee_attendance_to_excel
 from utils.date_converter import parse_date
 from utils.user_helpers import require_module_access
-from utils.employee_comprehensive_report_updated import generate_employee_comprehensive_pdf, generate_employee_comprehensive_excel
-from utils.employee_basic_report import generate_employee_basic_pdf
+from utils.employee_comprehensive_report_updated import generate_employee_comprehensive_excel
 from utils.audit_logger import log_activity
+from services.employee_listing_service import EmployeeListingService, DEFAULT_PAGE_SIZE
+from services.employee_import_service import EmployeeImportService
+from services.job_queue_service import JobQueueService
+from services.pdf_render_service import PdfRenderService
+from services.image_pipeline_service import ImagePipelineService
+from routes.jobs import job_started_response
 
 employees_bp = Blueprint('employees', __name__)
 
@@ -56,61 +61,13 @@ def index():
     no_department_filter = request.args.get('no_department', '')
     duplicate_names_filter = request.args.get('duplicate_names', '')
     
-    # بناء الاستعلام الأساسي
-    query = Employee.query.options(
-        db.joinedload(Employee.departments),
-        db.joinedload(Employee.nationality_rel)
-    )
-    
     # فلترة الموظفين حسب القسم المحدد للمستخدم الحالي
     from flask_login import current_user
-    if current_user.assigned_department_id:
-        # إذا كان المستخدم مرتبط بقسم محدد، عرض موظفي ذلك القسم فقط
-        query = query.join(employee_departments).join(Department).filter(Department.id == current_user.assigned_department_id)
-    # إذا لم يكن المستخدم مرتبط بقسم، عرض جميع الموظفين (للمديرين العامين)
-    
-    # تطبيق فلتر القسم (إضافي للفلترة اليدوية)
-    elif department_filter:
-        query = query.join(employee_departments).join(Department).filter(Department.id == department_filter)
-    
-    # تطبيق فلتر الحالة
-    if status_filter:
-        query = query.filter(Employee.status == status_filter)
+    query = EmployeeListingService.filtered_query(request.args, current_user.assigned_department_id)
     
-    # تطبيق فلتر الأسماء المكررة
-    if duplicate_names_filter == 'yes':
-        # البحث عن الأسماء المكررة
-        duplicate_names_subquery = db.session.query(Employee.name, func.count(Employee.name).label('name_count'))\
-                                           .group_by(Employee.name)\
-                                           .having(func.count(Employee.name) > 1)\
-                                           .subquery()
-        query = query.join(duplicate_names_subquery, Employee.name == duplicate_names_subquery.c.name)
-    
-    # تطبيق فلتر الموظفين غير المربوطين بأي قسم
-    if no_department_filter == 'yes':
-        # الموظفين الذين لا يوجد لديهم أي أقسام
-        query = query.outerjoin(employee_departments)\
-                     .filter(employee_departments.c.employee_id.is_(None))
-    elif multi_department_filter == 'yes':
-        # الموظفين الذين لديهم أكثر من قسم
-        subquery = db.session.query(employee_departments.c.employee_id, 
-                                   func.count(employee_departments.c.department_id).label('dept_count'))\
-                            .group_by(employee_departments.c.employee_id)\
-                            .having(func.count(employee_departments.c.department_id) > 1)\
-                            .subquery()
-        query = query.join(subquery, Employee.id == subquery.c.employee_id)
-    elif multi_department_filter == 'no':
-        # الموظفين الذين لديهم قسم واحد فقط أو لا يوجد لديهم أقسام
-        subquery = db.session.query(employee_departments.c.employee_id, 
-                                   func.count(employee_departments.c.department_id).label('dept_count'))\
-                            .group_by(employee_departments.c.employee_id)\
-                            .having(func.count(employee_departments.c.department_id) <= 1)\
-                            .subquery()
-        query = query.outerjoin(subquery, Employee.id == subquery.c.employee_id)\
-                     .filter(or_(subquery.c.employee_id.is_(None), 
-                               subquery.c.dept_count <= 1))
-    
-    employees = query.all()
+    # الصفحة الأولى فقط، وباقي الصفحات تُحمّل من واجهة /employees/api/list
+    employee_page = EmployeeListingService.page(query)
+    total_count = query.order_by(None).count()
     
     # الحصول على الأقسام للفلتر - مفلترة حسب صلاحيات المستخدم
     if current_user.assigned_department_id:
@@ -133,35 +90,61 @@ def index():
                              .filter(employee_departments.c.employee_id.is_(None))\
                              .count()
     
-    # حساب الموظفين بأسماء مكررة - طريقة مبسطة
-    duplicate_names_list = db.session.query(Employee.name)\
-                                    .group_by(Employee.name)\
-                                    .having(func.count(Employee.name) > 1)\
-                                    .all()
-    
-    duplicate_names_count = 0
-    duplicate_names_set = set()
-    for name_tuple in duplicate_names_list:
-        name = name_tuple[0]
-        count = db.session.query(Employee).filter(Employee.name == name).count()
-        duplicate_names_count += count
-        duplicate_names_set.add(name)
+    # حساب الموظفين بأسماء مكررة (استعلام مجمّع واحد)
+    duplicate_names_count = EmployeeListingService.duplicate_names_count()
     
     single_dept_count = db.session.query(Employee).count() - multi_dept_count - no_dept_count
     
     return render_template('employees/index.html', 
-                         employees=employees, 
+                         employees=employee_page.employees, 
+                         total_count=total_count,
+                         next_cursor=employee_page.next_cursor,
                          departments=departments,
                          current_department=department_filter,
                          current_status=status_filter,
                          current_multi_department=multi_department_filter,
                          current_no_department=no_department_filter,
                          current_duplicate_names=duplicate_names_filter,
+                         current_search=request.args.get('q', ''),
                          multi_dept_count=multi_dept_count,
                          single_dept_count=single_dept_count,
                          no_dept_count=no_dept_count,
                          duplicate_names_count=duplicate_names_count,
-                         duplicate_names_set=duplicate_names_set)
+                         duplicate_names_set=employee_page.duplicate_names)
+
+@employees_bp.route('/api/list')
+@login_required
+@require_module_access(Module.EMPLOYEES, Permission.VIEW)
+def api_list():
+    """
+    واجهة JSON لقائمة الموظفين مع البحث والترتيب والتقسيم إلى صفحات بمؤشر
+
+    المعاملات: نفس فلاتر الصفحة إضافة إلى q (بحث)، sort، direction (asc/desc)،
+    limit، cursor (من next_cursor في الاستجابة السابقة).
+    يُرجع الإجمالي total في الصفحة الأولى فقط.
+    """
+    from flask_login import current_user
+    query = EmployeeListingService.filtered_query(request.args, current_user.assigned_department_id)
+    
+    cursor = request.args.get('cursor')
+    employee_page = EmployeeListingService.page(
+        query,
+        sort=request.args.get('sort', 'id'),
+        direction=request.args.get('direction', 'asc'),
+        limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+        cursor=cursor
+    )
+    
+    response = {
+        'items': [EmployeeListingService.serialize(employee, employee_page.duplicate_names)
+                  for employee in employee_page.employees],
+        'next_cursor': employee_page.next_cursor,
+        'has_more': employee_page.has_more
+    }
+    if not cursor:
+        response['total'] = query.order_by(None).count()
+    
+    return jsonify(response)
 
 @employees_bp.route('/create', methods=['GET', 'POST'])
 @login_required
@@ -369,6 +352,7 @@ def edit(id):
                     old_image_path = os.path.join('static', employee.bank_iban_image)
                     if os.path.exists(old_image_path):
                         os.remove(old_image_path)
+                        ImagePipelineService.remove(old_image_path)
                 
                 # حفظ الصورة الجديدة
                 employee.bank_iban_image = save_employee_image(bank_iban_image_file, id, 'iban')
@@ -749,6 +733,7 @@ def upload_iban(id):
                 old_image_path = os.path.join('static', employee.bank_iban_image)
                 if os.path.exists(old_image_path):
                     os.remove(old_image_path)
+                    ImagePipelineService.remove(old_image_path)
             
             # حفظ الصورة الجديدة
             image_path = save_employee_image(iban_file, employee.id, 'iban')
@@ -781,6 +766,7 @@ def delete_iban_image(id):
             image_path = os.path.join('static', employee.bank_iban_image)
             if os.path.exists(image_path):
                 os.remove(image_path)
+                ImagePipelineService.remove(image_path)
             
             # حذف المسار من قاعدة البيانات
             employee.bank_iban_image = None
@@ -877,73 +863,17 @@ def import_excel():
         
         if file and file.filename.endswith(('.xlsx', '.xls')):
             try:
-                print(f"Received file: {file.filename}")
-                
                 # Parse Excel file
                 employees_data = parse_employee_excel(file)
                 print(f"Parsed {len(employees_data)} employee records from Excel")
                 
-                success_count = 0
-                error_count = 0
-                error_details = []
-                
-                for index, data in enumerate(employees_data):
-                    try:
-                        print(f"Processing employee {index+1}: {data.get('name', 'Unknown')}")
-                        
-                        # Check if employee with same employee_id already exists
-                        existing = Employee.query.filter_by(employee_id=data['employee_id']).first()
-                        if existing:
-                            print(f"Employee with ID {data['employee_id']} already exists")
-                            error_count += 1
-                            error_details.append(f"الموظف برقم {data['employee_id']} موجود مسبقا")
-                            continue
-                            
-                        # Check if employee with same national_id already exists
-                        existing = Employee.query.filter_by(national_id=data['national_id']).first()
-                        if existing:
-                            print(f"Employee with national ID {data['national_id']} already exists")
-                            error_count += 1
-                            error_details.append(f"الموظف برقم هوية {data['national_id']} موجود مسبقا")
-                            continue
-                        
-                        # Extract department data separately
-                        department_name = data.pop('department', None)
-                        
-                        # Create employee without department field
-                        employee = Employee(**data)
-                        db.session.add(employee)
-                        db.session.flush()  # Get the ID without committing
-                        
-                        # Handle department assignment if provided
-                        if department_name:
-                            department = Department.query.filter_by(name=department_name).first()
-                            if department:
-                                employee.departments.append(department)
-                            else:
-                                # Create new department if it doesn't exist
-                                new_department = Department(name=department_name)
-                                db.session.add(new_department)
-                                db.session.flush()
-                                employee.departments.append(new_department)
-                        
-                        db.session.commit()
-                        success_count += 1
-                        print(f"Successfully added employee: {data.get('name')}")
-                    except Exception as e:
-                        db.session.rollback()
-                        error_count += 1
-                        print(f"Error adding employee {index+1}: {str(e)}")
-                        error_details.append(f"خطأ في السجل {index+1}: {str(e)}")
+                # استيراد جماعي: فحص التكرار مرة واحدة وإدراج على دفعات
+                report = EmployeeImportService.import_employees(employees_data)
                 
                 # Log the import
-                error_detail_str = ", ".join(error_details[:5])
-                if len(error_details) > 5:
-                    error_detail_str += f" وغيرها من الأخطاء..."
-                
-                details = f'تم استيراد {success_count} موظف بنجاح و {error_count} فشل'
-                if error_details:
-                    details += f". أخطاء: {error_detail_str}"
+                details = f'تم استيراد {report.imported} موظف بنجاح و {report.error_count} فشل'
+                if report.errors:
+                    details += f". أخطاء: {report.summary()}"
                     
                 audit = SystemAudit(
                     action='import',
@@ -954,12 +884,14 @@ def import_excel():
                 db.session.add(audit)
                 db.session.commit()
                 
-                if error_count > 0:
-                    flash(f'تم استيراد {success_count} موظف بنجاح و {error_count} فشل. {error_detail_str}', 'warning')
+                if report.error_count > 0:
+                    flash(f'تم استيراد {report.imported} موظف بنجاح و {report.error_count} فشل. {report.summary()}', 'warning')
+                    return render_template('employees/import.html', import_report=report)
                 else:
-                    flash(f'تم استيراد {success_count} موظف بنجاح', 'success')
+                    flash(f'تم استيراد {report.imported} موظف بنجاح', 'success')
                 return redirect(url_for('employees.index'))
             except Exception as e:
+                db.session.rollback()
                 flash(f'حدث خطأ أثناء استيراد الملف: {str(e)}', 'danger')
         else:
             flash('الملف يجب أن يكون بصيغة Excel (.xlsx, .xls)', 'danger')
@@ -1340,51 +1272,14 @@ def export_excel():
         flash(f'حدث خطأ أثناء تصدير البيانات: {str(e)}', 'danger')
         return redirect(url_for('employees.index'))
 
-@employees_bp.route('/export_comprehensive')
+@employees_bp.route('/export_comprehensive', methods=['POST'])
 @login_required
 @require_module_access(Module.EMPLOYEES, Permission.VIEW)
 def export_comprehensive():
     """تصدير شامل لبيانات الموظفين مع جميع التفاصيل والعُهد والمعلومات البنكية"""
-    try:
-        from utils.basic_comprehensive_export import generate_comprehensive_employee_excel
-        
-        employees = Employee.query.options(
-            db.joinedload(Employee.departments),
-            db.joinedload(Employee.nationality_rel),
-            db.joinedload(Employee.salaries),
-            db.joinedload(Employee.attendances),
-            db.joinedload(Employee.documents)
-        ).all()
-        
-        output = generate_comprehensive_employee_excel(employees)
-        
-        # تسجيل العملية
-        audit = SystemAudit(
-            action='export_comprehensive',
-            entity_type='employee',
-            entity_id=0,
-            details=f'تم التصدير الشامل لبيانات {len(employees)} موظف مع جميع التفاصيل'
-        )
-        db.session.add(audit)
-        db.session.commit()
-        
-        # إنشاء اسم الملف مع التاريخ
-        current_date = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'تصدير_شامل_الموظفين_{current_date}.xlsx'
-        
-        return send_file(
-            output,
-            download_name=filename,
-            as_attachment=True,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        
-    except Exception as e:
-        import traceback
-        print(f"Error in comprehensive export: {str(e)}")
-        print(traceback.format_exc())
-        flash(f'حدث خطأ أثناء التصدير الشامل: {str(e)}', 'danger')
-        return redirect(url_for('employees.index'))
+    # التصدير الشامل يحمّل جميع الموظفين مع سجلاتهم، لذا يُنفذ كمهمة خلفية
+    job = JobQueueService.enqueue('employees.export_comprehensive', user_id=current_user.id)
+    return job_started_response(job, url_for('employees.index'))
         
 @employees_bp.route('/<int:id>/export_attendance_excel')
 @login_required
@@ -1498,6 +1393,7 @@ def upload_image(id):
                 old_file_path = os.path.join('static', old_path)
                 if os.path.exists(old_file_path):
                     os.remove(old_file_path)
+                    ImagePipelineService.remove(old_file_path)
             
             db.session.commit()
             
@@ -1533,7 +1429,8 @@ def basic_report(id):
         
         # إنشاء ملف PDF
         print("استدعاء دالة إنشاء PDF")
-        pdf_buffer = generate_employee_basic_pdf(id)
+        pdf = PdfRenderService.render('employee_basic_report', id)
+        pdf_buffer = BytesIO(pdf) if pdf else None
         print("تم استلام ناتج ملف PDF")
         
         if not pdf_buffer:
@@ -1584,7 +1481,8 @@ def comprehensive_report(id):
         
         # إنشاء ملف PDF
         print("استدعاء دالة إنشاء PDF")
-        output = generate_employee_comprehensive_pdf(id)
+        pdf = PdfRenderService.render('employee_comprehensive_report', id)
+        output = BytesIO(pdf) if pdf else None
         print("تم استلام ناتج ملف PDF")
         
         if not output:
@@ -9,6 +9,8 @@ from app import db
 from models import Department, Employee, Attendance, Salary, Document, SystemAudit
 from utils.date_converter import parse_date, format_date_hijri, format_date_gregorian, get_month_name_ar
 from utils.excel import generate_employee_excel, generate_salary_excel
+from utils.excel_stream import xlsx_response
+from services.pdf_cache_service import cached_pdf_response
 # استخدام مولد PDF البسيط الذي يتجنب مشاكل الترميز
 # from utils.simple_pdf_generator import generate_salary_report_pdf
 # استيراد الدوال المتبقية من الملفات المناسبة
@@ -142,20 +144,17 @@ def salaries_excel():
     else:
         department_name = "جميع الأقسام"
     
-    # الحصول على بيانات الرواتب كقائمة كائنات
-    salaries = salaries_query.all()
+    # تُقرأ الرواتب على دفعات أثناء كتابة الملف
+    salaries = salaries_query.options(
+        db.joinedload(Salary.employee).selectinload(Employee.departments)
+    ).order_by(Salary.id)
     
     try:
         # استدعاء دالة إنشاء ملف Excel
         excel_data = generate_salary_excel(salaries)
         
         # إرجاع البيانات كملف تنزيل
-        return send_file(
-            excel_data,
-            as_attachment=True,
-            download_name=f"salaries_report_{year}_{month}.xlsx",
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        return xlsx_response(excel_data, f"salaries_report_{year}_{month}.xlsx")
     
     except Exception as e:
         # في حالة حدوث خطأ، نسجله ونعرض رسالة خطأ للمستخدم
@@ -194,16 +193,16 @@ def salary_notification_pdf(salary_id):
     }
     
     try:
-        # استدعاء الدالة المحسنة لإنشاء إشعار الراتب
-        pdf_data = generate_salary_notification_pdf(notification_data)
-        
-        # إرجاع البيانات كملف تنزيل
-        return send_file(
-            BytesIO(pdf_data),
-            as_attachment=True,
-            download_name=f"salary_notification_{employee.employee_id}_{salary.month}_{salary.year}.pdf",
-            mimetype='application/pdf'
+        # إرسال الملف المخزن، أو إنشاؤه بالدالة المحسنة عند أول طلب أو بعد تعديل الراتب أو الموظف
+        response = cached_pdf_response(
+            'salary', salary.id, 'salary_notification_enhanced',
+            (salary.updated_at, employee.updated_at, notification_data['department_name']),
+            lambda: generate_salary_notification_pdf(notification_data),
+            download_name=f"salary_notification_{employee.employee_id}_{salary.month}_{salary.year}.pdf"
         )
+        if response is None:
+            raise ValueError('لم يتم إنشاء ملف PDF')
+        return response
     
     except Exception as e:
         # في حالة حدوث خطأ، نسجله ونعرض رسالة خطأ للمستخدم
@@ -11,6 +11,7 @@ register_heif_opener()
 from models import VehicleExternalSafetyCheck, VehicleSafetyImage, Vehicle, Employee, User, UserRole, VehicleHandover
 from app import db
 from utils.audit_logger import log_audit
+from services.image_pipeline_service import ImagePipelineService
 from flask_login import current_user
 from sqlalchemy import func, select
 from sqlalchemy.orm import aliased, contains_eager
@@ -485,8 +486,8 @@ def handle_safety_check_submission(vehicle):
                         elif 'webp' in header:
                             source_format = 'webp'
                         
-                        # دائماً حفظ كـ JPEG للتوافق مع جميع المتصفحات
-                        ext = 'jpg'
+                        # الصيغ التي تعرضها المتصفحات تُحفظ كما هي، و HEIC يُحوَّل إلى JPEG
+                        ext = 'jpg' if source_format == 'heic' else source_format
                         
                         # إنشاء اسم ملف آمن
                         filename = f"{uuid.uuid4()}.{ext}"
@@ -496,12 +497,14 @@ def handle_safety_check_submission(vehicle):
                         with open(image_path, 'wb') as f:
                             f.write(image_bytes)
                         
-                        # ضغط الصورة وتحويلها إلى JPEG
-                        success = compress_image(image_path)
-                        if not success:
-                            current_app.logger.warning(f"فشل ضغط الصورة {filename}")
-                        else:
-                            current_app.logger.info(f"تم تحويل صورة {source_format} إلى JPEG: {filename}")
+                        # تحويل HEIC إلى JPEG فقط، وتوليد النسخ المصغرة خارج الطلب
+                        if source_format == 'heic':
+                            success = compress_image(image_path)
+                            if not success:
+                                current_app.logger.warning(f"فشل ضغط الصورة {filename}")
+                            else:
+                                current_app.logger.info(f"تم تحويل صورة {source_format} إلى JPEG: {filename}")
+                        ImagePipelineService.enqueue(image_path)
                         
                         # حفظ معلومات الصورة في قاعدة البيانات
                         description = notes_list[i] if i < len(notes_list) else None
@@ -1217,6 +1220,7 @@ def delete_external_safety_check(check_id):
                     image_full_path = os.path.join(current_app.root_path, image.image_path)
                     if os.path.exists(image_full_path):
                         os.remove(image_full_path)
+                        ImagePipelineService.remove(image_full_path)
                         current_app.logger.info(f"تم حذف الصورة: {image_full_path}")
             
             # تسجيل العملية قبل الحذف
@@ -1306,6 +1310,7 @@ def delete_safety_check(check_id):
             try:
                 if os.path.exists(image.image_path):
                     os.remove(image.image_path)
+                    ImagePipelineService.remove(image.image_path)
             except Exception as e:
                 current_app.logger.error(f"خطأ في حذف الصورة: {str(e)}")
         
@@ -1354,8 +1359,7 @@ def export_safety_check_pdf(check_id):
         
         # استيراد مكتبات معالجة النصوص العربية
         try:
-            import arabic_reshaper
-            from bidi.algorithm import get_display
+            from utils.arabic_shaping import shape_arabic
             arabic_support = True
         except ImportError:
             arabic_support = False
@@ -1366,9 +1370,7 @@ def export_safety_check_pdf(check_id):
                 return text
             try:
                 # تشكيل النص العربي
-                reshaped_text = arabic_reshaper.reshape(text)
-                # تطبيق خوارزمية الـ bidi للاتجاه الصحيح
-                display_text = get_display(reshaped_text)
+                display_text = shape_arabic(text)
                 return display_text
             except Exception as e:
                 current_app.logger.error(f"خطأ في معالجة النص العربي: {str(e)}")
@@ -1760,6 +1762,7 @@ def bulk_delete_safety_checks():
                         image_full_path = os.path.join(current_app.root_path, image.image_path)
                         if os.path.exists(image_full_path):
                             os.remove(image_full_path)
+                            ImagePipelineService.remove(image_full_path)
                             images_deleted += 1
                             current_app.logger.info(f"تم حذف الصورة: {image_full_path}")
                 
@@ -0,0 +1,118 @@
+"""
+مسارات متابعة المهام الخلفية وتحميل ملفاتها الناتجة
+"""
+import json
+import os
+from functools import wraps
+from urllib.parse import urlparse
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, send_file, abort
+from flask_login import login_required, current_user
+from app import db
+from models import BackgroundJob, UserRole
+from services.background_jobs import REPORT_JOB_ENVIRON_KEY
+from services.job_queue_service import JobQueueService
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+def _get_job_or_404(id):
+    """المهمة المطلوبة إذا كانت للمستخدم الحالي أو كان مدير النظام"""
+    job = db.session.get(BackgroundJob, id)
+    if job is None:
+        abort(404)
+    if job.user_id != current_user.id and current_user.role != UserRole.ADMIN:
+        abort(403)
+    return job
+
+
+def _is_local_url(url):
+    """رابط نسبي داخل الموقع فقط (لا يقبل //host أو /\\host التي تفسرها المتصفحات كروابط خارجية)"""
+    if not url or not url.startswith('/') or url.startswith(('//', '/\\')):
+        return False
+    # المتصفحات تتجاهل محارف التحكم (مثل Tab) داخل الروابط فيصبح /\t/host مكافئاً لـ //host
+    if any(ord(char) < 32 for char in url):
+        return False
+    parsed = urlparse(url.replace('\\', '/'))
+    return not parsed.scheme and not parsed.netloc
+
+
+def job_status(job):
+    """بيانات حالة المهمة للعرض والاستطلاع"""
+    return {
+        'id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.progress_message,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'download_url': url_for('jobs.download', id=job.id) if job.result_path else None,
+        'finished': job.is_finished
+    }
+
+
+def job_started_response(job, return_url=None):
+    """
+    الاستجابة بعد إضافة مهمة: JSON لطلبات AJAX، أو التحويل إلى صفحة متابعة المهمة
+
+    :param job: المهمة المضافة
+    :param return_url: رابط العودة بعد انتهاء المهمة (اختياري)
+    """
+    status_url = url_for('jobs.status', id=job.id)
+    if request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'success': True, 'job_id': job.id, 'status_url': status_url}), 202
+    return redirect(url_for('jobs.view', id=job.id, next=return_url))
+
+
+def pdf_report_job(view):
+    """
+    تنفيذ مسار تقرير PDF كمهمة خلفية
+
+    طلب المستخدم يضيف مهمة 'reports.pdf' بمسار الطلب ومعاملاته ويحوّل إلى صفحة
+    متابعتها، ثم يعيد العامل تنفيذ المسار نفسه فيُنشأ الملف داخل المهمة. يتطلب تسجيل
+    الدخول لأن المهمة وملفها الناتج مرتبطان بصاحبها.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.environ.get(REPORT_JOB_ENVIRON_KEY):
+            return view(*args, **kwargs)
+        job = JobQueueService.enqueue('reports.pdf', {
+            'endpoint': request.endpoint,
+            'path': request.path,
+            'query_string': request.query_string.decode('utf-8', 'replace')
+        }, user_id=current_user.id)
+        return job_started_response(job, url_for('reports.index'))
+    return login_required(wrapper)
+
+
+@jobs_bp.route('/<int:id>')
+@login_required
+def view(id):
+    """صفحة متابعة تقدم المهمة"""
+    job = _get_job_or_404(id)
+    return_url = request.args.get('next')
+    if not _is_local_url(return_url):
+        return_url = None
+    return render_template('jobs/view.html', job=job, status=job_status(job), return_url=return_url)
+
+
+@jobs_bp.route('/<int:id>/status')
+@login_required
+def status(id):
+    """حالة المهمة بصيغة JSON للاستطلاع الدوري"""
+    return jsonify(job_status(_get_job_or_404(id)))
+
+
+@jobs_bp.route('/<int:id>/download')
+@login_required
+def download(id):
+    """تحميل الملف الناتج عن المهمة بعد اكتمالها"""
+    job = _get_job_or_404(id)
+    if job.status != BackgroundJob.STATUS_SUCCEEDED or not job.result_path or not os.path.exists(job.result_path):
+        abort(404)
+    return send_file(
+        job.result_path,
+        as_attachment=True,
+        download_name=job.result_filename or os.path.basename(job.result_path),
+        mimetype=job.result_mimetype
+    )
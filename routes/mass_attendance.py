@@ -9,6 +9,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 
 from app import db
 from models import Department, Employee, Attendance, SystemAudit
+from services.attendance_upsert_service import AttendanceUpsertService, date_range
 
 # تعريف Blueprint للحضور الجماعي
 mass_attendance_bp = Blueprint('mass', __name__)
@@ -48,10 +49,10 @@ def departments():
                 flash('الرجاء إدخال تواريخ صالحة', 'warning')
                 return redirect(url_for('mass.departments'))
             
-            # معالجة كل قسم على حدة
+            # جمع الموظفين النشطين لكل قسم
             dept_count = 0
-            emp_count = 0
-            record_count = 0
+            employee_ids = set()
+            selected_departments = []
             
             for dept_id_str in department_ids:
                 dept_id = int(dept_id_str)
@@ -61,42 +62,17 @@ def departments():
                     continue
                 
                 dept_count += 1
+                selected_departments.append(department)
                 
-                # الحصول على الموظفين النشطين في القسم باستخدام علاقة many-to-many
-                employees = [emp for emp in department.employees if emp.status == 'active']
-                
-                dept_emp_count = len(employees)
-                emp_count += dept_emp_count
-                
-                # تسجيل الحضور لكل موظف لكل يوم
-                current_date = start_date
-                while current_date <= end_date:
-                    for employee in employees:
-                        # البحث عن سجل موجود
-                        existing = Attendance.query.filter_by(
-                            employee_id=employee.id,
-                            date=current_date
-                        ).first()
-                        
-                        if existing:
-                            # تحديث السجل الموجود
-                            existing.status = status
-                            if status != 'present':
-                                existing.check_in = None
-                                existing.check_out = None
-                        else:
-                            # إنشاء سجل جديد
-                            attendance = Attendance()
-                            attendance.employee_id = employee.id
-                            attendance.date = current_date
-                            attendance.status = status
-                            db.session.add(attendance)
-                        
-                        record_count += 1
-                    
-                    # الانتقال لليوم التالي
-                    current_date += timedelta(days=1)
-                
+                # الموظفون النشطون في القسم باستخدام علاقة many-to-many
+                employee_ids.update(emp.id for emp in department.employees if emp.status == 'active')
+            
+            emp_count = len(employee_ids)
+            
+            # تسجيل الحضور لجميع الموظفين في جميع الأيام دفعة واحدة
+            result = AttendanceUpsertService.upsert_grid(employee_ids, date_range(start_date, end_date), status)
+            
+            for department in selected_departments:
                 # تسجيل النشاط في سجل النظام
                 try:
                     SystemAudit.create_audit_record(
@@ -115,7 +91,7 @@ def departments():
             
             # عرض رسالة نجاح
             days_count = (end_date - start_date).days + 1
-            flash(f'تم تسجيل الحضور لـ {dept_count} قسم و {emp_count} موظف خلال {days_count} يوم بإجمالي {record_count} سجل', 'success')
+            flash(f'تم تسجيل الحضور لـ {dept_count} قسم و {emp_count} موظف خلال {days_count} يوم بإجمالي {result.total} سجل ({result.inserted} جديد، {result.updated} محدث)', 'success')
             
             # العودة لصفحة الحضور
             return redirect(url_for('attendance.index'))
@@ -28,6 +28,10 @@ from routes.vehicles import update_vehicle_state, update_vehicle_driver
 from utils.hijri_converter import convert_gregorian_to_hijri, format_hijri_date
 from utils.decorators import module_access_required, permission_required
 from utils.audit_logger import log_activity
+from services.image_pipeline_service import ImagePipelineService
+from utils.image_parts import save_image_part, store_base64_image
+from services.operation_counters_service import OperationCountersService
+from services.operation_query_service import OperationQueryService
 from routes.operations import create_operation_request
 
 # from flask import render_template, request, redirect, url_for, flash
@@ -2117,22 +2121,8 @@ def save_base64_image(base64_string, subfolder):
         return None
 
     try:
-        # إعداد مسار الحفظ
-        upload_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'uploads', subfolder)
-        os.makedirs(upload_folder, exist_ok=True)
-
-        # فك التشفير
-        header, encoded_data = base64_string.split(',', 1)
-        image_data = base64.b64decode(encoded_data)
-
-        # إنشاء اسم ملف فريد وحفظه
-        filename = f"{uuid.uuid4().hex}.png"
-        file_path = os.path.join(upload_folder, filename)
-        with open(file_path, 'wb') as f:
-            f.write(image_data)
-
-        # إرجاع المسار النسبي (مهم لقاعدة البيانات و HTML)
-        return os.path.join(subfolder, filename)
+        # فك التشفير على دفعات إلى الملف مباشرة، وإرجاع المسار النسبي (مهم لقاعدة البيانات و HTML)
+        return store_base64_image(base64_string, subfolder)
 
     except Exception as e:
         print(f"Error saving Base64 image: {e}")
@@ -2163,6 +2153,7 @@ def save_uploaded_file(file, subfolder):
 
         file_path = os.path.join(upload_folder, unique_filename)
         file.save(file_path)
+        ImagePipelineService.enqueue(file_path)
 
         # إرجاع المسار النسبي
         return os.path.join(subfolder, unique_filename)
@@ -2193,6 +2184,9 @@ def save_file(file, folder):
     # تحديد نوع الملف (صورة أو PDF)
     file_type = 'pdf' if filename.lower().endswith('.pdf') else 'image'
 
+    # توليد النسخ المصغرة للصور خارج الطلب
+    ImagePipelineService.enqueue(file_path)
+
     # إرجاع المسار النسبي للملف ونوعه
     return f"uploads/{folder}/{unique_filename}", file_type
 
@@ -2397,10 +2391,10 @@ def create_handover_mobile(vehicle_id):
             handover_date = datetime.strptime(handover_date_str, '%Y-%m-%d').date() if handover_date_str else date.today()
             handover_time = datetime.strptime(handover_time_str, '%H:%M').time() if handover_time_str else None
 
-            saved_diagram_path = save_base64_image(request.form.get('damage_diagram_data'), 'diagrams')
-            saved_supervisor_sig_path = save_base64_image(request.form.get('supervisor_signature_data'), 'signatures')
-            saved_driver_sig_path = save_base64_image(request.form.get('driver_signature_data'), 'signatures')
-            movement_officer_signature_path = save_base64_image(request.form.get('movement_officer_signature_data'), 'signatures') # تصحيح الاسم هنا
+            saved_diagram_path = save_image_part('damage_diagram_data', 'diagrams')
+            saved_supervisor_sig_path = save_image_part('supervisor_signature_data', 'signatures', signature=True)
+            saved_driver_sig_path = save_image_part('driver_signature_data', 'signatures', signature=True)
+            movement_officer_signature_path = save_image_part('movement_officer_signature_data', 'signatures', signature=True) # تصحيح الاسم هنا
             custom_logo_file = request.files.get('custom_logo_file')
             saved_custom_logo_path = save_uploaded_file(custom_logo_file, 'logos')
 
@@ -2591,17 +2585,17 @@ def edit_handover_mobile(handover_id):
             existing_handover.updated_at = datetime.utcnow()
 
             # تحديث الصور والتواقيع فقط إذا تم تقديم بيانات جديدة
-            new_diagram_data = request.form.get('damage_diagram_data')
-            if new_diagram_data: existing_handover.damage_diagram_path = save_base64_image(new_diagram_data, 'diagrams')
+            new_diagram_path = save_image_part('damage_diagram_data', 'diagrams')
+            if new_diagram_path: existing_handover.damage_diagram_path = new_diagram_path
 
-            new_supervisor_sig = request.form.get('supervisor_signature_data')
-            if new_supervisor_sig: existing_handover.supervisor_signature_path = save_base64_image(new_supervisor_sig, 'signatures')
+            new_supervisor_sig_path = save_image_part('supervisor_signature_data', 'signatures', signature=True)
+            if new_supervisor_sig_path: existing_handover.supervisor_signature_path = new_supervisor_sig_path
 
-            new_driver_sig = request.form.get('driver_signature_data')
-            if new_driver_sig: existing_handover.driver_signature_path = save_base64_image(new_driver_sig, 'signatures')
+            new_driver_sig_path = save_image_part('driver_signature_data', 'signatures', signature=True)
+            if new_driver_sig_path: existing_handover.driver_signature_path = new_driver_sig_path
 
-            new_movement_sig = request.form.get('movement_officer_signature_data')
-            if new_movement_sig: existing_handover.movement_officer_signature_path = save_base64_image(new_movement_sig, 'signatures')
+            new_movement_sig_path = save_image_part('movement_officer_signature_data', 'signatures', signature=True)
+            if new_movement_sig_path: existing_handover.movement_officer_signature_path = new_movement_sig_path
 
             # معالجة رفع الملفات الجديدة
             files = request.files.getlist('files')
@@ -3883,8 +3877,9 @@ def add_vehicle_checklist():
                         image_path = os.path.join('uploads', 'vehicles', 'checklists', unique_filename)
                         full_path = os.path.join(app.static_folder, image_path)
 
-                        # حفظ الصورة
+                        # حفظ الصورة، وتوليد النسخ المصغرة خارج الطلب
                         image.save(full_path)
+                        ImagePipelineService.enqueue(full_path)
 
                         # الحصول على وصف الصورة (إذا وجد)
                         description_key = f'image_description_{i}'
@@ -4953,6 +4948,7 @@ def add_workshop_record(vehicle_id):
                     os.makedirs(folder_path, exist_ok=True)
                     image_path = os.path.join(folder_path, unique_filename)
                     image.save(image_path)
+                    ImagePipelineService.enqueue(image_path)
 
                     # إنشاء سجل الصورة
                     workshop_image = VehicleWorkshopImage(
@@ -4974,6 +4970,7 @@ def add_workshop_record(vehicle_id):
                     os.makedirs(folder_path, exist_ok=True)
                     image_path = os.path.join(folder_path, unique_filename)
                     image.save(image_path)
+                    ImagePipelineService.enqueue(image_path)
 
                     # إنشاء سجل الصورة
                     workshop_image = VehicleWorkshopImage(
@@ -5096,7 +5093,6 @@ def edit_workshop_record(workshop_id):
 
             # معالجة الصور المرفوعة
             import os
-            from PIL import Image
             import uuid
 
             uploaded_images = []
@@ -5116,18 +5112,10 @@ def edit_workshop_record(workshop_id):
                                 upload_dir = os.path.join('static', 'uploads', 'workshop')
                                 os.makedirs(upload_dir, exist_ok=True)
                                 
-                                # حفظ الملف
+                                # حفظ الملف، وتوليد النسخ المصغرة خارج الطلب
                                 file_path = os.path.join(upload_dir, filename)
                                 file.save(file_path)
-                                
-                                # ضغط الصورة إذا كانت كبيرة
-                                try:
-                                    with Image.open(file_path) as img:
-                                        if img.width > 1200 or img.height > 1200:
-                                            img.thumbnail((1200, 1200), Image.Resampling.LANCZOS)
-                                            img.save(file_path, optimize=True, quality=85)
-                                except Exception as e:
-                                    current_app.logger.warning(f"تعذر ضغط الصورة {filename}: {str(e)}")
+                                ImagePipelineService.enqueue(file_path)
                                 
                                 # إضافة سجل الصورة لقاعدة البيانات
                                 image_record = VehicleWorkshopImage(
@@ -5161,19 +5149,10 @@ def edit_workshop_record(workshop_id):
                             upload_dir = os.path.join('static', 'uploads', 'workshop', 'receipts')
                             os.makedirs(upload_dir, exist_ok=True)
                             
-                            # حفظ الملف
+                            # حفظ الملف، وتوليد النسخ المصغرة للصور خارج الطلب
                             file_path = os.path.join(upload_dir, filename)
                             file.save(file_path)
-                            
-                            # ضغط الصورة إذا كانت صورة وكبيرة
-                            if file_ext in {'png', 'jpg', 'jpeg', 'gif'}:
-                                try:
-                                    with Image.open(file_path) as img:
-                                        if img.width > 1200 or img.height > 1200:
-                                            img.thumbnail((1200, 1200), Image.Resampling.LANCZOS)
-                                            img.save(file_path, optimize=True, quality=85)
-                                except Exception as e:
-                                    current_app.logger.warning(f"تعذر ضغط الصورة {filename}: {str(e)}")
+                            ImagePipelineService.enqueue(file_path)
                             
                             return f"uploads/workshop/receipts/{filename}"
                         
@@ -5699,11 +5678,13 @@ def delete_handover(handover_id):
             if image.file_path and os.path.exists(os.path.join('static', image.file_path)):
                 try:
                     os.remove(os.path.join('static', image.file_path))
+                    ImagePipelineService.remove(os.path.join('static', image.file_path))
                 except:
                     pass
             if image.image_path and os.path.exists(os.path.join('static', image.image_path)):
                 try:
                     os.remove(os.path.join('static', image.image_path))
+                    ImagePipelineService.remove(os.path.join('static', image.image_path))
                 except:
                     pass
             db.session.delete(image)
@@ -5864,30 +5845,12 @@ def operations_dashboard():
         flash('غير مسموح لك بالوصول لهذه الصفحة', 'danger')
         return redirect(url_for('mobile.dashboard'))
 
-    # استلام قيمة البحث من رابط URL
+    # أحدث العمليات المعلقة مع البحث برقم اللوحة
     search_plate = request.args.get('search_plate', '').strip()
+    pending_requests = OperationQueryService.pending(search_plate)
 
-    # بناء استعلام العمليات المعلقة
-    pending_query = OperationRequest.query.filter_by(status='pending')
-
-    # تطبيق فلتر البحث (إذا تم إدخال قيمة)
-    if search_plate:
-        pending_query = pending_query.join(Vehicle).filter(Vehicle.plate_number.ilike(f"%{search_plate}%"))
-
-    # تنفيذ الاستعلام النهائي
-    pending_requests = pending_query.order_by(
-        OperationRequest.priority.desc(),
-        OperationRequest.requested_at.desc()
-    ).limit(10).all()
-
-    # إحصائيات العمليات
-    stats = {
-        'pending': OperationRequest.query.filter_by(status='pending').count(),
-        'under_review': OperationRequest.query.filter_by(status='under_review').count(),
-        'approved': OperationRequest.query.filter_by(status='approved').count(),
-        'rejected': OperationRequest.query.filter_by(status='rejected').count(),
-        'unread_notifications': OperationNotification.query.filter_by(user_id=current_user.id, is_read=False).count() if hasattr(current_user, 'id') else 0
-    }
+    # إحصائيات العمليات من العدادات المشتركة
+    _, stats = OperationCountersService.snapshot(current_user.id)
 
     return render_template('mobile/operations.html', 
                          stats=stats, 
@@ -5909,34 +5872,18 @@ def operations_list():
     priority_filter = request.args.get('priority', 'all')
     vehicle_search = request.args.get('vehicle_search', '').strip()
     
-    query = OperationRequest.query
-    
-    if status_filter != 'all':
-        query = query.filter_by(status=status_filter)
-    
-    if operation_type_filter != 'all':
-        query = query.filter_by(operation_type=operation_type_filter)
-    
-    if priority_filter != 'all':
-        query = query.filter_by(priority=priority_filter)
-    
-    # البحث حسب السيارة أو المحتوى
-    if vehicle_search:
-        query = query.filter(
-            or_(
-                OperationRequest.title.contains(vehicle_search),
-                OperationRequest.description.contains(vehicle_search)
-            )
-        )
-    
-    # ترتيب العمليات
-    operations = query.order_by(
-        OperationRequest.priority.desc(),
-        OperationRequest.requested_at.desc()
-    ).all()
+    # صفحة واحدة بمؤشر بدلاً من تحميل جميع العمليات، والبحث برقم لوحة السيارة
+    query = OperationQueryService.filtered_query({
+        'status': status_filter,
+        'operation_type': operation_type_filter,
+        'priority': priority_filter,
+        'vehicle_search': vehicle_search
+    })
+    operation_page = OperationQueryService.page(query, cursor=request.args.get('cursor'))
     
     return render_template('mobile/operations_list.html', 
-                         operations=operations,
+                         operations=operation_page.operations,
+                         next_cursor=operation_page.next_cursor,
                          status_filter=status_filter,
                          operation_type_filter=operation_type_filter,
                          priority_filter=priority_filter,
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 from app import db
 from models import (OperationRequest, OperationNotification, VehicleHandover, 
@@ -6,6 +6,9 @@ from models import (OperationRequest, OperationNotification, VehicleHandover,
                    Vehicle, User, UserRole, Employee)
 from datetime import datetime
 from utils.audit_logger import log_audit
+from services.operation_counters_service import OperationCountersService
+from services.notification_fanout_service import NotificationFanoutService
+from services.operation_query_service import OperationQueryService
 
 
 
@@ -49,8 +52,6 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-import arabic_reshaper
-from bidi.algorithm import get_display
 # from utils.fpdf_handover_pdf import generate_handover_report_pdf
 # ============ تأكد من وجود هذه الاستيرادات في أعلى الملف ============
 from datetime import date
@@ -255,35 +256,12 @@ def operations_dashboard():
         flash('غير مسموح لك بالوصول لهذه الصفحة', 'danger')
         return redirect(url_for('dashboard.index'))
 
-    # === بداية التعديلات ===
-
-    # 1. استلام قيمة البحث من رابط URL
+    # أحدث العمليات المعلقة مع البحث برقم اللوحة
     search_plate = request.args.get('search_plate', '').strip()
+    pending_requests = OperationQueryService.pending(search_plate)
 
-    # 2. بناء استعلام العمليات المعلقة
-    pending_query = OperationRequest.query.filter_by(status='pending')
-
-    # 3. تطبيق فلتر البحث (إذا تم إدخال قيمة)
-    if search_plate:
-        # للانضمام مع جدول المركبات والبحث في حقل رقم اللوحة
-        pending_query = pending_query.join(Vehicle).filter(Vehicle.plate_number.ilike(f"%{search_plate}%"))
-
-    # 4. تنفيذ الاستعلام النهائي
-    pending_requests = pending_query.order_by(
-        OperationRequest.priority.desc(),
-        OperationRequest.requested_at.desc()
-    ).limit(10).all()
-
-    # === نهاية التعديلات ===
-
-    # إحصائيات العمليات (تبقى كما هي)
-    stats = {
-        'pending': OperationRequest.query.filter_by(status='pending').count(),
-        'under_review': OperationRequest.query.filter_by(status='under_review').count(),
-        'approved': OperationRequest.query.filter_by(status='approved').count(),
-        'rejected': OperationRequest.query.filter_by(status='rejected').count(),
-        'unread_notifications': OperationNotification.query.filter_by(user_id=current_user.id, is_read=False).count()
-    }
+    # إحصائيات العمليات من العدادات المشتركة
+    _, stats = OperationCountersService.snapshot(current_user.id)
 
     return render_template('operations/dashboard.html', 
                          stats=stats, 
@@ -303,33 +281,18 @@ def operations_list():
     priority_filter = request.args.get('priority', 'all')
     vehicle_search = request.args.get('vehicle_search', '').strip()
     
-    query = OperationRequest.query
-    
-    if status_filter != 'all':
-        query = query.filter_by(status=status_filter)
-    
-    if operation_type_filter != 'all':
-        query = query.filter_by(operation_type=operation_type_filter)
-    
-    if priority_filter != 'all':
-        query = query.filter_by(priority=priority_filter)
-    
-    # البحث حسب السيارة
-    if vehicle_search:
-        # البحث في عنوان العملية أو الوصف حيث يتم ذكر رقم السيارة عادة
-        query = query.filter(
-            OperationRequest.title.contains(vehicle_search) |
-            OperationRequest.description.contains(vehicle_search)
-        )
-    
-    # ترتيب العمليات
-    operations = query.order_by(
-        OperationRequest.priority.desc(),
-        OperationRequest.requested_at.desc()
-    ).all()
+    # صفحة واحدة بمؤشر بدلاً من تحميل جميع العمليات، والبحث برقم لوحة السيارة
+    query = OperationQueryService.filtered_query({
+        'status': status_filter,
+        'operation_type': operation_type_filter,
+        'priority': priority_filter,
+        'vehicle_search': vehicle_search
+    })
+    operation_page = OperationQueryService.page(query, cursor=request.args.get('cursor'))
     
     return render_template('operations/list.html', 
-                         operations=operations,
+                         operations=operation_page.operations,
+                         next_cursor=operation_page.next_cursor,
                          status_filter=status_filter,
                          operation_type_filter=operation_type_filter,
                          priority_filter=priority_filter,
@@ -818,16 +781,13 @@ def create_operation_request(operation_type, related_record_id, vehicle_id,
         db.session.add(operation)
         db.session.flush()  # للحصول على ID
         
-        # إنشاء إشعارات للمديرين
-        admins = User.query.filter_by(role=UserRole.ADMIN).all()
-        for admin in admins:
-            create_notification(
-                operation_id=operation.id,
-                user_id=admin.id,
-                notification_type='new_operation',
-                title=f'عملية جديدة تحتاج موافقة: {title}',
-                message=f'عملية جديدة من نوع {get_operation_type_name(operation_type)} تحتاج للمراجعة والموافقة.'
-            )
+        # إنشاء إشعارات للمديرين (جملة إدراج واحدة، أو مهمة خلفية)
+        NotificationFanoutService.notify_admins(
+            operation_id=operation.id,
+            notification_type='new_operation',
+            title=f'عملية جديدة تحتاج موافقة: {title}',
+            message=f'عملية جديدة من نوع {get_operation_type_name(operation_type)} تحتاج للمراجعة والموافقة.'
+        )
         
         # لا نحفظ هنا، الدالة المستدعية مسؤولة عن الحفظ
         return operation
@@ -866,15 +826,12 @@ def get_operation_type_name(operation_type):
 # دالة مساعدة للحصول على عدد العمليات المعلقة للمدير
 def get_pending_operations_count():
     """الحصول على عدد العمليات المعلقة"""
-    return OperationRequest.query.filter_by(status='pending').count()
+    return OperationQueryService.status_counts()['pending']
 
 # دالة مساعدة للحصول على عدد الإشعارات غير المقروءة
 def get_unread_notifications_count(user_id):
     """الحصول على عدد الإشعارات غير المقروءة للمستخدم"""
-    return OperationNotification.query.filter_by(
-        user_id=user_id, 
-        is_read=False
-    ).count()
+    return OperationQueryService.unread_count(user_id)
 
 @operations_bp.route('/api/count')
 @login_required
@@ -884,14 +841,37 @@ def api_operations_count():
     if current_user.role != UserRole.ADMIN:
         return jsonify({'error': 'غير مسموح'})
     
-    pending_count = OperationRequest.query.filter_by(status='pending').count()
-    under_review_count = OperationRequest.query.filter_by(status='under_review').count()
+    # العدادات المشتركة في الذاكرة (تُحدَّث عند أي تعديل على العمليات أو الإشعارات)
+    _, counts = OperationCountersService.snapshot(current_user.id)
+    return jsonify(counts)
+
+@operations_bp.route('/api/stream')
+@login_required
+def api_operations_stream():
+    """بث إحصائيات العمليات عند تغيرها (Server-Sent Events)"""
+    
+    if current_user.role != UserRole.ADMIN:
+        return jsonify({'error': 'غير مسموح'}), 403
     
-    return jsonify({
-        'pending': pending_count,
-        'under_review': under_review_count,
-        'unread_notifications': get_unread_notifications_count(current_user.id)
-    })
+    # عند امتلاء الاتصالات: 204 يوقف EventSource فتعود الصفحة إلى /api/count
+    if not OperationCountersService.acquire_stream(current_app.config.get('OPERATIONS_SSE_MAX_STREAMS', 4)):
+        return '', 204
+    
+    user_id = current_user.id
+    # البث لا يستخدم جلسة الطلب (العدادات تُقرأ باتصال مستقل)، فيُعاد اتصالها إلى المجمع
+    # بدلاً من بقائه محجوزاً داخل معاملة طوال مدة البث
+    db.session.remove()
+    
+    response = Response(
+        stream_with_context(OperationCountersService.stream(user_id)),
+        mimetype='text/event-stream'
+    )
+    # يُحرر المكان عند إغلاق الاستجابة حتى لو انقطع الاتصال قبل بدء المولّد
+    response.call_on_close(OperationCountersService.release_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    # تعطيل التخزين المؤقت في nginx حتى تصل الأحداث فوراً
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @operations_bp.route('/<int:operation_id>/export-excel')
 @login_required
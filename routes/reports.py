@@ -8,12 +8,13 @@ from app import db
 from models import Department, Employee, Attendance, Salary, Document, SystemAudit, Vehicle, Fee, VehicleChecklist, VehicleDamageMarker, VehicleChecklistImage
 from utils.date_converter import parse_date, format_date_hijri, format_date_gregorian, get_month_name_ar
 from utils.excel import generate_employee_excel, generate_salary_excel
+from services.pdf_cache_service import cached_pdf_response
+from routes.jobs import pdf_report_job
 from utils.vehicles_export import export_vehicle_pdf, export_vehicle_excel
 from utils.pdf_generator import generate_salary_report_pdf
 from utils.vehicle_checklist_pdf import create_vehicle_checklist_pdf
 # إضافة الاستيرادات المفقودة
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from reportlab.lib import colors
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4, landscape
@@ -52,6 +53,7 @@ def export_vehicles_report(export_type):
         return redirect(url_for('mobile.report_vehicles'))
 
 
+# تقرير فحص واحد صغير ومخزن مؤقتاً (cached_pdf_response)، لذا يبقى متزامناً بخلاف تقارير PDF المجمعة
 @reports_bp.route('/vehicle_checklist/<int:checklist_id>/pdf')
 @login_required
 def vehicle_checklist_pdf(checklist_id):
@@ -73,33 +75,38 @@ def vehicle_checklist_pdf(checklist_id):
             # إضافة تحذير في بداية التقرير ولكن السماح بعرض التشك لست التاريخي
             print(f"تحذير: {restrictions['message']}")
         
-        # جمع بيانات عناصر الفحص مرتبة حسب الفئة
-        checklist_items = {}
-        for item in checklist.checklist_items:
-            if item.category not in checklist_items:
-                checklist_items[item.category] = []
+        def render():
+            # جمع بيانات عناصر الفحص مرتبة حسب الفئة
+            checklist_items = {}
+            for item in checklist.checklist_items:
+                if item.category not in checklist_items:
+                    checklist_items[item.category] = []
+                
+                checklist_items[item.category].append(item)
             
-            checklist_items[item.category].append(item)
-        
-        # الحصول على علامات التلف المرتبطة بهذا الفحص
-        damage_markers = VehicleDamageMarker.query.filter_by(checklist_id=checklist_id).all()
-        
-        # الحصول على صور الفحص المرفقة
-        checklist_images = VehicleChecklistImage.query.filter_by(checklist_id=checklist_id).all()
+            # الحصول على علامات التلف المرتبطة بهذا الفحص
+            damage_markers = VehicleDamageMarker.query.filter_by(checklist_id=checklist_id).all()
+            
+            # الحصول على صور الفحص المرفقة
+            checklist_images = VehicleChecklistImage.query.filter_by(checklist_id=checklist_id).all()
+            
+            return create_vehicle_checklist_pdf(
+                checklist=checklist,
+                vehicle=vehicle,
+                checklist_items=checklist_items,
+                damage_markers=damage_markers,
+                checklist_images=checklist_images
+            )
         
-        # إنشاء ملف PDF
-        pdf_buffer = create_vehicle_checklist_pdf(
-            checklist=checklist,
-            vehicle=vehicle,
-            checklist_items=checklist_items,
-            damage_markers=damage_markers,
-            checklist_images=checklist_images
+        # إرسال الملف المخزن، أو إنشاؤه عند أول طلب أو بعد تعديل الفحص أو عناصره أو صوره
+        response = cached_pdf_response(
+            'vehicle_checklist', checklist.id, 'vehicle_checklist',
+            (checklist.updated_at, vehicle.updated_at),
+            render,
+            download_name=f'vehicle_checklist_{checklist_id}.pdf'
         )
-        
-        # إنشاء استجابة تحميل للملف
-        response = make_response(pdf_buffer.getvalue())
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename=vehicle_checklist_{checklist_id}.pdf'
+        if response is None:
+            raise ValueError('لم يتم إنشاء ملف PDF')
         
         return response
         
@@ -156,6 +163,7 @@ def export_employees_report(export_type):
 # دوال متعلقة بتصدير السيارات
 @reports_bp.route('/vehicles/pdf')
 @login_required
+@pdf_report_job
 def vehicles_pdf():
     """تصدير تقرير المركبات إلى PDF"""
     # الحصول على معلمات الفلتر
@@ -278,6 +286,7 @@ def vehicles_excel():
 
 @reports_bp.route('/fees/pdf')
 @login_required
+@pdf_report_job
 def fees_pdf():
     """تصدير تقرير الرسوم إلى PDF"""
     # الحصول على معلمات الفلتر
@@ -608,6 +617,7 @@ def employees_report():
                           status=status)
 
 @reports_bp.route('/employees/pdf')
+@pdf_report_job
 def employees_pdf():
     """تصدير تقرير الموظفين إلى PDF"""
     department_id = request.args.get('department_id', '')
@@ -781,6 +791,7 @@ def attendance_report():
                         format_date_hijri=format_date_hijri)
 
 @reports_bp.route('/attendance/pdf')
+@pdf_report_job
 def attendance_pdf():
     """تصدير تقرير الحضور إلى PDF"""
     # الحصول على معلمات الفلتر
@@ -881,13 +892,13 @@ def attendance_pdf():
     # إضافة العنوان
     title = f"تقرير الحضور والغياب - {department_name} - {status_name}"
     # تهيئة النص العربي للعرض في PDF
-    title = get_display(arabic_reshaper.reshape(title))
+    title = shape_arabic(title)
     elements.append(Paragraph(title, title_style))
     elements.append(Spacer(1, 10))
     
     # إضافة نطاق التاريخ
     date_range = f"الفترة من: {format_date_gregorian(from_date)} إلى: {format_date_gregorian(to_date)}"
-    date_range = get_display(arabic_reshaper.reshape(date_range))
+    date_range = shape_arabic(date_range)
     elements.append(Paragraph(date_range, arabic_style))
     elements.append(Spacer(1, 20))
     
@@ -896,7 +907,7 @@ def attendance_pdf():
     data = []
     
     # إضافة الرؤوس
-    headers_display = [get_display(arabic_reshaper.reshape(h)) for h in headers]
+    headers_display = [shape_arabic(h) for h in headers]
     data.append(headers_display)
     
     # إضافة بيانات الحضور
@@ -914,12 +925,12 @@ def attendance_pdf():
         
         row = [
             format_date_gregorian(attendance.date),
-            get_display(arabic_reshaper.reshape(employee.name)),
+            shape_arabic(employee.name),
             employee.employee_id,
             str(attendance.check_in) if attendance.check_in else "---",
             str(attendance.check_out) if attendance.check_out else "---",
-            get_display(arabic_reshaper.reshape(status_text)),
-            get_display(arabic_reshaper.reshape(department_name))
+            shape_arabic(status_text),
+            shape_arabic(department_name)
         ]
         data.append(row)
     
@@ -953,13 +964,13 @@ def attendance_pdf():
         table.setStyle(table_style)
         elements.append(table)
     else:
-        no_data_text = get_display(arabic_reshaper.reshape("لا توجد بيانات متاحة"))
+        no_data_text = shape_arabic("لا توجد بيانات متاحة")
         elements.append(Paragraph(no_data_text, arabic_style))
     
     # إضافة معلومات التقرير في أسفل الصفحة
     elements.append(Spacer(1, 20))
     footer_text = f"تاريخ إنشاء التقرير: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    footer_text = get_display(arabic_reshaper.reshape(footer_text))
+    footer_text = shape_arabic(footer_text)
     elements.append(Paragraph(footer_text, arabic_style))
     
     # بناء المستند
@@ -1184,6 +1195,7 @@ def salaries_report():
                         month_name=get_month_name_ar(month))
 
 @reports_bp.route('/salaries/pdf')
+@pdf_report_job
 def salaries_pdf():
     """تصدير تقرير الرواتب إلى PDF"""
     # استخدام توليد التقارير عبر وحدة utils.pdf_generator
@@ -1253,6 +1265,7 @@ def salaries_pdf():
     )
 
 @reports_bp.route('/salaries/pdf')
+@pdf_report_job
 def salaries_report_pdf():
     """
     إنشاء تقرير PDF شامل للرواتب بناءً على الفلاتر.
@@ -1536,6 +1549,7 @@ def documents_report():
                         format_date_hijri=format_date_hijri)
 
 @reports_bp.route('/documents/pdf')
+@pdf_report_job
 def documents_pdf():
     """تصدير تقرير الوثائق إلى PDF"""
     # الحصول على معلمات الفلتر
@@ -1,13 +1,21 @@
 import pandas as pd
 from io import BytesIO
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask_login import current_user
 from werkzeug.utils import secure_filename
 from sqlalchemy import func
 from datetime import datetime
 from app import db
 from models import Salary, Employee, Department, SystemAudit
 from utils.audit_logger import log_activity
-from utils.excel import parse_salary_excel, generate_salary_excel, generate_comprehensive_employee_report, generate_employee_salary_simple_excel
+from services.job_queue_service import JobQueueService
+from routes.jobs import job_started_response
+from services.pdf_cache_service import cached_pdf_response
+from services.pdf_render_service import PdfRenderService
+from services.salary_import_service import SalaryImportService
+from services.salary_worksheet_service import SalaryWorksheetService, parse_amount
+from utils.excel import read_salary_frame, generate_salary_excel, generate_comprehensive_employee_report, generate_employee_salary_simple_excel
+from utils.excel_stream import xlsx_response
 # from utils.simple_pdf_generator import create_vehicle_handover_pdf as generate_salary_report_pdf
 # from utils.reports import generate_salary_report_pdf
 # from utils.salary_pdf_generator import
@@ -16,11 +24,9 @@ from utils.ultra_safe_pdf import create_ultra_safe_salary_pdf
 from utils.salary_pdf_generator import generate_salary_summary_pdf
 from utils.salary_report_pdf import generate_salary_report_pdf
 
-from utils.salary_notification import generate_salary_notification_pdf, generate_batch_salary_notifications
 from utils.whatsapp_notification import (
     send_salary_notification_whatsapp, 
     send_salary_deduction_notification_whatsapp,
-    send_batch_salary_notifications_whatsapp,
     send_batch_deduction_notifications_whatsapp
 )
 
@@ -70,8 +76,10 @@ def index():
         filter_employee = int(employee_id) if employee_id and employee_id.isdigit() else None
         filter_department = int(department_id) if department_id and department_id.isdigit() else None
         
-        # بناء الاستعلام الأساسي
-        query = Salary.query
+        # بناء الاستعلام الأساسي مع تحميل الموظف وأقسامه مسبقاً بدلاً من تحميلها لكل صف في القالب
+        query = Salary.query.options(
+            db.joinedload(Salary.employee).selectinload(Employee.departments)
+        )
         
         # إضافة فلتر الشهر (فقط إذا لم يطلب المستخدم كل الشهور)
         if not show_all_months:
@@ -107,7 +115,9 @@ def index():
         
         if should_show_employees_for_input:
             # الحصول على قائمة الموظفين النشطين
-            active_employees_query = Employee.query.filter_by(status='active')
+            active_employees_query = Employee.query.filter_by(status='active').options(
+                db.selectinload(Employee.departments)
+            )
             
             # إذا تم تحديد قسم، قم بتصفية الموظفين حسب القسم
             if filter_department:
@@ -461,68 +471,18 @@ def save_all_smart():
         if not salaries_data:
             return {'success': False, 'message': 'لا توجد بيانات للحفظ'}
         
-        saved_count = 0
-        
-        for salary_data in salaries_data:
-            employee_id = salary_data.get('employee_id')
-            month = int(salary_data.get('month'))
-            year = int(salary_data.get('year'))
-            
-            # التحقق من وجود سجل سابق
-            existing_salary = Salary.query.filter_by(
-                employee_id=employee_id,
-                month=month,
-                year=year
-            ).first()
-            
-            if existing_salary:
-                continue  # تخطي إذا كان موجود
-            
-            # معالجة القيم
-            def parse_value(value):
-                if value and str(value).strip():
-                    try:
-                        return float(value)
-                    except (ValueError, TypeError):
-                        return None
-                return None
-            
-            basic_salary = parse_value(salary_data.get('basic_salary'))
-            allowances = parse_value(salary_data.get('allowances'))
-            deductions = parse_value(salary_data.get('deductions'))
-            bonus = parse_value(salary_data.get('bonus'))
-            
-            # يجب أن يكون الراتب الأساسي موجود
-            if basic_salary is None:
-                continue
-            
-            # حساب صافي الراتب
-            net_salary = basic_salary
-            if allowances is not None:
-                net_salary += allowances
-            if bonus is not None:
-                net_salary += bonus
-            if deductions is not None:
-                net_salary -= deductions
-            
-            # إنشاء سجل الراتب
-            new_salary = Salary(
-                employee_id=employee_id,
-                month=month,
-                year=year,
-                basic_salary=basic_salary,
-                allowances=allowances,
-                deductions=deductions,
-                bonus=bonus,
-                net_salary=net_salary
-            )
-            
-            db.session.add(new_salary)
-            saved_count += 1
-        
+        # حفظ جميع الصفوف بجمل UPSERT مجمّعة على (الموظف، السنة، الشهر)
+        result = SalaryWorksheetService.save_rows(salaries_data)
         db.session.commit()
         
-        return {'success': True, 'message': f'تم حفظ {saved_count} راتب بنجاح', 'saved_count': saved_count}
+        return {
+            'success': True,
+            'message': f'تم حفظ {result.total} راتب بنجاح',
+            'saved_count': result.total,
+            'inserted_count': result.inserted,
+            'updated_count': result.updated,
+            'skipped_count': result.skipped
+        }
         
     except Exception as e:
         db.session.rollback()
@@ -541,84 +501,36 @@ def save_smart():
         if not employee_id or not month or not year:
             return {'success': False, 'message': 'بيانات أساسية مفقودة'}
         
-        # فحص الحقول المالية
-        basic_salary = data.get('basic_salary')
-        allowances = data.get('allowances') 
-        deductions = data.get('deductions')
-        bonus = data.get('bonus')
-        
         # التحقق من أن المستخدم أدخل على الأقل الراتب الأساسي
-        if not basic_salary or basic_salary == '' or float(basic_salary) <= 0:
+        basic_salary = parse_amount(data.get('basic_salary'))
+        if basic_salary is None or basic_salary <= 0:
             return {'success': False, 'message': 'يجب إدخال الراتب الأساسي'}
         
-        # تحويل القيم الفارغة إلى None بدلاً من 0
-        def parse_value(value):
-            if value is None or value == '' or value == 'null':
-                return None
-            try:
-                parsed = float(value)
-                return parsed if parsed != 0 else None
-            except (ValueError, TypeError):
-                return None
-        
-        # معالجة القيم
-        basic_salary = float(basic_salary)
-        allowances = parse_value(allowances)
-        deductions = parse_value(deductions) 
-        bonus = parse_value(bonus)
-        
-        # حساب صافي الراتب
-        net_salary = basic_salary
-        if allowances:
-            net_salary += allowances
-        if bonus:
-            net_salary += bonus
-        if deductions:
-            net_salary -= deductions
-        
-        # التحقق من وجود سجل سابق
-        existing = Salary.query.filter_by(
-            employee_id=employee_id,
-            month=month,
-            year=year
-        ).first()
-        
-        if existing:
-            return {'success': False, 'message': 'يوجد سجل راتب لهذا الموظف في نفس الشهر والسنة'}
-        
-        # إنشاء سجل جديد
-        salary = Salary(
-            employee_id=employee_id,
-            month=month,
-            year=year,
-            basic_salary=basic_salary,
-            allowances=allowances,
-            deductions=deductions,
-            bonus=bonus,
-            net_salary=net_salary,
-            notes=data.get('notes', '')
-        )
+        employee = Employee.query.get(employee_id)
+        if not employee:
+            return {'success': False, 'message': 'الموظف غير موجود'}
         
-        db.session.add(salary)
+        # إنشاء الراتب أو تحديثه إن كان موجوداً لنفس الشهر والسنة
+        result = SalaryWorksheetService.save_rows([data])
+        net_salary = result.net_salaries[(employee.id, year, month)]
         
         # تسجيل العملية
-        employee = Employee.query.get(employee_id)
         audit = SystemAudit(
-            action='create',
+            action='create' if result.inserted else 'update',
             entity_type='salary',
-            entity_id=employee_id,
-            details=f'تم إنشاء سجل راتب ذكي للموظف: {employee.name} لشهر {month}/{year}'
+            entity_id=employee.id,
+            details=f'تم {"إنشاء" if result.inserted else "تحديث"} سجل راتب ذكي للموظف: {employee.name} لشهر {month}/{year}'
         )
         db.session.add(audit)
         db.session.commit()
         
         # إعداد رسالة النجاح مع تفاصيل الحقول المحفوظة
         saved_fields = ['الراتب الأساسي']
-        if allowances:
+        if parse_amount(data.get('allowances')):
             saved_fields.append('البدلات')
-        if deductions:
+        if parse_amount(data.get('deductions')):
             saved_fields.append('الخصومات')
-        if bonus:
+        if parse_amount(data.get('bonus')):
             saved_fields.append('المكافآت')
         
         return {
@@ -631,6 +543,48 @@ def save_smart():
         db.session.rollback()
         return {'success': False, 'message': f'حدث خطأ: {str(e)}'}
 
+@salaries_bp.route('/worksheet')
+def worksheet():
+    """ورقة عمل الرواتب: صفحة من الموظفين مع راتب كل منهم للشهر المحدد (JSON)"""
+    now = datetime.now()
+    month = request.args.get('month', now.month, type=int)
+    year = request.args.get('year', now.year, type=int)
+    
+    page = SalaryWorksheetService.page(
+        month,
+        year,
+        department_id=request.args.get('department_id', type=int),
+        employee_id=request.args.get('employee_id', type=int),
+        limit=request.args.get('limit', type=int),
+        cursor=request.args.get('cursor')
+    )
+    
+    rows = []
+    for employee, salary in page.rows:
+        rows.append({
+            'employee_id': employee.id,
+            'employee_number': employee.employee_id,
+            'name': employee.name,
+            'departments': [department.name for department in employee.departments],
+            'salary': None if salary is None else {
+                'id': salary.id,
+                'basic_salary': salary.basic_salary,
+                'allowances': salary.allowances,
+                'deductions': salary.deductions,
+                'bonus': salary.bonus,
+                'net_salary': salary.net_salary,
+                'is_paid': salary.is_paid
+            }
+        })
+    
+    return jsonify({
+        'month': month,
+        'year': year,
+        'rows': rows,
+        'next_cursor': page.next_cursor,
+        'has_more': page.has_more
+    })
+
 @salaries_bp.route('/validate_incomplete', methods=['POST'])
 def validate_incomplete():
     """التحقق من الحقول غير المكتملة قبل الحفظ"""
@@ -693,101 +647,40 @@ def import_excel():
         
         if file and file.filename.endswith(('.xlsx', '.xls')):
             try:
-                # Parse Excel file
-                salaries_data = parse_salary_excel(file, month, year)
-                success_count = 0
-                error_count = 0
+                frame = read_salary_frame(file)
+                if frame.empty:
+                    raise ValueError('لا توجد سجلات رواتب صالحة في الملف')
+                
+                # معاينة فقط: عرض تقرير الفروقات دون الحفظ
+                dry_run = request.form.get('preview') == '1'
+                report = SalaryImportService.import_frame(frame, month, year, dry_run=dry_run)
                 
-                for data in salaries_data:
-                    try:
-                        # تنظيف رقم الموظف المستورد (إزالة الأصفار الزائدة والمسافات)
-                        employee_id_str = str(data['employee_id']).strip()
-                        
-                        # محاولة البحث عن الموظف بأكثر من طريقة
-                        # 1. البحث المباشر
-                        employee = Employee.query.filter_by(employee_id=employee_id_str).first()
-                        
-                        # 2. البحث بعد إزالة الأصفار من البداية
-                        if not employee:
-                            clean_id = employee_id_str.lstrip('0')
-                            employee = Employee.query.filter_by(employee_id=clean_id).first()
-                            
-                        # 3. البحث بإضافة أصفار للبداية (حتى 6 أرقام إجمالاً)
-                        if not employee:
-                            padded_id = employee_id_str.zfill(6)
-                            employee = Employee.query.filter_by(employee_id=padded_id).first()
-                            
-                        # 4. البحث باستخدام like للعثور على تطابق جزئي
-                        if not employee:
-                            employee = Employee.query.filter(
-                                Employee.employee_id.like(f"%{employee_id_str}%")
-                            ).first()
-                            
-                        if not employee:
-                            print(f"لم يتم العثور على موظف برقم: {data['employee_id']} بعد محاولة البحث بعدة طرق")
-                            raise ValueError(f"لم يتم العثور على موظف برقم: {data['employee_id']}")
-                            
-                        # التحقق من وجود سجل راتب لهذا الموظف في نفس الشهر والسنة
-                        existing = Salary.query.filter_by(
-                            employee_id=employee.id,  # استخدام معرف الموظف في قاعدة البيانات
-                            month=month,
-                            year=year
-                        ).first()
-                        
-                        # تحضير بيانات الراتب
-                        salary_data = {
-                            'employee_id': employee.id,  # معرف الموظف في قاعدة البيانات وليس رقم الموظف
-                            'month': month,
-                            'year': year,
-                            'basic_salary': data['basic_salary'],
-                            'allowances': data['allowances'],
-                            'deductions': data['deductions'],
-                            'bonus': data['bonus'],
-                            'net_salary': data['net_salary']
-                        }
-                        
-                        if 'notes' in data:
-                            salary_data['notes'] = data['notes']
-                        
-                        if existing:
-                            # تحديث السجل الموجود
-                            existing.basic_salary = data['basic_salary']
-                            existing.allowances = data['allowances']
-                            existing.deductions = data['deductions']
-                            existing.bonus = data['bonus']
-                            existing.net_salary = data['net_salary']
-                            if 'notes' in data:
-                                existing.notes = data['notes']
-                            db.session.commit()
-                        else:
-                            # إنشاء سجل جديد
-                            salary = Salary(**salary_data)
-                            db.session.add(salary)
-                            db.session.commit()
-                        
-                        success_count += 1
-                    except Exception as e:
-                        # طباعة رسالة الخطأ للسجل
-                        print(f"Error importing salary: {str(e)}")
-                        db.session.rollback()
-                        error_count += 1
+                if dry_run:
+                    db.session.rollback()
+                    return render_template('salaries/import.html',
+                                          current_month=month,
+                                          current_year=year,
+                                          report=report)
                 
                 # Log the import
                 audit = SystemAudit(
                     action='import',
                     entity_type='salary',
                     entity_id=0,
-                    details=f'تم استيراد {success_count} سجل راتب لشهر {month}/{year} بنجاح و {error_count} فشل'
+                    details=f'استيراد رواتب شهر {month}/{year}: {report.summary()}'
                 )
                 db.session.add(audit)
                 db.session.commit()
                 
-                if error_count > 0:
-                    flash(f'تم استيراد {success_count} سجل راتب بنجاح و {error_count} فشل', 'warning')
+                counts = report.counts
+                saved_count = counts['new'] + counts['changed']
+                if counts['unknown_employee'] > 0:
+                    flash(f'تم استيراد {saved_count} سجل راتب ({report.summary()})', 'warning')
                 else:
-                    flash(f'تم استيراد {success_count} سجل راتب بنجاح', 'success')
+                    flash(f'تم استيراد {saved_count} سجل راتب بنجاح ({report.summary()})', 'success')
                 return redirect(url_for('salaries.index', month=month, year=year))
             except Exception as e:
+                db.session.rollback()
                 flash(f'حدث خطأ أثناء استيراد الملف: {str(e)}', 'danger')
         else:
             flash('الملف يجب أن يكون بصيغة Excel (.xlsx, .xls)', 'danger')
@@ -870,8 +763,11 @@ def export_excel():
         # ترتيب النتائج حسب القسم ثم اسم الموظف
         query = query.join(Department, Employee.department_id == Department.id).order_by(Department.name, Employee.name)
         
-        # تنفيذ الاستعلام
-        salaries = query.all()
+        # تُقرأ الرواتب على دفعات أثناء كتابة الملف بدلاً من تحميلها كلها
+        salaries_count = query.count()
+        salaries = query.options(
+            db.joinedload(Salary.employee).selectinload(Employee.departments)
+        )
         
         # توليد ملف Excel
         output = generate_salary_excel(salaries, filter_description)
@@ -882,7 +778,7 @@ def export_excel():
             action='export',
             entity_type='salary',
             entity_id=0,
-            details=f'تم تصدير {len(salaries)} سجل راتب إلى ملف Excel [{filters_text}]'
+            details=f'تم تصدير {salaries_count} سجل راتب إلى ملف Excel [{filters_text}]'
         )
         db.session.add(audit)
         db.session.commit()
@@ -890,12 +786,7 @@ def export_excel():
         # إنشاء اسم الملف
         filename = f'رواتب_{"_".join(filename_parts)}.xlsx'
         
-        return send_file(
-            BytesIO(output.getvalue()),
-            download_name=filename,
-            as_attachment=True,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        return xlsx_response(output, filename)
     except Exception as e:
         flash(f'حدث خطأ أثناء تصدير البيانات: {str(e)}', 'danger')
         return redirect(url_for('salaries.index'))
@@ -995,8 +886,15 @@ def salary_notification_pdf(id):
         # الحصول على سجل الراتب
         salary = Salary.query.get_or_404(id)
         
-        # إنشاء ملف PDF
-        pdf_bytes = generate_salary_notification_pdf(salary)
+        # إرسال الملف المخزن، أو إنشاؤه عند أول طلب أو بعد تعديل الراتب أو بيانات الموظف
+        response = cached_pdf_response(
+            'salary', salary.id, 'salary_notification',
+            (salary.updated_at, salary.employee.updated_at),
+            lambda: PdfRenderService.render('salary_notification', salary.id),
+            download_name=f'salary_notification_{salary.employee.employee_id}_{salary.month}_{salary.year}.pdf'
+        )
+        if response is None:
+            raise ValueError('لم يتم إنشاء ملف PDF')
         
         # تسجيل العملية - بدون تحديد user_id
         audit = SystemAudit(
@@ -1009,12 +907,7 @@ def salary_notification_pdf(id):
         db.session.add(audit)
         db.session.commit()
         
-        return send_file(
-            BytesIO(pdf_bytes),
-            download_name=f'salary_notification_{salary.employee.employee_id}_{salary.month}_{salary.year}.pdf',
-            as_attachment=True,
-            mimetype='application/pdf'
-        )
+        return response
     except Exception as e:
         flash(f'حدث خطأ أثناء إنشاء إشعار الراتب: {str(e)}', 'danger')
         return redirect(url_for('salaries.index'))
@@ -1321,11 +1214,9 @@ def comprehensive_report():
             db.session.commit()
             
             # إرسال الملف كتنزيل
-            return send_file(
+            return xlsx_response(
                 report_excel,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=f'تقرير_شامل_الموظفين_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+                f'تقرير_شامل_الموظفين_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
             )
             
         except Exception as e:
@@ -1516,108 +1407,14 @@ def batch_salary_notifications():
             month = int(month)
             year = int(year)
             
-            # إذا تم تحديد قسم
-            if department_id and department_id != 'all':
-                department_id = int(department_id)
-                department = Department.query.get(department_id)
-                department_name = department.name if department else "غير معروف"
-                
-                if notification_type == 'whatsapp':
-                    # إرسال الإشعارات عبر WhatsApp
-                    success_count, failure_count, error_messages = send_batch_salary_notifications_whatsapp(department_id, month, year)
-                    
-                    if success_count > 0:
-                        # تسجيل العملية
-                        audit = SystemAudit(
-                            action='batch_whatsapp_notifications',
-                            entity_type='salary',
-                            entity_id=0,
-                            details=f'تم إرسال {success_count} إشعار راتب عبر WhatsApp لموظفي قسم {department_name} لشهر {month}/{year}',
-                            user_id=None
-                        )
-                        db.session.add(audit)
-                        db.session.commit()
-                        
-                        # عرض رسالة نجاح مع تفاصيل النجاح/الفشل
-                        if failure_count > 0:
-                            flash(f'تم إرسال {success_count} إشعار راتب بنجاح و {failure_count} فشل', 'warning')
-                            for error in error_messages[:5]:  # عرض أول 5 أخطاء فقط
-                                flash(error, 'danger')
-                            if len(error_messages) > 5:
-                                flash(f'... و {len(error_messages) - 5} أخطاء أخرى', 'danger')
-                        else:
-                            flash(f'تم إرسال {success_count} إشعار راتب عبر WhatsApp بنجاح', 'success')
-                    else:
-                        flash(f'لم يتم إرسال أي إشعارات. {error_messages[0] if error_messages else "لا توجد رواتب مسجلة لموظفي قسم " + department_name + " في شهر " + str(month) + "/" + str(year)}', 'warning')
-                else:
-                    # إنشاء ملفات PDF (السلوك الافتراضي)
-                    processed_employees = generate_batch_salary_notifications(department_id, month, year)
-                    
-                    if processed_employees:
-                        # تسجيل العملية
-                        audit = SystemAudit(
-                            action='batch_notifications',
-                            entity_type='salary',
-                            entity_id=0,
-                            details=f'تم إنشاء {len(processed_employees)} إشعار راتب لموظفي قسم {department_name} لشهر {month}/{year}',
-                            user_id=None
-                        )
-                        db.session.add(audit)
-                        db.session.commit()
-                        
-                        flash(f'تم إنشاء {len(processed_employees)} إشعار راتب لموظفي قسم {department_name}', 'success')
-                    else:
-                        flash(f'لا توجد رواتب مسجلة لموظفي قسم {department_name} في شهر {month}/{year}', 'warning')
-            else:
-                # معالجة الإشعارات لجميع الموظفين
-                if notification_type == 'whatsapp':
-                    # إرسال الإشعارات عبر WhatsApp
-                    success_count, failure_count, error_messages = send_batch_salary_notifications_whatsapp(None, month, year)
-                    
-                    if success_count > 0:
-                        # تسجيل العملية
-                        audit = SystemAudit(
-                            action='batch_whatsapp_notifications',
-                            entity_type='salary',
-                            entity_id=0,
-                            details=f'تم إرسال {success_count} إشعار راتب عبر WhatsApp لجميع الموظفين لشهر {month}/{year}',
-                            user_id=None
-                        )
-                        db.session.add(audit)
-                        db.session.commit()
-                        
-                        # عرض رسالة نجاح مع تفاصيل النجاح/الفشل
-                        if failure_count > 0:
-                            flash(f'تم إرسال {success_count} إشعار راتب بنجاح و {failure_count} فشل', 'warning')
-                            for error in error_messages[:5]:  # عرض أول 5 أخطاء فقط
-                                flash(error, 'danger')
-                            if len(error_messages) > 5:
-                                flash(f'... و {len(error_messages) - 5} أخطاء أخرى', 'danger')
-                        else:
-                            flash(f'تم إرسال {success_count} إشعار راتب عبر WhatsApp بنجاح', 'success')
-                    else:
-                        flash(f'لم يتم إرسال أي إشعارات. {error_messages[0] if error_messages else "لا توجد رواتب مسجلة لشهر " + str(month) + "/" + str(year)}', 'warning')
-                else:
-                    # إنشاء ملفات PDF (السلوك الافتراضي)
-                    processed_employees = generate_batch_salary_notifications(None, month, year)
-                    
-                    if processed_employees:
-                        # تسجيل العملية
-                        audit = SystemAudit(
-                            action='batch_notifications',
-                            entity_type='salary',
-                            entity_id=0,
-                            details=f'تم إنشاء {len(processed_employees)} إشعار راتب لجميع الموظفين لشهر {month}/{year}',
-                            user_id=None
-                        )
-                        db.session.add(audit)
-                        db.session.commit()
-                        
-                        flash(f'تم إنشاء {len(processed_employees)} إشعار راتب لجميع الموظفين', 'success')
-                    else:
-                        flash(f'لا توجد رواتب مسجلة لشهر {month}/{year}', 'warning')
-                    
-            return redirect(url_for('salaries.index', month=month, year=year))
+            # إنشاء/إرسال الإشعارات لجميع الموظفين قد يستغرق وقتاً طويلاً، لذا يُنفذ كمهمة خلفية
+            job = JobQueueService.enqueue('salaries.batch_notifications', {
+                'department_id': int(department_id) if department_id and department_id != 'all' else None,
+                'month': month,
+                'year': year,
+                'notification_type': notification_type
+            }, user_id=current_user.id if current_user.is_authenticated else None)
+            return job_started_response(job, url_for('salaries.index', month=month, year=year))
                 
         except Exception as e:
             flash(f'حدث خطأ أثناء إنشاء إشعارات الرواتب: {str(e)}', 'danger')
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, flash, redirect, url_for,
 from flask_login import login_required, current_user
 from app import db
 from models import User, Department, UserRole, Module, Permission, AuditLog, UserPermission
+from services.permission_cache_service import PermissionCacheService
 from functools import wraps
 from sqlalchemy.orm import joinedload # <<<<<--- أضف هذا السطر
 
@@ -591,6 +592,7 @@ def update_permissions(user_id):
         # 4. حذف كل الصلاحيات القديمة للمستخدم
         # هذا هو الأسلوب الأنظف. نحذف القديم ونضيف الجديد.
         UserPermission.query.filter_by(user_id=user_to_update.id).delete()
+        PermissionCacheService.bump_version(user_to_update.id)
 
         # 5. إضافة الصلاحيات الجديدة المجمعة
         for module, aggregated_permissions in new_permissions_map.items():
@@ -24,6 +24,14 @@ from models import (
 )
 from utils.audit_logger import log_activity
 from utils.audit_logger import log_audit
+from services.vehicle_assignment_service import VehicleAssignmentService
+from services.fleet_summary_service import FleetSummaryService
+from services.job_queue_service import JobQueueService, new_artifact_path
+from routes.jobs import job_started_response
+from services.pdf_cache_service import cached_pdf_response
+from services.pdf_render_service import PdfRenderService
+from services.image_pipeline_service import ImagePipelineService
+from utils.image_parts import save_image_part, store_base64_image
 from utils.whatsapp_message_generator import generate_whatsapp_url
 from utils.vehicles_export import export_vehicle_pdf, export_workshop_records_pdf, export_vehicle_excel, export_workshop_records_excel
 from utils.simple_pdf_generator import create_vehicle_handover_pdf as generate_complete_vehicle_report
@@ -38,8 +46,6 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-import arabic_reshaper
-from bidi.algorithm import get_display
 # from utils.fpdf_handover_pdf import generate_handover_report_pdf
 # ============ تأكد من وجود هذه الاستيرادات في أعلى الملف ============
 from routes.operations import create_operation_request # أو المسار الصحيح للدالة
@@ -55,42 +61,12 @@ from openpyxl.utils.dataframe import dataframe_to_rows
 from openpyxl.styles import Font, PatternFill, Alignment
 
 def update_vehicle_driver(vehicle_id):
-        """تحديث اسم السائق في جدول السيارات بناءً على آخر سجل تسليم من نوع delivery"""
+        """تحديث بيانات السائق الحالي في جدول السيارات بناءً على آخر سجل تسليم معتمد"""
         try:
-                # الحصول على جميع سجلات التسليم (delivery) للسيارة مرتبة حسب التاريخ
-                delivery_records = VehicleHandover.query.filter_by(
-                        vehicle_id=vehicle_id, 
-                        handover_type='delivery'
-                ).order_by(VehicleHandover.handover_date.desc()).all()
-
-                if delivery_records:
-                        # أخذ أحدث سجل تسليم (delivery)
-                        latest_delivery = delivery_records[0]
-
-                        # تحديد اسم السائق (إما من جدول الموظفين أو من اسم الشخص المدخل يدوياً)
-                        driver_name = None
-                        if latest_delivery.employee_id:
-                                employee = Employee.query.get(latest_delivery.employee_id)
-                                if employee:
-                                        driver_name = employee.name
-
-                        # إذا لم يكن هناك موظف معين، استخدم اسم الشخص المدخل يدوياً
-                        if not driver_name and latest_delivery.person_name:
-                                driver_name = latest_delivery.person_name
-
-                        # تحديث اسم السائق في جدول السيارات
-                        vehicle = Vehicle.query.get(vehicle_id)
-                        if vehicle:
-                                vehicle.driver_name = driver_name
-                                db.session.commit()
-                else:
-                        # إذا لم يكن هناك سجلات تسليم، امسح اسم السائق
-                        vehicle = Vehicle.query.get(vehicle_id)
-                        if vehicle:
-                                vehicle.driver_name = None
-                                db.session.commit()
-
+                VehicleAssignmentService.sync(db.session.connection(), [vehicle_id], session=db.session)
+                db.session.commit()
         except Exception as e:
+                db.session.rollback()
                 print(f"خطأ في تحديث اسم السائق: {e}")
                 # لا نريد أن يؤثر هذا الخطأ على العملية الأساسية
                 pass
@@ -127,62 +103,20 @@ def update_vehicle_state(vehicle_id):
         # 2. التحقق من الإيجار النشط
         active_rental = VehicleRental.query.filter_by(vehicle_id=vehicle_id, is_active=True).first()
 
-        # ================== بداية المنطق الجديد لتحديد السجلات الرسمية ==================
-
-        # 3. إنشاء استعلام فرعي لجلب ID لكل سجل handover له طلب موافقة.
-        approved_handover_ids_subquery = db.session.query(
-            OperationRequest.related_record_id
-        ).filter(
-            OperationRequest.operation_type == 'handover',
-            OperationRequest.status == 'approved',
-            OperationRequest.vehicle_id == vehicle_id
-        ).subquery()
-
-        # 4. إنشاء استعلام فرعي لجلب ID لكل سجل handover له طلب (بغض النظر عن حالته).
-        all_handover_request_ids_subquery = db.session.query(
-            OperationRequest.related_record_id
-        ).filter(
-            OperationRequest.operation_type == 'handover',
-            OperationRequest.vehicle_id == vehicle_id
-        ).subquery()
-
-        # 5. بناء الاستعلام الأساسي الذي يختار السجلات "الرسمية" فقط.
-        # السجل يعتبر رسمياً إذا تمت الموافقة عليه، أو إذا كان قديماً (ليس له طلب موافقة أصلاً).
-        base_official_query = VehicleHandover.query.filter(
-            VehicleHandover.vehicle_id == vehicle_id
-        ).filter(
-            or_(
-                VehicleHandover.id.in_(approved_handover_ids_subquery),
-                ~VehicleHandover.id.in_(all_handover_request_ids_subquery)
-            )
-        )
-
-        # 6. الآن نستخدم هذا الاستعلام الرسمي للحصول على آخر عملية تسليم واستلام
-        latest_delivery = base_official_query.filter(
-            VehicleHandover.handover_type.in_(['delivery', 'تسليم'])
-        ).order_by(VehicleHandover.created_at.desc()).first()
-
-        latest_return = base_official_query.filter(
-            VehicleHandover.handover_type.in_(['return', 'استلام', 'receive'])
-        ).order_by(VehicleHandover.created_at.desc()).first()
-
-        # =================== نهاية المنطق الجديد لتحديد السجلات الرسمية ===================
-
-        # 7. تطبيق التحديثات على السائق والحالة بناءً على السجلات الرسمية فقط
-        is_currently_handed_out = False
-        if latest_delivery:
-            if not latest_return or latest_delivery.created_at > latest_return.created_at:
-                is_currently_handed_out = True
+        # 3. بيانات التسليم الحالية (السائق وتاريخ آخر تسليم) محفوظة في أعمدة السيارة وتُحسب
+        # من آخر سجل تسليم/استلام رسمي (معتمد أو قديم ليس له طلب موافقة).
+        # نتأكد من تزامنها ثم نقرأها بدلاً من إعادة تتبع سجل العمليات.
+        db.session.flush()
+        VehicleAssignmentService.sync(db.session.connection(), [vehicle_id], session=db.session)
+        is_currently_handed_out = bool(vehicle.driver_name)
 
         if is_currently_handed_out:
             # السيناريو (أ): السيارة مسلّمة حالياً (بناءً على سجل معتمد)
-            vehicle.driver_name = latest_delivery.person_name
             # تحديث الحالة فقط إذا لم تكن السيارة في حالة حرجة (ورشة/حادث)
             if not is_critical_state:
                 vehicle.status = 'rented' if active_rental else 'in_project'
         else:
             # السيناريو (ب): السيارة متاحة (بناءً على سجل معتمد)
-            vehicle.driver_name = None
             # تحديث الحالة فقط إذا لم تكن السيارة في حالة حرجة
             if not is_critical_state:
                 vehicle.status = 'rented' if active_rental else 'available'
@@ -280,27 +214,19 @@ def update_vehicle_state(vehicle_id):
 
 
 def update_all_vehicle_drivers():
-        """تحديث أسماء جميع السائقين في جدول السيارات"""
-        vehicles = Vehicle.query.all()
-        updated_count = 0
-
-        for vehicle in vehicles:
-                update_vehicle_driver(vehicle.id)
-                updated_count += 1
+        """إعادة حساب بيانات السائقين الحاليين لجميع السيارات وإصلاح أي انحراف"""
+        try:
+                fixed_count = VehicleAssignmentService.reconcile(db.session.connection())
+                db.session.commit()
+        except Exception:
+                db.session.rollback()
+                raise
 
-        return updated_count
+        return fixed_count
 
 def get_vehicle_current_employee_id(vehicle_id):
         """الحصول على معرف الموظف الحالي للسيارة"""
-        latest_delivery = VehicleHandover.query.filter_by(
-                vehicle_id=vehicle_id
-        ).filter(
-                VehicleHandover.handover_type.in_(['delivery', 'تسليم', 'handover'])
-        ).order_by(VehicleHandover.handover_date.desc()).first()
-
-        if latest_delivery and latest_delivery.employee_id:
-                return latest_delivery.employee_id
-        return None
+        return db.session.query(Vehicle.current_driver_id).filter(Vehicle.id == vehicle_id).scalar()
 
 # قائمة بأهم حالات السيارة للاختيار منها في النماذج
 VEHICLE_STATUS_CHOICES = [
@@ -381,6 +307,9 @@ def save_file(file, folder='vehicles'):
         # تحديد نوع الملف (صورة أو PDF)
         file_type = 'pdf' if filename.lower().endswith('.pdf') else 'image'
 
+        # توليد النسخ المصغرة للصور خارج الطلب
+        ImagePipelineService.enqueue(file_path)
+
         # إرجاع المسار النسبي للملف ونوعه
         return f"uploads/{folder}/{unique_filename}", file_type
 
@@ -562,32 +491,14 @@ def expired_documents():
         # التاريخ الحالي
         today = datetime.now().date()
 
-        # السيارات ذات استمارة منتهية
-        expired_registration = Vehicle.query.filter(
-                Vehicle.registration_expiry_date.isnot(None),
-                Vehicle.registration_expiry_date < today
-        ).order_by(Vehicle.registration_expiry_date).all()
-
-        # السيارات ذات فحص دوري منتهي
-        expired_inspection = Vehicle.query.filter(
-                Vehicle.inspection_expiry_date.isnot(None),
-                Vehicle.inspection_expiry_date < today
-        ).order_by(Vehicle.inspection_expiry_date).all()
-
-        # السيارات ذات تفويض منتهي
-        expired_authorization = Vehicle.query.filter(
-                Vehicle.authorization_expiry_date.isnot(None),
-                Vehicle.authorization_expiry_date < today
-        ).order_by(Vehicle.authorization_expiry_date).all()
+        # السيارات ذات الوثائق المنتهية (استعلام واحد بأعمدة العرض فقط)
+        document_alerts = FleetSummaryService.document_alerts(today=today, include_expiring=False)
+        expired_registration = document_alerts.expired['registration']
+        expired_inspection = document_alerts.expired['inspection']
+        expired_authorization = document_alerts.expired['authorization']
 
         # جميع السيارات التي تحتوي على وثيقة منتهية واحدة على الأقل
-        expired_all = Vehicle.query.filter(
-                or_(
-                        Vehicle.registration_expiry_date.isnot(None) & (Vehicle.registration_expiry_date < today),
-                        Vehicle.inspection_expiry_date.isnot(None) & (Vehicle.inspection_expiry_date < today),
-                        Vehicle.authorization_expiry_date.isnot(None) & (Vehicle.authorization_expiry_date < today)
-                )
-        ).order_by(Vehicle.plate_number).all()
+        expired_all = document_alerts.expired_all
 
         return render_template(
                 'vehicles/expired_documents.html',
@@ -604,23 +515,11 @@ def export_expired_documents_excel():
         # التاريخ الحالي
         today = datetime.now().date()
 
-        # السيارات ذات استمارة منتهية
-        expired_registration = Vehicle.query.filter(
-                Vehicle.registration_expiry_date.isnot(None),
-                Vehicle.registration_expiry_date < today
-        ).order_by(Vehicle.registration_expiry_date).all()
-
-        # السيارات ذات فحص دوري منتهي
-        expired_inspection = Vehicle.query.filter(
-                Vehicle.inspection_expiry_date.isnot(None),
-                Vehicle.inspection_expiry_date < today
-        ).order_by(Vehicle.inspection_expiry_date).all()
-
-        # السيارات ذات تفويض منتهي
-        expired_authorization = Vehicle.query.filter(
-                Vehicle.authorization_expiry_date.isnot(None),
-                Vehicle.authorization_expiry_date < today
-        ).order_by(Vehicle.authorization_expiry_date).all()
+        # السيارات ذات الوثائق المنتهية (استعلام واحد بأعمدة العرض فقط)
+        document_alerts = FleetSummaryService.document_alerts(today=today, include_expiring=False)
+        expired_registration = document_alerts.expired['registration']
+        expired_inspection = document_alerts.expired['inspection']
+        expired_authorization = document_alerts.expired['authorization']
 
         # إنشاء قوائم البيانات
         registration_data = []
@@ -991,62 +890,21 @@ def index():
         # تسجيل عدد السيارات للتشخيص
         print(f"DEBUG: عدد السيارات المُرسلة للصفحة: {len(vehicles)}")
         print(f"DEBUG: قيود الفلترة - حالة: {status_filter}, شركة: {make_filter}, مشروع: {project_filter}, رقم: {search_plate}")
-        # إضافة معرف الموظف الحالي لكل سيارة
-        for vehicle in vehicles:
-                try:
-                        vehicle.current_employee_id = get_vehicle_current_employee_id(vehicle.id)
-                except Exception as e:
-                        vehicle.current_employee_id = None
-                        print(f"خطأ في الحصول على معرف الموظف للمركبة {vehicle.id}: {e}")
-
-        # تحقق من تواريخ انتهاء الوثائق والتنبيه بالقريبة للانتهاء
-        expiring_documents = []
+        # ملخص الأسطول (أعداد الحالات والوثائق المنتهية) في استعلام تجميعي واحد
         today = datetime.now().date()
-        thirty_days_later = today + timedelta(days=30)
-
-        # احصائيات للوثائق المنتهية أو القريبة من الانتهاء
-        for vehicle in vehicles:
-                if vehicle.authorization_expiry_date and today <= vehicle.authorization_expiry_date <= thirty_days_later:
-                        expiring_documents.append({
-                                'vehicle_id': vehicle.id,
-                                'plate_number': vehicle.plate_number,
-                                'document_type': 'authorization',
-                                'document_name': 'تفويض المركبة',
-                                'expiry_date': vehicle.authorization_expiry_date,
-                                'days_remaining': (vehicle.authorization_expiry_date - today).days
-                        })
-
-                if vehicle.registration_expiry_date and today <= vehicle.registration_expiry_date <= thirty_days_later:
-                        expiring_documents.append({
-                                'vehicle_id': vehicle.id,
-                                'plate_number': vehicle.plate_number,
-                                'document_type': 'registration',
-                                'document_name': 'استمارة السيارة',
-                                'expiry_date': vehicle.registration_expiry_date,
-                                'days_remaining': (vehicle.registration_expiry_date - today).days
-                        })
-
-                if vehicle.inspection_expiry_date and today <= vehicle.inspection_expiry_date <= thirty_days_later:
-                        expiring_documents.append({
-                                'vehicle_id': vehicle.id,
-                                'plate_number': vehicle.plate_number,
-                                'document_type': 'inspection',
-                                'document_name': 'الفحص الدوري',
-                                'expiry_date': vehicle.inspection_expiry_date, 
-                                'days_remaining': (vehicle.inspection_expiry_date - today).days
-                        })
+        fleet_summary = FleetSummaryService.summarize(today=today)
 
-        # ترتيب الوثائق المنتهية حسب عدد الأيام المتبقية (الأقرب للانتهاء أولاً)
-        expiring_documents.sort(key=lambda x: x['days_remaining'])
+        # الوثائق القريبة من الانتهاء للسيارات المعروضة (المعرف ورقم اللوحة فقط)
+        expiring_documents = FleetSummaryService.document_alerts(query, today=today).expiring_documents()
 
         # إحصائيات سريعة
         stats = {
-                'total': Vehicle.query.count(),
-                'available': Vehicle.query.filter_by(status='available').count(),
-                'rented': Vehicle.query.filter_by(status='rented').count(),
-                'in_project': Vehicle.query.filter_by(status='in_project').count(),
-                'in_workshop': Vehicle.query.filter_by(status='in_workshop').count(),
-                'accident': Vehicle.query.filter_by(status='accident').count()
+                'total': fleet_summary.total,
+                'available': fleet_summary.count('available'),
+                'rented': fleet_summary.count('rented'),
+                'in_project': fleet_summary.count('in_project'),
+                'in_workshop': fleet_summary.count('in_workshop'),
+                'accident': fleet_summary.count('accident')
         }
 
         return render_template(
@@ -1061,14 +919,7 @@ def index():
                 projects=projects,
                 statuses=VEHICLE_STATUS_CHOICES,
                 expiring_documents=expiring_documents,
-                expired_authorization_vehicles=Vehicle.query.filter(
-                    Vehicle.authorization_expiry_date.isnot(None),
-                    Vehicle.authorization_expiry_date < today
-                ).all(),
-                expired_inspection_vehicles=Vehicle.query.filter(
-                    Vehicle.inspection_expiry_date.isnot(None),
-                    Vehicle.inspection_expiry_date < today
-                ).all(),
+                fleet_summary=fleet_summary,
                 now=datetime.now(),
                 timedelta=timedelta,
                 today=today
@@ -2189,6 +2040,7 @@ def edit_workshop(id):
                         old_file_path = os.path.join(current_app.static_folder, workshop.delivery_receipt)
                         if os.path.exists(old_file_path):
                             os.remove(old_file_path)
+                            ImagePipelineService.remove(old_file_path)
                     
                     # حفظ الإيصال الجديد
                     receipt_path, _ = save_file(delivery_receipt_file, 'workshop')
@@ -2204,6 +2056,7 @@ def edit_workshop(id):
                         old_file_path = os.path.join(current_app.static_folder, workshop.pickup_receipt)
                         if os.path.exists(old_file_path):
                             os.remove(old_file_path)
+                            ImagePipelineService.remove(old_file_path)
                     
                     # حفظ الإيصال الجديد
                     receipt_path, _ = save_file(pickup_receipt_file, 'workshop')
@@ -2233,6 +2086,7 @@ def edit_workshop(id):
                         old_file_path = os.path.join(current_app.static_folder, old_image.image_path)
                         if os.path.exists(old_file_path):
                             os.remove(old_file_path)
+                            ImagePipelineService.remove(old_file_path)
                     # حذف السجل من قاعدة البيانات
                     db.session.delete(old_image)
                 
@@ -2266,6 +2120,7 @@ def edit_workshop(id):
                         old_file_path = os.path.join(current_app.static_folder, old_image.image_path)
                         if os.path.exists(old_file_path):
                             os.remove(old_file_path)
+                            ImagePipelineService.remove(old_file_path)
                     # حذف السجل من قاعدة البيانات
                     db.session.delete(old_image)
                 
@@ -2533,6 +2388,7 @@ def delete_workshop_image(id):
         file_path = os.path.join(current_app.static_folder, image.image_path)
         if os.path.exists(file_path):
                 os.remove(file_path)
+                ImagePipelineService.remove(file_path)
 
         db.session.delete(image)
         db.session.commit()
@@ -2666,22 +2522,8 @@ def save_base64_image(base64_string, subfolder):
                 return None
 
         try:
-                # إعداد مسار الحفظ
-                upload_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'uploads', subfolder)
-                os.makedirs(upload_folder, exist_ok=True)
-
-                # فك التشفير
-                header, encoded_data = base64_string.split(',', 1)
-                image_data = base64.b64decode(encoded_data)
-
-                # إنشاء اسم ملف فريد وحفظه
-                filename = f"{uuid.uuid4().hex}.png"
-                file_path = os.path.join(upload_folder, filename)
-                with open(file_path, 'wb') as f:
-                        f.write(image_data)
-
-                # إرجاع المسار النسبي (مهم لقاعدة البيانات و HTML)
-                return os.path.join(subfolder, filename)
+                # فك التشفير على دفعات إلى الملف مباشرة، وإرجاع المسار النسبي (مهم لقاعدة البيانات و HTML)
+                return store_base64_image(base64_string, subfolder)
 
         except Exception as e:
                 print(f"Error saving Base64 image: {e}")
@@ -2712,6 +2554,7 @@ def save_uploaded_file(file, subfolder):
 
                 file_path = os.path.join(upload_folder, unique_filename)
                 file.save(file_path)
+                ImagePipelineService.enqueue(file_path)
 
                 # إرجاع المسار النسبي
                 return os.path.join(subfolder, unique_filename)
@@ -2918,10 +2761,10 @@ def create_handover(id):
             handover_time = datetime.strptime(handover_time_str, '%H:%M').time() if handover_time_str else None
 
             # معالجة الصور والتواقيع
-            saved_diagram_path = save_base64_image(request.form.get('damage_diagram_data'), 'diagrams')
-            saved_supervisor_sig_path = save_base64_image(request.form.get('supervisor_signature_data'), 'signatures')
-            saved_driver_sig_path = save_base64_image(request.form.get('driver_signature_data'), 'signatures')
-            movement_officer_signature_path = save_base64_image(request.form.get('movement_officer_signature'), 'signatures')
+            saved_diagram_path = save_image_part('damage_diagram_data', 'diagrams')
+            saved_supervisor_sig_path = save_image_part('supervisor_signature_data', 'signatures', signature=True)
+            saved_driver_sig_path = save_image_part('driver_signature_data', 'signatures', signature=True)
+            movement_officer_signature_path = save_image_part('movement_officer_signature', 'signatures', signature=True)
             custom_logo_file = request.files.get('custom_logo_file')
             saved_custom_logo_path = save_uploaded_file(custom_logo_file, 'logos')
 
@@ -3654,8 +3497,6 @@ def handover_pdf(id):
         import io
         import os
         from datetime import datetime
-        # استخدام مولد PDF المحسن مع WeasyPrint
-        from utils.enhanced_arabic_handover_pdf import create_vehicle_handover_pdf
 
         try:
                 # التأكد من تحويل المعرف إلى عدد صحيح
@@ -3665,47 +3506,16 @@ def handover_pdf(id):
                 handover = VehicleHandover.query.get_or_404(id)
                 vehicle = Vehicle.query.get_or_404(handover.vehicle_id)
 
-                # تجهيز البيانات
-                handover_data = {
-                        'vehicle': {
-                                'plate_number': str(vehicle.plate_number),
-                                'make': str(vehicle.make),
-                                'model': str(vehicle.model),
-                                'year': int(vehicle.year),
-                                'color': str(vehicle.color)
-                        },
-                        'handover_type': 'تسليم' if handover.handover_type == 'delivery' else 'استلام',
-                        'handover_date': handover.handover_date.strftime('%Y-%m-%d'),
-                        'person_name': str(handover.person_name),
-                        'vehicle_status_summary': str(handover.vehicle_status_summary) if handover.vehicle_status_summary else "طبيعية",
-                        'fuel_level': str(handover.fuel_level),
-                        'mileage': int(handover.mileage),
-                        'has_spare_tire': bool(handover.has_spare_tire),
-                        'has_fire_extinguisher': bool(handover.has_fire_extinguisher),
-                        'has_first_aid_kit': bool(handover.has_first_aid_kit),
-                        'has_warning_triangle': bool(handover.has_warning_triangle),
-                        'has_tools': bool(handover.has_tools),
-                        'notes': str(handover.notes) if handover.notes else "",
-                        'form_link': str(handover.form_link) if handover.form_link else ""
-                }
-
-                # إضافة معلومات المشرف إذا وجدت
-                if hasattr(handover, 'supervisor_name') and handover.supervisor_name:
-                        handover_data['supervisor_name'] = str(handover.supervisor_name)
-
-                # إنشاء ملف PDF باستخدام المولد المحسن
-                pdf_buffer = create_vehicle_handover_pdf(handover)
-
-                # تحديد اسم الملف
-                filename = f"handover_form_{vehicle.plate_number}.pdf"
-
-                # إرسال الملف للمستخدم
-                return send_file(
-                        pdf_buffer,
-                        download_name=filename,
-                        as_attachment=True,
-                        mimetype='application/pdf'
+                # إرسال الملف المخزن إن وجد، وإلا إنشاؤه باستخدام المولد المحسن وتخزينه
+                response = cached_pdf_response(
+                        'handover', handover.id, 'handover_pdf',
+                        (handover.updated_at, vehicle.updated_at),
+                        lambda: PdfRenderService.render('handover', handover.id),
+                        download_name=f"handover_form_{vehicle.plate_number}.pdf"
                 )
+                if response is None:
+                        raise ValueError('لم يتم إنشاء ملف PDF')
+                return response
         except Exception as e:
                 # في حالة حدوث خطأ، عرض رسالة الخطأ والعودة إلى صفحة عرض السيارة
                 flash(f'خطأ في إنشاء ملف PDF: {str(e)}', 'danger')
@@ -3734,39 +3544,26 @@ def handover_pdf_public(id):
         handover = VehicleHandover.query.get_or_404(id)
         vehicle = Vehicle.query.get_or_404(handover.vehicle_id)
 
-        # استخدام مولد PDF الأصلي مع تحديث خط beIN-Normal
-        from utils.fpdf_handover_pdf import generate_handover_report_pdf_weasyprint
-
-        # إنشاء PDF باستخدام WeasyPrint مع خط beIN-Normal
-        pdf_buffer = generate_handover_report_pdf_weasyprint(handover)
-
-        # التحقق من نجاح إنشاء PDF
-        if not pdf_buffer:
-            current_app.logger.error(f"فشل في إنشاء PDF للتسليم {id}")
-            return "خطأ في إنشاء ملف PDF. يرجى المحاولة مرة أخرى.", 500
-
-        # التحقق من حجم PDF
-        pdf_buffer.seek(0, 2)  # الانتقال إلى نهاية الملف
-        pdf_size = pdf_buffer.tell()
-        pdf_buffer.seek(0)  # العودة إلى البداية
-
-        if pdf_size == 0:
-            current_app.logger.error(f"PDF فارغ للتسليم {id}")
-            return "ملف PDF فارغ. يرجى المحاولة مرة أخرى.", 500
-
-        current_app.logger.info(f"تم إنشاء PDF بحجم {pdf_size} بايت للتسليم {id}")
-
         # تحضير اسم الملف
         plate_clean = handover.vehicle.plate_number if handover.vehicle else f"record_{handover.id}"
         filename = f"handover_{plate_clean}_{handover.handover_date}.pdf"
 
-        return send_file(
-            pdf_buffer,
+        # الرابط العام يُفتح مرات عديدة: يُرسل الملف المخزن، ويُنشأ باستخدام WeasyPrint عند أول طلب أو بعد التعديل
+        response = cached_pdf_response(
+            'handover', handover.id, 'handover_pdf_public',
+            (handover.updated_at, vehicle.updated_at),
+            lambda: PdfRenderService.render('handover_public', handover.id),
             download_name=filename,
-            as_attachment=False,
-            mimetype='application/pdf'
+            as_attachment=False
         )
 
+        # التحقق من نجاح إنشاء PDF
+        if response is None:
+            current_app.logger.error(f"فشل في إنشاء PDF للتسليم {id}")
+            return "خطأ في إنشاء ملف PDF. يرجى المحاولة مرة أخرى.", 500
+
+        return response
+
     except Exception as e:
         current_app.logger.error(f"خطأ في إنشاء PDF للتسليم {id}: {e}")
         return "خطأ في إنشاء الملف. يرجى المحاولة مرة أخرى.", 500
@@ -3861,15 +3658,12 @@ def handover_pdf_public(id):
 @login_required
 def dashboard():
         """لوحة المعلومات والإحصائيات للسيارات"""
-        # إجمالي عدد السيارات
-        total_vehicles = Vehicle.query.count()
-
-        # توزيع السيارات حسب الحالة
-        status_stats = db.session.query(
-                Vehicle.status, func.count(Vehicle.id)
-        ).group_by(Vehicle.status).all()
+        today = datetime.now().date()
 
-        status_dict = {status: count for status, count in status_stats}
+        # إجمالي عدد السيارات وتوزيعها حسب الحالة (استعلام تجميعي واحد)
+        fleet_summary = FleetSummaryService.summarize(today=today)
+        total_vehicles = fleet_summary.total
+        status_dict = fleet_summary.status_counts
 
         # حساب قيمة الإيجارات الشهرية
         total_monthly_rent = db.session.query(
@@ -3961,26 +3755,11 @@ def dashboard():
                         'model': vehicle.model
                 })
 
-        # استرجاع السيارات ذات الوثائق المنتهية
-        today = datetime.now().date()
-
-        # السيارات ذات استمارة منتهية
-        expired_registration_vehicles = Vehicle.query.filter(
-                Vehicle.registration_expiry_date.isnot(None),
-                Vehicle.registration_expiry_date < today
-        ).order_by(Vehicle.registration_expiry_date).all()
-
-        # السيارات ذات فحص دوري منتهي
-        expired_inspection_vehicles = Vehicle.query.filter(
-                Vehicle.inspection_expiry_date.isnot(None),
-                Vehicle.inspection_expiry_date < today
-        ).order_by(Vehicle.inspection_expiry_date).all()
-
-        # السيارات ذات تفويض منتهي
-        expired_authorization_vehicles = Vehicle.query.filter(
-                Vehicle.authorization_expiry_date.isnot(None),
-                Vehicle.authorization_expiry_date < today
-        ).order_by(Vehicle.authorization_expiry_date).all()
+        # السيارات ذات الوثائق المنتهية (أعمدة العرض والسائق الحالي فقط)
+        document_alerts = FleetSummaryService.document_alerts(today=today, include_expiring=False)
+        expired_registration_vehicles = document_alerts.expired['registration']
+        expired_inspection_vehicles = document_alerts.expired['inspection']
+        expired_authorization_vehicles = document_alerts.expired['authorization']
 
         # إعداد بيانات حالة السيارات بالتنسيق المطلوب في القالب
         status_counts = {
@@ -4013,7 +3792,7 @@ def dashboard():
                 ).scalar() or 0,
 
                 # عدد السيارات في المشاريع
-                'vehicles_in_projects': Vehicle.query.filter_by(status='in_project').count(),
+                'vehicles_in_projects': fleet_summary.count('in_project'),
 
                 # عدد المشاريع النشطة
                 'project_assignments_count': db.session.query(
@@ -4244,8 +4023,8 @@ def export_vehicles_excel():
         if make_filter:
                 query = query.filter(Vehicle.make == make_filter)
 
-        # الحصول على قائمة السيارات
-        vehicles = query.order_by(Vehicle.status, Vehicle.plate_number).all()
+        # الحصول على قائمة السيارات (مع السائق الحالي في نفس الاستعلام)
+        vehicles = query.options(db.joinedload(Vehicle.current_driver)).order_by(Vehicle.status, Vehicle.plate_number).all()
 
         # تحويل حالة السيارة إلى نص مقروء بالعربية
         status_map = {
@@ -4284,6 +4063,7 @@ def export_vehicles_excel():
                         'اللون': vehicle.color,
                         'نوع السيارة': vehicle.type_of_car or 'سيارة عادية',
                         'الحالة': status_map.get(vehicle.status, vehicle.status),
+                        'السائق الحالي': vehicle.current_driver.name if vehicle.current_driver else (vehicle.driver_name or ''),
                         'تكاليف الصيانة الإجمالية': total_maintenance_cost,
                         'المؤجر': active_rental.lessor_name if active_rental else '',
                         'تكلفة الإيجار الشهرية': active_rental.monthly_cost if active_rental else 0,
@@ -4455,9 +4235,11 @@ def export_workshop_to_pdf(id):
                         flash('لا توجد سجلات ورشة لهذه المركبة!', 'warning')
                         return redirect(url_for('vehicles.view', id=id))
 
-                # إنشاء تقرير PDF باستخدام FPDF
-                from utils.fpdf_arabic_report import generate_workshop_report_pdf_fpdf
-                pdf_buffer = generate_workshop_report_pdf_fpdf(vehicle, workshop_records)
+                # إنشاء تقرير PDF باستخدام FPDF في عمليات التوليد
+                pdf = PdfRenderService.render('workshop_report', vehicle.id)
+                if not pdf:
+                        raise ValueError('لم يتم إنشاء ملف PDF')
+                pdf_buffer = io.BytesIO(pdf)
 
                 # اسم الملف
                 filename = f"workshop_report_{vehicle.plate_number}_{datetime.now().strftime('%Y%m%d')}.pdf"
@@ -5174,14 +4956,17 @@ def generate_vehicle_report(id):
 @vehicles_bp.route('/update-drivers', methods=['POST'])
 @login_required
 def update_drivers():
-        """تحديث جميع أسماء السائقين من سجلات التسليم"""
+        """إعادة مطابقة بيانات السائقين الحاليين مع سجلات التسليم المعتمدة وإصلاح أي انحراف"""
         try:
-                updated_count = update_all_vehicle_drivers()
-                flash(f'تم تحديث أسماء السائقين لـ {updated_count} سيارة بنجاح!', 'success')
+                fixed_count = update_all_vehicle_drivers()
+                if fixed_count:
+                        flash(f'تم تصحيح بيانات السائق الحالي لـ {fixed_count} سيارة بنجاح!', 'success')
+                else:
+                        flash('بيانات السائقين الحالية مطابقة لسجلات التسليم، لا يوجد ما يحتاج إلى تصحيح.', 'info')
         except Exception as e:
                 flash(f'حدث خطأ أثناء التحديث: {str(e)}', 'danger')
 
-        return redirect(url_for('vehicles.detailed'))
+        return redirect(url_for('vehicles.detailed_list'))
 
 @vehicles_bp.route('/<int:vehicle_id>/current_employee')
 @login_required
@@ -5345,6 +5130,7 @@ def vehicle_license_image(vehicle_id):
                     file_path = os.path.join('static', 'uploads', 'vehicles', vehicle.license_image)
                     if os.path.exists(file_path):
                         os.remove(file_path)
+                        ImagePipelineService.remove(file_path)
 
                     # حذف المرجع من قاعدة البيانات
                     vehicle.license_image = None
@@ -5391,6 +5177,7 @@ def vehicle_license_image(vehicle_id):
                     old_file_path = os.path.join(upload_dir, vehicle.license_image)
                     if os.path.exists(old_file_path):
                         os.remove(old_file_path)
+                        ImagePipelineService.remove(old_file_path)
 
                 # تأمين اسم الملف وإضافة timestamp لتجنب التضارب
                 filename = secure_filename(file.filename)
@@ -5398,23 +5185,9 @@ def vehicle_license_image(vehicle_id):
                 filename = f"license_{vehicle.plate_number}_{timestamp}_{filename}"
                 filepath = os.path.join(upload_dir, filename)
 
-                # حفظ الملف
+                # حفظ الملف، وتوليد النسخ المصغرة خارج الطلب
                 file.save(filepath)
-
-                # ضغط الصورة إذا كانت كبيرة
-                try:
-                    from PIL import Image
-                    with Image.open(filepath) as img:
-                        # تحويل إلى RGB إذا كانت الصورة RGBA
-                        if img.mode == 'RGBA':
-                            img = img.convert('RGB')
-
-                        # تصغير الصورة إذا كانت أكبر من 1500x1500
-                        if img.width > 1500 or img.height > 1500:
-                            img.thumbnail((1500, 1500), Image.Resampling.LANCZOS)
-                            img.save(filepath, 'JPEG', quality=85, optimize=True)
-                except Exception as e:
-                    print(f"خطأ في معالجة الصورة: {e}")
+                ImagePipelineService.enqueue(filepath)
 
                 # تحديث قاعدة البيانات
                 vehicle.license_image = filename
@@ -5732,125 +5505,11 @@ def import_vehicles():
         flash('يجب أن يكون الملف من نوع Excel (.xlsx أو .xls)', 'error')
         return redirect(url_for('vehicles.import_vehicles'))
     
-    try:
-        # قراءة ملف Excel
-        df = pd.read_excel(file)
-        
-        # التحقق من وجود الأعمدة المطلوبة
-        required_columns = ['رقم اللوحة', 'الشركة المصنعة', 'الموديل', 'السنة', 'اللون', 'نوع السيارة']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        
-        if missing_columns:
-            flash(f'الأعمدة التالية مفقودة في الملف: {", ".join(missing_columns)}', 'error')
-            return redirect(url_for('vehicles.import_vehicles'))
-        
-        # إنشاء خريطة حالات السيارة
-        status_reverse_map = {
-            'متاحة': 'available',
-            'مؤجرة': 'rented',
-            'في المشروع': 'in_project',
-            'في الورشة': 'in_workshop',
-            'حادث': 'accident'
-        }
-        
-        success_count = 0
-        error_count = 0
-        errors = []
-        
-        for index, row in df.iterrows():
-            try:
-                # التحقق من وجود رقم اللوحة
-                if pd.isna(row['رقم اللوحة']) or str(row['رقم اللوحة']).strip() == '':
-                    error_count += 1
-                    errors.append(f'الصف {index + 2}: رقم اللوحة مطلوب')
-                    continue
-                
-                plate_number = str(row['رقم اللوحة']).strip()
-                
-                # التحقق من عدم وجود السيارة مسبقاً
-                existing_vehicle = Vehicle.query.filter_by(plate_number=plate_number).first()
-                if existing_vehicle:
-                    error_count += 1
-                    errors.append(f'الصف {index + 2}: السيارة برقم اللوحة {plate_number} موجودة مسبقاً')
-                    continue
-                
-                # إنشاء سيارة جديدة
-                vehicle = Vehicle()
-                vehicle.plate_number = plate_number
-                vehicle.make = str(row['الشركة المصنعة']).strip() if not pd.isna(row['الشركة المصنعة']) else ''
-                vehicle.model = str(row['الموديل']).strip() if not pd.isna(row['الموديل']) else ''
-                vehicle.color = str(row['اللون']).strip() if not pd.isna(row['اللون']) else ''
-                vehicle.type_of_car = str(row['نوع السيارة']).strip() if not pd.isna(row['نوع السيارة']) else 'سيارة عادية'
-                
-                # معالجة السنة
-                if not pd.isna(row['السنة']):
-                    try:
-                        vehicle.year = int(float(row['السنة']))
-                    except (ValueError, TypeError):
-                        vehicle.year = None
-                else:
-                    vehicle.year = None
-                
-                # معالجة الحالة
-                if 'الحالة' in df.columns and not pd.isna(row['الحالة']):
-                    status_arabic = str(row['الحالة']).strip()
-                    vehicle.status = status_reverse_map.get(status_arabic, 'available')
-                else:
-                    vehicle.status = 'available'
-                
-                # معالجة الملاحظات إذا كانت موجودة
-                if 'ملاحظات' in df.columns and not pd.isna(row['ملاحظات']):
-                    vehicle.notes = str(row['ملاحظات']).strip()
-                
-                # إضافة تواريخ الإنشاء والتحديث
-                vehicle.created_at = datetime.now()
-                vehicle.updated_at = datetime.now()
-                
-                # إضافة السيارة إلى قاعدة البيانات
-                db.session.add(vehicle)
-                success_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                errors.append(f'الصف {index + 2}: خطأ في معالجة البيانات - {str(e)}')
-                continue
-        
-        # حفظ التغييرات
-        if success_count > 0:
-            try:
-                db.session.commit()
-                
-                # تسجيل العملية في سجل النشاطات
-                log_activity(
-                    action=f'استيراد السيارات من ملف Excel',
-                    entity_type='Vehicle',
-                    details=f'تم استيراد {success_count} سيارة بنجاح، {error_count} خطأ'
-                )
-                
-                flash(f'تم استيراد {success_count} سيارة بنجاح!', 'success')
-                
-                if error_count > 0:
-                    flash(f'حدثت {error_count} أخطاء أثناء الاستيراد', 'warning')
-                    
-            except Exception as e:
-                db.session.rollback()
-                flash(f'خطأ في حفظ البيانات: {str(e)}', 'error')
-                return redirect(url_for('vehicles.import_vehicles'))
-        else:
-            flash('لم يتم استيراد أي سيارة', 'warning')
-        
-        # إظهار الأخطاء إذا كانت موجودة
-        if errors:
-            for error in errors[:10]:  # إظهار أول 10 أخطاء فقط
-                flash(error, 'error')
-            if len(errors) > 10:
-                flash(f'وهناك {len(errors) - 10} أخطاء أخرى...', 'info')
-        
-        return redirect(url_for('vehicles.index'))
-        
-    except Exception as e:
-        flash(f'خطأ في قراءة الملف: {str(e)}', 'error')
-        return redirect(url_for('vehicles.import_vehicles'))
+    # حفظ الملف وتنفيذ الاستيراد كمهمة خلفية
+    path = new_artifact_path(os.path.splitext(file.filename)[1])
+    file.save(path)
+    job = JobQueueService.enqueue('vehicles.import', {'path': path}, user_id=current_user.id)
+    return job_started_response(job, url_for('vehicles.index'))
 
 
 
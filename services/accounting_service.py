@@ -7,6 +7,7 @@ from sqlalchemy import func, and_, or_
 from app import db
 from models_accounting import *
 from models import Employee, Vehicle
+from services.ledger_balance_service import LedgerBalanceService
 
 
 class AccountingService:
@@ -279,37 +280,14 @@ class AccountingService:
     
     @staticmethod
     def calculate_account_balance(account_id, as_of_date=None):
-        """حساب رصيد حساب معين"""
+        """حساب رصيد حساب معين (من الأرصدة الشهرية وقيود الشهر الجاري)"""
         try:
-            if not as_of_date:
-                as_of_date = date.today()
-            
             account = Account.query.get(account_id)
             if not account:
                 return Decimal('0')
             
-            # جمع المدين والدائن
-            debits = db.session.query(func.sum(TransactionEntry.amount)).join(Transaction).filter(
-                TransactionEntry.account_id == account_id,
-                TransactionEntry.entry_type == EntryType.DEBIT,
-                Transaction.transaction_date <= as_of_date,
-                Transaction.is_approved == True
-            ).scalar() or Decimal('0')
-            
-            credits = db.session.query(func.sum(TransactionEntry.amount)).join(Transaction).filter(
-                TransactionEntry.account_id == account_id,
-                TransactionEntry.entry_type == EntryType.CREDIT,
-                Transaction.transaction_date <= as_of_date,
-                Transaction.is_approved == True
-            ).scalar() or Decimal('0')
-            
-            # حساب الرصيد حسب نوع الحساب
-            if account.account_type in [AccountType.ASSETS, AccountType.EXPENSES]:
-                balance = debits - credits
-            else:
-                balance = credits - debits
-            
-            return balance
+            net = LedgerBalanceService.net_balances(as_of_date, [account_id]).get(account_id, Decimal('0'))
+            return LedgerBalanceService.signed_balance(account.account_type, net)
             
         except Exception as e:
             return Decimal('0')
@@ -365,10 +343,11 @@ class AccountingService:
         """تحديث أرصدة جميع الحسابات"""
         try:
             accounts = Account.query.filter_by(is_active=True).all()
+            balances = LedgerBalanceService.net_balances(date.today(), [account.id for account in accounts])
             
             for account in accounts:
-                balance = AccountingService.calculate_account_balance(account.id)
-                account.balance = balance
+                net = balances.get(account.id, Decimal('0'))
+                account.balance = LedgerBalanceService.signed_balance(account.account_type, net)
                 account.updated_at = datetime.utcnow()
             
             db.session.commit()
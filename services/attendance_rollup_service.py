@@ -0,0 +1,352 @@
+"""
+خدمة الملخص اليومي المجمّع لسجلات الحضور (attendance_daily_rollup)
+
+يُحدَّث الملخص تلقائياً عبر أحداث جلسة SQLAlchemy عند إضافة أو تعديل أو حذف
+سجلات الحضور، وتُنقل سجلات الموظف بين مفاتيح الملخص عند تغير أقسامه أو مشروعه أو
+حالته (نشط)، فتطابق الأعداد العضوية الحالية. يمكن إعادة بنائه لفترة محددة عبر الأمر:
+    flask rebuild-attendance-rollup --start 2025-01-01 --end 2025-12-31
+"""
+import logging
+from collections import Counter
+from sqlalchemy import case, event, func, literal, select, inspect
+from sqlalchemy.orm import Session
+from app import db
+from models import Attendance, AttendanceDailyRollup, Department, Employee, employee_departments
+from utils.db_upsert import upsert_rows
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KEY_COLUMNS = ('date', 'department_id', 'project', 'active', 'status')
+
+# خصائص الموظف التي يتغير بتغيرها مفتاح سجلاته في الملخص
+EMPLOYEE_MEMBERSHIP_ATTRIBUTES = ('project', 'status', 'departments')
+
+# يصبح True بعد التأكد (مرة واحدة لكل عملية) من أن الملخص مبني
+_rollup_initialized = False
+
+
+class AttendanceRollupService:
+    """إدارة الملخص اليومي المجمّع للحضور"""
+
+    @staticmethod
+    def ensure_initialized(connection=None, session=None):
+        """
+        التأكد من بناء الملخص قبل أول استخدام في العملية الحالية
+
+        إذا كان جدول الملخص فارغاً مع وجود سجلات حضور يُعاد بناؤه بالكامل. بدون اتصال
+        يتم ذلك في معاملة مستقلة؛ أما مع اتصال ضمن معاملة المستدعي فلا يُعلَّم الملخص
+        كمبني إلا بعد حفظ الجلسة (session) حتى لا يبقى العلم صحيحاً إذا تراجعت المعاملة.
+        :return: True إذا تمت إعادة البناء الآن
+        """
+        global _rollup_initialized
+        if _rollup_initialized:
+            return False
+
+        if connection is None:
+            with db.engine.begin() as connection:
+                rebuilt = AttendanceRollupService._initialize(connection)
+            _rollup_initialized = True
+            return rebuilt
+
+        rebuilt = AttendanceRollupService._initialize(connection)
+        if session is not None:
+            session.info['attendance_rollup_initialized'] = True
+        return rebuilt
+
+    @staticmethod
+    def _initialize(connection):
+        """إعادة بناء الملخص إذا كان فارغاً مع وجود سجلات حضور"""
+        rollup_table = AttendanceDailyRollup.__table__
+        attendance_table = Attendance.__table__
+
+        has_rollup = connection.execute(select(rollup_table.c.id).limit(1)).first() is not None
+        if has_rollup:
+            return False
+        has_attendance = connection.execute(select(attendance_table.c.id).limit(1)).first() is not None
+        if not has_attendance:
+            return False
+        logger.info("جدول ملخص الحضور فارغ، جاري إعادة بنائه بالكامل")
+        AttendanceRollupService.rebuild(connection)
+        return True
+
+    @staticmethod
+    def rebuild(connection, start_date=None, end_date=None):
+        """
+        إعادة بناء الملخص من جدول الحضور لفترة محددة (أو لكامل السجل)
+
+        :param connection: اتصال قاعدة البيانات أو الجلسة
+        :param start_date: تاريخ البداية (اختياري)
+        :param end_date: تاريخ النهاية (اختياري)
+        :return: عدد صفوف الملخص المُدرجة
+        """
+        rollup_table = AttendanceDailyRollup.__table__
+        attendance_table = Attendance.__table__
+        employee_table = Employee.__table__
+
+        def date_filter(column):
+            conditions = []
+            if start_date:
+                conditions.append(column >= start_date)
+            if end_date:
+                conditions.append(column <= end_date)
+            return conditions
+
+        connection.execute(rollup_table.delete().where(*date_filter(rollup_table.c.date)))
+
+        project = func.coalesce(employee_table.c.project, literal(AttendanceDailyRollup.NO_PROJECT))
+        active = case((employee_table.c.status == 'active', True), else_=False)
+        target_columns = ['date', 'department_id', 'project', 'active', 'status', 'count']
+
+        # صفوف إجمالي جميع الأقسام
+        all_departments = select(
+            attendance_table.c.date,
+            literal(AttendanceDailyRollup.ALL_DEPARTMENTS),
+            project,
+            active,
+            attendance_table.c.status,
+            func.count(attendance_table.c.id)
+        ).select_from(
+            attendance_table.join(employee_table, employee_table.c.id == attendance_table.c.employee_id)
+        ).where(
+            *date_filter(attendance_table.c.date)
+        ).group_by(attendance_table.c.date, project, active, attendance_table.c.status)
+
+        # صفوف كل قسم على حدة (عبر علاقة many-to-many)
+        per_department = select(
+            attendance_table.c.date,
+            employee_departments.c.department_id,
+            project,
+            active,
+            attendance_table.c.status,
+            func.count(attendance_table.c.id)
+        ).select_from(
+            attendance_table.join(
+                employee_table, employee_table.c.id == attendance_table.c.employee_id
+            ).join(
+                employee_departments, employee_departments.c.employee_id == attendance_table.c.employee_id
+            )
+        ).where(
+            *date_filter(attendance_table.c.date)
+        ).group_by(
+            attendance_table.c.date, employee_departments.c.department_id, project, active, attendance_table.c.status
+        )
+
+        inserted = 0
+        for source in (all_departments, per_department):
+            result = connection.execute(rollup_table.insert().from_select(target_columns, source))
+            inserted += max(result.rowcount or 0, 0)
+        return inserted
+
+    @staticmethod
+    def apply_deltas(connection, deltas, session=None, moved=None):
+        """
+        تطبيق فروقات الأعداد على الملخص
+
+        :param connection: اتصال قاعدة البيانات
+        :param deltas: Counter مفاتيحه (التاريخ، معرف الموظف، الحالة) وقيمه مقدار التغيير
+        :param session: جلسة ORM التي يتبع لها الاتصال (لتعليم الملخص كمبني بعد حفظها)
+        :param moved: الموظفون الذين تغيرت أقسامهم أو مشروعهم أو حالتهم، من snapshot_memberships
+        """
+        deltas = {key: value for key, value in deltas.items() if value}
+        moved = moved or {}
+        if not deltas and not moved:
+            return
+
+        if AttendanceRollupService.ensure_initialized(connection, session):
+            # إعادة البناء الكاملة تضمنت التغييرات الحالية بالفعل
+            return
+
+        employee_ids = {employee_id for _, employee_id, _ in deltas} | set(moved)
+        memberships = AttendanceRollupService.memberships(connection, employee_ids)
+
+        rollup_deltas = Counter()
+        for (day, employee_id, status), value in deltas.items():
+            for key in _membership_keys(memberships.get(employee_id)):
+                rollup_deltas[(day, *key, status)] += value
+
+        # نقل جميع سجلات الموظف المنقول من مفاتيحه السابقة إلى مفاتيحه الحالية
+        current_counts = AttendanceRollupService.attendance_counts(connection, moved)
+        for employee_id, (old_membership, old_counts) in moved.items():
+            for (day, status), value in old_counts.items():
+                for key in _membership_keys(old_membership):
+                    rollup_deltas[(day, *key, status)] -= value
+            for (day, status), value in current_counts.get(employee_id, {}).items():
+                for key in _membership_keys(memberships.get(employee_id)):
+                    rollup_deltas[(day, *key, status)] += value
+
+        rows = [
+            dict(zip(ROLLUP_KEY_COLUMNS, key), count=value)
+            for key, value in rollup_deltas.items() if value
+        ]
+        upsert_rows(connection, AttendanceDailyRollup.__table__, rows,
+                    key_columns=ROLLUP_KEY_COLUMNS, increment_columns=('count',))
+
+    @staticmethod
+    def memberships(connection, employee_ids):
+        """
+        عضوية الموظفين الحالية كما تُصنَّف في الملخص
+
+        :return: قاموس {معرف الموظف: (المشروع، نشط، قائمة معرفات الأقسام)}، والموظفون غير الموجودين ليسوا فيه
+        """
+        if not employee_ids:
+            return {}
+        employee_table = Employee.__table__
+        memberships = {}
+        for employee_id, project, status in connection.execute(
+            select(employee_table.c.id, employee_table.c.project, employee_table.c.status)
+            .where(employee_table.c.id.in_(employee_ids))
+        ):
+            memberships[employee_id] = (project or AttendanceDailyRollup.NO_PROJECT, status == 'active', [])
+        for employee_id, department_id in connection.execute(
+            select(employee_departments.c.employee_id, employee_departments.c.department_id).where(
+                employee_departments.c.employee_id.in_(memberships)
+            )
+        ):
+            memberships[employee_id][2].append(department_id)
+        return memberships
+
+    @staticmethod
+    def attendance_counts(connection, employee_ids):
+        """أعداد سجلات حضور الموظفين حسب (التاريخ، الحالة): {معرف الموظف: Counter}"""
+        if not employee_ids:
+            return {}
+        attendance_table = Attendance.__table__
+        counts = {}
+        for employee_id, day, status, value in connection.execute(
+            select(
+                attendance_table.c.employee_id, attendance_table.c.date,
+                attendance_table.c.status, func.count(attendance_table.c.id)
+            ).where(
+                attendance_table.c.employee_id.in_(employee_ids)
+            ).group_by(attendance_table.c.employee_id, attendance_table.c.date, attendance_table.c.status)
+        ):
+            counts.setdefault(employee_id, Counter())[(day, status)] += value
+        return counts
+
+    @staticmethod
+    def snapshot_memberships(connection, employee_ids):
+        """
+        العضوية وأعداد الحضور الحالية للموظفين قبل تعديل عضويتهم (تُقرأ قبل الدفعة)
+
+        :return: قاموس {معرف الموظف: (العضوية، Counter أعداد الحضور)} يُمرَّر إلى apply_deltas
+        """
+        memberships = AttendanceRollupService.memberships(connection, employee_ids)
+        counts = AttendanceRollupService.attendance_counts(connection, memberships)
+        return {
+            employee_id: (membership, counts.get(employee_id, Counter()))
+            for employee_id, membership in memberships.items()
+        }
+
+
+def _membership_keys(membership):
+    """مفاتيح الملخص (القسم، المشروع، نشط) التي تُحسب فيها سجلات موظف بهذه العضوية"""
+    if membership is None:
+        # سجلات موظف غير موجود لا تُحسب (مثل إعادة البناء التي تربط الحضور بالموظفين)
+        return []
+    project, active, department_ids = membership
+    keys = [(AttendanceDailyRollup.ALL_DEPARTMENTS, project, active)]
+    keys.extend((department_id, project, active) for department_id in department_ids)
+    return keys
+
+
+def _committed_value(obj, attribute):
+    """القيمة المحفوظة سابقاً لخاصية (قبل التعديل الحالي)"""
+    history = inspect(obj).attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, attribute)
+
+
+def _has_changes(obj, attributes):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attributes)
+
+
+@event.listens_for(Session, 'before_flush')
+def _snapshot_membership_changes(session, flush_context, instances):
+    """
+    حفظ العضوية وأعداد الحضور السابقة للموظفين الذين ستتغير أقسامهم أو مشروعهم أو حالتهم
+
+    تُقرأ قبل الدفعة لأن سجلاتهم محسوبة في الملخص بالعضوية السابقة، ثم تُنقل في after_flush.
+    """
+    employee_ids = set()
+    deleted_departments = []
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Employee) and obj.id is not None and _has_changes(obj, EMPLOYEE_MEMBERSHIP_ATTRIBUTES):
+            employee_ids.add(obj.id)
+        elif isinstance(obj, Department):
+            # تعديل الأقسام من جهة القسم (ومنها قسم جديد) لا يظهر دائماً في تاريخ خاصية الموظف
+            history = inspect(obj).attrs['employees'].history
+            employee_ids.update(
+                employee.id for employee in (*history.added, *history.deleted) if inspect(employee).persistent
+            )
+    for obj in session.deleted:
+        if isinstance(obj, Employee):
+            employee_ids.add(obj.id)
+        elif isinstance(obj, Department):
+            deleted_departments.append(obj.id)
+
+    if deleted_departments:
+        employee_ids.update(session.connection().execute(
+            select(employee_departments.c.employee_id).where(
+                employee_departments.c.department_id.in_(deleted_departments)
+            )
+        ).scalars())
+
+    moved = session.info.setdefault('attendance_rollup_moves', {})
+    employee_ids.difference_update(moved)
+    employee_ids.discard(None)
+    if employee_ids:
+        moved.update(AttendanceRollupService.snapshot_memberships(session.connection(), employee_ids))
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_attendance_changes(session, flush_context):
+    """تحديث الملخص بفروقات سجلات الحضور المضافة والمعدلة والمحذوفة في هذه الدفعة"""
+    moved = session.info.pop('attendance_rollup_moves', {})
+    deltas = Counter()
+
+    for obj in session.new:
+        if isinstance(obj, Attendance):
+            deltas[(obj.date, obj.employee_id, obj.status)] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Attendance):
+            key = tuple(_committed_value(obj, attr) for attr in ('date', 'employee_id', 'status'))
+            deltas[key] -= 1
+
+    for obj in session.dirty:
+        if isinstance(obj, Attendance):
+            if not _has_changes(obj, ('date', 'employee_id', 'status')):
+                continue
+            old_key = tuple(_committed_value(obj, attr) for attr in ('date', 'employee_id', 'status'))
+            deltas[old_key] -= 1
+            deltas[(obj.date, obj.employee_id, obj.status)] += 1
+
+    # سجلات الموظفين المنقولين تُعاد حسابها بالكامل في apply_deltas
+    for key in [key for key in deltas if key[1] in moved]:
+        del deltas[key]
+
+    if deltas or moved:
+        AttendanceRollupService.apply_deltas(session.connection(), deltas, session, moved)
+
+
+@event.listens_for(Session, 'after_commit')
+def _mark_rollup_initialized(session):
+    """تعليم الملخص كمبني بعد حفظ المعاملة التي تحققت منه أو أعادت بناءه"""
+    global _rollup_initialized
+    if session.info.pop('attendance_rollup_initialized', False):
+        _rollup_initialized = True
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rollup_initialized(session):
+    session.info.pop('attendance_rollup_initialized', None)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_membership_snapshots(session, previous_transaction):
+    """تجاهل لقطات العضوية لدفعة فشلت أو أُلغيت"""
+    session.info.pop('attendance_rollup_moves', None)
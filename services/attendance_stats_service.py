@@ -0,0 +1,149 @@
+"""
+خدمة تجميع إحصائيات الحضور
+"""
+from collections import defaultdict
+from datetime import timedelta
+from sqlalchemy import func
+from app import db
+from models import AttendanceDailyRollup, Employee, employee_departments
+from services.attendance_rollup_service import AttendanceRollupService
+
+
+ATTENDANCE_STATUSES = ('present', 'absent', 'leave', 'sick')
+
+
+class AttendanceGrid:
+    """شبكة أعداد الحضور مفهرسة بـ (التاريخ، الحالة) مع بُعد اختياري"""
+
+    def __init__(self, rows, with_dimension=False):
+        self.with_dimension = with_dimension
+        # {date: {status: count}} أو {dimension: {date: {status: count}}}
+        self._cells = defaultdict(lambda: defaultdict(int))
+        self._by_dimension = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+
+        for row in rows:
+            if with_dimension:
+                day, status, dimension, count = row
+                self._by_dimension[dimension][day][status] += count
+            else:
+                day, status, count = row
+            self._cells[day][status] += count
+
+    @staticmethod
+    def _empty_counts():
+        return {status: 0 for status in ATTENDANCE_STATUSES}
+
+    def for_day(self, day, dimension=None):
+        """أعداد الحالات ليوم واحد"""
+        return self.totals(day, day, dimension)
+
+    def totals(self, start_date, end_date, dimension=None):
+        """مجموع أعداد الحالات خلال فترة (شاملة الطرفين)"""
+        cells = self._by_dimension[dimension] if dimension is not None else self._cells
+        result = self._empty_counts()
+        for day, counts in cells.items():
+            if start_date <= day <= end_date:
+                for status, count in counts.items():
+                    result[status] = result.get(status, 0) + count
+        return result
+
+    def daily_series(self, start_date, end_date, dimension=None):
+        """سلسلة يومية لكل تاريخ في الفترة لاستخدامها في المخططات"""
+        cells = self._by_dimension[dimension] if dimension is not None else self._cells
+        series = []
+        current = start_date
+        while current <= end_date:
+            counts = self._empty_counts()
+            counts.update(cells.get(current, {}))
+            series.append({
+                'date': current.strftime('%Y-%m-%d'),
+                'day': str(current.day),
+                **counts
+            })
+            current += timedelta(days=1)
+        return series
+
+    def dimensions(self):
+        """قيم البُعد الموجودة في النتيجة (الأقسام أو المشاريع)"""
+        return list(self._by_dimension.keys())
+
+
+class AttendanceStatsService:
+    """محرك تجميع إحصائيات الحضور باستعلام واحد مجمّع"""
+
+    @staticmethod
+    def aggregate(start_date, end_date, project_name=None, department_id=None, dimension=None, active_only=False):
+        """
+        تجميع أعداد الحضور حسب (التاريخ × الحالة) في استعلام واحد من جدول الملخص اليومي
+
+        الأقسام والمشروع هي العضوية الحالية للموظفين (يُنقل الملخص عند تغيرها).
+        :param start_date: تاريخ البداية
+        :param end_date: تاريخ النهاية
+        :param project_name: تقييد النتائج بموظفي مشروع نشطين (اختياري)
+        :param department_id: تقييد النتائج بقسم معين (اختياري)
+        :param dimension: بُعد إضافي للتجميع: 'department' أو 'project' (اختياري)
+        :param active_only: الاقتصار على الموظفين النشطين
+        :return: كائن AttendanceGrid
+        """
+        AttendanceRollupService.ensure_initialized()
+
+        rollup = AttendanceDailyRollup
+        columns = [rollup.date, rollup.status]
+        group_by = [rollup.date, rollup.status]
+
+        query_filters = [rollup.date >= start_date, rollup.date <= end_date]
+
+        if dimension == 'department':
+            columns.append(rollup.department_id)
+            group_by.append(rollup.department_id)
+            query_filters.append(rollup.department_id != rollup.ALL_DEPARTMENTS)
+        else:
+            query_filters.append(rollup.department_id == (department_id or rollup.ALL_DEPARTMENTS))
+
+        if dimension == 'project':
+            columns.append(rollup.project)
+            group_by.append(rollup.project)
+
+        if department_id and dimension == 'department':
+            query_filters.append(rollup.department_id == department_id)
+        if project_name:
+            query_filters.append(rollup.project == project_name)
+        if project_name or active_only:
+            query_filters.append(rollup.active.is_(True))
+
+        rows = db.session.query(*columns, func.sum(rollup.count)).filter(
+            *query_filters
+        ).group_by(*group_by).all()
+        rows = [(*row[:-1], int(row[-1] or 0)) for row in rows]
+        return AttendanceGrid(rows, with_dimension=dimension in ('department', 'project'))
+
+    @staticmethod
+    def count_active_employees(project_name=None, department_id=None):
+        """عدد الموظفين النشطين المرتبطين بأقسام أو بمشروع محدد"""
+        query = db.session.query(func.count(func.distinct(Employee.id))).filter(
+            Employee.status == 'active'
+        )
+        if project_name:
+            query = query.filter(Employee.project == project_name)
+        else:
+            query = query.join(
+                employee_departments, Employee.id == employee_departments.c.employee_id
+            )
+            if department_id:
+                query = query.filter(employee_departments.c.department_id == department_id)
+        return query.scalar() or 0
+
+    @staticmethod
+    def count_active_employees_by_department(project_name=None):
+        """عدد الموظفين النشطين لكل قسم في استعلام واحد"""
+        query = db.session.query(
+            employee_departments.c.department_id,
+            func.count(func.distinct(Employee.id))
+        ).join(
+            Employee, Employee.id == employee_departments.c.employee_id
+        ).filter(
+            Employee.status == 'active'
+        )
+        if project_name:
+            query = query.filter(Employee.project == project_name)
+        return dict(query.group_by(employee_departments.c.department_id).all())
@@ -0,0 +1,131 @@
+"""
+خدمة التسجيل الجماعي للحضور (موظفون × أيام) بجمل UPSERT مجمّعة
+
+بدلاً من استعلام SELECT لكل موظف ولكل يوم ثم إضافة أو تعديل كائن ORM، تُقرأ
+السجلات الموجودة للشبكة كاملة على دفعات، ثم تُكتب جميع الخلايا بجمل
+INSERT ... ON CONFLICT DO UPDATE (أو ما يقابلها في SQLite و MySQL) على القيد
+الفريد (employee_id, date). الكتابة المباشرة لا تمر بأحداث ORM، لذلك تُطبق فروقات
+ملخص الحضور اليومي يدوياً من الحالات السابقة المقروءة.
+"""
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app import db
+from models import Attendance
+from services.attendance_rollup_service import AttendanceRollupService
+from utils.db_upsert import upsert_rows
+
+logger = logging.getLogger(__name__)
+
+# عدد الصفوف في كل جملة إدراج (7 أعمدة لكل صف، أقل من حد متغيرات SQLite)
+UPSERT_CHUNK_SIZE = 500
+
+# عدد الموظفين في كل استعلام لقراءة السجلات الموجودة
+READ_CHUNK_SIZE = 500
+
+
+class AttendanceUpsertResult:
+    """نتيجة التسجيل الجماعي"""
+
+    def __init__(self, inserted=0, updated=0, skipped=0):
+        self.inserted = inserted
+        self.updated = updated
+        self.skipped = skipped
+
+    @property
+    def total(self):
+        """عدد السجلات التي تمت كتابتها (الجديدة والمحدثة)"""
+        return self.inserted + self.updated
+
+
+def date_range(start_date, end_date):
+    """قائمة الأيام من تاريخ البداية إلى تاريخ النهاية شاملة"""
+    return [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class AttendanceUpsertService:
+    """كتابة شبكة حضور (موظفون × أيام) دفعة واحدة"""
+
+    @staticmethod
+    def upsert_grid(employee_ids, dates, status, overwrite=True, clear_times=True, connection=None):
+        """
+        تسجيل الحالة نفسها لكل موظف في كل يوم
+
+        لا تحفظ الجلسة؛ الكتابة تتم ضمن معاملة المستدعي.
+        :param employee_ids: أرقام الموظفين
+        :param dates: الأيام المطلوبة
+        :param status: حالة الحضور (present, absent, leave, sick)
+        :param overwrite: تحديث السجلات الموجودة، أو تركها كما هي إذا كانت False
+        :param clear_times: مسح وقتي الدخول والخروج للسجلات المحدثة إذا كانت الحالة غير present
+        :param connection: اتصال قاعدة البيانات (افتراضياً جلسة الطلب)
+        :return: كائن AttendanceUpsertResult
+        """
+        session = None if connection else db.session()
+        connection = connection or session.connection()
+        employee_ids = sorted({int(employee_id) for employee_id in employee_ids})
+        dates = sorted(set(dates))
+        result = AttendanceUpsertResult()
+        if not employee_ids or not dates:
+            return result
+
+        table = Attendance.__table__
+        wanted_dates = set(dates)
+
+        # الحالات الحالية للخلايا الموجودة: (الموظف، اليوم) -> الحالة
+        existing = {}
+        for employee_chunk in _chunks(employee_ids, READ_CHUNK_SIZE):
+            for employee_id, day, old_status in connection.execute(
+                select(table.c.employee_id, table.c.date, table.c.status).where(
+                    table.c.employee_id.in_(employee_chunk),
+                    table.c.date >= dates[0],
+                    table.c.date <= dates[-1]
+                )
+            ):
+                if day in wanted_dates:
+                    existing[(employee_id, day)] = old_status
+
+        now = datetime.utcnow()
+        reset_times = clear_times and status != 'present'
+        rollup_deltas = Counter()
+        rows = []
+        for employee_id in employee_ids:
+            for day in dates:
+                old_status = existing.get((employee_id, day))
+                if old_status is None:
+                    result.inserted += 1
+                elif not overwrite:
+                    result.skipped += 1
+                    continue
+                else:
+                    result.updated += 1
+                    rollup_deltas[(day, employee_id, old_status)] -= 1
+                rollup_deltas[(day, employee_id, status)] += 1
+                rows.append({
+                    'employee_id': employee_id,
+                    'date': day,
+                    'status': status,
+                    'check_in': None,
+                    'check_out': None,
+                    'created_at': now,
+                    'updated_at': now
+                })
+
+        update_columns = ()
+        if overwrite:
+            update_columns = ('status', 'updated_at') + (('check_in', 'check_out') if reset_times else ())
+
+        for chunk in _chunks(rows, UPSERT_CHUNK_SIZE):
+            upsert_rows(connection, table, chunk, key_columns=('employee_id', 'date'), update_columns=update_columns)
+
+        AttendanceRollupService.apply_deltas(connection, rollup_deltas, session)
+        logger.info(
+            f"تسجيل حضور جماعي: {len(employee_ids)} موظف × {len(dates)} يوم "
+            f"({result.inserted} جديد، {result.updated} محدث، {result.skipped} متجاوز)"
+        )
+        return result
@@ -0,0 +1,286 @@
+"""
+معالجات المهام الخلفية للعمليات الطويلة (التصدير الشامل، الاستيراد، إشعارات الرواتب المجمعة،
+تقارير PDF)
+
+تُنفَّذ في عملية العامل (flask run-job-worker)، ويتم حفظ التغييرات مع حالة المهمة
+في نهاية التنفيذ بواسطة JobQueueService.run.
+"""
+import os
+from datetime import datetime
+import pandas as pd
+from flask import current_app
+from flask_login import login_user
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.http import parse_options_header
+from app import db
+from models import Department, Document, Employee, SystemAudit, User, Vehicle
+from services.job_queue_service import job_handler
+
+# مفتاح في بيئة الطلب يميز طلب تقرير PDF المُعاد تنفيذه داخل العامل عن طلب المستخدم الأصلي
+REPORT_JOB_ENVIRON_KEY = 'nuzum.report_job'
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# عدد السجلات بين كل تحديث لتقدم المهمة
+PROGRESS_EVERY = 50
+
+VEHICLE_STATUS_REVERSE_MAP = {
+    'متاحة': 'available',
+    'مؤجرة': 'rented',
+    'في المشروع': 'in_project',
+    'في الورشة': 'in_workshop',
+    'حادث': 'accident'
+}
+
+VEHICLE_REQUIRED_COLUMNS = ['رقم اللوحة', 'الشركة المصنعة', 'الموديل', 'السنة', 'اللون', 'نوع السيارة']
+
+
+def _remove_upload(path):
+    """حذف الملف المرفوع بعد انتهاء الاستيراد"""
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+@job_handler('employees.export_comprehensive')
+def export_employees_comprehensive(context):
+    """التصدير الشامل لبيانات الموظفين إلى ملف Excel"""
+    from utils.basic_comprehensive_export import generate_comprehensive_employee_excel
+
+    context.progress(5, message='جاري تحميل بيانات الموظفين')
+    employees = Employee.query.options(
+        db.selectinload(Employee.departments),
+        db.selectinload(Employee.nationality_rel),
+        db.selectinload(Employee.salaries),
+        db.selectinload(Employee.attendances),
+        db.selectinload(Employee.documents)
+    ).all()
+
+    context.progress(40, message=f'جاري إنشاء ملف Excel لـ {len(employees)} موظف')
+    output = generate_comprehensive_employee_excel(employees)
+
+    path = context.artifact_path('.xlsx')
+    with open(path, 'wb') as artifact:
+        artifact.write(output.getbuffer())
+
+    db.session.add(SystemAudit(
+        action='export_comprehensive',
+        entity_type='employee',
+        entity_id=0,
+        details=f'تم التصدير الشامل لبيانات {len(employees)} موظف مع جميع التفاصيل',
+        user_id=context.user_id
+    ))
+
+    current_date = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return {
+        'message': f'تم تصدير بيانات {len(employees)} موظف',
+        'file': path,
+        'download_name': f'تصدير_شامل_الموظفين_{current_date}.xlsx',
+        'mimetype': XLSX_MIMETYPE
+    }
+
+
+@job_handler('reports.pdf')
+def render_report_pdf(context, endpoint, path, query_string=''):
+    """
+    إنشاء تقرير PDF بإعادة تنفيذ مسار التقرير داخل العامل باسم صاحب المهمة
+
+    يُنفذ الطلب في سياق تطبيق مستقل (جلسة قاعدة بيانات ومتغيرات g خاصة به) حتى لا
+    يبقى المستخدم مسجلاً في سياق العامل بعد انتهاء المهمة.
+    """
+    user = db.session.get(User, context.user_id)
+    if user is None:
+        raise ValueError('صاحب المهمة غير موجود')
+
+    context.progress(10, message='جاري إنشاء التقرير')
+    app = current_app._get_current_object()
+    output_path = context.artifact_path('.pdf')
+    with app.app_context(), app.test_request_context(
+        path, query_string=query_string, environ_overrides={REPORT_JOB_ENVIRON_KEY: True}
+    ):
+        login_user(user)
+        response = app.full_dispatch_request()
+        try:
+            if response.status_code != 200 or response.mimetype != 'application/pdf':
+                raise ValueError(f'تعذر إنشاء التقرير ({endpoint})')
+            with open(output_path, 'wb') as artifact:
+                for chunk in response.iter_encoded():
+                    artifact.write(chunk)
+        finally:
+            response.close()
+
+    _, options = parse_options_header(response.headers.get('Content-Disposition', ''))
+    return {
+        'message': 'تم إنشاء التقرير',
+        'file': output_path,
+        'download_name': options.get('filename') or os.path.basename(output_path),
+        'mimetype': 'application/pdf'
+    }
+
+
+@job_handler('salaries.batch_notifications')
+def batch_salary_notifications(context, month, year, department_id=None, notification_type='pdf'):
+    """إنشاء أو إرسال إشعارات الرواتب المجمعة لقسم أو لجميع الموظفين"""
+    from utils.salary_notification import generate_batch_salary_notifications
+    from utils.whatsapp_notification import send_batch_salary_notifications_whatsapp
+
+    if department_id:
+        department = Department.query.get(department_id)
+        target = f'لموظفي قسم {department.name if department else "غير معروف"}'
+    else:
+        target = 'لجميع الموظفين'
+
+    context.progress(5, message=f'جاري معالجة إشعارات الرواتب {target}')
+
+    if notification_type == 'whatsapp':
+        success_count, failure_count, error_messages = send_batch_salary_notifications_whatsapp(
+            department_id, month, year,
+            progress=lambda done, total: context.progress(5 + done * 90 // total, message=f'تم إرسال {done} من {total} إشعار')
+        )
+        if success_count > 0:
+            db.session.add(SystemAudit(
+                action='batch_whatsapp_notifications',
+                entity_type='salary',
+                entity_id=0,
+                details=f'تم إرسال {success_count} إشعار راتب عبر WhatsApp {target} لشهر {month}/{year}',
+                user_id=context.user_id
+            ))
+            message = f'تم إرسال {success_count} إشعار راتب عبر WhatsApp بنجاح'
+            if failure_count > 0:
+                message = f'تم إرسال {success_count} إشعار راتب بنجاح و {failure_count} فشل'
+        else:
+            message = f'لم يتم إرسال أي إشعارات. {error_messages[0] if error_messages else f"لا توجد رواتب مسجلة {target} في شهر {month}/{year}"}'
+        return {'message': message, 'success_count': success_count,
+                'failure_count': failure_count, 'errors': error_messages}
+
+    processed_employees = generate_batch_salary_notifications(department_id, month, year)
+    if processed_employees:
+        db.session.add(SystemAudit(
+            action='batch_notifications',
+            entity_type='salary',
+            entity_id=0,
+            details=f'تم إنشاء {len(processed_employees)} إشعار راتب {target} لشهر {month}/{year}',
+            user_id=context.user_id
+        ))
+        message = f'تم إنشاء {len(processed_employees)} إشعار راتب {target}'
+    else:
+        message = f'لا توجد رواتب مسجلة {target} في شهر {month}/{year}'
+    return {'message': message, 'success_count': len(processed_employees)}
+
+
+@job_handler('documents.import')
+def import_documents(context, path):
+    """استيراد الوثائق من ملف Excel مرفوع"""
+    from utils.excel import parse_document_excel
+
+    try:
+        with open(path, 'rb') as upload:
+            documents_data = parse_document_excel(upload)
+
+        success_count = 0
+        error_count = 0
+        for index, data in enumerate(documents_data):
+            try:
+                with db.session.begin_nested():
+                    db.session.add(Document(**data))
+                success_count += 1
+            except (SQLAlchemyError, TypeError, ValueError):
+                error_count += 1
+            if index % PROGRESS_EVERY == 0:
+                context.progress(index, len(documents_data), f'تمت معالجة {index} من {len(documents_data)} وثيقة')
+    finally:
+        _remove_upload(path)
+
+    db.session.add(SystemAudit(
+        action='import',
+        entity_type='document',
+        entity_id=0,
+        details=f'تم استيراد {success_count} وثيقة بنجاح و {error_count} فشل',
+        user_id=context.user_id
+    ))
+    return {'message': f'تم استيراد {success_count} وثيقة بنجاح و {error_count} فشل',
+            'success_count': success_count, 'failure_count': error_count}
+
+
+@job_handler('vehicles.import')
+def import_vehicles(context, path):
+    """استيراد السيارات من ملف Excel مرفوع"""
+    try:
+        df = pd.read_excel(path)
+    finally:
+        _remove_upload(path)
+
+    missing_columns = [col for col in VEHICLE_REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        raise ValueError(f'الأعمدة التالية مفقودة في الملف: {", ".join(missing_columns)}')
+
+    existing_plates = {plate for plate, in db.session.query(Vehicle.plate_number).all()}
+    success_count = 0
+    errors = []
+
+    for index, row in df.iterrows():
+        if index % PROGRESS_EVERY == 0:
+            context.progress(index, len(df), f'تمت معالجة {index} من {len(df)} صف')
+        try:
+            # التحقق من وجود رقم اللوحة
+            if pd.isna(row['رقم اللوحة']) or str(row['رقم اللوحة']).strip() == '':
+                errors.append(f'الصف {index + 2}: رقم اللوحة مطلوب')
+                continue
+
+            plate_number = str(row['رقم اللوحة']).strip()
+
+            # التحقق من عدم وجود السيارة مسبقاً (في قاعدة البيانات أو في صف سابق من الملف)
+            if plate_number in existing_plates:
+                errors.append(f'الصف {index + 2}: السيارة برقم اللوحة {plate_number} موجودة مسبقاً')
+                continue
+
+            vehicle = Vehicle()
+            vehicle.plate_number = plate_number
+            vehicle.make = str(row['الشركة المصنعة']).strip() if not pd.isna(row['الشركة المصنعة']) else ''
+            vehicle.model = str(row['الموديل']).strip() if not pd.isna(row['الموديل']) else ''
+            vehicle.color = str(row['اللون']).strip() if not pd.isna(row['اللون']) else ''
+            vehicle.type_of_car = str(row['نوع السيارة']).strip() if not pd.isna(row['نوع السيارة']) else 'سيارة عادية'
+
+            # معالجة السنة
+            if not pd.isna(row['السنة']):
+                try:
+                    vehicle.year = int(float(row['السنة']))
+                except (ValueError, TypeError):
+                    vehicle.year = None
+            else:
+                vehicle.year = None
+
+            # معالجة الحالة
+            if 'الحالة' in df.columns and not pd.isna(row['الحالة']):
+                vehicle.status = VEHICLE_STATUS_REVERSE_MAP.get(str(row['الحالة']).strip(), 'available')
+            else:
+                vehicle.status = 'available'
+
+            if 'ملاحظات' in df.columns and not pd.isna(row['ملاحظات']):
+                vehicle.notes = str(row['ملاحظات']).strip()
+
+            vehicle.created_at = datetime.now()
+            vehicle.updated_at = datetime.now()
+
+            db.session.add(vehicle)
+            existing_plates.add(plate_number)
+            success_count += 1
+
+        except Exception as e:
+            errors.append(f'الصف {index + 2}: خطأ في معالجة البيانات - {str(e)}')
+
+    if success_count > 0:
+        db.session.add(SystemAudit(
+            action='import',
+            entity_type='vehicle',
+            entity_id=0,
+            details=f'تم استيراد {success_count} سيارة بنجاح، {len(errors)} خطأ',
+            user_id=context.user_id
+        ))
+        message = f'تم استيراد {success_count} سيارة بنجاح!'
+        if errors:
+            message += f' حدثت {len(errors)} أخطاء أثناء الاستيراد'
+    else:
+        message = 'لم يتم استيراد أي سيارة'
+
+    return {'message': message, 'success_count': success_count,
+            'failure_count': len(errors), 'errors': errors}
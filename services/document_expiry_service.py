@@ -0,0 +1,104 @@
+"""
+خدمة إحصائيات انتهاء صلاحية وثائق الموظفين
+"""
+from datetime import date, timedelta
+from sqlalchemy import func
+from app import db
+from models import Document, Employee
+from utils.sql_aggregates import count_when
+
+
+# عدد الأيام التي تعتبر فيها الوثيقة "قريبة من الانتهاء"
+EXPIRING_WINDOW_DAYS = 30
+
+
+class DocumentExpiryService:
+    """حساب إحصائيات وقوائم انتهاء الوثائق في قاعدة البيانات بدلاً من تحميل جميع الوثائق"""
+
+    @staticmethod
+    def stats(today=None, windows=(EXPIRING_WINDOW_DAYS,)):
+        """
+        أعداد الوثائق حسب حالة الانتهاء في استعلام تجميعي واحد
+
+        :param today: تاريخ المقارنة (الافتراضي اليوم)
+        :param windows: حدود فترات "قريبة من الانتهاء" بالأيام بترتيب تصاعدي، مثل (30, 60, 90)
+        :return: قاموس يحتوي على:
+            total: إجمالي الوثائق
+            expired: الوثائق المنتهية
+            expiring: الوثائق التي تنتهي خلال الفترة الأولى (من اليوم حتى windows[0] يوماً)
+            expiring_<n>: الوثائق التي تنتهي بعد الفترة السابقة وحتى n يوماً
+            valid: الوثائق السارية بعد الفترة الأولى
+            no_expiry: الوثائق بدون تاريخ انتهاء
+        """
+        today = today or date.today()
+        expiry = Document.expiry_date
+
+        columns = [
+            func.count(Document.id).label('total'),
+            count_when(expiry.is_(None)).label('no_expiry'),
+            count_when(expiry < today).label('expired'),
+            count_when(expiry > today + timedelta(days=windows[0])).label('valid'),
+        ]
+        lower = today
+        for index, days in enumerate(windows):
+            upper = today + timedelta(days=days)
+            # الفترة الأولى تشمل اليوم الحالي، والفترات التالية تبدأ بعد نهاية السابقة
+            in_window = expiry.between(lower, upper) if index == 0 else (expiry > lower) & (expiry <= upper)
+            columns.append(count_when(in_window).label(f'expiring_{days}'))
+            lower = upper
+
+        row = db.session.query(*columns).one()
+        result = {key: int(value) for key, value in row._mapping.items()}
+        result['expiring'] = result[f'expiring_{windows[0]}']
+        return result
+
+    @staticmethod
+    def type_counts():
+        """عدد الوثائق لكل نوع"""
+        return dict(db.session.query(
+            Document.document_type, func.count(Document.id)
+        ).group_by(Document.document_type).all())
+
+    @staticmethod
+    def documents_query(start_date=None, end_date=None):
+        """
+        استعلام الوثائق ذات تاريخ انتهاء ضمن فترة مع بيانات الموظف في نفس الاستعلام
+
+        يعيد الأعمدة المطلوبة للعرض فقط بدلاً من كائنات الوثائق والموظفين الكاملة.
+        """
+        query = db.session.query(
+            Document.id,
+            Document.employee_id,
+            Document.document_type,
+            Document.document_number,
+            Document.expiry_date,
+            Employee.name.label('employee_name'),
+            Employee.mobile.label('employee_mobile'),
+            Employee.contract_type.label('contract_type'),
+            Employee.nationality.label('nationality')
+        ).join(
+            Employee, Employee.id == Document.employee_id
+        ).filter(
+            Document.expiry_date.isnot(None)
+        )
+        if start_date is not None:
+            query = query.filter(Document.expiry_date >= start_date)
+        if end_date is not None:
+            query = query.filter(Document.expiry_date <= end_date)
+        return query
+
+    @staticmethod
+    def expiring_documents(days, today=None):
+        """الوثائق التي تنتهي خلال عدد محدد من الأيام مرتبة حسب تاريخ الانتهاء"""
+        today = today or date.today()
+        return DocumentExpiryService.documents_query(
+            today, today + timedelta(days=days)
+        ).order_by(Document.expiry_date).all()
+
+    @staticmethod
+    def expired_documents(today=None):
+        """الوثائق المنتهية مرتبة من الأحدث انتهاءً"""
+        today = today or date.today()
+        return DocumentExpiryService.documents_query(
+            end_date=today - timedelta(days=1)
+        ).order_by(Document.expiry_date.desc()).all()
@@ -0,0 +1,215 @@
+"""
+خدمة الاستيراد الجماعي للموظفين من ملفات Excel
+
+تحمّل أرقام الموظفين وأرقام الهوية الموجودة وخريطة الأقسام مرة واحدة،
+ثم تُدرج الموظفين على دفعات داخل نقاط حفظ (savepoints) في معاملة واحدة
+وتُرجع تقريراً بأخطاء كل سجل.
+"""
+import logging
+from datetime import date
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from models import Department, Employee, employee_departments
+from utils.date_converter import parse_date
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 500
+
+# عدد القيم في استعلام IN الواحد عند فحص التكرار في قاعدة البيانات
+LOOKUP_CHUNK_SIZE = 1000
+
+REQUIRED_FIELDS = ('name', 'employee_id', 'national_id', 'mobile', 'job_title')
+
+EMPLOYEE_COLUMNS = set(Employee.__table__.columns.keys()) - {'id'}
+DATE_COLUMNS = {name for name in EMPLOYEE_COLUMNS if isinstance(Employee.__table__.c[name].type, db.Date)}
+
+
+class ImportReport:
+    """نتيجة الاستيراد: عدد السجلات المضافة وأخطاء كل سجل"""
+
+    def __init__(self, total):
+        self.total = total
+        self.imported = 0
+        self.errors = []
+
+    def add_error(self, row_number, message):
+        self.errors.append((row_number, message))
+
+    @property
+    def error_count(self):
+        return len(self.errors)
+
+    def summary(self, limit=5):
+        """ملخص نصي لأول الأخطاء لعرضه في رسالة أو سجل المراجعة"""
+        summary = ", ".join(message for _, message in self.errors[:limit])
+        if len(self.errors) > limit:
+            summary += " وغيرها من الأخطاء..."
+        return summary
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _existing_values(column, values):
+    """القيم الموجودة مسبقاً في عمود من جدول الموظفين من بين مجموعة قيم"""
+    existing = set()
+    for chunk in _chunks(list(values), LOOKUP_CHUNK_SIZE):
+        existing.update(db.session.execute(select(column).where(column.in_(chunk))).scalars())
+    return existing
+
+
+def _column_default(name):
+    """القيمة الافتراضية الثابتة للعمود (إن وجدت) لتوحيد مفاتيح صفوف الإدراج"""
+    default = Employee.__table__.c[name].default
+    if default is not None and default.is_scalar:
+        return default.arg
+    return None
+
+
+class EmployeeImportService:
+    """استيراد الموظفين على دفعات بدلاً من استعلامات وحفظ لكل سجل"""
+
+    @staticmethod
+    def import_employees(employees_data, department_id=None, batch_size=IMPORT_BATCH_SIZE):
+        """
+        استيراد قائمة موظفين ناتجة عن parse_employee_excel
+
+        لا تقوم الدالة بالحفظ النهائي (commit)، ويتولى ذلك المستدعي بعد تسجيل العملية.
+
+        :param employees_data: قائمة قواميس بيانات الموظفين
+        :param department_id: ربط جميع الموظفين بهذا القسم بدلاً من عمود القسم في الملف (اختياري)
+        :param batch_size: عدد الموظفين في كل دفعة إدراج
+        :return: كائن ImportReport
+        """
+        report = ImportReport(len(employees_data))
+
+        existing_employee_ids = _existing_values(
+            Employee.employee_id, {data.get('employee_id') for data in employees_data if data.get('employee_id')}
+        )
+        existing_national_ids = _existing_values(
+            Employee.national_id, {data.get('national_id') for data in employees_data if data.get('national_id')}
+        )
+        departments = dict(db.session.query(Department.name, Department.id).all())
+
+        seen_employee_ids = set()
+        seen_national_ids = set()
+        pending = []
+
+        for index, data in enumerate(employees_data):
+            row_number = index + 1
+            error = EmployeeImportService._validate(
+                data, existing_employee_ids, existing_national_ids, seen_employee_ids, seen_national_ids
+            )
+            if error:
+                report.add_error(row_number, error)
+                continue
+
+            try:
+                values = EmployeeImportService._employee_values(data)
+            except ValueError as e:
+                report.add_error(row_number, f"خطأ في السجل {row_number}: {str(e)}")
+                continue
+
+            if department_id:
+                values['department_id'] = department_id
+                department_name = None
+            else:
+                department_name = (data.get('department') or '').strip() or None
+
+            seen_employee_ids.add(values['employee_id'])
+            seen_national_ids.add(values['national_id'])
+            pending.append((row_number, values, department_name))
+
+        # إنشاء الأقسام الجديدة دفعة واحدة
+        new_departments = sorted({name for _, _, name in pending if name and name not in departments})
+        if new_departments:
+            db.session.execute(insert(Department), [{'name': name} for name in new_departments])
+            departments.update(db.session.query(Department.name, Department.id).filter(
+                Department.name.in_(new_departments)
+            ).all())
+
+        for batch in _chunks(pending, batch_size):
+            EmployeeImportService._insert_batch(batch, departments, department_id, report)
+
+        return report
+
+    @staticmethod
+    def _validate(data, existing_employee_ids, existing_national_ids, seen_employee_ids, seen_national_ids):
+        """التحقق من سجل واحد مقابل القيم الموجودة في قاعدة البيانات وفي الملف"""
+        missing = [field for field in REQUIRED_FIELDS if not data.get(field)]
+        if missing:
+            return f"السجل ينقصه الحقول: {', '.join(missing)}"
+
+        employee_id = data['employee_id']
+        if employee_id in existing_employee_ids:
+            return f"الموظف برقم {employee_id} موجود مسبقا"
+        if employee_id in seen_employee_ids:
+            return f"الموظف برقم {employee_id} مكرر في الملف"
+
+        national_id = data['national_id']
+        if national_id in existing_national_ids:
+            return f"الموظف برقم هوية {national_id} موجود مسبقا"
+        if national_id in seen_national_ids:
+            return f"الموظف برقم هوية {national_id} مكرر في الملف"
+
+        return None
+
+    @staticmethod
+    def _employee_values(data):
+        """تحويل بيانات السجل إلى قيم أعمدة جدول الموظفين (مع تجاهل الأعمدة غير المعروفة)"""
+        values = {}
+        for key, value in data.items():
+            if key not in EMPLOYEE_COLUMNS:
+                continue
+            if key in DATE_COLUMNS and value is not None and not isinstance(value, date):
+                # pandas يحوّل خلايا التاريخ إلى نص بصيغة "YYYY-MM-DD 00:00:00"
+                text = str(value).strip()
+                if text.endswith(' 00:00:00'):
+                    text = text[:-len(' 00:00:00')]
+                try:
+                    value = parse_date(text)
+                except ValueError:
+                    raise ValueError(f"تاريخ غير صالح في الحقل {key}: {value}")
+            values[key] = value
+        return values
+
+    @staticmethod
+    def _insert_batch(batch, departments, department_id, report):
+        """إدراج دفعة من الموظفين وربطهم بالأقسام داخل نقطة حفظ"""
+        # جميع صفوف الإدراج الجماعي يجب أن تحتوي على نفس المفاتيح
+        columns = set().union(*(values.keys() for _, values, _ in batch))
+        rows = [{column: values.get(column, _column_default(column)) for column in columns}
+                for _, values, _ in batch]
+
+        try:
+            with db.session.begin_nested():
+                inserted = db.session.execute(
+                    insert(Employee).returning(Employee.id, Employee.employee_id), rows
+                ).all()
+                ids_by_employee_id = {employee_id: id for id, employee_id in inserted}
+
+                links = []
+                for _, values, department_name in batch:
+                    link_department_id = department_id or departments.get(department_name)
+                    if link_department_id:
+                        links.append({
+                            'employee_id': ids_by_employee_id[values['employee_id']],
+                            'department_id': link_department_id
+                        })
+                if links:
+                    db.session.execute(employee_departments.insert(), links)
+
+            report.imported += len(batch)
+        except SQLAlchemyError as e:
+            # فشل الدفعة (مثلاً بسبب إضافة متزامنة): إعادة المحاولة سجلاً سجلاً لتحديد السجلات المسببة
+            logger.warning(f"فشل إدراج دفعة من {len(batch)} موظف، إعادة المحاولة لكل سجل: {str(e)}")
+            if len(batch) == 1:
+                row_number = batch[0][0]
+                report.add_error(row_number, f"خطأ في السجل {row_number}: {str(e.orig if hasattr(e, 'orig') else e)}")
+                return
+            for item in batch:
+                EmployeeImportService._insert_batch([item], departments, department_id, report)
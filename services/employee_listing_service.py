@@ -0,0 +1,164 @@
+"""
+خدمة عرض قائمة الموظفين: الفلترة والبحث والترتيب والتقسيم إلى صفحات بمؤشر (keyset)
+"""
+from datetime import date
+from sqlalchemy import func, literal, or_, tuple_
+from app import db
+from models import Department, Employee, employee_departments
+from utils.keyset_cursor import decode_cursor, encode_cursor
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# أعمدة الترتيب المسموحة: الاسم -> (التعبير، دالة تحويل قيمة المؤشر)
+# الأعمدة التي تقبل NULL تُرتب بقيمة بديلة حتى تبقى المقارنة في المؤشر صحيحة
+SORT_COLUMNS = {
+    'id': (Employee.id, int),
+    'employee_id': (Employee.employee_id, str),
+    'name': (Employee.name, str),
+    'national_id': (Employee.national_id, str),
+    'job_title': (Employee.job_title, str),
+    'status': (Employee.status, str),
+    'join_date': (func.coalesce(Employee.join_date, literal(date.min)), date.fromisoformat),
+}
+
+
+class EmployeePage:
+    """صفحة من نتائج قائمة الموظفين"""
+
+    def __init__(self, employees, next_cursor, duplicate_names):
+        self.employees = employees
+        self.next_cursor = next_cursor
+        self.has_more = next_cursor is not None
+        self.duplicate_names = duplicate_names
+
+
+class EmployeeListingService:
+    """استعلامات قائمة الموظفين دون تحميل جميع الموظفين في الذاكرة"""
+
+    @staticmethod
+    def filtered_query(filters, assigned_department_id=None):
+        """
+        بناء استعلام الموظفين حسب فلاتر صفحة القائمة
+
+        :param filters: قاموس الفلاتر (department, status, multi_department, no_department, duplicate_names, q)
+        :param assigned_department_id: قسم المستخدم الحالي إن كان مقيداً بقسم
+        """
+        query = Employee.query
+
+        if assigned_department_id:
+            # المستخدم المرتبط بقسم محدد يرى موظفي ذلك القسم فقط
+            query = query.join(employee_departments).join(Department).filter(Department.id == assigned_department_id)
+        elif filters.get('department'):
+            query = query.join(employee_departments).join(Department).filter(Department.id == filters['department'])
+
+        if filters.get('status'):
+            query = query.filter(Employee.status == filters['status'])
+
+        if filters.get('duplicate_names') == 'yes':
+            duplicate_names_subquery = db.session.query(Employee.name)\
+                                               .group_by(Employee.name)\
+                                               .having(func.count(Employee.id) > 1)\
+                                               .subquery()
+            query = query.filter(Employee.name.in_(db.session.query(duplicate_names_subquery.c.name)))
+
+        department_counts = db.session.query(
+            employee_departments.c.employee_id,
+            func.count(employee_departments.c.department_id).label('dept_count')
+        ).group_by(employee_departments.c.employee_id)
+
+        if filters.get('no_department') == 'yes':
+            query = query.filter(~Employee.id.in_(db.session.query(employee_departments.c.employee_id)))
+        elif filters.get('multi_department') == 'yes':
+            multi = department_counts.having(func.count(employee_departments.c.department_id) > 1).subquery()
+            query = query.filter(Employee.id.in_(db.session.query(multi.c.employee_id)))
+        elif filters.get('multi_department') == 'no':
+            multi = department_counts.having(func.count(employee_departments.c.department_id) > 1).subquery()
+            query = query.filter(~Employee.id.in_(db.session.query(multi.c.employee_id)))
+
+        search = (filters.get('q') or '').strip()
+        if search:
+            pattern = f'%{search}%'
+            query = query.filter(or_(
+                Employee.name.ilike(pattern),
+                Employee.employee_id.ilike(pattern),
+                Employee.national_id.ilike(pattern),
+                Employee.mobile.ilike(pattern),
+                Employee.job_title.ilike(pattern)
+            ))
+
+        return query
+
+    @staticmethod
+    def page(query, sort='id', direction='asc', limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """
+        جلب صفحة واحدة مرتبة باستخدام مؤشر (keyset) بدلاً من OFFSET
+
+        :return: كائن EmployeePage
+        """
+        sort_expression, convert = SORT_COLUMNS.get(sort, SORT_COLUMNS['id'])
+        descending = direction == 'desc'
+        limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+        if cursor:
+            position = decode_cursor(cursor, convert, int)
+            if position is not None:
+                sort_value, last_id = position
+                if descending:
+                    query = query.filter(tuple_(sort_expression, Employee.id) < tuple_(sort_value, last_id))
+                else:
+                    query = query.filter(tuple_(sort_expression, Employee.id) > tuple_(sort_value, last_id))
+
+        if descending:
+            query = query.order_by(sort_expression.desc(), Employee.id.desc())
+        else:
+            query = query.order_by(sort_expression.asc(), Employee.id.asc())
+
+        rows = query.add_columns(sort_expression).options(
+            db.selectinload(Employee.departments)
+        ).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_employee, last_sort_value = rows[-1]
+            next_cursor = encode_cursor(last_sort_value, last_employee.id)
+
+        employees = [employee for employee, _ in rows]
+        duplicate_names = EmployeeListingService.duplicate_names_among({employee.name for employee in employees})
+        return EmployeePage(employees, next_cursor, duplicate_names)
+
+    @staticmethod
+    def duplicate_names_among(names):
+        """الأسماء المكررة في جدول الموظفين من بين مجموعة أسماء محددة"""
+        if not names:
+            return set()
+        rows = db.session.query(Employee.name).filter(
+            Employee.name.in_(names)
+        ).group_by(Employee.name).having(func.count(Employee.id) > 1).all()
+        return {name for name, in rows}
+
+    @staticmethod
+    def duplicate_names_count():
+        """عدد الموظفين الذين يشتركون في الاسم مع موظف آخر (استعلام مجمّع واحد)"""
+        name_counts = db.session.query(
+            func.count(Employee.id).label('name_count')
+        ).group_by(Employee.name).having(func.count(Employee.id) > 1).subquery()
+        return db.session.query(func.coalesce(func.sum(name_counts.c.name_count), 0)).scalar() or 0
+
+    @staticmethod
+    def serialize(employee, duplicate_names=()):
+        """تحويل الموظف إلى قاموس لصفوف الجدول"""
+        return {
+            'id': employee.id,
+            'employee_id': employee.employee_id,
+            'name': employee.name,
+            'national_id': employee.national_id,
+            'mobile': employee.mobile,
+            'job_title': employee.job_title,
+            'status': employee.status,
+            'join_date': employee.join_date.strftime('%d/%m/%Y') if employee.join_date else None,
+            'departments': [department.name for department in employee.departments],
+            'is_duplicate_name': employee.name in duplicate_names,
+        }
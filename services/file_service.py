@@ -11,6 +11,7 @@ from pillow_heif import register_heif_opener
 register_heif_opener()
 from flask import current_app
 from utils.audit_logger import log_activity
+from services.image_pipeline_service import ImagePipelineService
 from flask_login import current_user
 
 class FileService:
@@ -138,6 +139,7 @@ class FileService:
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
+                ImagePipelineService.remove(file_path)
                 
                 log_activity(
                     user_id=current_user.id if current_user.is_authenticated else None,
@@ -186,9 +188,8 @@ class FileService:
         )
         
         if success:
-            # تحسين الصورة
-            image_path = os.path.join(upload_folder, result)
-            FileService.resize_image(image_path)
+            # توليد النسخ المصغرة خارج الطلب مع الإبقاء على الأصل
+            ImagePipelineService.enqueue(os.path.join(upload_folder, result))
             
             return True, result
         
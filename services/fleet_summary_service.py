@@ -0,0 +1,154 @@
+"""
+خدمة ملخص الأسطول: أعداد السيارات حسب الحالة وتنبيهات انتهاء وثائق السيارات
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from sqlalchemy import func, or_
+from models import Employee, Vehicle
+from utils.sql_aggregates import count_when
+
+
+# عدد الأيام التي تعتبر فيها الوثيقة "قريبة من الانتهاء"
+EXPIRING_WINDOW_DAYS = 30
+
+# وثائق السيارة: النوع -> (عمود تاريخ الانتهاء، الاسم المعروض)
+VEHICLE_DOCUMENTS = {
+    'authorization': (Vehicle.authorization_expiry_date, 'تفويض المركبة'),
+    'registration': (Vehicle.registration_expiry_date, 'استمارة السيارة'),
+    'inspection': (Vehicle.inspection_expiry_date, 'الفحص الدوري'),
+}
+
+
+class FleetSummary:
+    """نتيجة ملخص الأسطول"""
+
+    def __init__(self, status_counts, expired, expiring):
+        self.status_counts = status_counts
+        self.total = sum(status_counts.values())
+        self.expired = expired
+        self.expiring = expiring
+
+    def count(self, status):
+        """عدد السيارات في حالة معينة"""
+        return self.status_counts.get(status, 0)
+
+
+class DocumentAlerts:
+    """السيارات ذات الوثائق المنتهية أو القريبة من الانتهاء (بيانات العرض فقط)"""
+
+    def __init__(self, rows, today, horizon):
+        self.today = today
+        self.expired = {document_type: [] for document_type in VEHICLE_DOCUMENTS}
+        self.expiring = {document_type: [] for document_type in VEHICLE_DOCUMENTS}
+        self.expired_all = []
+
+        for row in rows:
+            has_expired = False
+            for document_type in VEHICLE_DOCUMENTS:
+                expiry_date = getattr(row, f'{document_type}_expiry_date')
+                if expiry_date is None:
+                    continue
+                if expiry_date < today:
+                    self.expired[document_type].append(row)
+                    has_expired = True
+                elif expiry_date <= horizon:
+                    self.expiring[document_type].append(row)
+            if has_expired:
+                self.expired_all.append(row)
+
+        for document_type in VEHICLE_DOCUMENTS:
+            sort_key = lambda row, document_type=document_type: getattr(row, f'{document_type}_expiry_date')
+            self.expired[document_type].sort(key=sort_key)
+            self.expiring[document_type].sort(key=sort_key)
+        self.expired_all.sort(key=lambda row: row.plate_number)
+
+    def expiring_documents(self):
+        """قائمة الوثائق القريبة من الانتهاء مرتبة حسب الأيام المتبقية"""
+        documents = []
+        for document_type, (_, document_name) in VEHICLE_DOCUMENTS.items():
+            for row in self.expiring[document_type]:
+                expiry_date = getattr(row, f'{document_type}_expiry_date')
+                documents.append({
+                    'vehicle_id': row.id,
+                    'plate_number': row.plate_number,
+                    'document_type': document_type,
+                    'document_name': document_name,
+                    'expiry_date': expiry_date,
+                    'days_remaining': (expiry_date - self.today).days
+                })
+        documents.sort(key=lambda document: document['days_remaining'])
+        return documents
+
+
+class FleetSummaryService:
+    """حساب إحصائيات الأسطول باستعلامات تجميعية بدلاً من تحميل جميع السيارات"""
+
+    @staticmethod
+    def summarize(query=None, today=None, days_ahead=EXPIRING_WINDOW_DAYS):
+        """
+        أعداد السيارات حسب الحالة وأعداد الوثائق المنتهية والقريبة من الانتهاء في استعلام واحد
+
+        :param query: استعلام سيارات مفلتر مسبقاً (اختياري، الافتراضي جميع السيارات)
+        :param today: تاريخ المقارنة (الافتراضي اليوم)
+        :param days_ahead: عدد أيام فترة "قريب من الانتهاء"
+        :return: كائن FleetSummary
+        """
+        today = today or date.today()
+        horizon = today + timedelta(days=days_ahead)
+
+        columns = [Vehicle.status, func.count(Vehicle.id)]
+        for column, _ in VEHICLE_DOCUMENTS.values():
+            columns.append(count_when(column < today))
+            columns.append(count_when(column.between(today, horizon)))
+
+        rows = (query if query is not None else Vehicle.query).with_entities(
+            *columns
+        ).order_by(None).group_by(Vehicle.status).all()
+
+        status_counts = {}
+        expired = defaultdict(int)
+        expiring = defaultdict(int)
+        for row in rows:
+            status_counts[row[0]] = row[1]
+            for index, document_type in enumerate(VEHICLE_DOCUMENTS):
+                expired[document_type] += int(row[2 + index * 2])
+                expiring[document_type] += int(row[3 + index * 2])
+
+        return FleetSummary(
+            status_counts,
+            {document_type: expired[document_type] for document_type in VEHICLE_DOCUMENTS},
+            {document_type: expiring[document_type] for document_type in VEHICLE_DOCUMENTS}
+        )
+
+    @staticmethod
+    def document_alerts(query=None, today=None, days_ahead=EXPIRING_WINDOW_DAYS, include_expiring=True):
+        """
+        السيارات التي لديها وثيقة منتهية (أو قريبة من الانتهاء) بأعمدة العرض فقط
+
+        :param query: استعلام سيارات مفلتر مسبقاً (اختياري، الافتراضي جميع السيارات)
+        :param today: تاريخ المقارنة (الافتراضي اليوم)
+        :param days_ahead: عدد أيام فترة "قريب من الانتهاء"
+        :param include_expiring: تضمين الوثائق القريبة من الانتهاء إضافة إلى المنتهية
+        :return: كائن DocumentAlerts
+        """
+        today = today or date.today()
+        horizon = today + timedelta(days=days_ahead)
+        limit = horizon if include_expiring else today - timedelta(days=1)
+
+        rows = (query if query is not None else Vehicle.query).outerjoin(
+            Employee, Employee.id == Vehicle.current_driver_id
+        ).with_entities(
+            Vehicle.id,
+            Vehicle.plate_number,
+            Vehicle.make,
+            Vehicle.model,
+            Vehicle.year,
+            Vehicle.authorization_expiry_date,
+            Vehicle.registration_expiry_date,
+            Vehicle.inspection_expiry_date,
+            Employee.name.label('current_driver_name')
+        ).filter(
+            or_(*[column <= limit for column, _ in VEHICLE_DOCUMENTS.values()])
+        ).order_by(None).all()
+
+        return DocumentAlerts(rows, today, horizon if include_expiring else limit)
@@ -0,0 +1,137 @@
+"""
+خدمة معالجة الصور المرفوعة خارج الطلب
+
+تُحفظ الصورة الأصلية كما هي ويعود الطلب فوراً، ثم تولد مجموعة عمليات محلية
+النسخ المصغرة (thumb / medium / print) بصيغتي WebP و JPEG مع تطبيق اتجاه EXIF.
+تطلب القوالب الحجم المناسب عبر الفلتر image_url، وتطلب مولدات PDF الملف عبر
+image_file؛ وإذا لم تُولَّد النسخة بعد يُستخدم الأصل.
+
+عدد العمليات من الإعداد IMAGE_PIPELINE_PROCESSES، والقيمة 0 تعني التوليد
+داخل الطلب (بيئة التطوير).
+"""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app, url_for
+from utils.image_derivatives import (DERIVED_FOLDER, IMAGE_SIZES, derivative_relpath, generate_derivatives,
+                                     is_image_path, remove_derivatives)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    """مجموعة عمليات معالجة الصور، تُنشأ عند أول استخدام"""
+    global _executor
+    if _executor is None:
+        processes = current_app.config.get('IMAGE_PIPELINE_PROCESSES') or 0
+        if processes <= 0:
+            return None
+        # لا تحتاج العمليات إلى التطبيق: spawn يحمّل وحدة المعالجة فقط
+        _executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def _reset_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _log_failure(relpath):
+    def callback(future):
+        error = future.exception()
+        if error is not None:
+            logger.warning(f"تعذر توليد نسخ الصورة {relpath}: {str(error)}")
+    return callback
+
+
+def static_relpath(path):
+    """
+    مسار الصورة نسبةً إلى المجلد static بأي صيغة خُزن بها في قاعدة البيانات
+    ('static/uploads/..' أو '/static/uploads/..' أو 'uploads/..' أو مسار مطلق)
+    """
+    if not path:
+        return None
+    static_root = current_app.static_folder
+    if os.path.isabs(path) and path.startswith(static_root):
+        path = os.path.relpath(path, static_root)
+    path = path.replace('\\', '/').lstrip('/')
+    if path.startswith('static/'):
+        path = path[len('static/'):]
+    return path
+
+
+class ImagePipelineService:
+    """جدولة توليد نسخ الصور والوصول إليها"""
+
+    @staticmethod
+    def enqueue(path):
+        """
+        جدولة توليد نسخ صورة محفوظة دون انتظار
+
+        :param path: مسار الصورة (نسبةً إلى static أو مطلق)
+        :return: True إذا جُدولت (أو وُلدت عند تعطيل العمليات)
+        """
+        relpath = static_relpath(path)
+        if not relpath or not is_image_path(relpath):
+            return False
+
+        static_root = current_app.static_folder
+        executor = _get_executor()
+        if executor is not None:
+            try:
+                executor.submit(generate_derivatives, static_root, relpath).add_done_callback(_log_failure(relpath))
+                return True
+            except BrokenProcessPool:
+                logger.exception("توقفت مجموعة عمليات معالجة الصور")
+                _reset_executor()
+
+        try:
+            generate_derivatives(static_root, relpath)
+            return True
+        except Exception as e:
+            logger.warning(f"تعذر توليد نسخ الصورة {relpath}: {str(e)}")
+            return False
+
+    @staticmethod
+    def derivative(path, size, fmt='webp'):
+        """مسار النسخة المولدة نسبةً إلى static، أو None إذا لم تُولد بعد"""
+        if size not in IMAGE_SIZES:
+            raise ValueError(f'حجم غير معروف: {size}')
+        relpath = static_relpath(path)
+        if not relpath or relpath.startswith(DERIVED_FOLDER) or not is_image_path(relpath):
+            return None
+        derived = derivative_relpath(relpath, size, fmt)
+        if os.path.exists(os.path.join(current_app.static_folder, derived)):
+            return derived
+        return None
+
+    @staticmethod
+    def image_url(path, size='medium'):
+        """رابط الصورة بالحجم المطلوب (WebP)، أو رابط الأصل إذا لم تُولد النسخة"""
+        relpath = static_relpath(path)
+        if not relpath:
+            return ''
+        derived = ImagePipelineService.derivative(relpath, size)
+        return url_for('static', filename=(derived or relpath).replace(os.sep, '/'))
+
+    @staticmethod
+    def image_file(path, size='print'):
+        """مسار ملف الصورة بالحجم المطلوب (JPEG) لمولدات PDF، أو مسار الأصل"""
+        relpath = static_relpath(path)
+        if not relpath:
+            return None
+        derived = ImagePipelineService.derivative(relpath, size, 'jpg')
+        return os.path.join(current_app.static_folder, derived or relpath)
+
+    @staticmethod
+    def remove(path):
+        """حذف النسخ المولدة لصورة"""
+        relpath = static_relpath(path)
+        if relpath:
+            remove_derivatives(current_app.static_folder, relpath)
@@ -0,0 +1,290 @@
+"""
+خدمة المهام الخلفية: قائمة انتظار محفوظة في قاعدة البيانات وعمليات عاملة محلية
+
+تُسجّل المسارات المهمة عبر JobQueueService.enqueue وتُرجع رقمها فوراً، ثم تنفذها
+عمليات العامل التي تُشغّل بالأمر:
+    flask run-job-worker --processes 2
+ولا تحتاج إلى وسيط خارجي (Redis/RabbitMQ)؛ المطالبة بالمهمة تتم بتحديث شرطي ذري.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app import db
+from models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# معالجات المهام المسجلة: اسم المهمة -> دالة
+JOB_HANDLERS = {}
+
+# المهمة التي لم يُحدَّث تقدمها خلال هذه المدة تعتبر متوقفة (توقف العامل أثناء التنفيذ)
+STALE_JOB_MINUTES = 30
+
+POLL_INTERVAL_SECONDS = 2
+
+
+def job_handler(job_type):
+    """
+    تسجيل دالة كمعالج لنوع مهمة
+
+    تستقبل الدالة (context, **params) وتُرجع قاموس النتيجة، ويمكنها إرجاع
+    'file' (مسار الملف الناتج) و'download_name' و'mimetype' لإتاحة تحميله.
+    """
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+def artifacts_folder():
+    """مجلد ملفات المهام (الملفات المرفوعة للاستيراد والملفات الناتجة)، خارج المجلدات العامة"""
+    folder = current_app.config.get('JOB_ARTIFACTS_FOLDER') or os.path.join(current_app.instance_path, 'jobs')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def new_artifact_path(extension):
+    """مسار فريد لملف جديد داخل مجلد المهام"""
+    return os.path.join(artifacts_folder(), f'{uuid.uuid4().hex}{extension}')
+
+
+class JobContext:
+    """سياق تنفيذ المهمة المُمرَّر إلى المعالج"""
+
+    def __init__(self, job):
+        self.job_id = job.id
+        self.user_id = job.user_id
+
+    def progress(self, done, total=None, message=None):
+        """
+        تحديث تقدم المهمة باتصال مستقل حتى لا يُحفظ عمل المعالج غير المكتمل
+
+        :param done: عدد العناصر المنجزة (أو النسبة إذا لم يُحدد total)
+        :param total: إجمالي العناصر (اختياري)
+        :param message: رسالة تظهر للمستخدم (اختياري)
+        """
+        percent = int(done * 100 / total) if total else int(done)
+        values = {'progress': max(0, min(percent, 100)), 'updated_at': datetime.utcnow()}
+        if message is not None:
+            values['progress_message'] = message[:255]
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    update(BackgroundJob.__table__).where(BackgroundJob.__table__.c.id == self.job_id).values(**values)
+                )
+        except SQLAlchemyError as e:
+            # تعذر تحديث التقدم (مثلاً قفل SQLite أثناء كتابة المعالج) لا يوقف المهمة
+            logger.debug(f"تعذر تحديث تقدم المهمة {self.job_id}: {str(e)}")
+
+    def artifact_path(self, extension):
+        return new_artifact_path(extension)
+
+
+class JobQueueService:
+    """إضافة المهام إلى قائمة الانتظار وتنفيذها"""
+
+    @staticmethod
+    def enqueue(job_type, params=None, user_id=None, commit=True):
+        """
+        إضافة مهمة إلى قائمة الانتظار وحفظها
+
+        :param job_type: اسم المعالج المسجل
+        :param params: معاملات المهمة (قابلة للتحويل إلى JSON)
+        :param user_id: المستخدم صاحب المهمة
+        :param commit: False لإضافة المهمة ضمن معاملة المستدعي (تُحفظ وتبدأ مع حفظه)
+        :return: كائن BackgroundJob
+        """
+        job = BackgroundJob(
+            job_type=job_type,
+            status=BackgroundJob.STATUS_QUEUED,
+            params=json.dumps(params or {}, ensure_ascii=False, default=str),
+            user_id=user_id
+        )
+        db.session.add(job)
+        if not commit:
+            db.session.info['jobs_enqueued'] = True
+            return job
+
+        db.session.commit()
+        _start_thread_runner()
+        return job
+
+    @staticmethod
+    def claim_next(worker_name):
+        """
+        المطالبة بأقدم مهمة في الانتظار بتحديث شرطي ذري (آمن مع عدة عمليات عاملة)
+
+        :return: كائن BackgroundJob أو None إذا لم توجد مهام
+        """
+        table = BackgroundJob.__table__
+        while True:
+            job_id = db.session.execute(
+                select(table.c.id).where(table.c.status == BackgroundJob.STATUS_QUEUED).order_by(table.c.id).limit(1)
+            ).scalar()
+            if job_id is None:
+                db.session.rollback()
+                return None
+
+            now = datetime.utcnow()
+            claimed = db.session.execute(
+                update(table).where(
+                    table.c.id == job_id, table.c.status == BackgroundJob.STATUS_QUEUED
+                ).values(status=BackgroundJob.STATUS_RUNNING, worker=worker_name, started_at=now, updated_at=now)
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return db.session.get(BackgroundJob, job_id)
+            # سبقتنا عملية أخرى إلى هذه المهمة، نحاول التالية
+
+    @staticmethod
+    def run(job):
+        """تنفيذ مهمة تمت المطالبة بها وحفظ نتيجتها أو خطئها"""
+        handler = JOB_HANDLERS.get(job.job_type)
+        job_id = job.id
+        try:
+            if handler is None:
+                raise ValueError(f'نوع المهمة غير معروف: {job.job_type}')
+            params = json.loads(job.params or '{}')
+            result = handler(JobContext(job), **params) or {}
+        except Exception as e:
+            logger.exception(f"فشل تنفيذ المهمة {job_id} ({job.job_type})")
+            db.session.rollback()
+            job = db.session.get(BackgroundJob, job_id)
+            job.status = BackgroundJob.STATUS_FAILED
+            job.error = str(e)
+            job.finished_at = job.updated_at = datetime.utcnow()
+            db.session.commit()
+            return job
+
+        # حفظ أي تغييرات أجراها المعالج مع حالة المهمة في نفس المعاملة
+        job = db.session.get(BackgroundJob, job_id)
+        job.status = BackgroundJob.STATUS_SUCCEEDED
+        job.progress = 100
+        job.result_path = result.pop('file', None)
+        job.result_filename = result.pop('download_name', None)
+        job.result_mimetype = result.pop('mimetype', None)
+        job.result = json.dumps(result, ensure_ascii=False, default=str)
+        job.finished_at = job.updated_at = datetime.utcnow()
+        db.session.commit()
+        return job
+
+    @staticmethod
+    def run_pending(worker_name, limit=None):
+        """تنفيذ المهام المنتظرة حتى تفرغ القائمة (أو حتى الحد المحدد)، وإرجاع عدد المهام المنفذة"""
+        count = 0
+        while limit is None or count < limit:
+            job = JobQueueService.claim_next(worker_name)
+            if job is None:
+                break
+            JobQueueService.run(job)
+            count += 1
+        return count
+
+    @staticmethod
+    def fail_stale_jobs(minutes=STALE_JOB_MINUTES):
+        """
+        اعتبار المهام قيد التنفيذ التي توقف تحديثها فاشلة (توقفت عملية العامل)
+
+        لا يعاد تشغيلها تلقائياً لأن بعضها غير قابل للتكرار بأمان (مثل إرسال الإشعارات).
+        """
+        table = BackgroundJob.__table__
+        result = db.session.execute(
+            update(table).where(
+                table.c.status == BackgroundJob.STATUS_RUNNING,
+                table.c.updated_at < datetime.utcnow() - timedelta(minutes=minutes)
+            ).values(status=BackgroundJob.STATUS_FAILED, error='توقف العامل أثناء تنفيذ المهمة',
+                     finished_at=datetime.utcnow())
+        )
+        db.session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def purge_finished(days):
+        """حذف المهام المنتهية الأقدم من عدد الأيام المحدد مع ملفاتها الناتجة"""
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        jobs = BackgroundJob.query.filter(
+            BackgroundJob.status.in_([BackgroundJob.STATUS_SUCCEEDED, BackgroundJob.STATUS_FAILED]),
+            BackgroundJob.finished_at < cutoff
+        ).all()
+        for job in jobs:
+            if job.result_path and os.path.exists(job.result_path):
+                os.remove(job.result_path)
+            db.session.delete(job)
+        db.session.commit()
+        return len(jobs)
+
+    @staticmethod
+    def run_worker(processes=1, poll_interval=POLL_INTERVAL_SECONDS):
+        """تشغيل عمليات العامل ومتابعتها حتى الإيقاف (Ctrl+C)"""
+        JobQueueService.fail_stale_jobs()
+        # إغلاق اتصالات العملية الأم حتى لا تتشاركها العمليات الفرعية
+        db.engine.dispose()
+
+        workers = []
+        for index in range(processes):
+            process = multiprocessing.Process(
+                target=_worker_loop, args=(f'{socket.gethostname()}:{os.getpid()}:{index}', poll_interval)
+            )
+            process.start()
+            workers.append(process)
+
+        try:
+            for process in workers:
+                process.join()
+        except KeyboardInterrupt:
+            for process in workers:
+                process.terminate()
+
+
+def _worker_loop(worker_name, poll_interval):
+    """حلقة عملية العامل: تنفيذ المهام المنتظرة ثم الانتظار"""
+    from app import app
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+        logger.info(f"بدأ عامل المهام {worker_name}")
+        while True:
+            try:
+                if not JobQueueService.run_pending(worker_name):
+                    time.sleep(poll_interval)
+            except Exception:
+                logger.exception(f"خطأ في عامل المهام {worker_name}")
+                db.session.rollback()
+                time.sleep(poll_interval)
+
+
+def _start_thread_runner():
+    if current_app.config.get('JOBS_RUN_IN_THREAD'):
+        # بيئة بدون عملية عامل (تطوير): التنفيذ في خيط خلفي داخل نفس العملية
+        app = current_app._get_current_object()
+        threading.Thread(target=_run_pending_in_thread, args=(app,), daemon=True).start()
+
+
+@event.listens_for(Session, 'after_commit')
+def _start_enqueued_jobs(session):
+    """تشغيل المهام المضافة ضمن معاملة المستدعي بعد حفظها"""
+    if session.info.pop('jobs_enqueued', False):
+        _start_thread_runner()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_enqueued_jobs(session):
+    session.info.pop('jobs_enqueued', None)
+
+
+def _run_pending_in_thread(app):
+    with app.app_context():
+        try:
+            JobQueueService.run_pending(f'thread:{os.getpid()}')
+        finally:
+            db.session.remove()
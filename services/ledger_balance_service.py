@@ -0,0 +1,523 @@
+"""
+خدمة أرصدة الحسابات الشهرية (account_period_balances)
+
+يُحفظ لكل حساب وشهر مجموع المدين والدائن من القيود المعتمدة والرصيد التراكمي في
+نهاية الشهر، ويُحدَّث تلقائياً عبر أحداث جلسة SQLAlchemy عند إضافة القيود أو
+اعتمادها أو إلغاء اعتمادها أو حذفها أو تغيير تاريخها. رصيد الحساب في أي تاريخ هو
+رصيد نهاية الشهر السابق من الجدول مضافاً إليه قيود الشهر الحالي حتى ذلك التاريخ،
+فلا يُعاد جمع دفتر الأستاذ كاملاً.
+
+يمكن إعادة بناء الجدول عبر الأمر:
+    flask rebuild-ledger-balances
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import case, event, extract, func, select, inspect
+from sqlalchemy.orm import Session
+from app import db
+from models_accounting import Account, AccountPeriodBalance, AccountType, EntryType, Transaction, TransactionEntry
+from utils.db_upsert import upsert_rows
+
+logger = logging.getLogger(__name__)
+
+ENTRY_ATTRIBUTES = ('transaction_id', 'account_id', 'entry_type', 'amount')
+TRANSACTION_ATTRIBUTES = ('is_approved', 'transaction_date')
+
+# الحسابات التي رصيدها الطبيعي مدين
+DEBIT_ACCOUNT_TYPES = (AccountType.ASSETS, AccountType.EXPENSES)
+
+ZERO = Decimal('0')
+
+# يصبح True بعد التأكد (مرة واحدة لكل عملية) من أن الجدول مبني
+_balances_initialized = False
+
+
+def _month_start(day):
+    if isinstance(day, datetime):
+        day = day.date()
+    return day.replace(day=1)
+
+
+def _signed_amount():
+    """مبلغ القيد بإشارة موجبة للمدين وسالبة للدائن"""
+    return case(
+        (TransactionEntry.__table__.c.entry_type == EntryType.DEBIT, TransactionEntry.__table__.c.amount),
+        else_=-TransactionEntry.__table__.c.amount
+    )
+
+
+class LedgerBalanceService:
+    """قراءة وصيانة أرصدة الحسابات الشهرية"""
+
+    @staticmethod
+    def ensure_initialized(connection=None, session=None):
+        """
+        التأكد من بناء الجدول قبل أول استخدام في العملية الحالية
+
+        إذا كان الجدول فارغاً مع وجود قيود محاسبية يُعاد بناؤه بالكامل. بدون اتصال
+        يتم ذلك في معاملة مستقلة؛ أما مع اتصال ضمن معاملة المستدعي فلا يُعلَّم الجدول
+        كمبني إلا بعد حفظ الجلسة (session) حتى لا يبقى العلم صحيحاً إذا تراجعت المعاملة.
+        :return: True إذا تمت إعادة البناء الآن
+        """
+        global _balances_initialized
+        if _balances_initialized:
+            return False
+
+        if connection is None:
+            with db.engine.begin() as connection:
+                rebuilt = LedgerBalanceService._initialize(connection)
+            _balances_initialized = True
+            return rebuilt
+
+        rebuilt = LedgerBalanceService._initialize(connection)
+        if session is not None:
+            session.info['ledger_balances_initialized'] = True
+        return rebuilt
+
+    @staticmethod
+    def _initialize(connection):
+        """إعادة بناء الجدول إذا كان فارغاً مع وجود قيود محاسبية"""
+        balances_table = AccountPeriodBalance.__table__
+        entries_table = TransactionEntry.__table__
+
+        has_balances = connection.execute(select(balances_table.c.id).limit(1)).first() is not None
+        if has_balances:
+            return False
+        has_entries = connection.execute(select(entries_table.c.id).limit(1)).first() is not None
+        if not has_entries:
+            return False
+        logger.info("جدول أرصدة الحسابات الشهرية فارغ، جاري إعادة بنائه بالكامل")
+        LedgerBalanceService.rebuild(connection)
+        return True
+
+    @staticmethod
+    def rebuild(connection):
+        """
+        إعادة بناء الأرصدة الشهرية لجميع الحسابات من القيود المعتمدة
+
+        :param connection: اتصال قاعدة البيانات أو الجلسة
+        :return: عدد صفوف الأرصدة المُدرجة
+        """
+        balances_table = AccountPeriodBalance.__table__
+        entries_table = TransactionEntry.__table__
+        transactions_table = Transaction.__table__
+
+        connection.execute(balances_table.delete())
+
+        year = extract('year', transactions_table.c.transaction_date)
+        month = extract('month', transactions_table.c.transaction_date)
+        rows = connection.execute(
+            select(
+                entries_table.c.account_id,
+                year,
+                month,
+                func.sum(case((entries_table.c.entry_type == EntryType.DEBIT, entries_table.c.amount), else_=0)),
+                func.sum(case((entries_table.c.entry_type == EntryType.CREDIT, entries_table.c.amount), else_=0))
+            ).select_from(
+                entries_table.join(transactions_table, transactions_table.c.id == entries_table.c.transaction_id)
+            ).where(
+                transactions_table.c.is_approved.is_(True)
+            ).group_by(
+                entries_table.c.account_id, year, month
+            ).order_by(
+                entries_table.c.account_id, year, month
+            )
+        ).all()
+
+        values = []
+        closing = {}
+        for account_id, row_year, row_month, debits, credits in rows:
+            debits = Decimal(debits or 0)
+            credits = Decimal(credits or 0)
+            closing[account_id] = closing.get(account_id, ZERO) + debits - credits
+            values.append({
+                'account_id': account_id,
+                'period_start': date(int(row_year), int(row_month), 1),
+                'debit_total': debits,
+                'credit_total': credits,
+                'closing_balance': closing[account_id]
+            })
+
+        if values:
+            connection.execute(balances_table.insert(), values)
+        return len(values)
+
+    @staticmethod
+    def apply_deltas(connection, deltas, session=None):
+        """
+        تطبيق فروقات المدين والدائن على الأرصدة الشهرية وتحديث الرصيد التراكمي للأشهر اللاحقة
+
+        :param connection: اتصال قاعدة البيانات
+        :param deltas: قاموس مفاتيحه (معرف الحساب، أول يوم في الشهر) وقيمه [فرق المدين، فرق الدائن]
+        :param session: جلسة ORM التي يتبع لها الاتصال (لتعليم الجدول كمبني بعد حفظها)
+        """
+        deltas = {key: value for key, value in deltas.items() if value[0] or value[1]}
+        if not deltas:
+            return
+
+        if LedgerBalanceService.ensure_initialized(connection, session):
+            # إعادة البناء الكاملة تضمنت التغييرات الحالية بالفعل
+            return
+
+        # قفل صفوف الحسابات المتأثرة (بترتيب ثابت لتفادي الجمود) حتى تُطبَّق معاملتان متزامنتان
+        # على الحساب نفسه واحدة تلو الأخرى؛ وإلا أعادت كل منهما حساب الرصيد التراكمي للأشهر
+        # اللاحقة من قيم لا ترى تغييرات الأخرى فتكتب فوقها
+        accounts_table = Account.__table__
+        connection.execute(
+            select(accounts_table.c.id)
+            .where(accounts_table.c.id.in_(sorted({account_id for account_id, _ in deltas})))
+            .order_by(accounts_table.c.id)
+            .with_for_update()
+        ).all()
+
+        balances_table = AccountPeriodBalance.__table__
+        rows = [{
+            'account_id': account_id,
+            'period_start': period_start,
+            'debit_total': debits,
+            'credit_total': credits,
+            'closing_balance': ZERO
+        } for (account_id, period_start), (debits, credits) in deltas.items()]
+        upsert_rows(connection, balances_table, rows,
+                    key_columns=('account_id', 'period_start'),
+                    increment_columns=('debit_total', 'credit_total'))
+
+        # الرصيد التراكمي من أقدم شهر تغيّر لكل حساب (عادةً الشهر الحالي فقط)
+        earliest = {}
+        for account_id, period_start in deltas:
+            if account_id not in earliest or period_start < earliest[account_id]:
+                earliest[account_id] = period_start
+
+        for account_id, period_start in earliest.items():
+            running = connection.execute(
+                select(balances_table.c.closing_balance).where(
+                    balances_table.c.account_id == account_id,
+                    balances_table.c.period_start < period_start
+                ).order_by(balances_table.c.period_start.desc()).limit(1).with_for_update()
+            ).scalar() or ZERO
+
+            # قراءات مقفلة حتى تُقرأ أحدث القيم المعتمدة بعد انتظار القفل (لا لقطة المعاملة)
+            for row in connection.execute(
+                select(
+                    balances_table.c.id, balances_table.c.debit_total,
+                    balances_table.c.credit_total, balances_table.c.closing_balance
+                ).where(
+                    balances_table.c.account_id == account_id,
+                    balances_table.c.period_start >= period_start
+                ).order_by(balances_table.c.period_start).with_for_update()
+            ).all():
+                running += Decimal(row.debit_total) - Decimal(row.credit_total)
+                if Decimal(row.closing_balance) != running:
+                    connection.execute(
+                        balances_table.update().where(balances_table.c.id == row.id).values(closing_balance=running)
+                    )
+
+    @staticmethod
+    def net_balances(as_of_date=None, account_ids=None, connection=None):
+        """
+        صافي رصيد الحسابات (مدين - دائن) من القيود المعتمدة حتى تاريخ معين
+
+        يُقرأ رصيد نهاية آخر شهر مكتمل من الجدول، وتُجمع قيود الشهر الجاري حتى التاريخ فقط.
+        :param as_of_date: التاريخ (افتراضياً اليوم)
+        :param account_ids: الحسابات المطلوبة (افتراضياً جميع الحسابات)
+        :param connection: اتصال قاعدة البيانات (افتراضياً جلسة الطلب)
+        :return: قاموس {معرف الحساب: الرصيد}، والحسابات بلا قيود غير موجودة فيه
+        """
+        # إعادة البناء (عند أول استخدام) في معاملة مستقلة: صفحات القراءة تتراجع عن معاملتها في نهاية الطلب
+        LedgerBalanceService.ensure_initialized()
+        connection = connection or db.session.connection()
+
+        as_of_date = as_of_date or date.today()
+        if isinstance(as_of_date, datetime):
+            as_of_date = as_of_date.date()
+        month_start = _month_start(as_of_date)
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        # إذا كان التاريخ آخر يوم في الشهر فرصيد الشهر كله محفوظ ولا حاجة لجمع القيود
+        if as_of_date + timedelta(days=1) == next_month:
+            snapshot_before, tail_start = next_month, None
+        else:
+            snapshot_before, tail_start = month_start, month_start
+
+        balances_table = AccountPeriodBalance.__table__
+        latest = select(
+            balances_table.c.account_id,
+            func.max(balances_table.c.period_start).label('period_start')
+        ).where(balances_table.c.period_start < snapshot_before)
+        if account_ids is not None:
+            latest = latest.where(balances_table.c.account_id.in_(account_ids))
+        latest = latest.group_by(balances_table.c.account_id).subquery()
+
+        balances = defaultdict(lambda: ZERO)
+        for account_id, closing in connection.execute(
+            select(balances_table.c.account_id, balances_table.c.closing_balance).join(
+                latest,
+                (latest.c.account_id == balances_table.c.account_id)
+                & (latest.c.period_start == balances_table.c.period_start)
+            )
+        ):
+            balances[account_id] += Decimal(closing or 0)
+
+        if tail_start is not None:
+            entries_table = TransactionEntry.__table__
+            transactions_table = Transaction.__table__
+            tail = select(entries_table.c.account_id, func.sum(_signed_amount())).select_from(
+                entries_table.join(transactions_table, transactions_table.c.id == entries_table.c.transaction_id)
+            ).where(
+                transactions_table.c.is_approved.is_(True),
+                transactions_table.c.transaction_date >= tail_start,
+                transactions_table.c.transaction_date <= as_of_date
+            )
+            if account_ids is not None:
+                tail = tail.where(entries_table.c.account_id.in_(account_ids))
+            for account_id, amount in connection.execute(tail.group_by(entries_table.c.account_id)):
+                balances[account_id] += Decimal(amount or 0)
+
+        return dict(balances)
+
+    @staticmethod
+    def net_movements(start_date, end_date, account_ids=None, connection=None):
+        """صافي حركة الحسابات (مدين - دائن) بين تاريخين شاملين"""
+        closing = LedgerBalanceService.net_balances(end_date, account_ids, connection)
+        opening = LedgerBalanceService.net_balances(start_date - timedelta(days=1), account_ids, connection)
+        return {
+            account_id: closing.get(account_id, ZERO) - opening.get(account_id, ZERO)
+            for account_id in set(closing) | set(opening)
+        }
+
+    @staticmethod
+    def monthly_closing(account_id, year, connection=None):
+        """
+        صافي رصيد الحساب (مدين - دائن) في نهاية كل شهر من السنة
+
+        :return: قائمة من 12 قيمة؛ الأشهر بلا قيود تحمل رصيد الشهر السابق
+        """
+        # إعادة البناء (عند أول استخدام) في معاملة مستقلة: صفحات القراءة تتراجع عن معاملتها في نهاية الطلب
+        LedgerBalanceService.ensure_initialized()
+        connection = connection or db.session.connection()
+
+        balances_table = AccountPeriodBalance.__table__
+        year_start = date(year, 1, 1)
+
+        running = connection.execute(
+            select(balances_table.c.closing_balance).where(
+                balances_table.c.account_id == account_id,
+                balances_table.c.period_start < year_start
+            ).order_by(balances_table.c.period_start.desc()).limit(1)
+        ).scalar() or ZERO
+
+        closings = dict(connection.execute(
+            select(balances_table.c.period_start, balances_table.c.closing_balance).where(
+                balances_table.c.account_id == account_id,
+                balances_table.c.period_start >= year_start,
+                balances_table.c.period_start < date(year + 1, 1, 1)
+            )
+        ).all())
+
+        monthly = []
+        for month in range(1, 13):
+            running = Decimal(closings.get(date(year, month, 1), running))
+            monthly.append(running)
+        return monthly
+
+    @staticmethod
+    def signed_balance(account_type, net_balance):
+        """تحويل صافي الرصيد (مدين - دائن) إلى رصيد الحساب حسب طبيعته"""
+        return net_balance if account_type in DEBIT_ACCOUNT_TYPES else -net_balance
+
+
+def _committed_value(obj, attribute):
+    """القيمة المحفوظة سابقاً لخاصية (قبل التعديل الحالي)"""
+    history = inspect(obj).attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, attribute)
+
+
+def _has_changes(obj, attributes):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attributes)
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    """مستمع فارغ؛ تسجيله بـ active_history يجعل SQLAlchemy يحمّل القيمة السابقة للخاصية
+    المنتهية صلاحيتها (بعد commit) قبل تعديلها، فتبقى في history.deleted"""
+    return value
+
+
+for _attribute in ENTRY_ATTRIBUTES:
+    event.listen(getattr(TransactionEntry, _attribute), 'set', _load_old_value, active_history=True, retval=True)
+for _attribute in TRANSACTION_ATTRIBUTES:
+    event.listen(getattr(Transaction, _attribute), 'set', _load_old_value, active_history=True, retval=True)
+
+
+@event.listens_for(Session, 'before_flush')
+def _snapshot_ledger_deletions(session, flush_context, instances):
+    """
+    حفظ القيم المحفوظة للقيود والمعاملات التي قد تُحذف في هذه الدفعة
+
+    بعد الحذف لا يمكن تحميل الخصائص المنتهية صلاحيتها، والقيود المحذوفة بإزالتها من
+    المعاملة (delete-orphan) لا تظهر في session.deleted؛ لذلك تُقرأ قيمها قبل الحذف
+    ويُحدد في after_flush ما حُذف منها فعلاً.
+    """
+    candidates = []
+    for obj in session.deleted:
+        if isinstance(obj, (Transaction, TransactionEntry)):
+            candidates.append(obj)
+    for obj in session.dirty:
+        if isinstance(obj, Transaction):
+            removed = inspect(obj).attrs['entries'].history.deleted
+            candidates.extend(entry for entry in removed if inspect(entry).persistent)
+
+    snapshots = session.info.setdefault('ledger_deletion_snapshots', {})
+    for obj in candidates:
+        attributes = TRANSACTION_ATTRIBUTES if isinstance(obj, Transaction) else ENTRY_ATTRIBUTES
+        snapshots[(type(obj), obj.id)] = (obj, tuple(_committed_value(obj, attr) for attr in attributes))
+
+
+def _was_deleted(session, flush_context, obj):
+    """هل حُذف الكائن في هذه الدفعة (القيود اليتيمة تُسجل للحذف في flush_context فقط)"""
+    state = inspect(obj)
+    return obj in session.deleted or state.was_deleted or flush_context.states.get(state, (False, False))[0]
+
+
+def _add_contribution(deltas, sign, entry, transaction_state):
+    """إضافة أثر قيد (transaction_id, account_id, entry_type, amount) إلى الفروقات إذا كانت معاملته معتمدة"""
+    if entry is None or transaction_state is None:
+        return
+    is_approved, transaction_date = transaction_state
+    if not is_approved or transaction_date is None:
+        return
+    _, account_id, entry_type, amount = entry
+    if account_id is None or amount is None:
+        return
+    amount = Decimal(str(amount)) * sign
+    delta = deltas[(account_id, _month_start(transaction_date))]
+    if entry_type in (EntryType.DEBIT, EntryType.DEBIT.value):
+        delta[0] += amount
+    else:
+        delta[1] += amount
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_ledger_changes(session, flush_context):
+    """تحديث الأرصدة الشهرية بفروقات القيود والمعاملات المضافة والمعدلة والمحذوفة في هذه الدفعة"""
+    # حالة المعاملات (معتمدة، التاريخ) قبل الدفعة وبعدها؛ None تعني غير موجودة
+    old_transactions, new_transactions = {}, {}
+    changed_transactions = set()
+    entry_changes = []
+    handled_entries = set()
+
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            old_transactions[obj.id] = None
+            new_transactions[obj.id] = (obj.is_approved, obj.transaction_date)
+        elif isinstance(obj, TransactionEntry):
+            entry_changes.append((None, tuple(getattr(obj, attr) for attr in ENTRY_ATTRIBUTES)))
+            handled_entries.add(obj.id)
+
+    # المحذوفات (ومنها القيود المحذوفة بإزالتها من المعاملة) من القيم المحفوظة قبل الدفعة
+    deleted_transactions = set()
+    for (cls, obj_id), (obj, values) in session.info.pop('ledger_deletion_snapshots', {}).items():
+        if not _was_deleted(session, flush_context, obj):
+            continue
+        if cls is Transaction:
+            old_transactions[obj_id] = values
+            new_transactions[obj_id] = None
+            changed_transactions.add(obj_id)
+            deleted_transactions.add(obj_id)
+        else:
+            entry_changes.append((values, None))
+            handled_entries.add(obj_id)
+
+    for obj in session.dirty:
+        if isinstance(obj, Transaction) and obj.id in deleted_transactions:
+            continue
+        if isinstance(obj, TransactionEntry) and obj.id in handled_entries:
+            continue
+        if isinstance(obj, Transaction) and _has_changes(obj, TRANSACTION_ATTRIBUTES):
+            old_transactions[obj.id] = tuple(_committed_value(obj, attr) for attr in TRANSACTION_ATTRIBUTES)
+            new_transactions[obj.id] = (obj.is_approved, obj.transaction_date)
+            changed_transactions.add(obj.id)
+        elif isinstance(obj, TransactionEntry) and _has_changes(obj, ENTRY_ATTRIBUTES):
+            entry_changes.append((
+                tuple(_committed_value(obj, attr) for attr in ENTRY_ATTRIBUTES),
+                tuple(getattr(obj, attr) for attr in ENTRY_ATTRIBUTES)
+            ))
+            handled_entries.add(obj.id)
+
+    if not entry_changes and not changed_transactions:
+        return
+
+    connection = session.connection()
+    transactions_table = Transaction.__table__
+    entries_table = TransactionEntry.__table__
+
+    # حالة المعاملات التي لم تتغير في هذه الدفعة
+    unknown = {
+        entry[0] for change in entry_changes for entry in change
+        if entry is not None and entry[0] is not None and entry[0] not in new_transactions
+    }
+    if unknown:
+        for transaction_id, is_approved, transaction_date in connection.execute(
+            select(transactions_table.c.id, transactions_table.c.is_approved, transactions_table.c.transaction_date)
+            .where(transactions_table.c.id.in_(unknown))
+        ):
+            old_transactions[transaction_id] = new_transactions[transaction_id] = (is_approved, transaction_date)
+
+    deltas = defaultdict(lambda: [ZERO, ZERO])
+    for old_entry, new_entry in entry_changes:
+        if old_entry is not None:
+            _add_contribution(deltas, -1, old_entry, old_transactions.get(old_entry[0]))
+        if new_entry is not None:
+            _add_contribution(deltas, 1, new_entry, new_transactions.get(new_entry[0]))
+
+    # قيود المعاملات التي تغير اعتمادها أو تاريخها دون تعديل القيود نفسها
+    if changed_transactions:
+        for entry in connection.execute(
+            select(
+                entries_table.c.id, entries_table.c.transaction_id, entries_table.c.account_id,
+                entries_table.c.entry_type, entries_table.c.amount
+            ).where(entries_table.c.transaction_id.in_(changed_transactions))
+        ):
+            if entry.id in handled_entries:
+                continue
+            values = tuple(entry)[1:]
+            _add_contribution(deltas, -1, values, old_transactions.get(entry.transaction_id))
+            _add_contribution(deltas, 1, values, new_transactions.get(entry.transaction_id))
+
+    if deltas:
+        LedgerBalanceService.apply_deltas(connection, deltas, session)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_ledger_snapshots(session, previous_transaction):
+    """تجاهل لقطات الحذف لدفعة فشلت أو أُلغيت"""
+    session.info.pop('ledger_deletion_snapshots', None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _mark_balances_initialized(session):
+    """تعليم الجدول كمبني بعد حفظ المعاملة التي تحققت منه أو أعادت بناءه"""
+    global _balances_initialized
+    if session.info.pop('ledger_balances_initialized', False):
+        _balances_initialized = True
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_balances_initialized(session):
+    session.info.pop('ledger_balances_initialized', None)
+
+
+def _rebuild_after_bulk_change(context):
+    """Query.update() و Query.delete() لا تمر بـ after_flush والصفوف المتأثرة غير معروفة: إعادة بناء كاملة"""
+    if context.mapper.class_ in (Transaction, TransactionEntry):
+        LedgerBalanceService.rebuild(context.session.connection())
+        context.session.info['ledger_balances_initialized'] = True
+
+
+event.listen(Session, 'after_bulk_update', _rebuild_after_bulk_change)
+event.listen(Session, 'after_bulk_delete', _rebuild_after_bulk_change)
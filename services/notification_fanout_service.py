@@ -0,0 +1,151 @@
+"""
+خدمة توزيع إشعارات العمليات على المديرين
+
+عند إنشاء طلب عملية تُدرج إشعارات جميع المديرين بجملة INSERT واحدة متعددة الصفوف
+بدلاً من كائن ORM لكل مدير، وتُحفظ قائمة أرقام المديرين في الذاكرة وتُبطل عند
+إضافة مستخدم أو حذفه أو تغيير دوره؛ فتبقى تكلفة إرسال العملية ثابتة مهما زاد
+عدد المديرين.
+
+عند تفعيل NOTIFICATION_FANOUT_ASYNC يُضاف التوزيع كمهمة خلفية ضمن معاملة الطلب
+نفسها، فيُنفذه عامل المهام بعد حفظ العملية.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, insert, inspect, select
+from sqlalchemy.orm import Session
+from app import db
+from models import OperationNotification, User, UserRole
+from services.job_queue_service import JobQueueService, job_handler
+from services.operation_counters_service import OperationCountersService
+
+logger = logging.getLogger(__name__)
+
+FANOUT_JOB_TYPE = 'notifications.operation_fanout'
+
+# أقصى عمر لقائمة المديرين المحفوظة (لتغييرات الأدوار من عمليات ويب أخرى)
+ADMIN_CACHE_SECONDS = 300
+
+_admins_lock = threading.Lock()
+_admin_ids = None
+_admin_ids_at = 0.0
+
+
+class NotificationFanoutService:
+    """توزيع إشعار واحد على مجموعة مستلمين"""
+
+    @staticmethod
+    def admin_ids():
+        """أرقام المستخدمين بدور المدير (من الذاكرة، وتُحمَّل عند أول استخدام أو بعد الإبطال)"""
+        global _admin_ids, _admin_ids_at
+        with _admins_lock:
+            if _admin_ids is not None and time.monotonic() - _admin_ids_at < ADMIN_CACHE_SECONDS:
+                return _admin_ids
+        table = User.__table__
+        ids = tuple(db.session.execute(
+            select(table.c.id).where(table.c.role == UserRole.ADMIN).order_by(table.c.id)
+        ).scalars())
+        with _admins_lock:
+            _admin_ids = ids
+            _admin_ids_at = time.monotonic()
+        return ids
+
+    @staticmethod
+    def invalidate_admins():
+        """إبطال قائمة المديرين المحفوظة"""
+        global _admin_ids
+        with _admins_lock:
+            _admin_ids = None
+
+    @staticmethod
+    def fan_out(operation_id, user_ids, notification_type, title, message):
+        """
+        إدراج الإشعار لجميع المستلمين بجملة واحدة ضمن جلسة الطلب (دون حفظ)
+
+        :return: عدد الإشعارات المدرجة
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return 0
+        now = datetime.utcnow()
+        rows = [{
+            'operation_request_id': operation_id,
+            'user_id': user_id,
+            'notification_type': notification_type,
+            'title': title,
+            'message': message,
+            'is_read': False,
+            'is_sent': False,
+            'created_at': now
+        } for user_id in user_ids]
+        db.session.execute(insert(OperationNotification.__table__).values(rows))
+        # الإدراج المباشر لا يمر بأحداث ORM: تُبطل عدادات الإشعارات يدوياً
+        OperationCountersService.track_changes(db.session, user_ids=user_ids)
+        return len(rows)
+
+    @staticmethod
+    def notify_admins(operation_id, notification_type, title, message):
+        """
+        إشعار جميع المديرين بعملية، فوراً أو كمهمة خلفية حسب NOTIFICATION_FANOUT_ASYNC
+
+        لا تحفظ الجلسة؛ الإشعارات (أو المهمة) تُحفظ مع حفظ المستدعي للعملية.
+        """
+        if current_app.config.get('NOTIFICATION_FANOUT_ASYNC'):
+            JobQueueService.enqueue(FANOUT_JOB_TYPE, {
+                'operation_id': operation_id,
+                'notification_type': notification_type,
+                'title': title,
+                'message': message
+            }, commit=False)
+            return 0
+        return NotificationFanoutService.fan_out(
+            operation_id, NotificationFanoutService.admin_ids(), notification_type, title, message
+        )
+
+
+@job_handler(FANOUT_JOB_TYPE)
+def operation_fanout_job(context, operation_id, notification_type, title, message):
+    """توزيع إشعار عملية جديدة على المديرين في عامل المهام"""
+    count = NotificationFanoutService.fan_out(
+        operation_id, NotificationFanoutService.admin_ids(), notification_type, title, message
+    )
+    return {'message': f'تم إرسال {count} إشعار'}
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_admin_changes(session, flush_context):
+    """تسجيل إضافة المستخدمين أو حذفهم أو تغيير أدوارهم لإبطال قائمة المديرين بعد الحفظ"""
+    for obj in session.new:
+        if isinstance(obj, User):
+            session.info['notification_admins_changed'] = True
+            return
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            session.info['notification_admins_changed'] = True
+            return
+    for obj in session.dirty:
+        if isinstance(obj, User) and inspect(obj).attrs.role.history.has_changes():
+            session.info['notification_admins_changed'] = True
+            return
+
+
+def _track_bulk_user_change(context):
+    if context.mapper.class_ is User:
+        context.session.info['notification_admins_changed'] = True
+
+
+event.listen(Session, 'after_bulk_update', _track_bulk_user_change)
+event.listen(Session, 'after_bulk_delete', _track_bulk_user_change)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_admin_changes(session):
+    if session.info.pop('notification_admins_changed', False):
+        NotificationFanoutService.invalidate_admins()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_admin_changes(session):
+    session.info.pop('notification_admins_changed', None)
@@ -0,0 +1,203 @@
+"""
+عدادات العمليات والإشعارات المشتركة للوحات المدير (Server-Sent Events)
+
+تحتفظ كل عملية ويب بنسخة واحدة من العدادات (عدد العمليات لكل حالة، والإشعارات
+غير المقروءة لكل مستخدم) تُحسب باستعلام مجمّع واحد وتُشارك بين جميع التبويبات
+المفتوحة، فلا يتضاعف عدد الاستعلامات مع عدد المستخدمين. تُبطل العدادات فور
+حفظ أي تعديل على OperationRequest أو OperationNotification (عبر أحداث الجلسة)
+ويُوقظ ذلك جميع اتصالات /operations/api/stream لترسل القيم الجديدة.
+
+التعديلات التي تتم في عمليات ويب أخرى تظهر خلال REFRESH_SECONDS على الأكثر.
+"""
+import json
+import logging
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from models import OperationNotification, OperationRequest
+from services.operation_query_service import OperationQueryService
+
+logger = logging.getLogger(__name__)
+
+# أقصى عمر للعدادات قبل إعادة حسابها (للتعديلات من عمليات ويب أخرى)
+REFRESH_SECONDS = 15
+
+# الفاصل بين رسائل الإبقاء على الاتصال (SSE comment)
+KEEPALIVE_SECONDS = 20
+
+# مدة الاتصال الواحد قبل أن يعيد المتصفح الاتصال تلقائياً
+STREAM_SECONDS = 300
+
+# مهلة إعادة الاتصال التي يستخدمها EventSource بعد انتهاء الاتصال (بالمللي ثانية)
+RECONNECT_MS = 3000
+
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_changed = threading.Condition(_lock)
+_state = {
+    'version': 0,
+    'statuses': None,
+    'statuses_at': 0.0,
+    'unread': {},
+    'streams': 0
+}
+
+
+def _read_state(user_id):
+    statuses = _state['statuses']
+    now = time.monotonic()
+    stale = statuses is None or now - _state['statuses_at'] > REFRESH_SECONDS
+    unread, unread_at = _state['unread'].get(user_id, (None, 0.0))
+    if now - unread_at > REFRESH_SECONDS:
+        unread = None
+    return statuses, unread, _state['version'], stale
+
+
+class OperationCountersService:
+    """قراءة العدادات المشتركة وبثها"""
+
+    @staticmethod
+    def snapshot(user_id):
+        """
+        العدادات الحالية للمستخدم
+
+        تُعاد من الذاكرة ما لم تُبطل أو يتجاوز عمرها REFRESH_SECONDS، ويُحسب
+        الاستعلام خارج الجلسة حتى لا يحجز اتصالاً طوال مدة البث.
+        :return: (رقم الإصدار، القاموس {pending, under_review, approved, rejected, unread_notifications})
+        """
+        with _lock:
+            statuses, unread, version, stale = _read_state(user_id)
+        if stale or unread is None:
+            # استعلام واحد لكل العملية: الاتصالات الأخرى تنتظر النتيجة بدلاً من تكرارها
+            with _refresh_lock:
+                with _lock:
+                    statuses, unread, version, stale = _read_state(user_id)
+                if stale or unread is None:
+                    with db.engine.connect() as connection:
+                        if stale:
+                            statuses = OperationQueryService.status_counts(connection)
+                        unread = OperationQueryService.unread_count(user_id, connection)
+                    with _lock:
+                        if _state['version'] == version:
+                            # لم يُبطل شيء أثناء الاستعلام: تُحفظ النتيجة للمشتركين الآخرين
+                            if stale:
+                                _state['statuses'] = statuses
+                                _state['statuses_at'] = time.monotonic()
+                            _state['unread'][user_id] = (unread, time.monotonic())
+
+        counts = dict(statuses)
+        counts['unread_notifications'] = unread
+        return version, counts
+
+    @staticmethod
+    def invalidate(statuses=True, user_ids=()):
+        """
+        إبطال العدادات وإيقاظ اتصالات البث
+
+        :param statuses: إبطال عدادات حالات العمليات
+        :param user_ids: المستخدمون الذين تغيرت إشعاراتهم، و None لجميع المستخدمين
+        """
+        with _changed:
+            if statuses:
+                _state['statuses'] = None
+            if user_ids is None:
+                _state['unread'].clear()
+            else:
+                for user_id in user_ids:
+                    _state['unread'].pop(user_id, None)
+            _state['version'] += 1
+            _changed.notify_all()
+
+    @staticmethod
+    def track_changes(session, statuses=False, user_ids=()):
+        """تسجيل تعديل تم بجملة مباشرة (خارج كائنات ORM) لإبطال العدادات بعد حفظ الجلسة"""
+        if statuses:
+            session.info['operation_counters_statuses'] = True
+        if user_ids:
+            session.info.setdefault('operation_counters_users', set()).update(user_ids)
+
+    @staticmethod
+    def stream(user_id):
+        """
+        مولّد أحداث SSE للمستخدم: حدث counts عند تغير أي عداد، وتعليق كل KEEPALIVE_SECONDS
+
+        ينتهي بعد STREAM_SECONDS ويعيد المتصفح الاتصال تلقائياً بعد RECONNECT_MS.
+        يجب حجز مكان للاتصال قبله عبر acquire_stream وتحريره عند إغلاق الاستجابة.
+        """
+        yield f'retry: {RECONNECT_MS}\n\n'
+        deadline = time.monotonic() + STREAM_SECONDS
+        last_sent = None
+        while time.monotonic() < deadline:
+            version, counts = OperationCountersService.snapshot(user_id)
+            if counts != last_sent:
+                last_sent = counts
+                yield f'event: counts\ndata: {json.dumps(counts)}\n\n'
+            else:
+                yield ': keepalive\n\n'
+            with _changed:
+                if _state['version'] == version:
+                    _changed.wait(timeout=min(KEEPALIVE_SECONDS, REFRESH_SECONDS))
+
+    @staticmethod
+    def acquire_stream(max_streams):
+        """
+        حجز مكان لاتصال بث جديد إذا لم يبلغ عدد الاتصالات المفتوحة الحد الأقصى
+
+        الفحص والزيادة تحت القفل نفسه حتى لا يتجاوز طلبان متزامنان الحد معاً.
+        :return: True إذا تم الحجز (ويجب استدعاء release_stream عند انتهاء الاتصال)
+        """
+        with _lock:
+            if _state['streams'] >= max_streams:
+                return False
+            _state['streams'] += 1
+            return True
+
+    @staticmethod
+    def release_stream():
+        """تحرير مكان اتصال بث محجوز"""
+        with _lock:
+            _state['streams'] -= 1
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_counter_changes(session, flush_context):
+    """تسجيل تعديلات العمليات والإشعارات في هذه الدفعة لإبطال العدادات بعد الحفظ"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, OperationRequest):
+            session.info['operation_counters_statuses'] = True
+        elif isinstance(obj, OperationNotification) and obj.user_id is not None:
+            session.info.setdefault('operation_counters_users', set()).add(obj.user_id)
+
+
+def _track_bulk_change(context):
+    """Query.update() و Query.delete() لا تمر بـ after_flush، والمستخدمون المتأثرون غير معروفين"""
+    model = context.mapper.class_
+    if model is OperationRequest:
+        context.session.info['operation_counters_statuses'] = True
+    elif model is OperationNotification:
+        context.session.info['operation_counters_all_users'] = True
+
+
+event.listen(Session, 'after_bulk_update', _track_bulk_change)
+event.listen(Session, 'after_bulk_delete', _track_bulk_change)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_counter_changes(session):
+    statuses = session.info.pop('operation_counters_statuses', False)
+    user_ids = session.info.pop('operation_counters_users', set())
+    if session.info.pop('operation_counters_all_users', False):
+        user_ids = None
+    if statuses or user_ids is None or user_ids:
+        OperationCountersService.invalidate(statuses=statuses, user_ids=user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_counter_changes(session):
+    session.info.pop('operation_counters_statuses', None)
+    session.info.pop('operation_counters_users', None)
+    session.info.pop('operation_counters_all_users', None)
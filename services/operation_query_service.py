@@ -0,0 +1,113 @@
+"""
+خدمة استعلامات طلبات العمليات: الإحصائيات المجمّعة، والفلترة، والتقسيم إلى صفحات بمؤشر (keyset)
+
+الترتيب ثابت (الأولوية ثم تاريخ الطلب تنازلياً، ثم الرقم لفك التعادل)، ويستفيد
+من الفهرس (status, priority, requested_at) عند الفلترة بالحالة. البحث برقم
+اللوحة يتم بالربط مع جدول المركبات بدلاً من البحث في العنوان والوصف.
+"""
+from datetime import datetime
+from sqlalchemy import func, select, tuple_
+from app import db
+from models import OperationNotification, OperationRequest, Vehicle
+from utils.keyset_cursor import decode_cursor, encode_cursor
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# الحالات المعروضة في الإحصائيات
+OPERATION_STATUSES = ('pending', 'under_review', 'approved', 'rejected')
+
+# أعمدة الترتيب (تنازلياً)
+ORDER_COLUMNS = (OperationRequest.priority, OperationRequest.requested_at, OperationRequest.id)
+
+
+class OperationPage:
+    """صفحة من نتائج قائمة العمليات"""
+
+    def __init__(self, operations, next_cursor):
+        self.operations = operations
+        self.next_cursor = next_cursor
+        self.has_more = next_cursor is not None
+
+
+class OperationQueryService:
+    """استعلامات طلبات العمليات دون تحميل جميع العمليات في الذاكرة"""
+
+    @staticmethod
+    def status_counts(connection=None):
+        """
+        عدد العمليات لكل حالة باستعلام مجمّع واحد
+
+        :param connection: اتصال قاعدة البيانات (افتراضياً جلسة الطلب)
+        :return: قاموس {الحالة: العدد} لجميع الحالات في OPERATION_STATUSES
+        """
+        table = OperationRequest.__table__
+        rows = (connection or db.session).execute(
+            select(table.c.status, func.count()).where(table.c.status.in_(OPERATION_STATUSES)).group_by(table.c.status)
+        ).all()
+        counts = dict.fromkeys(OPERATION_STATUSES, 0)
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    @staticmethod
+    def unread_count(user_id, connection=None):
+        """عدد الإشعارات غير المقروءة للمستخدم (يستخدم الفهرس (user_id, is_read))"""
+        table = OperationNotification.__table__
+        return (connection or db.session).execute(
+            select(func.count()).select_from(table).where(table.c.user_id == user_id, table.c.is_read.is_(False))
+        ).scalar() or 0
+
+    @staticmethod
+    def filtered_query(filters):
+        """
+        بناء استعلام العمليات حسب فلاتر صفحة القائمة
+
+        :param filters: قاموس الفلاتر (status, operation_type, priority, vehicle_search) والقيمة 'all' تعني بدون فلتر
+        """
+        query = OperationRequest.query
+
+        for field in ('status', 'operation_type', 'priority'):
+            value = filters.get(field)
+            if value and value != 'all':
+                query = query.filter(getattr(OperationRequest, field) == value)
+
+        search = (filters.get('vehicle_search') or '').strip()
+        if search:
+            query = query.join(Vehicle, OperationRequest.vehicle_id == Vehicle.id).filter(
+                Vehicle.plate_number.ilike(f'%{search}%')
+            )
+
+        return query
+
+    @staticmethod
+    def page(query, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """
+        جلب صفحة واحدة مرتبة باستخدام مؤشر (keyset) بدلاً من OFFSET
+
+        :return: كائن OperationPage
+        """
+        limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+        if cursor:
+            position = decode_cursor(cursor, str, datetime.fromisoformat, int)
+            if position is not None:
+                query = query.filter(tuple_(*ORDER_COLUMNS) < tuple_(*position))
+
+        operations = query.order_by(*(column.desc() for column in ORDER_COLUMNS)).options(
+            db.joinedload(OperationRequest.vehicle),
+            db.joinedload(OperationRequest.requester)
+        ).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(operations) > limit:
+            operations = operations[:limit]
+            last = operations[-1]
+            next_cursor = encode_cursor(last.priority, last.requested_at, last.id)
+        return OperationPage(operations, next_cursor)
+
+    @staticmethod
+    def pending(search_plate=None, limit=10):
+        """أحدث العمليات المعلقة للوحة المدير، مع البحث برقم اللوحة"""
+        query = OperationQueryService.filtered_query({'status': 'pending', 'vehicle_search': search_plate})
+        return OperationQueryService.page(query, limit=limit).operations
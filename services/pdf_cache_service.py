@@ -0,0 +1,205 @@
+"""
+خدمة تخزين ملفات PDF المولدة (نماذج التسليم، إشعارات الرواتب، تقارير الفحص) على القرص
+
+مفتاح الملف هو بصمة (نوع القالب، إصداره، رقم السجل، تواريخ تحديث السجل والسجلات
+المرتبطة)، فأي تعديل على السجل أو سجلاته الفرعية (الصور، عناصر الفحص) ينتج مفتاحاً
+جديداً، كما تُحذف ملفاته القديمة عبر مستمع after_flush. يُحد حجم المجلد بحذف
+الأقدم استخداماً.
+
+تُرسل الملفات مع ETag يساوي المفتاح، فيُرد بـ 304 دون توليد أو قراءة للملف
+عندما تكون النسخة لدى المتصفح حديثة.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from flask import current_app, request, send_file
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+from models import (Salary, VehicleChecklist, VehicleChecklistImage, VehicleChecklistItem,
+                    VehicleDamageMarker, VehicleHandover, VehicleHandoverImage)
+
+logger = logging.getLogger(__name__)
+
+# إصدار كل قالب؛ يُرفع عند تغيير شكل الملف الناتج لإبطال النسخ المخزنة السابقة
+PDF_TEMPLATE_VERSIONS = {
+    'handover_pdf': '1',
+    'handover_pdf_public': '1',
+    'salary_notification': '1',
+    'salary_notification_enhanced': '1',
+    'vehicle_checklist': '1'
+}
+
+# الحد الافتراضي لحجم مجلد التخزين
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# السجلات التي تُولَّد منها الملفات: النموذج -> المجموعة (مجلد ملفات السجل)
+CACHED_MODELS = {
+    VehicleHandover: 'handover',
+    Salary: 'salary',
+    VehicleChecklist: 'vehicle_checklist'
+}
+
+# السجلات الفرعية التي تظهر في ملف السجل الأصلي: النموذج -> (النموذج الأصلي، حقل رقمه)
+# تعديلها يحدّث updated_at للسجل الأصلي حتى يتغير مفتاح الملف و ETag
+CHILD_MODELS = {
+    VehicleHandoverImage: (VehicleHandover, 'handover_record_id'),
+    VehicleChecklistItem: (VehicleChecklist, 'checklist_id'),
+    VehicleChecklistImage: (VehicleChecklist, 'checklist_id'),
+    VehicleDamageMarker: (VehicleChecklist, 'checklist_id')
+}
+
+
+def cache_folder():
+    """مجلد تخزين ملفات PDF، خارج المجلدات العامة"""
+    folder = current_app.config.get('PDF_CACHE_FOLDER') or os.path.join(current_app.instance_path, 'pdf_cache')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _record_folder(group, record_id):
+    return os.path.join(cache_folder(), group, str(record_id))
+
+
+class PdfCacheService:
+    """تخزين ملفات PDF المولدة وإبطالها"""
+
+    @staticmethod
+    def cache_key(template, record_id, versions=()):
+        """
+        بصمة الملف المولد
+
+        :param template: اسم القالب (من PDF_TEMPLATE_VERSIONS)
+        :param record_id: رقم السجل
+        :param versions: قيم تتغير مع تعديل السجل أو السجلات المرتبطة (مثل updated_at)
+        """
+        parts = [template, PDF_TEMPLATE_VERSIONS.get(template, '0'), str(record_id)]
+        parts += [value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in versions]
+        return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def get_or_render(group, record_id, key, render):
+        """
+        مسار الملف المخزن، أو توليده بالدالة render وتخزينه
+
+        :param group: مجموعة السجل (تُحذف ملفاتها معاً عند الإبطال)
+        :param record_id: رقم السجل
+        :param key: بصمة الملف من cache_key
+        :param render: دالة بدون معاملات تُرجع bytes أو BytesIO
+        :return: مسار الملف، أو None إذا لم يُنتج render محتوى
+        """
+        folder = _record_folder(group, record_id)
+        path = os.path.join(folder, f'{key}.pdf')
+        if os.path.exists(path):
+            # تحديث وقت الاستخدام لترتيب الحذف (الأقدم استخداماً أولاً)
+            os.utime(path)
+            return path
+
+        data = render()
+        if hasattr(data, 'getvalue'):
+            data = data.getvalue()
+        if not data:
+            return None
+
+        os.makedirs(folder, exist_ok=True)
+        temp_path = os.path.join(folder, f'.{uuid.uuid4().hex}.tmp')
+        with open(temp_path, 'wb') as cached:
+            cached.write(data)
+        os.replace(temp_path, path)
+
+        PdfCacheService.evict()
+        return path
+
+    @staticmethod
+    def invalidate(group, record_id):
+        """حذف جميع الملفات المخزنة لسجل"""
+        shutil.rmtree(_record_folder(group, record_id), ignore_errors=True)
+
+    @staticmethod
+    def evict(max_bytes=None):
+        """حذف الملفات الأقدم استخداماً حتى يصبح حجم المجلد ضمن الحد، وإرجاع عدد الملفات المحذوفة"""
+        if max_bytes is None:
+            max_bytes = current_app.config.get('PDF_CACHE_MAX_BYTES') or DEFAULT_MAX_BYTES
+
+        files = []
+        total = 0
+        for root, _, names in os.walk(cache_folder()):
+            for name in names:
+                if not name.endswith('.pdf'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+
+def cached_pdf_response(group, record_id, template, versions, render, download_name, as_attachment=True):
+    """
+    إرسال ملف PDF من التخزين مع ETag، أو 304 إذا كانت نسخة المتصفح حديثة
+
+    :return: الاستجابة، أو None إذا فشل توليد الملف
+    """
+    key = PdfCacheService.cache_key(template, record_id, versions)
+    if key in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(key)
+    else:
+        path = PdfCacheService.get_or_render(group, record_id, key, render)
+        if path is None:
+            return None
+        response = send_file(path, mimetype='application/pdf', as_attachment=as_attachment,
+                             download_name=download_name, etag=key, conditional=True, max_age=0)
+    # الملفات تحتوي بيانات شخصية: لا تُخزن في الوسطاء، ويتحقق المتصفح منها في كل مرة
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_changed_records(session, flush_context):
+    """إبطال ملفات السجلات المعدلة أو المحذوفة أو التي تغيرت سجلاتها الفرعية في هذه الدفعة"""
+    records = set()
+    touched_parents = defaultdict(set)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        model = type(obj)
+        if model not in CACHED_MODELS and model not in CHILD_MODELS:
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if model in CACHED_MODELS:
+            records.add((CACHED_MODELS[model], obj.id))
+        else:
+            parent_model, attribute = CHILD_MODELS[model]
+            parent_id = getattr(obj, attribute)
+            if parent_id is not None:
+                touched_parents[parent_model].add(parent_id)
+                records.add((CACHED_MODELS[parent_model], parent_id))
+
+    connection = session.connection() if touched_parents else None
+    for parent_model, ids in touched_parents.items():
+        table = parent_model.__table__
+        connection.execute(update(table).where(table.c.id.in_(ids)).values(updated_at=datetime.utcnow()))
+
+    for group, record_id in records:
+        try:
+            PdfCacheService.invalidate(group, record_id)
+        except (OSError, RuntimeError) as e:
+            # خارج سياق التطبيق أو تعذر الحذف: يُحذف الملف لاحقاً ضمن حد الحجم
+            logger.debug(f"تعذر إبطال ملفات {group}/{record_id}: {str(e)}")
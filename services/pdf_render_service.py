@@ -0,0 +1,198 @@
+"""
+خدمة توليد ملفات PDF في مجموعة عمليات مهيأة مسبقاً
+
+كل عملية في المجموعة تستورد التطبيق ومكتبات التوليد (FPDF و ReportLab و WeasyPrint
+وخطوط العربية) مرة واحدة عند بدئها، ثم تستقبل مهام التوليد برقم السجل فتحمّله
+بنفسها وتُرجع محتوى الملف؛ فلا يتحمل الطلب تكلفة تهيئة المكتبات، ولا يحجز
+التوليد عملية الويب، وتتوزع الدفعات الكبيرة (إشعارات الرواتب) على جميع الأنوية.
+
+عدد العمليات من الإعداد PDF_RENDER_PROCESSES، والقيمة 0 تعني التوليد داخل
+العملية الحالية كما كان سابقاً.
+"""
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from app import db
+from services.pdf_render_worker import init_worker, run_task
+
+logger = logging.getLogger(__name__)
+
+# مهام التوليد المسجلة: اسم المهمة -> دالة تستقبل أرقام السجلات وتُرجع محتوى PDF
+RENDER_TASKS = {}
+
+# المهلة القصوى لتوليد ملف واحد بالثواني
+RENDER_TIMEOUT_SECONDS = 120
+
+_executor = None
+
+
+def render_task(name):
+    """
+    تسجيل دالة كمهمة توليد
+
+    تستقبل الدالة أرقام السجلات (قيم بسيطة قابلة للنقل بين العمليات) وتحمّل
+    السجلات بنفسها، وتُرجع bytes أو BytesIO أو None عند الفشل.
+    """
+    def decorator(func):
+        RENDER_TASKS[name] = func
+        return func
+    return decorator
+
+
+def _as_bytes(data):
+    if hasattr(data, 'getvalue'):
+        return data.getvalue()
+    return data
+
+
+def _get_executor():
+    """مجموعة العمليات، تُنشأ عند أول استخدام"""
+    global _executor
+    if _executor is None:
+        processes = current_app.config.get('PDF_RENDER_PROCESSES') or 0
+        if processes <= 0:
+            return None
+        # spawn بدلاً من fork: عملية الويب متعددة الخيوط ولها اتصالات مفتوحة
+        _executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker
+        )
+    return _executor
+
+
+def _reset_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+class PdfRenderService:
+    """إرسال مهام توليد PDF إلى مجموعة العمليات"""
+
+    @staticmethod
+    def render(name, *args, timeout=RENDER_TIMEOUT_SECONDS):
+        """
+        توليد ملف PDF بمهمة مسجلة
+
+        :param name: اسم المهمة (من RENDER_TASKS)
+        :param args: أرقام السجلات
+        :return: محتوى الملف bytes، أو None إذا لم ينتج المولد ملفاً
+        """
+        if name not in RENDER_TASKS:
+            raise ValueError(f'مهمة توليد غير معروفة: {name}')
+
+        executor = _get_executor()
+        if executor is not None:
+            try:
+                return executor.submit(run_task, name, args).result(timeout=timeout)
+            except BrokenProcessPool:
+                # توقفت إحدى العمليات: تُعاد المجموعة عند الطلب التالي ويُولد هذا الملف محلياً
+                logger.exception("توقفت مجموعة عمليات توليد PDF")
+                _reset_executor()
+
+        return _as_bytes(RENDER_TASKS[name](*args))
+
+    @staticmethod
+    def render_many(name, ids, timeout=RENDER_TIMEOUT_SECONDS):
+        """
+        توليد ملف لكل رقم سجل موزعاً على عمليات المجموعة
+
+        :param name: اسم المهمة (من RENDER_TASKS)
+        :param ids: أرقام السجلات
+        :return: قائمة (رقم السجل، المحتوى أو None، الخطأ أو None) بنفس ترتيب ids
+        """
+        if name not in RENDER_TASKS:
+            raise ValueError(f'مهمة توليد غير معروفة: {name}')
+
+        ids = list(ids)
+        executor = _get_executor()
+        if executor is None:
+            return [PdfRenderService._render_local(name, record_id) for record_id in ids]
+
+        try:
+            futures = [executor.submit(run_task, name, (record_id,)) for record_id in ids]
+        except BrokenProcessPool:
+            logger.exception("توقفت مجموعة عمليات توليد PDF")
+            _reset_executor()
+            return [PdfRenderService._render_local(name, record_id) for record_id in ids]
+
+        results = []
+        for record_id, future in zip(ids, futures):
+            try:
+                results.append((record_id, future.result(timeout=timeout), None))
+            except Exception as e:
+                results.append((record_id, None, e))
+        if any(isinstance(error, BrokenProcessPool) for _, _, error in results):
+            _reset_executor()
+        return results
+
+    @staticmethod
+    def _render_local(name, record_id):
+        try:
+            return record_id, _as_bytes(RENDER_TASKS[name](record_id)), None
+        except Exception as e:
+            return record_id, None, e
+
+    @staticmethod
+    def shutdown():
+        """إيقاف عمليات التوليد"""
+        _reset_executor()
+
+
+@render_task('salary_notification')
+def render_salary_notification(salary_id):
+    from models import Salary
+    from utils.salary_notification import generate_salary_notification_pdf
+
+    salary = db.session.get(Salary, salary_id)
+    return generate_salary_notification_pdf(salary) if salary else None
+
+
+@render_task('handover')
+def render_handover(handover_id):
+    from models import VehicleHandover
+    from utils.enhanced_arabic_handover_pdf import create_vehicle_handover_pdf
+
+    handover = db.session.get(VehicleHandover, handover_id)
+    return create_vehicle_handover_pdf(handover) if handover else None
+
+
+@render_task('handover_public')
+def render_handover_public(handover_id):
+    from models import VehicleHandover
+    from utils.fpdf_handover_pdf import generate_handover_report_pdf_weasyprint
+
+    handover = db.session.get(VehicleHandover, handover_id)
+    return generate_handover_report_pdf_weasyprint(handover) if handover else None
+
+
+@render_task('workshop_report')
+def render_workshop_report(vehicle_id):
+    from models import Vehicle, VehicleWorkshop
+    from utils.fpdf_arabic_report import generate_workshop_report_pdf_fpdf
+
+    vehicle = db.session.get(Vehicle, vehicle_id)
+    if vehicle is None:
+        return None
+    workshop_records = VehicleWorkshop.query.filter_by(vehicle_id=vehicle_id).order_by(
+        VehicleWorkshop.entry_date.desc()
+    ).all()
+    return generate_workshop_report_pdf_fpdf(vehicle, workshop_records)
+
+
+@render_task('employee_basic_report')
+def render_employee_basic_report(employee_id):
+    from utils.employee_basic_report import generate_employee_basic_pdf
+
+    return generate_employee_basic_pdf(employee_id)
+
+
+@render_task('employee_comprehensive_report')
+def render_employee_comprehensive_report(employee_id):
+    from utils.employee_comprehensive_report_updated import generate_employee_comprehensive_pdf
+
+    return generate_employee_comprehensive_pdf(employee_id)
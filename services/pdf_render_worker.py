@@ -0,0 +1,53 @@
+"""
+الجزء الذي يعمل داخل عمليات توليد PDF (انظر services/pdf_render_service.py)
+
+لا يستورد التطبيق عند تحميله: العملية الجديدة تحمّل هذه الوحدة أولاً لتنفيذ
+init_worker، فيُستورد التطبيق كاملاً من داخلها قبل تحميل مهام التوليد.
+"""
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# الوحدات التي تُستورد عند بدء كل عملية حتى لا يتحمل أول طلب تكلفة تحميلها
+WARM_MODULES = (
+    'utils.professional_arabic_salary_pdf',
+    'utils.enhanced_arabic_handover_pdf',
+    'utils.fpdf_arabic_report',
+    'utils.employee_basic_report',
+    'utils.employee_comprehensive_report_updated',
+    'utils.fpdf_handover_pdf'
+)
+
+# التطبيق داخل عملية التوليد (يُهيأ في init_worker)
+_app = None
+
+
+def init_worker():
+    """تهيئة عملية التوليد: استيراد التطبيق ومكتبات التوليد مرة واحدة"""
+    global _app
+    from app import app, db
+
+    with app.app_context():
+        # عدم مشاركة اتصالات قاعدة البيانات مع العملية الأم
+        db.engine.dispose(close=False)
+
+    for module in WARM_MODULES:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            # مكتبة غير مثبتة (مثل WeasyPrint) لا تمنع بقية المهام
+            logger.warning(f"تعذر تحميل {module} في عملية التوليد: {str(e)}")
+
+    _app = app
+
+
+def run_task(name, args):
+    """تنفيذ مهمة توليد في سياق طلب (لدعم render_template و url_for في القوالب)"""
+    from services.pdf_render_service import RENDER_TASKS
+
+    with _app.test_request_context():
+        data = RENDER_TASKS[name](*args)
+    if hasattr(data, 'getvalue'):
+        return data.getvalue()
+    return data
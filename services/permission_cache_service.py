@@ -0,0 +1,88 @@
+"""
+خدمة خريطة صلاحيات المستخدمين المجمّعة
+
+تُجمع صفوف UserPermission للمستخدم مرة واحدة في خريطة ثابتة (الوحدة -> بتات
+الصلاحيات) وتُحفظ في ذاكرة العملية بمفتاح (المستخدم، رقم إصدار الصلاحيات)، فتصبح
+فحوص has_module_access و has_permission ومرشح check_module_access في القوالب
+بحثاً في قاموس بدلاً من المرور على علاقة permissions في كل استدعاء.
+
+رقم الإصدار محفوظ في عمود user.permissions_version ويُقرأ مع المستخدم في كل طلب،
+ويُزاد عند تعديل صلاحيات المستخدم (تلقائياً عبر أحداث الجلسة للتعديلات على كائنات
+UserPermission، ويدوياً عبر bump_version بعد الحذف الجماعي)؛ فتُعاد ترجمة الخريطة
+في جميع عمليات الويب عند أول طلب بعد التعديل.
+"""
+import threading
+from types import MappingProxyType
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from app import db
+from models import User, UserPermission
+
+_lock = threading.Lock()
+# معرف المستخدم -> (رقم الإصدار، الخريطة)
+_compiled = {}
+
+
+class PermissionCacheService:
+    """ترجمة صلاحيات المستخدم وحفظها"""
+
+    @staticmethod
+    def module_map(user):
+        """
+        خريطة صلاحيات المستخدم للإصدار الحالي
+
+        :param user: كائن المستخدم
+        :return: خريطة للقراءة فقط {Module: بتات الصلاحيات} من الصلاحيات المحفوظة
+        """
+        version = user.permissions_version or 0
+        with _lock:
+            cached = _compiled.get(user.id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        # الترجمة من اتصال مستقل يرى الصفوف المحفوظة فقط، حتى لا تُخزن صلاحيات معاملة
+        # لم تُحفظ بعد (وقد تتراجع) تحت رقم الإصدار المحفوظ
+        table = UserPermission.__table__
+        users = User.__table__
+        compiled = {}
+        with db.engine.connect() as connection:
+            committed_version = connection.execute(
+                select(users.c.permissions_version).where(users.c.id == user.id)
+            ).scalar() or 0
+            for module, permissions in connection.execute(
+                select(table.c.module, table.c.permissions).where(table.c.user_id == user.id)
+            ):
+                compiled[module] = compiled.get(module, 0) | (permissions or 0)
+        module_map = MappingProxyType(compiled)
+
+        with _lock:
+            _compiled[user.id] = (committed_version, module_map)
+        return module_map
+
+    @staticmethod
+    def bump_version(user_id, connection=None):
+        """زيادة رقم إصدار صلاحيات المستخدم (ضمن معاملة الجلسة الحالية)"""
+        table = User.__table__
+        (connection or db.session).execute(
+            update(table).where(table.c.id == user_id).values(
+                permissions_version=db.func.coalesce(table.c.permissions_version, 0) + 1
+            )
+        )
+        with _lock:
+            _compiled.pop(user_id, None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_changed_permissions(session, flush_context):
+    """زيادة رقم الإصدار للمستخدمين الذين أُضيفت صلاحياتهم أو عُدلت أو حُذفت في هذه الدفعة"""
+    user_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, UserPermission) and obj.user_id is not None:
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            user_ids.add(obj.user_id)
+
+    if user_ids:
+        connection = session.connection()
+        for user_id in user_ids:
+            PermissionCacheService.bump_version(user_id, connection)
@@ -5,6 +5,7 @@ from datetime import datetime, date, timedelta
 from sqlalchemy import func, and_, or_
 from models import Employee, Attendance, Salary, Document, Vehicle, Department
 from core.extensions import db
+from services.document_expiry_service import DocumentExpiryService
 import pandas as pd
 from io import BytesIO
 
@@ -119,52 +120,31 @@ class ReportService:
     @staticmethod
     def get_document_expiry_report(days_ahead=30):
         """تقرير انتهاء صلاحية الوثائق"""
-        cutoff_date = date.today() + timedelta(days=days_ahead)
-        
-        expiring_docs = db.session.query(
-            Document,
-            Employee.name.label('employee_name'),
-            Employee.mobile.label('employee_mobile')
-        ).join(Employee).filter(
-            and_(
-                Document.expiry_date.isnot(None),
-                Document.expiry_date <= cutoff_date,
-                Document.expiry_date >= date.today()
-            )
-        ).order_by(Document.expiry_date).all()
-        
-        expired_docs = db.session.query(
-            Document,
-            Employee.name.label('employee_name'),
-            Employee.mobile.label('employee_mobile')
-        ).join(Employee).filter(
-            and_(
-                Document.expiry_date.isnot(None),
-                Document.expiry_date < date.today()
-            )
-        ).order_by(Document.expiry_date.desc()).all()
+        today = date.today()
+        expiring_docs = DocumentExpiryService.expiring_documents(days_ahead, today=today)
+        expired_docs = DocumentExpiryService.expired_documents(today=today)
         
         return {
             'expiring_soon': [
                 {
-                    'document_id': doc.Document.id,
+                    'document_id': doc.id,
                     'employee_name': doc.employee_name,
                     'employee_mobile': doc.employee_mobile,
-                    'document_type': doc.Document.document_type,
-                    'document_number': doc.Document.document_number,
-                    'expiry_date': doc.Document.expiry_date.strftime('%Y-%m-%d'),
-                    'days_remaining': (doc.Document.expiry_date - date.today()).days
+                    'document_type': doc.document_type,
+                    'document_number': doc.document_number,
+                    'expiry_date': doc.expiry_date.strftime('%Y-%m-%d'),
+                    'days_remaining': (doc.expiry_date - today).days
                 } for doc in expiring_docs
             ],
             'expired': [
                 {
-                    'document_id': doc.Document.id,
+                    'document_id': doc.id,
                     'employee_name': doc.employee_name,
                     'employee_mobile': doc.employee_mobile,
-                    'document_type': doc.Document.document_type,
-                    'document_number': doc.Document.document_number,
-                    'expiry_date': doc.Document.expiry_date.strftime('%Y-%m-%d'),
-                    'days_overdue': (date.today() - doc.Document.expiry_date).days
+                    'document_type': doc.document_type,
+                    'document_number': doc.document_number,
+                    'expiry_date': doc.expiry_date.strftime('%Y-%m-%d'),
+                    'days_overdue': (today - doc.expiry_date).days
                 } for doc in expired_docs
             ]
         }
@@ -0,0 +1,219 @@
+"""
+خدمة استيراد الرواتب من Excel بعمليات على الأعمدة
+
+يُقرأ الملف إلى جدول pandas موحد الأعمدة (read_salary_frame)، وتُحل جميع أرقام
+الموظفين من خريطة واحدة محمّلة مسبقاً، وتُقرأ رواتب الفترة الموجودة دفعة واحدة
+ثم تُقارن بالملف لتصنيف كل صف (جديد، متغير، بدون تغيير، موظف غير معروف) قبل كتابة
+الصفوف الجديدة والمتغيرة بجمل UPSERT مجمّعة.
+"""
+import logging
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from app import db
+from models import Employee, Salary
+from services.salary_worksheet_service import SalaryWorksheetService
+from utils.excel import SALARY_AMOUNT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# عدد الموظفين في كل استعلام لقراءة الرواتب الموجودة
+READ_CHUNK_SIZE = 500
+
+STATUS_NEW = 'new'
+STATUS_CHANGED = 'changed'
+STATUS_UNCHANGED = 'unchanged'
+STATUS_UNKNOWN = 'unknown_employee'
+
+
+class SalaryImportReport:
+    """تقرير الفروقات بين ملف الاستيراد ورواتب الفترة الحالية"""
+
+    def __init__(self, month, year, rows, duplicate_rows=0):
+        self.month = month
+        self.year = year
+        # قواميس الصفوف مع status والقيم السابقة (previous) للصفوف المتغيرة
+        self.rows = rows
+        self.duplicate_rows = duplicate_rows
+        self.applied = False
+
+    def by_status(self, status):
+        return [row for row in self.rows if row['status'] == status]
+
+    @property
+    def new(self):
+        return self.by_status(STATUS_NEW)
+
+    @property
+    def changed(self):
+        return self.by_status(STATUS_CHANGED)
+
+    @property
+    def unchanged(self):
+        return self.by_status(STATUS_UNCHANGED)
+
+    @property
+    def unknown(self):
+        return self.by_status(STATUS_UNKNOWN)
+
+    @property
+    def counts(self):
+        return {
+            STATUS_NEW: len(self.new),
+            STATUS_CHANGED: len(self.changed),
+            STATUS_UNCHANGED: len(self.unchanged),
+            STATUS_UNKNOWN: len(self.unknown),
+        }
+
+    def summary(self):
+        """ملخص نصي لعرضه في رسالة أو سجل المراجعة"""
+        counts = self.counts
+        summary = (
+            f"{counts[STATUS_NEW]} جديد، {counts[STATUS_CHANGED]} متغير، "
+            f"{counts[STATUS_UNCHANGED]} بدون تغيير، {counts[STATUS_UNKNOWN]} موظف غير معروف"
+        )
+        if self.duplicate_rows:
+            summary += f"، {self.duplicate_rows} صف مكرر"
+        return summary
+
+
+def _normalize_number(series):
+    """توحيد أرقام الموظفين للمطابقة: إزالة المسافات والأصفار البادئة"""
+    normalized = series.astype(str).str.strip().str.lstrip('0')
+    return normalized.where(normalized != '', '0')
+
+
+class SalaryImportService:
+    """استيراد رواتب شهر كامل من ملف Excel"""
+
+    @staticmethod
+    def employee_map():
+        """
+        خريطة رقم الموظف -> معرف الموظف لجميع الموظفين في استعلام واحد
+
+        :return: زوج (خريطة الأرقام كما هي، خريطة الأرقام بدون الأصفار البادئة)؛ الأرقام
+                 التي تتطابق بعد إزالة الأصفار لأكثر من موظف تُستبعد من الخريطة الثانية
+        """
+        table = Employee.__table__
+        employees = pd.DataFrame(
+            db.session.execute(select(table.c.employee_id, table.c.id)).all(),
+            columns=['number', 'id']
+        )
+        employees = employees[employees['number'].notna()]
+        exact = dict(zip(employees['number'].astype(str).str.strip(), employees['id']))
+
+        employees = employees.assign(normalized=_normalize_number(employees['number']))
+        employees = employees.drop_duplicates('normalized', keep=False)
+        normalized = dict(zip(employees['normalized'], employees['id']))
+        return exact, normalized
+
+    @staticmethod
+    def diff(frame, month, year):
+        """
+        مقارنة صفوف الملف برواتب الفترة دون الكتابة في قاعدة البيانات
+
+        :param frame: جدول ناتج عن read_salary_frame
+        :param month: الشهر
+        :param year: السنة
+        :return: كائن SalaryImportReport
+        """
+        compare_notes = frame.attrs.get('has_notes', True)
+        frame = frame.copy()
+        frame['net_salary'] = frame['basic_salary'] + frame['allowances'] + frame['bonus'] - frame['deductions']
+
+        exact, normalized = SalaryImportService.employee_map()
+        resolved = frame['employee_id'].map(exact)
+        resolved = resolved.fillna(_normalize_number(frame['employee_id']).map(normalized))
+        frame['employee_pk'] = resolved.astype('Int64')
+
+        # إذا تكرر الموظف في الملف يُعتمد آخر صف له
+        known = frame['employee_pk'].notna()
+        duplicated = known & frame.duplicated('employee_pk', keep='last')
+        duplicate_rows = int(duplicated.sum())
+        frame = frame[~duplicated]
+        known = frame['employee_pk'].notna()
+
+        existing = SalaryImportService._existing_salaries(
+            [int(employee_id) for employee_id in frame.loc[known, 'employee_pk']], month, year
+        )
+        frame = frame.merge(existing, how='left', on='employee_pk', suffixes=('', '_previous'))
+
+        has_previous = frame['salary_id'].notna()
+        same = has_previous.copy()
+        if compare_notes:
+            same &= frame['notes'].fillna('') == frame['notes_previous'].fillna('')
+        for field in SALARY_AMOUNT_FIELDS:
+            same &= np.isclose(frame[field], frame[f'{field}_previous'].astype(float).fillna(0.0))
+
+        frame['status'] = np.select(
+            [frame['employee_pk'].isna(), ~has_previous, same],
+            [STATUS_UNKNOWN, STATUS_NEW, STATUS_UNCHANGED],
+            default=STATUS_CHANGED
+        )
+
+        rows = []
+        for record in frame.to_dict('records'):
+            row = {
+                'row_number': int(record['row_number']),
+                'employee_number': record['employee_id'],
+                'employee_id': None if pd.isna(record['employee_pk']) else int(record['employee_pk']),
+                'month': month,
+                'year': year,
+                'notes': record['notes'],
+                'net_salary': float(record['net_salary']),
+                'status': record['status'],
+                'previous': None,
+            }
+            row.update({field: float(record[field]) for field in SALARY_AMOUNT_FIELDS})
+            if record['status'] == STATUS_CHANGED:
+                row['previous'] = {
+                    field: None if pd.isna(record[f'{field}_previous']) else record[f'{field}_previous']
+                    for field in SALARY_AMOUNT_FIELDS + ('net_salary', 'notes')
+                }
+            rows.append(row)
+
+        return SalaryImportReport(month, year, rows, duplicate_rows)
+
+    @staticmethod
+    def import_frame(frame, month, year, dry_run=False, update_notes=None):
+        """
+        استيراد الصفوف الجديدة والمتغيرة بجمل UPSERT مجمّعة
+
+        لا تحفظ الجلسة؛ يحفظ المستدعي بعد مراجعة التقرير.
+        :param dry_run: إرجاع التقرير فقط دون الكتابة
+        :param update_notes: استبدال ملاحظات الرواتب المتغيرة بملاحظات الملف
+                             (افتراضياً إذا كان في الملف عمود للملاحظات)
+        :return: كائن SalaryImportReport
+        """
+        if update_notes is None:
+            update_notes = frame.attrs.get('has_notes', True)
+        report = SalaryImportService.diff(frame, month, year)
+        if not dry_run:
+            SalaryWorksheetService.save_rows(report.new + report.changed, update_notes=update_notes)
+            report.applied = True
+        logger.info(f"استيراد رواتب {month}/{year}: {report.summary()}")
+        return report
+
+    @staticmethod
+    def _existing_salaries(employee_ids, month, year):
+        """رواتب الفترة الموجودة للموظفين المحددين كجدول pandas"""
+        columns = ['employee_pk', 'salary_id'] + [f'{field}_previous' for field in SALARY_AMOUNT_FIELDS] + [
+            'net_salary_previous', 'notes_previous'
+        ]
+        table = Salary.__table__
+        records = []
+        for start in range(0, len(employee_ids), READ_CHUNK_SIZE):
+            records.extend(db.session.execute(
+                select(
+                    table.c.employee_id, table.c.id, table.c.basic_salary, table.c.allowances,
+                    table.c.deductions, table.c.bonus, table.c.net_salary, table.c.notes
+                ).where(
+                    table.c.employee_id.in_(employee_ids[start:start + READ_CHUNK_SIZE]),
+                    table.c.month == month,
+                    table.c.year == year
+                )
+            ).all())
+
+        existing = pd.DataFrame([tuple(record) for record in records], columns=columns)
+        existing['employee_pk'] = existing['employee_pk'].astype('Int64')
+        return existing
@@ -0,0 +1,211 @@
+"""
+خدمة ورقة عمل الرواتب الشهرية
+
+تعرض الموظفين على صفحات بمؤشر (keyset) مع راتب كل موظف للفترة المحددة في استعلام
+واحد (ربط خارجي بين الموظف وراتب الشهر) وتحميل أقسام الصفحة دفعة واحدة، بدلاً من
+تحميل جميع سجلات الرواتب وجميع الموظفين ثم حل علاقة الموظف وأقسامه لكل صف.
+
+وتحفظ تعديلات الورقة بجمل UPSERT مجمّعة على القيد الفريد (employee_id, year, month)
+بدلاً من استعلام SELECT ثم إضافة كائن ORM لكل صف.
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import and_, select, tuple_
+from app import db
+from models import Department, Employee, Salary
+from utils.db_upsert import upsert_rows
+from utils.keyset_cursor import decode_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# عدد الصفوف في كل جملة إدراج (11 عموداً لكل صف، أقل من حد متغيرات SQLite)
+UPSERT_CHUNK_SIZE = 500
+
+# عدد الموظفين في كل استعلام لقراءة الرواتب الموجودة
+READ_CHUNK_SIZE = 500
+
+AMOUNT_FIELDS = ('basic_salary', 'allowances', 'deductions', 'bonus')
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def parse_amount(value):
+    """تحويل قيمة مُدخلة إلى رقم، وإرجاع None للقيم الفارغة أو غير الصالحة"""
+    if value is None or str(value).strip() in ('', 'null'):
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def net_salary(basic_salary, allowances=0.0, deductions=0.0, bonus=0.0):
+    """صافي الراتب = الأساسي + البدلات + المكافآت - الخصومات"""
+    return (basic_salary or 0.0) + (allowances or 0.0) + (bonus or 0.0) - (deductions or 0.0)
+
+
+class SalaryWorksheetPage:
+    """صفحة من ورقة عمل الرواتب: قائمة (الموظف، الراتب أو None)"""
+
+    def __init__(self, rows, next_cursor):
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.has_more = next_cursor is not None
+
+
+class SalarySaveResult:
+    """نتيجة حفظ صفوف ورقة العمل"""
+
+    def __init__(self, inserted=0, updated=0, skipped=0, net_salaries=None):
+        self.inserted = inserted
+        self.updated = updated
+        self.skipped = skipped
+        # (الموظف، السنة، الشهر) -> صافي الراتب المحفوظ
+        self.net_salaries = net_salaries or {}
+
+    @property
+    def total(self):
+        """عدد السجلات التي تمت كتابتها (الجديدة والمحدثة)"""
+        return self.inserted + self.updated
+
+
+class SalaryWorksheetService:
+    """قراءة ورقة عمل الرواتب وحفظها على دفعات"""
+
+    @staticmethod
+    def page(month, year, department_id=None, employee_id=None, status='active',
+             limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """
+        جلب صفحة من الموظفين مرتبة بالاسم مع راتب كل منهم للشهر المحدد
+
+        :param month: الشهر
+        :param year: السنة
+        :param department_id: تصفية حسب القسم
+        :param employee_id: تصفية حسب الموظف
+        :param status: حالة الموظفين (None لجميع الحالات)
+        :param limit: عدد الموظفين في الصفحة
+        :param cursor: مؤشر الصفحة التالية من الصفحة السابقة
+        :return: كائن SalaryWorksheetPage
+        """
+        limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+        query = db.session.query(Employee, Salary).outerjoin(
+            Salary,
+            and_(Salary.employee_id == Employee.id, Salary.month == month, Salary.year == year)
+        )
+        if status:
+            query = query.filter(Employee.status == status)
+        if employee_id:
+            query = query.filter(Employee.id == employee_id)
+        if department_id:
+            query = query.filter(Employee.departments.any(Department.id == department_id))
+
+        if cursor:
+            position = decode_cursor(cursor, str, int)
+            if position is not None:
+                query = query.filter(tuple_(Employee.name, Employee.id) > tuple_(*position))
+
+        rows = query.options(db.selectinload(Employee.departments)).order_by(
+            Employee.name.asc(), Employee.id.asc()
+        ).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_employee = rows[-1][0]
+            next_cursor = encode_cursor(last_employee.name, last_employee.id)
+
+        return SalaryWorksheetPage([(employee, salary) for employee, salary in rows], next_cursor)
+
+    @staticmethod
+    def save_rows(rows, overwrite=True, update_notes=False, connection=None):
+        """
+        حفظ صفوف ورقة العمل بجمل UPSERT مجمّعة
+
+        لا تحفظ الجلسة؛ الكتابة تتم ضمن معاملة المستدعي. الصفوف بدون راتب أساسي
+        أو لموظف غير موجود تُتجاوز، وإذا تكرر المفتاح نفسه يُعتمد آخر صف.
+        :param rows: قواميس تحتوي employee_id, month, year, basic_salary
+                     ويمكن أن تحتوي allowances, deductions, bonus, notes
+        :param overwrite: تحديث الرواتب الموجودة، أو تركها كما هي إذا كانت False
+        :param update_notes: استبدال الملاحظات في الرواتب المحدثة
+        :param connection: اتصال قاعدة البيانات (افتراضياً جلسة الطلب)
+        :return: كائن SalarySaveResult
+        """
+        connection = connection or db.session.connection()
+        result = SalarySaveResult()
+        now = datetime.utcnow()
+
+        values = {}
+        for row in rows:
+            try:
+                key = (int(row.get('employee_id')), int(row.get('year')), int(row.get('month')))
+            except (TypeError, ValueError):
+                result.skipped += 1
+                continue
+            amounts = {field: parse_amount(row.get(field)) for field in AMOUNT_FIELDS}
+            if amounts['basic_salary'] is None:
+                result.skipped += 1
+                continue
+            amounts = {field: amount or 0.0 for field, amount in amounts.items()}
+            if key in values:
+                result.skipped += 1
+            values[key] = {
+                'employee_id': key[0],
+                'year': key[1],
+                'month': key[2],
+                **amounts,
+                'net_salary': net_salary(**amounts),
+                'notes': row.get('notes') or None,
+                'is_paid': False,
+                'created_at': now,
+                'updated_at': now
+            }
+        if not values:
+            return result
+
+        employee_ids = sorted({key[0] for key in values})
+        table = Salary.__table__
+        known_employees = set()
+        existing = set()
+        for employee_chunk in _chunks(employee_ids, READ_CHUNK_SIZE):
+            known_employees.update(connection.execute(
+                select(Employee.__table__.c.id).where(Employee.__table__.c.id.in_(employee_chunk))
+            ).scalars())
+            existing.update(tuple(key) for key in connection.execute(
+                select(table.c.employee_id, table.c.year, table.c.month).where(
+                    table.c.employee_id.in_(employee_chunk),
+                    table.c.year.in_({key[1] for key in values}),
+                    table.c.month.in_({key[2] for key in values})
+                )
+            ).tuples() if tuple(key) in values)
+
+        to_write = []
+        for key, row in values.items():
+            if key[0] not in known_employees or (key in existing and not overwrite):
+                result.skipped += 1
+                continue
+            if key in existing:
+                result.updated += 1
+            else:
+                result.inserted += 1
+            result.net_salaries[key] = row['net_salary']
+            to_write.append(row)
+
+        update_columns = ()
+        if overwrite:
+            update_columns = AMOUNT_FIELDS + ('net_salary', 'updated_at') + (('notes',) if update_notes else ())
+
+        for chunk in _chunks(to_write, UPSERT_CHUNK_SIZE):
+            upsert_rows(connection, table, chunk, key_columns=('employee_id', 'year', 'month'),
+                        update_columns=update_columns)
+
+        logger.info(
+            f"حفظ ورقة الرواتب: {result.inserted} جديد، {result.updated} محدث، {result.skipped} متجاوز"
+        )
+        return result
@@ -0,0 +1,194 @@
+"""
+خدمة تقديم الملفات المرفوعة (صور المركبات والورشة والوثائق)
+
+يُحفظ في الذاكرة المسار الفعلي لكل ملف مطلوب بدلاً من البحث عنه في مجلدي
+uploads و static/uploads مع كل طلب، ويُرسل الملف مع ETag و Last-Modified فيرد
+المتصفح بطلب شرطي ويُجاب بـ 304 دون قراءة الملف. الملفات ذات الأسماء العشوائية
+(UUID) لا يتغير محتواها، فتُرسل مع Cache-Control طويل و immutable ولا يعيد
+المتصفح طلبها أصلاً. التخزين private دائماً لأن الملفات بيانات شخصية لا تُخزن في
+الوكلاء المشتركة أو CDN. طلبات Range (الفيديو وملفات PDF الكبيرة) مدعومة.
+
+عند ضبط UPLOAD_OFFLOAD يرسل التطبيق الترويسات فقط ويترك قراءة الملف للخادم:
+    'x-accel'   : ترويسة X-Accel-Redirect لـ nginx (UPLOAD_ACCEL_PREFIX + اسم المجلد + المسار)
+    'x-sendfile': ترويسة X-Sendfile بالمسار المطلق (Apache / lighttpd)
+
+مثال إعداد nginx (CloudPanel) للوضع x-accel مع البادئة الافتراضية:
+    location /_protected/uploads/ { internal; alias /home/<site>/htdocs/<app>/uploads/; }
+    location /_protected/static-uploads/ { internal; alias /home/<site>/htdocs/<app>/static/uploads/; }
+"""
+import mimetypes
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request, send_file, send_from_directory, abort
+from werkzeug.security import safe_join
+
+# مجلدات الملفات المرفوعة: الاسم (يُستخدم في مسار X-Accel-Redirect) -> المسار نسبةً إلى جذر التطبيق
+UPLOAD_ROOTS = {
+    'uploads': 'uploads',
+    'static-uploads': os.path.join('static', 'uploads')
+}
+
+# أقصى عدد للمسارات المحفوظة في الذاكرة
+RESOLVE_CACHE_SIZE = 8192
+
+# مدة حفظ نتيجة "الملف غير موجود" بالثواني، قصيرة لأن الملف قد يُرفع بعدها مباشرة
+MISSING_TTL_SECONDS = 30
+
+# مدة التخزين في المتصفح للملفات ذات الأسماء العشوائية (سنة)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# اسم ملف يحتوي UUID (بشرطات أو بدونها) لا يُعاد استخدامه لمحتوى آخر
+_IMMUTABLE_NAME = re.compile(
+    r'[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}', re.IGNORECASE
+)
+
+_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+_resolved = OrderedDict()
+_resolved_lock = threading.Lock()
+
+
+def _cache_get(key):
+    with _resolved_lock:
+        entry = _resolved.get(key)
+        if entry is None:
+            return None
+        root_name, expires = entry
+        if expires is not None and expires < time.monotonic():
+            del _resolved[key]
+            return None
+        _resolved.move_to_end(key)
+        return entry
+
+
+def _cache_put(key, root_name):
+    expires = time.monotonic() + MISSING_TTL_SECONDS if root_name is None else None
+    with _resolved_lock:
+        _resolved[key] = (root_name, expires)
+        _resolved.move_to_end(key)
+        while len(_resolved) > RESOLVE_CACHE_SIZE:
+            _resolved.popitem(last=False)
+
+
+def _cache_drop(key):
+    with _resolved_lock:
+        _resolved.pop(key, None)
+
+
+def _root_path(root_name):
+    return os.path.join(current_app.root_path, UPLOAD_ROOTS[root_name])
+
+
+def _stat(root_name, filename):
+    """(المسار المطلق، stat) أو None إذا لم يكن الملف موجوداً أو كان المسار خارج المجلد"""
+    path = safe_join(_root_path(root_name), filename)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    return path, stat
+
+
+def is_immutable(filename):
+    """هل اسم الملف عشوائي (UUID) فلا يتغير محتواه أبداً"""
+    return _IMMUTABLE_NAME.search(os.path.basename(filename)) is not None
+
+
+class UploadServingService:
+    """تحديد مكان الملف المرفوع وإرساله مع ترويسات التخزين المؤقت"""
+
+    @staticmethod
+    def resolve(filename, roots):
+        """
+        البحث عن الملف في المجلدات بالترتيب مع حفظ النتيجة
+
+        :param filename: المسار المطلوب نسبةً إلى مجلد الرفع
+        :param roots: أسماء المجلدات من UPLOAD_ROOTS بترتيب البحث
+        :return: (اسم المجلد، المسار المطلق، stat) أو None
+        """
+        key = (tuple(roots), filename)
+        entry = _cache_get(key)
+        if entry is not None:
+            root_name = entry[0]
+            if root_name is None:
+                return None
+            found = _stat(root_name, filename)
+            if found is not None:
+                return (root_name,) + found
+            # حُذف الملف أو نُقل: يُعاد البحث
+            _cache_drop(key)
+
+        for root_name in roots:
+            found = _stat(root_name, filename)
+            if found is not None:
+                _cache_put(key, root_name)
+                return (root_name,) + found
+
+        _cache_put(key, None)
+        return None
+
+    @staticmethod
+    def serve(filename, roots):
+        """
+        إرسال الملف المرفوع، أو صورة بديلة للصور المفقودة، أو 404
+
+        :param filename: المسار المطلوب نسبةً إلى مجلد الرفع
+        :param roots: أسماء المجلدات من UPLOAD_ROOTS بترتيب البحث
+        """
+        found = UploadServingService.resolve(filename, roots)
+        if found is None:
+            if filename.lower().endswith(_IMAGE_EXTENSIONS):
+                response = send_from_directory(os.path.join(current_app.root_path, 'static', 'images'),
+                                               'image-not-found.svg', max_age=60)
+                response.cache_control.public = True
+                return response
+            abort(404)
+
+        root_name, path, stat = found
+        etag = f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+        immutable = is_immutable(filename)
+        max_age = IMMUTABLE_MAX_AGE if immutable else current_app.config.get('UPLOAD_CACHE_MAX_AGE', 3600)
+        offload = (current_app.config.get('UPLOAD_OFFLOAD') or '').lower()
+
+        if offload in ('x-accel', 'x-sendfile'):
+            response = current_app.response_class(
+                mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            )
+            response.set_etag(etag)
+            response.last_modified = int(stat.st_mtime)
+            response.cache_control.max_age = max_age
+            # الطلب الشرطي يُجاب هنا، وقراءة الملف و Range على الخادم
+            response.make_conditional(request)
+            # ترويسة التحويل فقط عند إرسال الملف: مع 304 يستبدل nginx الاستجابة بالملف كاملاً
+            if response.status_code != 304:
+                if offload == 'x-accel':
+                    prefix = current_app.config.get('UPLOAD_ACCEL_PREFIX') or '/_protected'
+                    relpath = os.path.relpath(path, _root_path(root_name)).replace(os.sep, '/')
+                    response.headers['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{root_name}/{relpath}"
+                else:
+                    response.headers['X-Sendfile'] = path
+        else:
+            # conditional=True: ‏304 للطلبات الشرطية، و 206 لطلبات Range
+            response = send_file(path, conditional=True, etag=etag, last_modified=stat.st_mtime, max_age=max_age)
+
+        # private: الملفات المرفوعة (ومنها الوثائق وصور الهويات) تُخزن في المتصفح فقط لا في الوكلاء المشتركة
+        response.cache_control.public = False
+        response.cache_control.private = True
+        if immutable:
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.must_revalidate = True
+        return response
+
+    @staticmethod
+    def clear_cache():
+        """مسح المسارات المحفوظة (بعد نقل ملفات بين المجلدات)"""
+        with _resolved_lock:
+            _resolved.clear()
@@ -0,0 +1,198 @@
+"""
+خدمة بيانات التسليم الحالية للمركبات (السائق، المشرف، تاريخ آخر تسليم)
+
+تُخزَّن هذه البيانات في أعمدة جدول المركبات وتُحدَّث داخل نفس المعاملة عبر
+أحداث جلسة SQLAlchemy عند إنشاء أو تعديل أو اعتماد أو حذف سجلات التسليم،
+ويمكن إصلاح أي انحراف عبر الأمر:
+    flask reconcile-vehicle-assignments
+"""
+import logging
+from datetime import datetime, time
+from sqlalchemy import bindparam, event, func, inspect, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from models import Employee, OperationRequest, Vehicle, VehicleHandover
+from utils.vehicle_driver_utils import (
+    DELIVERY_HANDOVER_TYPES, RETURN_HANDOVER_TYPES, official_handover_condition
+)
+
+logger = logging.getLogger(__name__)
+
+ASSIGNMENT_COLUMNS = ('current_driver_id', 'current_supervisor_id', 'last_handover_at', 'driver_name')
+
+# الحقول التي يؤثر تغييرها في سجل التسليم على بيانات السيارة الحالية
+HANDOVER_TRACKED_ATTRIBUTES = (
+    'vehicle_id', 'handover_type', 'handover_date', 'handover_time',
+    'employee_id', 'supervisor_employee_id', 'person_name'
+)
+
+EMPTY_ASSIGNMENT = dict.fromkeys(ASSIGNMENT_COLUMNS)
+
+
+class VehicleAssignmentService:
+    """حساب وحفظ بيانات التسليم الحالية للمركبات"""
+
+    @staticmethod
+    def compute(connection, vehicle_ids=None):
+        """
+        حساب بيانات التسليم الحالية من آخر سجل تسليم/استلام رسمي لكل سيارة
+
+        :param connection: اتصال قاعدة البيانات
+        :param vehicle_ids: معرفات السيارات (None لجميع السيارات)
+        :return: قاموس {vehicle_id: {column: value}} للسيارات التي لها سجلات رسمية
+        """
+        row_number = func.row_number().over(
+            partition_by=VehicleHandover.vehicle_id,
+            # عمليات اليوم نفسه تُرتب بالوقت (السجلات بدون وقت بعد السجلات ذات الوقت) ثم بالمعرف
+            order_by=(
+                VehicleHandover.handover_date.desc(),
+                VehicleHandover.handover_time.desc().nulls_last(),
+                VehicleHandover.id.desc()
+            )
+        ).label('row_number')
+
+        ranked = select(
+            VehicleHandover.vehicle_id,
+            VehicleHandover.handover_type,
+            VehicleHandover.handover_date,
+            VehicleHandover.handover_time,
+            VehicleHandover.employee_id,
+            VehicleHandover.supervisor_employee_id,
+            VehicleHandover.person_name,
+            Employee.name.label('employee_name'),
+            row_number
+        ).select_from(VehicleHandover).outerjoin(
+            Employee, Employee.id == VehicleHandover.employee_id
+        ).where(
+            VehicleHandover.handover_type.in_(DELIVERY_HANDOVER_TYPES + RETURN_HANDOVER_TYPES),
+            official_handover_condition()
+        )
+        if vehicle_ids is not None:
+            ranked = ranked.where(VehicleHandover.vehicle_id.in_(set(vehicle_ids)))
+        ranked = ranked.subquery()
+
+        assignments = {}
+        for row in connection.execute(select(ranked).where(ranked.c.row_number == 1)):
+            last_handover_at = datetime.combine(row.handover_date, row.handover_time or time.min)
+            if row.handover_type in DELIVERY_HANDOVER_TYPES:
+                # السيارة مسلّمة حالياً
+                assignments[row.vehicle_id] = {
+                    'current_driver_id': row.employee_id,
+                    'current_supervisor_id': row.supervisor_employee_id,
+                    'last_handover_at': last_handover_at,
+                    # اسم الموظف المرتبط أولاً، ثم اسم الشخص المدخل يدوياً
+                    'driver_name': row.employee_name or row.person_name,
+                }
+            else:
+                # آخر عملية رسمية هي استلام: السيارة بدون سائق
+                assignments[row.vehicle_id] = dict(EMPTY_ASSIGNMENT, last_handover_at=last_handover_at)
+        return assignments
+
+    @staticmethod
+    def sync(connection, vehicle_ids=None, session=None):
+        """
+        تحديث أعمدة بيانات التسليم الحالية للسيارات التي تغيرت قيمها فقط
+
+        :param connection: اتصال قاعدة البيانات
+        :param vehicle_ids: معرفات السيارات (None لجميع السيارات)
+        :param session: الجلسة الحالية لتحديث كائنات السيارات المحمّلة فيها (اختياري)
+        :return: عدد السيارات التي تم تحديثها
+        """
+        if vehicle_ids is not None and not vehicle_ids:
+            return 0
+
+        vehicle_table = Vehicle.__table__
+        current_query = select(vehicle_table.c.id, *[vehicle_table.c[col] for col in ASSIGNMENT_COLUMNS])
+        if vehicle_ids is not None:
+            current_query = current_query.where(vehicle_table.c.id.in_(set(vehicle_ids)))
+
+        assignments = VehicleAssignmentService.compute(connection, vehicle_ids)
+
+        changes = []
+        for row in connection.execute(current_query):
+            expected = assignments.get(row.id, EMPTY_ASSIGNMENT)
+            if any(getattr(row, col) != expected[col] for col in ASSIGNMENT_COLUMNS):
+                changes.append(dict({'b_' + col: expected[col] for col in ASSIGNMENT_COLUMNS}, b_id=row.id))
+
+        if not changes:
+            return 0
+
+        connection.execute(
+            vehicle_table.update().where(
+                vehicle_table.c.id == bindparam('b_id')
+            ).values(**{col: bindparam('b_' + col) for col in ASSIGNMENT_COLUMNS}),
+            changes
+        )
+
+        if session is not None:
+            # مزامنة الكائنات المحمّلة في الجلسة دون اعتبارها معدّلة
+            for change in changes:
+                vehicle = session.identity_map.get(session.identity_key(Vehicle, change['b_id']))
+                if vehicle is not None:
+                    for col in ASSIGNMENT_COLUMNS:
+                        set_committed_value(vehicle, col, change['b_' + col])
+
+        return len(changes)
+
+    @staticmethod
+    def reconcile(connection):
+        """
+        إعادة حساب بيانات التسليم الحالية لجميع السيارات وإصلاح أي انحراف
+
+        :return: عدد السيارات التي تم إصلاحها
+        """
+        fixed = VehicleAssignmentService.sync(connection)
+        if fixed:
+            logger.info(f"تم إصلاح بيانات التسليم الحالية لـ {fixed} سيارة")
+        return fixed
+
+
+def _previous_value(obj, attribute):
+    """القيمة المحفوظة سابقاً لخاصية (قبل التعديل الحالي)"""
+    history = inspect(obj).attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, attribute)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_handover_changes(session, flush_context):
+    """تحديث بيانات التسليم الحالية للسيارات المتأثرة بسجلات التسليم أو طلبات اعتمادها"""
+    vehicle_ids = set()
+
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, VehicleHandover) or (
+            isinstance(obj, OperationRequest) and _previous_value(obj, 'operation_type') == 'handover'
+        ):
+            vehicle_ids.add(_previous_value(obj, 'vehicle_id'))
+            vehicle_ids.add(obj.vehicle_id)
+
+    for obj in session.dirty:
+        if isinstance(obj, VehicleHandover):
+            tracked = HANDOVER_TRACKED_ATTRIBUTES
+        elif isinstance(obj, OperationRequest):
+            tracked = ('operation_type', 'related_record_id', 'vehicle_id', 'status')
+            if 'handover' not in (obj.operation_type, _previous_value(obj, 'operation_type')):
+                continue
+        else:
+            continue
+
+        state = inspect(obj)
+        if any(state.attrs[attr].history.has_changes() for attr in tracked):
+            vehicle_ids.add(_previous_value(obj, 'vehicle_id'))
+            vehicle_ids.add(obj.vehicle_id)
+
+    # تغيير اسم موظف يغير اسم السائق المحفوظ للسيارات التي يقودها حالياً
+    renamed_employees = {
+        obj.id for obj in session.dirty
+        if isinstance(obj, Employee) and inspect(obj).attrs['name'].history.has_changes()
+    }
+    if renamed_employees:
+        vehicle_table = Vehicle.__table__
+        vehicle_ids.update(session.connection().execute(
+            select(vehicle_table.c.id).where(vehicle_table.c.current_driver_id.in_(renamed_employees))
+        ).scalars())
+
+    vehicle_ids.discard(None)
+    if vehicle_ids:
+        VehicleAssignmentService.sync(session.connection(), vehicle_ids, session=session)
@@ -0,0 +1,310 @@
+"""
+محرك الإرسال المجمع لرسائل WhatsApp Cloud API
+
+تُحفظ رسائل الدفعة أولاً في جدول whatsapp_message بحالة queued، ثم تُرسل بعدد محدود
+من الخيوط المتزامنة عبر WhatsAppWrapper (جلسة HTTP دائمة الاتصال لكل خيط) وبمعدل
+لا يتجاوز حد الإرسال المسموح (دلو رموز token bucket). الأخطاء المؤقتة (تعذر الاتصال قبل الإرسال،
+429، 5xx، وأكواد تجاوز المعدل في Cloud API) يُعاد إرسالها مع تأخير متزايد، أما انتهاء مهلة
+القراءة بعد إرسال الطلب فلا يُعاد حتى لا تتكرر الرسالة. وتُحفظ حالة
+كل رسالة (sent / failed، عدد المحاولات، معرف الرسالة أو آخر خطأ) على دفعات.
+
+الخيوط لا تستخدم جلسة قاعدة البيانات؛ القراءة والكتابة تتم في الخيط الرئيسي باتصال
+مستقل حتى تبقى حالة الرسائل محفوظة حتى لو فشلت معاملة المستدعي.
+
+الإعدادات من متغيرات البيئة:
+    WHATSAPP_RATE_PER_SECOND  حد الرسائل في الثانية (افتراضياً 80، الحد الافتراضي لرقم Cloud API)
+    WHATSAPP_CONCURRENCY      عدد الطلبات المتزامنة (افتراضياً 16)
+    WHATSAPP_MAX_ATTEMPTS     عدد المحاولات لكل رسالة (افتراضياً 4)
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import requests
+import urllib3
+from sqlalchemy import bindparam, func, insert, select, update
+from app import db
+from models import Employee, WhatsAppMessage
+
+logger = logging.getLogger(__name__)
+
+RATE_PER_SECOND = float(os.getenv('WHATSAPP_RATE_PER_SECOND', '80'))
+CONCURRENCY = int(os.getenv('WHATSAPP_CONCURRENCY', '16'))
+MAX_ATTEMPTS = int(os.getenv('WHATSAPP_MAX_ATTEMPTS', '4'))
+
+# التأخير الأساسي قبل إعادة المحاولة (يتضاعف مع كل محاولة) والحد الأقصى له بالثواني
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# أكواد أخطاء Cloud API المؤقتة: تجاوز معدل الطلبات أو الإرسال لنفس المستلم
+RETRYABLE_ERROR_CODES = {4, 80007, 130429, 131056}
+
+# عدد الرسائل بين كل حفظ لحالات الإرسال وتحديث التقدم
+STATUS_FLUSH_EVERY = 100
+
+
+class TokenBucket:
+    """محدد معدل آمن للخيوط: rate رمز في الثانية وسعة capacity للدفعات القصيرة"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """الانتظار حتى يتوفر رمز ثم استهلاكه"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class DeliveryResult:
+    """نتيجة إرسال دفعة: أعداد الرسائل المرسلة والفاشلة وأسباب الفشل"""
+
+    def __init__(self, batch_id, sent=0, failed=0, failures=None):
+        self.batch_id = batch_id
+        self.sent = sent
+        self.failed = failed
+        # قائمة (معرف الموظف، اسم الموظف، آخر خطأ) للرسائل الفاشلة
+        self.failures = failures or []
+
+
+def _error_code(response):
+    """كود الخطأ في جسم استجابة Cloud API إن وجد"""
+    try:
+        return response.json().get('error', {}).get('code')
+    except ValueError:
+        return None
+
+
+def _retry_after(response):
+    """مدة الانتظار المطلوبة من الخادم (ترويسة Retry-After) بالثواني"""
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt):
+    """تأخير متزايد أسياً مع عشوائية لتفادي تزامن إعادة المحاولات"""
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)) * (0.5 + random.random())
+
+
+def _failed_before_send(error):
+    """هل فشل الطلب قبل إرساله (تعذر الاتصال أو انتهاء مهلته) فتكون إعادة المحاولة آمنة"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        # requests يغلف أخطاء فتح الاتصال في MaxRetryError وسببها NewConnectionError أو ConnectTimeoutError
+        reason = getattr(error.args[0], 'reason', None)
+        return isinstance(reason, urllib3.exceptions.ConnectTimeoutError)
+    return False
+
+
+def _send_with_retry(client, bucket, payload, max_attempts):
+    """
+    إرسال رسالة واحدة مع إعادة المحاولة للأخطاء المؤقتة (يُنفذ في خيط الإرسال)
+
+    :return: (نجح الإرسال، عدد المحاولات، معرف الرسالة، آخر خطأ)
+    """
+    error = None
+    for attempt in range(1, max_attempts + 1):
+        bucket.acquire()
+        wait = None
+        try:
+            response = client.post_message(payload)
+        except requests.exceptions.RequestException as e:
+            if _failed_before_send(e):
+                error = f'خطأ اتصال: {e}'
+                retryable = True
+            else:
+                # ربما وصل الطلب إلى الخادم (مثل انتهاء مهلة القراءة)؛ إعادة الإرسال قد تكرر الرسالة
+                error = f'حالة الإرسال غير معروفة: {e}'
+                retryable = False
+        else:
+            if response.ok:
+                try:
+                    message_id = response.json()['messages'][0]['id']
+                except (ValueError, KeyError, IndexError, TypeError):
+                    message_id = None
+                return True, attempt, message_id, None
+            error = f'HTTP {response.status_code}: {response.text[:500]}'
+            retryable = response.status_code in RETRYABLE_STATUS_CODES or _error_code(response) in RETRYABLE_ERROR_CODES
+            wait = _retry_after(response)
+
+        if not retryable or attempt == max_attempts:
+            return False, attempt, None, error
+        time.sleep(min(wait, BACKOFF_MAX_SECONDS) if wait is not None else _backoff(attempt))
+    return False, max_attempts, None, error
+
+
+class WhatsAppDeliveryService:
+    """حفظ رسائل الدفعات وإرسالها بالتوازي مع تحديد المعدل"""
+
+    @staticmethod
+    def queue(kind, messages):
+        """
+        حفظ رسائل دفعة جديدة بحالة queued
+
+        الرسائل بدون رقم مستلم تُحفظ مباشرة بحالة failed.
+        :param kind: نوع الإشعار (salary, deduction)
+        :param messages: قواميس تحتوي employee_id, salary_id, recipient, payload (قاموس محتوى الطلب)
+                         ويمكن أن تحتوي error لسبب عدم الإرسال
+        :return: معرف الدفعة
+        """
+        batch_id = uuid.uuid4().hex
+        now = datetime.utcnow()
+        rows = []
+        for message in messages:
+            error = message.get('error') or (None if message.get('recipient') else 'لا يوجد رقم هاتف مسجل للموظف')
+            rows.append({
+                'batch_id': batch_id,
+                'kind': kind,
+                'employee_id': message.get('employee_id'),
+                'salary_id': message.get('salary_id'),
+                'recipient': message.get('recipient'),
+                'payload': json.dumps(message.get('payload') or {}, ensure_ascii=False),
+                'status': WhatsAppMessage.STATUS_FAILED if error else WhatsAppMessage.STATUS_QUEUED,
+                'attempts': 0,
+                'last_error': error,
+                'created_at': now,
+                'updated_at': now
+            })
+        if rows:
+            with db.engine.begin() as connection:
+                connection.execute(insert(WhatsAppMessage.__table__), rows)
+        return batch_id
+
+    @staticmethod
+    def deliver(batch_id, retry_failed=False, progress=None, client=None,
+                concurrency=None, rate_per_second=None, max_attempts=None):
+        """
+        إرسال رسائل الدفعة المنتظرة
+
+        :param batch_id: معرف الدفعة
+        :param retry_failed: إعادة إرسال الرسائل الفاشلة سابقاً أيضاً (عدا التي بدون رقم مستلم)
+        :param progress: دالة تُستدعى بـ (المنجز، الإجمالي) أثناء الإرسال
+        :param client: عميل WhatsAppWrapper (افتراضياً عميل جديد من إعدادات البيئة)
+        :return: كائن DeliveryResult
+        """
+        concurrency = concurrency or CONCURRENCY
+        max_attempts = max_attempts or MAX_ATTEMPTS
+        table = WhatsAppMessage.__table__
+
+        statuses = [WhatsAppMessage.STATUS_QUEUED]
+        if retry_failed:
+            statuses.append(WhatsAppMessage.STATUS_FAILED)
+        with db.engine.connect() as connection:
+            pending = connection.execute(
+                select(table.c.id, table.c.payload).where(
+                    table.c.batch_id == batch_id,
+                    table.c.status.in_(statuses),
+                    table.c.recipient.isnot(None)
+                ).order_by(table.c.id)
+            ).all()
+
+        if pending:
+            if client is None:
+                from whatsapp_client import WhatsAppWrapper
+                try:
+                    client = WhatsAppWrapper(pool_size=concurrency)
+                except ValueError as e:
+                    WhatsAppDeliveryService._save_statuses([
+                        {'_id': message_id, '_status': WhatsAppMessage.STATUS_FAILED, '_attempts': 0,
+                         '_provider_id': None, '_error': str(e), '_sent_at': None}
+                        for message_id, _ in pending
+                    ])
+                    pending = []
+
+        if pending:
+            bucket = TokenBucket(rate_per_second or RATE_PER_SECOND)
+            updates = []
+            done = 0
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                futures = {
+                    pool.submit(_send_with_retry, client, bucket, json.loads(payload), max_attempts): message_id
+                    for message_id, payload in pending
+                }
+                for future in as_completed(futures):
+                    try:
+                        sent, attempts, provider_id, error = future.result()
+                    except Exception as e:
+                        sent, attempts, provider_id, error = False, 1, None, str(e)
+                    updates.append({
+                        '_id': futures[future],
+                        '_status': WhatsAppMessage.STATUS_SENT if sent else WhatsAppMessage.STATUS_FAILED,
+                        '_attempts': attempts,
+                        '_provider_id': provider_id,
+                        '_error': error,
+                        '_sent_at': datetime.utcnow() if sent else None
+                    })
+                    done += 1
+                    if len(updates) >= STATUS_FLUSH_EVERY:
+                        WhatsAppDeliveryService._save_statuses(updates)
+                        updates = []
+                        if progress:
+                            progress(done, len(pending))
+            WhatsAppDeliveryService._save_statuses(updates)
+            if progress:
+                progress(done, len(pending))
+
+        result = WhatsAppDeliveryService.summary(batch_id)
+        logger.info(f"دفعة واتساب {batch_id}: {result.sent} مرسلة، {result.failed} فاشلة")
+        return result
+
+    @staticmethod
+    def summary(batch_id):
+        """أعداد الرسائل المرسلة والفاشلة في الدفعة مع أسباب الفشل"""
+        table = WhatsAppMessage.__table__
+        employees = Employee.__table__
+        result = DeliveryResult(batch_id)
+        with db.engine.connect() as connection:
+            for status, count in connection.execute(
+                select(table.c.status, func.count()).where(table.c.batch_id == batch_id).group_by(table.c.status)
+            ):
+                if status == WhatsAppMessage.STATUS_SENT:
+                    result.sent = count
+                elif status == WhatsAppMessage.STATUS_FAILED:
+                    result.failed = count
+            result.failures = [tuple(row) for row in connection.execute(
+                select(table.c.employee_id, employees.c.name, table.c.last_error)
+                .select_from(table.outerjoin(employees, employees.c.id == table.c.employee_id))
+                .where(table.c.batch_id == batch_id, table.c.status == WhatsAppMessage.STATUS_FAILED)
+                .order_by(table.c.id)
+            )]
+        return result
+
+    @staticmethod
+    def _save_statuses(updates):
+        """حفظ حالات الإرسال لمجموعة رسائل في جملة UPDATE واحدة (executemany)"""
+        if not updates:
+            return
+        table = WhatsAppMessage.__table__
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(table).where(table.c.id == bindparam('_id')).values(
+                    status=bindparam('_status'),
+                    attempts=table.c.attempts + bindparam('_attempts'),
+                    provider_message_id=bindparam('_provider_id'),
+                    last_error=bindparam('_error'),
+                    sent_at=bindparam('_sent_at'),
+                    updated_at=datetime.utcnow()
+                ),
+                updates
+            )
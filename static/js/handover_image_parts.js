@@ -0,0 +1,52 @@
+/**
+ * إرسال التواقيع ومخطط الأضرار كملفات ثنائية مع نموذج التسليم والاستلام
+ * Send handover signatures and damage diagram as binary multipart parts
+ *
+ * تضع لوحات الرسم الصورة في حقول مخفية بصيغة data URL (Base64)، وهذا السكربت
+ * يحولها عند الإرسال إلى ملفات PNG بنفس اسم الحقل، فتصل إلى الخادم كأجزاء ملفات
+ * أصغر بالثلث ولا تُحمَّل في ذاكرة النموذج. الحقول المعنية تحمل السمة data-image-part.
+ * المتصفحات التي لا تدعم DataTransfer ترسل القيمة النصية كما كانت.
+ */
+(function () {
+    function dataUrlToFile(dataUrl, name) {
+        const parts = dataUrl.split(',');
+        const mime = (parts[0].match(/^data:([^;]+)/) || [])[1] || 'image/png';
+        const binary = atob(parts[1]);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return new File([bytes], name + '.' + (mime.split('/')[1] || 'png'), { type: mime });
+    }
+
+    // المستمع على document يعمل بعد مستمعات النموذج التي تملأ الحقول المخفية
+    document.addEventListener('submit', function (event) {
+        if (event.defaultPrevented || typeof DataTransfer === 'undefined') {
+            return;
+        }
+        const form = event.target;
+        form.querySelectorAll('input[type="hidden"][data-image-part]').forEach(function (hiddenInput) {
+            if (!hiddenInput.name || !hiddenInput.value.startsWith('data:image/')) {
+                return;
+            }
+            try {
+                const transfer = new DataTransfer();
+                transfer.items.add(dataUrlToFile(hiddenInput.value, hiddenInput.name));
+
+                let fileInput = form.querySelector('input[type="file"][name="' + hiddenInput.name + '"]');
+                if (!fileInput) {
+                    fileInput = document.createElement('input');
+                    fileInput.type = 'file';
+                    fileInput.name = hiddenInput.name;
+                    fileInput.hidden = true;
+                    form.appendChild(fileInput);
+                }
+                fileInput.files = transfer.files;
+                hiddenInput.value = '';
+            } catch (e) {
+                // تبقى القيمة النصية ويفك الخادم تشفيرها
+                console.log('تعذر تحويل الصورة إلى ملف، سيتم إرسالها كنص', e);
+            }
+        });
+    });
+})();
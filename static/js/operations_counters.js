@@ -0,0 +1,45 @@
+/**
+ * متابعة عدادات العمليات والإشعارات في لوحات المدير
+ * Operations counters subscription (Server-Sent Events with polling fallback)
+ *
+ * يفتح اتصال EventSource مع /operations/api/stream ويستدعي الدالة عند كل تغير في
+ * العدادات. إذا رفض الخادم الاتصال (امتلاء الاتصالات أو متصفح لا يدعم SSE) يعود
+ * إلى الاستطلاع الدوري لـ /operations/api/count.
+ */
+function subscribeOperationCounters(onCounts, options) {
+    const settings = Object.assign({
+        streamUrl: '/operations/api/stream',
+        countUrl: '/operations/api/count',
+        pollInterval: 30000
+    }, options || {});
+
+    let pollTimer = null;
+
+    function startPolling() {
+        if (pollTimer) return;
+        const poll = function () {
+            fetch(settings.countUrl)
+                .then(response => response.json())
+                .then(data => { if (!data.error) onCounts(data); })
+                .catch(console.error);
+        };
+        poll();
+        pollTimer = setInterval(poll, settings.pollInterval);
+    }
+
+    if (typeof EventSource === 'undefined') {
+        startPolling();
+        return;
+    }
+
+    const source = new EventSource(settings.streamUrl);
+    source.addEventListener('counts', function (event) {
+        onCounts(JSON.parse(event.data));
+    });
+    source.onerror = function () {
+        // EventSource يعيد الاتصال تلقائياً ما لم يُغلق نهائياً (204 أو خطأ HTTP)
+        if (source.readyState === EventSource.CLOSED) {
+            startPolling();
+        }
+    };
+}
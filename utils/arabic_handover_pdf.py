@@ -11,8 +11,7 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 
 def register_arabic_fonts():
     """تسجيل الخطوط العربية مع التركيز على خط beIN-Normal"""
@@ -38,8 +37,7 @@ def format_arabic_text(text):
     if not text:
         return ""
     try:
-        reshaped_text = arabic_reshaper.reshape(str(text))
-        return get_display(reshaped_text)
+        return shape_arabic(str(text))
     except:
         return str(text)
 
@@ -6,8 +6,7 @@ import io
 import os
 from datetime import datetime
 
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -33,9 +32,7 @@ def get_arabic_text(text):
         # تحويل أي نوع بيانات إلى نص
         text = str(text)
         # إعادة تشكيل النص العربي
-        reshaped_text = arabic_reshaper.reshape(text)
-        # تطبيق خوارزمية BiDi للعرض من اليمين إلى اليسار
-        bidi_text = get_display(reshaped_text)
+        bidi_text = shape_arabic(text)
         return bidi_text
     except Exception as e:
         import logging
@@ -0,0 +1,106 @@
+"""
+تشكيل النصوص العربية للعرض في ملفات PDF و Excel (إعادة تشكيل الحروف + ترتيب الاتجاه)
+
+تمر جميع مولدات التقارير عبر shape_arabic بدلاً من استدعاء arabic_reshaper و
+bidi مباشرة: العناوين الثابتة (رؤوس الأعمدة، الحالات، أسماء الأشهر) مُشكَّلة مسبقاً
+عند تحميل الوحدة، وبقية النصوص (أسماء الموظفين والأقسام) تُحفظ في ذاكرة LRU
+محدودة الحجم، فلا يُعاد تشكيل النص نفسه آلاف المرات في التقارير الكبيرة.
+"""
+import re
+from functools import lru_cache
+import arabic_reshaper
+from bidi.algorithm import get_display
+
+# أقصى عدد للنصوص المحفوظة في الذاكرة لكل دالة
+SHAPE_CACHE_SIZE = 8192
+
+# النصوص الأطول من هذا الحد (مثل الملاحظات) تُشكَّل دون حفظها
+MAX_CACHED_LENGTH = 256
+
+# الحروف التي تتطلب تشكيلاً أو عكس اتجاه (العربية ونماذج العرض العربية والعبرية)
+_RTL_PATTERN = re.compile('[\u0590-\u08ff\ufb1d-\ufdff\ufe70-\ufefc]')
+
+# العناوين والقيم الثابتة المتكررة في التقارير، تُشكَّل مرة واحدة عند التحميل
+STATIC_LABELS = (
+    # عام
+    'غير محدد', 'غير متوفرة', 'غير متوفر', 'لا توجد', 'لا يوجد', 'البيان', 'القيمة', 'المبلغ',
+    'التاريخ', 'الحالة', 'ملاحظات', 'الملاحظات', 'المجموع', 'الإجمالي', 'نعم', 'لا',
+    'توقيع الموظف', 'توقيع المسؤول', 'توقيع المدير المالي', 'نظام إدارة الموظفين - نُظم',
+    # بيانات الموظف
+    'اسم الموظف', 'رقم الموظف', 'الرقم الوظيفي', 'رقم الهوية', 'رقم الهوية الوطنية', 'القسم',
+    'المسمى الوظيفي', 'المنصب', 'الجنسية', 'رقم الجوال', 'البريد الإلكتروني', 'تاريخ الانضمام',
+    'الموقع', 'المشروع', 'نشط', 'غير نشط', 'في إجازة',
+    # الرواتب
+    'الراتب الأساسي', 'البدلات', 'المكافآت', 'الخصومات', 'صافي الراتب', 'إجمالي المستحقات',
+    'الشهر', 'السنة', 'ملخص الراتب', 'تفاصيل الراتب', 'بيانات الموظف',
+    # الحضور
+    'حاضر', 'غائب', 'إجازة', 'مرضي', 'متأخر',
+    # المركبات والورشة والتسليم
+    'رقم اللوحة', 'الشركة المصنعة', 'الموديل', 'اللون', 'نوع العملية', 'تسليم', 'استلام',
+    'متاحة', 'مؤجرة', 'في المشروع', 'في الورشة', 'حادث', 'صيانة دورية', 'عطل', 'قيد التنفيذ',
+    'تم الإصلاح', 'بانتظار الموافقة', 'تاريخ الدخول', 'تاريخ الخروج', 'سبب الدخول', 'حالة الإصلاح',
+    'التكلفة', 'اسم الورشة', 'الفني المسؤول', 'عدد الأيام',
+    # الوثائق
+    'نوع الوثيقة', 'رقم الوثيقة', 'تاريخ الإصدار', 'تاريخ الانتهاء', 'الجهة المصدرة',
+    # أسماء الأشهر
+    'يناير', 'فبراير', 'مارس', 'أبريل', 'مايو', 'يونيو',
+    'يوليو', 'أغسطس', 'سبتمبر', 'أكتوبر', 'نوفمبر', 'ديسمبر'
+)
+
+
+def _needs_shaping(text):
+    return _RTL_PATTERN.search(text) is not None
+
+
+@lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def _shape_cached(text, base_dir=None):
+    return get_display(arabic_reshaper.reshape(text), base_dir=base_dir)
+
+
+@lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def _reshape_cached(text):
+    return arabic_reshaper.reshape(text)
+
+
+SHAPED_LABELS = {label: get_display(arabic_reshaper.reshape(label)) for label in STATIC_LABELS}
+SHAPED_LABELS.update({f'{label}:': get_display(arabic_reshaper.reshape(f'{label}:')) for label in STATIC_LABELS})
+
+
+def shape_arabic(text, base_dir=None):
+    """
+    النص جاهزاً للعرض من اليسار لليمين في PDF (arabic_reshaper ثم bidi.get_display)
+
+    :param text: النص (أي قيمة تُحوَّل إلى نص، و None تُرجع نصاً فارغاً)
+    :param base_dir: اتجاه الفقرة لـ get_display ('R' أو 'L')، افتراضياً يُستنتج من النص
+    """
+    if text is None:
+        return ''
+    text = str(text)
+    if not text or not _needs_shaping(text):
+        # النصوص اللاتينية والأرقام لا تتغير بالتشكيل
+        return text
+    if base_dir is None:
+        shaped = SHAPED_LABELS.get(text)
+        if shaped is not None:
+            return shaped
+    if len(text) > MAX_CACHED_LENGTH:
+        return get_display(arabic_reshaper.reshape(text), base_dir=base_dir)
+    return _shape_cached(text, base_dir)
+
+
+def reshape_arabic(text):
+    """إعادة تشكيل الحروف فقط دون عكس الاتجاه (للمكتبات التي تطبق اتجاه النص بنفسها)"""
+    if text is None:
+        return ''
+    text = str(text)
+    if not text or not _needs_shaping(text):
+        return text
+    if len(text) > MAX_CACHED_LENGTH:
+        return arabic_reshaper.reshape(text)
+    return _reshape_cached(text)
+
+
+def shaping_cache_info():
+    """إحصاءات ذاكرة التشكيل (للمراقبة)"""
+    return {'shape': _shape_cached.cache_info(), 'reshape': _reshape_cached.cache_info(),
+            'static_labels': len(SHAPED_LABELS)}
@@ -14,8 +14,7 @@ import os
 from datetime import datetime
 
 # مكتبات دعم العربية
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 
 def format_arabic_text(text):
     """تنسيق النص العربي للعرض الصحيح في PDF"""
@@ -26,9 +25,7 @@ def format_arabic_text(text):
     
     try:
         # إعادة تشكيل النص العربي
-        reshaped_text = arabic_reshaper.reshape(text_str)
-        # تطبيق خوارزمية الاتجاه الثنائي
-        bidi_text = get_display(reshaped_text)
+        bidi_text = shape_arabic(text_str)
         return bidi_text
     except Exception as e:
         print(f"خطأ في معالجة النص العربي: {e}")
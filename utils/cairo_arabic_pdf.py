@@ -7,8 +7,7 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from datetime import datetime
 import io
 import os
@@ -40,9 +39,7 @@ def format_arabic_text(text):
     try:
         text_str = str(text)
         # إعادة تشكيل النص العربي
-        reshaped_text = arabic_reshaper.reshape(text_str)
-        # تطبيق خوارزمية الاتجاه الثنائي
-        bidi_text = get_display(reshaped_text)
+        bidi_text = shape_arabic(text_str)
         return bidi_text
     except Exception as e:
         print(f"خطأ في تنسيق النص العربي: {e}")
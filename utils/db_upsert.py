@@ -0,0 +1,86 @@
+"""
+أدوات الإدراج مع التحديث (UPSERT) المتوافقة مع PostgreSQL و MySQL و SQLite
+"""
+
+
+def _dialect_insert(dialect_name):
+    """إرجاع دالة insert الخاصة بقاعدة البيانات إن كانت تدعم UPSERT"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    if dialect_name in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        return insert
+    return None
+
+
+def _dialect_name(connection):
+    """اسم قاعدة البيانات لاتصال أو جلسة"""
+    if hasattr(connection, 'get_bind'):
+        return connection.get_bind().dialect.name
+    return connection.dialect.name
+
+
+def upsert_rows(connection, table, rows, key_columns, update_columns=(), increment_columns=()):
+    """
+    إدراج صفوف مع تحديث الصفوف الموجودة مسبقاً بنفس المفتاح في جملة واحدة
+
+    :param connection: اتصال SQLAlchemy (أو جلسة)
+    :param table: كائن الجدول (Table)
+    :param rows: قائمة قواميس القيم
+    :param key_columns: أسماء أعمدة المفتاح الفريد
+    :param update_columns: أعمدة تُستبدل قيمتها بالقيمة الجديدة عند التعارض
+    :param increment_columns: أعمدة تُضاف قيمتها الجديدة إلى القيمة الحالية عند التعارض
+    :return: عدد الصفوف المعالجة
+    """
+    if not rows:
+        return 0
+
+    dialect_name = _dialect_name(connection)
+    insert = _dialect_insert(dialect_name)
+
+    if insert is None:
+        return _upsert_rows_generic(connection, table, rows, key_columns, update_columns, increment_columns)
+
+    stmt = insert(table).values(rows)
+
+    if dialect_name in ('mysql', 'mariadb'):
+        new_values = stmt.inserted
+        set_ = {col: new_values[col] for col in update_columns}
+        set_.update({col: table.c[col] + new_values[col] for col in increment_columns})
+        if not set_:
+            # لا يوجد ما يُحدّث: نعيد كتابة عمود المفتاح الأول لتجاهل التعارض
+            set_ = {key_columns[0]: table.c[key_columns[0]]}
+        stmt = stmt.on_duplicate_key_update(**set_)
+    else:
+        new_values = stmt.excluded
+        set_ = {col: new_values[col] for col in update_columns}
+        set_.update({col: table.c[col] + new_values[col] for col in increment_columns})
+        if set_:
+            stmt = stmt.on_conflict_do_update(index_elements=list(key_columns), set_=set_)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(key_columns))
+
+    connection.execute(stmt)
+    return len(rows)
+
+
+def _upsert_rows_generic(connection, table, rows, key_columns, update_columns, increment_columns):
+    """مسار احتياطي لقواعد البيانات التي لا تدعم UPSERT: تحديث ثم إدراج صفاً بصف"""
+    for row in rows:
+        condition = [table.c[col] == row[col] for col in key_columns]
+        values = {col: row[col] for col in update_columns}
+        values.update({col: table.c[col] + row[col] for col in increment_columns})
+
+        updated = 0
+        if values:
+            updated = connection.execute(table.update().where(*condition).values(**values)).rowcount
+        else:
+            updated = connection.execute(table.select().where(*condition)).first() is not None
+
+        if not updated:
+            connection.execute(table.insert().values(**row))
+    return len(rows)
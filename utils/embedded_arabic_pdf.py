@@ -10,8 +10,7 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from datetime import datetime
 import tempfile
 import os
@@ -59,9 +58,7 @@ def format_arabic_text(text):
     try:
         text_str = str(text)
         # إعادة تشكيل النص العربي
-        reshaped_text = arabic_reshaper.reshape(text_str)
-        # تطبيق خوارزمية الاتجاه الثنائي
-        bidi_text = get_display(reshaped_text)
+        bidi_text = shape_arabic(text_str)
         return bidi_text
     except Exception as e:
         print(f"خطأ في تنسيق النص العربي: {e}")
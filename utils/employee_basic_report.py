@@ -8,9 +8,9 @@ import tempfile
 from io import BytesIO
 from datetime import datetime
 from fpdf import FPDF
-from arabic_reshaper import reshape
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from models import Employee, VehicleHandover, Vehicle
+from services.image_pipeline_service import ImagePipelineService
 from PIL import Image, ImageDraw
 
 class EmployeeBasicReportPDF(FPDF):
@@ -41,7 +41,7 @@ class EmployeeBasicReportPDF(FPDF):
             if os.path.exists(logo_path):
                 self.image(logo_path, x=10, y=8, w=30, h=30)
         # العنوان الرئيسي
-        title = self._ensure_str(get_display(reshape('تقرير المعلومات الأساسية للموظف')))
+        title = self._ensure_str(shape_arabic('تقرير المعلومات الأساسية للموظف'))
         self.set_xy(0, 12)
         self.set_text_color(40, 70, 120)
         self.cell(0, 20, title, 0, 1, 'C')
@@ -52,12 +52,12 @@ class EmployeeBasicReportPDF(FPDF):
         """تذييل الصفحة"""
         self.set_y(-15)
         self.set_font('Arabic', '', 10)
-        page_text = self._ensure_str(get_display(reshape(f'صفحة {self.page_no()}')))
+        page_text = self._ensure_str(shape_arabic(f'صفحة {self.page_no()}'))
         self.cell(0, 10, page_text, 0, 0, 'C')
         
         # تاريخ الطباعة
         current_date = datetime.now().strftime('%Y/%m/%d')
-        date_text = self._ensure_str(get_display(reshape(f'تاريخ الطباعة: {current_date}')))
+        date_text = self._ensure_str(shape_arabic(f'تاريخ الطباعة: {current_date}'))
         self.cell(0, 10, date_text, 0, 0, 'L')
         
     def add_section_title(self, title):
@@ -66,7 +66,7 @@ class EmployeeBasicReportPDF(FPDF):
         self.set_font('Arabic', 'B', 18)
         self.set_fill_color(70, 130, 180)
         self.set_text_color(255, 255, 255)
-        title_text = self._ensure_str(get_display(reshape(title)))
+        title_text = self._ensure_str(shape_arabic(title))
         # إضافة ظل خفيف خلف العنوان
         y = self.get_y()
         self.set_fill_color(220, 230, 245)
@@ -83,10 +83,10 @@ class EmployeeBasicReportPDF(FPDF):
         self.set_font('Arabic', font_style, 13)
         
         # التسمية
-        label_text = self._ensure_str(get_display(reshape(f'{label}:')))
+        label_text = self._ensure_str(shape_arabic(f'{label}:'))
         
         # القيمة
-        value_text = self._ensure_str(get_display(reshape(str(value) if value else 'غير محدد')))
+        value_text = self._ensure_str(shape_arabic(str(value) if value else 'غير محدد'))
         
         # Modern table row with subtle background and padding
         self.set_fill_color(245, 248, 255)
@@ -101,17 +101,17 @@ class EmployeeBasicReportPDF(FPDF):
         self.set_font('Arabic', '', 11)
         
         # رقم اللوحة
-        plate_text = self._ensure_str(get_display(reshape(record.vehicle.plate_number if record.vehicle else 'غير محدد')))
+        plate_text = self._ensure_str(shape_arabic(record.vehicle.plate_number if record.vehicle else 'غير محدد'))
         
         # نوع العملية
         operation_map = {'delivery': 'تسليم', 'return': 'استلام'}
-        operation_text = self._ensure_str(get_display(reshape(operation_map.get(record.handover_type, record.handover_type))))
+        operation_text = self._ensure_str(shape_arabic(operation_map.get(record.handover_type, record.handover_type)))
         
         # التاريخ
         date_text = record.handover_date.strftime('%Y/%m/%d') if record.handover_date else 'غير محدد'
         
         # الملاحظات
-        notes_text = self._ensure_str(get_display(reshape(record.notes[:50] + '...' if record.notes and len(record.notes) > 50 else record.notes or 'لا توجد')))
+        notes_text = self._ensure_str(shape_arabic(record.notes[:50] + '...' if record.notes and len(record.notes) > 50 else record.notes or 'لا توجد'))
         
         # Draw in RTL order: notes, date, operation, plate
         self.set_fill_color(255, 255, 255)
@@ -127,12 +127,12 @@ class EmployeeBasicReportPDF(FPDF):
         """إضافة صورة الموظف إلى التقرير مع تصميم جميل"""
         if image_path:
             try:
-                # بناء المسار الصحيح للصورة
-                full_path = os.path.join('static', image_path) if not image_path.startswith('static') else image_path
+                # نسخة الطباعة المصغرة إن وُلدت، وإلا الصورة الأصلية
+                full_path = ImagePipelineService.image_file(image_path, 'print')
                 if os.path.exists(full_path):
                     # إضافة عنوان الصورة مع تصميم جميل
                     self.set_font('Arabic', 'B', 14)
-                    title_text = self._ensure_str(get_display(reshape(title)))
+                    title_text = self._ensure_str(shape_arabic(title))
                     
                     # إطار للعنوان
                     self.set_fill_color(240, 248, 255)
@@ -250,7 +250,7 @@ class EmployeeBasicReportPDF(FPDF):
         else:
             # عرض رسالة عدم وجود صورة مع تصميم جميل
             self.set_font('Arabic', 'B', 12)
-            title_text = self._ensure_str(get_display(reshape(title)))
+            title_text = self._ensure_str(shape_arabic(title))
             
             # إطار للعنوان
             self.set_fill_color(255, 240, 240)  # لون وردي فاتح
@@ -260,7 +260,7 @@ class EmployeeBasicReportPDF(FPDF):
             # رسالة عدم التوفر
             self.set_font('Arabic', '', 11)
             self.set_text_color(128, 128, 128)  # رمادي
-            no_image_text = self._ensure_str(get_display(reshape('غير متوفرة')))
+            no_image_text = self._ensure_str(shape_arabic('غير متوفرة'))
             self.cell(0, 8, no_image_text, 0, 1, 'C')
             self.set_text_color(0, 0, 0)  # إعادة النص للأسود
             self.ln(8)
@@ -270,7 +270,7 @@ class EmployeeBasicReportPDF(FPDF):
         """إضافة صور الوثائق في صف واحد مع تنسيق احترافي"""
         # إضافة عنوان للوثائق
         self.set_font('Arabic', 'B', 14)
-        docs_title = self._ensure_str(get_display(reshape('وثائق الموظف')))
+        docs_title = self._ensure_str(shape_arabic('وثائق الموظف'))
         self.set_fill_color(230, 240, 250)
         self.set_draw_color(180, 200, 230)
         self.set_line_width(0.7)
@@ -299,11 +299,11 @@ class EmployeeBasicReportPDF(FPDF):
             self.set_xy(x_pos, current_y + doc_height + 4)
             self.set_font('Arabic', 'B', 10)
             self.set_text_color(70, 130, 180)
-            title_text = self._ensure_str(get_display(reshape(title)))
+            title_text = self._ensure_str(shape_arabic(title))
             self.cell(doc_width, 6, title_text, 0, 0, 'C')
             if image_path:
                 try:
-                    full_path = os.path.join('static', image_path) if not image_path.startswith('static') else image_path
+                    full_path = ImagePipelineService.image_file(image_path, 'print')
                     if os.path.exists(full_path):
                         margin = 3
                         self.image(full_path, x=x_pos + margin, y=current_y + margin, w=doc_width - 2*margin, h=doc_height - 2*margin)
@@ -311,7 +311,7 @@ class EmployeeBasicReportPDF(FPDF):
                         self.set_xy(x_pos + 5, current_y + doc_height/2 - 3)
                         self.set_font('Arabic', '', 9)
                         self.set_text_color(150, 150, 150)
-                        error_text = self._ensure_str(get_display(reshape('غير متوفرة')))
+                        error_text = self._ensure_str(shape_arabic('غير متوفرة'))
                         self.cell(doc_width - 10, 6, error_text, 0, 0, 'C')
                         self.set_draw_color(200, 200, 200)
                         self.set_line_width(2)
@@ -325,7 +325,7 @@ class EmployeeBasicReportPDF(FPDF):
                 self.set_xy(x_pos + 5, current_y + doc_height/2 - 3)
                 self.set_font('Arabic', '', 9)
                 self.set_text_color(150, 150, 150)
-                no_img_text = self._ensure_str(get_display(reshape('غير متوفرة')))
+                no_img_text = self._ensure_str(shape_arabic('غير متوفرة'))
                 self.cell(doc_width - 10, 6, no_img_text, 0, 0, 'C')
         self.set_text_color(0, 0, 0)
         self.set_draw_color(0, 0, 0)
@@ -400,10 +400,10 @@ def generate_employee_basic_pdf(employee_id):
             # رؤوس الجدول
             pdf.set_font('Arabic', 'B', 10)
             # RTL order: notes, date, operation, plate
-            pdf.cell(70, 10, pdf._ensure_str(get_display(reshape('الملاحظات'))), 1, 0, 'C')
-            pdf.cell(40, 10, pdf._ensure_str(get_display(reshape('التاريخ'))), 1, 0, 'C')
-            pdf.cell(30, 10, pdf._ensure_str(get_display(reshape('نوع العملية'))), 1, 0, 'C')
-            pdf.cell(40, 10, pdf._ensure_str(get_display(reshape('رقم اللوحة'))), 1, 1, 'C')
+            pdf.cell(70, 10, pdf._ensure_str(shape_arabic('الملاحظات')), 1, 0, 'C')
+            pdf.cell(40, 10, pdf._ensure_str(shape_arabic('التاريخ')), 1, 0, 'C')
+            pdf.cell(30, 10, pdf._ensure_str(shape_arabic('نوع العملية')), 1, 0, 'C')
+            pdf.cell(40, 10, pdf._ensure_str(shape_arabic('رقم اللوحة')), 1, 1, 'C')
             
             # البيانات
             for record in vehicle_records:
@@ -411,7 +411,7 @@ def generate_employee_basic_pdf(employee_id):
         else:
             pdf.add_section_title('سجلات تسليم/استلام المركبات')
             pdf.set_font('Arabic', '', 12)
-            no_records_text = pdf._ensure_str(get_display(reshape('لا توجد سجلات لتسليم أو استلام المركبات')))
+            no_records_text = pdf._ensure_str(shape_arabic('لا توجد سجلات لتسليم أو استلام المركبات'))
             pdf.cell(0, 10, no_records_text, 0, 1, 'C')
         
         # إحصائيات الوثائق المرفقة
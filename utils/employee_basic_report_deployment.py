@@ -2,8 +2,7 @@ import os
 from datetime import datetime
 from io import BytesIO
 from fpdf import FPDF
-from arabic_reshaper import reshape
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from models import Employee, VehicleHandover, Vehicle
 
 class EmployeeBasicReportPDF(FPDF):
@@ -70,7 +69,7 @@ class EmployeeBasicReportPDF(FPDF):
             self.cell(0, 15, 'Employee Basic Report', 0, 1, 'C')
         else:
             self.set_font('Arabic', 'B', 20)
-            title = get_display(reshape('تقرير المعلومات الأساسية للموظف'))
+            title = shape_arabic('تقرير المعلومات الأساسية للموظف')
             self.cell(0, 15, title, 0, 1, 'C')
         self.ln(5)
         
@@ -79,11 +78,11 @@ class EmployeeBasicReportPDF(FPDF):
         self.set_y(-15)
         if self.setup_fonts():
             self.set_font('Arabic', '', 10)
-            page_text = get_display(reshape(f'صفحة {self.page_no()}'))
+            page_text = shape_arabic(f'صفحة {self.page_no()}')
             self.cell(0, 10, page_text, 0, 0, 'C')
             
             current_date = datetime.now().strftime('%Y/%m/%d')
-            date_text = get_display(reshape(f'تاريخ الطباعة: {current_date}'))
+            date_text = shape_arabic(f'تاريخ الطباعة: {current_date}')
             self.cell(0, 10, date_text, 0, 0, 'L')
         else:
             self.set_font('Arial', '', 10)
@@ -96,7 +95,7 @@ class EmployeeBasicReportPDF(FPDF):
         self.ln(5)
         if self.setup_fonts():
             self.set_font('Arabic', 'B', 16)
-            title_text = get_display(reshape(title))
+            title_text = shape_arabic(title)
         else:
             self.set_font('Arial', 'B', 16)
             title_text = title
@@ -115,8 +114,8 @@ class EmployeeBasicReportPDF(FPDF):
             else:
                 self.set_font('Arabic', '', 12)
             
-            label_text = get_display(reshape(label))
-            value_text = get_display(reshape(str(value) if value else 'غير محدد'))
+            label_text = shape_arabic(label)
+            value_text = shape_arabic(str(value) if value else 'غير محدد')
         else:
             if is_name:
                 self.set_font('Arial', 'B', 14)
@@ -6,8 +6,7 @@
 import os
 from datetime import datetime
 from fpdf import FPDF
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 import pandas as pd
 from io import BytesIO
 from models import Employee, Attendance, Salary, Vehicle, Department
@@ -52,8 +51,7 @@ class EmployeeComprehensivePDF(FPDF):
         """معالجة النص العربي للعرض الصحيح"""
         if not text:
             return ''
-        reshaped_text = arabic_reshaper.reshape(str(text))
-        bidi_text = get_display(reshaped_text)
+        bidi_text = shape_arabic(str(text))
         return bidi_text
     
     def add_section_title(self, title):
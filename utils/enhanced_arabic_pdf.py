@@ -4,8 +4,7 @@
 """
 
 from fpdf import FPDF
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from datetime import datetime
 import io
 import os
@@ -23,9 +22,7 @@ class ArabicPDF(FPDF):
         try:
             text_str = str(text)
             # إعادة تشكيل النص العربي
-            reshaped_text = arabic_reshaper.reshape(text_str)
-            # تطبيق خوارزمية الاتجاه الثنائي
-            bidi_text = get_display(reshaped_text)
+            bidi_text = shape_arabic(text_str)
             return bidi_text
         except Exception as e:
             print(f"خطأ في تنسيق النص العربي: {e}")
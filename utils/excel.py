@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from utils.date_converter import parse_date, format_date_gregorian, format_date_hijri
 from calendar import monthrange
 import xlsxwriter
+from utils.excel_stream import ColumnWidths, close_workbook, open_workbook, sheet_name, stream_rows
 
 def parse_employee_excel(file):
     """
@@ -291,6 +292,95 @@ def generate_employee_excel(employees, output=None):
         print(f"خطأ في إنشاء ملف Excel: {str(e)}")
         raise Exception(f"Error generating Excel file: {str(e)}")
 
+# أسماء أعمدة ملف الرواتب المعروفة لكل حقل (تُقارن بعد تحويلها إلى أحرف صغيرة)
+SALARY_COLUMN_MAPPINGS = {
+    'employee_id': ['employee_id', 'employee id', 'emp id', 'employee number', 'emp no', 'emp.id', 'emp.no', 'emp .n', 'رقم الموظف', 'معرف الموظف', 'الرقم الوظيفي'],
+    'basic_salary': ['basic_salary', 'basic salary', 'salary', 'راتب', 'الراتب', 'الراتب الأساسي'],
+    'allowances': ['allowances', 'بدل', 'بدلات', 'البدلات'],
+    'deductions': ['deductions', 'خصم', 'خصومات', 'الخصومات'],
+    'bonus': ['bonus', 'مكافأة', 'علاوة', 'مكافآت'],
+    'notes': ['notes', 'ملاحظات']
+}
+
+SALARY_AMOUNT_FIELDS = ('basic_salary', 'allowances', 'deductions', 'bonus')
+
+
+def detect_salary_columns(columns):
+    """
+    تحديد عمود الملف لكل حقل من حقول الرواتب مرة واحدة
+
+    يُفضّل التطابق التام مع أحد الأسماء المعروفة، ثم الاحتواء الجزئي للحقول التي لم تُحدد.
+
+    Returns:
+        قاموس {الحقل: اسم العمود في الملف}
+    """
+    named = {col: str(col).lower().strip() for col in columns if not isinstance(col, datetime)}
+    detected = {}
+    for exact in (True, False):
+        for field, variations in SALARY_COLUMN_MAPPINGS.items():
+            if field in detected:
+                continue
+            for col, col_str in named.items():
+                if col in detected.values():
+                    continue
+                matched = col_str in variations if exact else any(var in col_str for var in variations)
+                if matched:
+                    detected[field] = col
+                    break
+    return detected
+
+
+def read_salary_frame(file):
+    """
+    قراءة ملف رواتب Excel إلى جدول pandas موحد الأعمدة
+
+    تُحدد الأعمدة مرة واحدة، ويُقرأ رقم الموظف كنص (مع الحفاظ على الأصفار البادئة)،
+    وتُحوّل الأعمدة المالية إلى أرقام بعمليات pandas على العمود كاملاً (القيم المفقودة
+    أو غير الرقمية تصبح 0).
+
+    Args:
+        file: The uploaded Excel file
+
+    Returns:
+        DataFrame بالأعمدة row_number, employee_id, basic_salary, allowances,
+        deductions, bonus, notes (notes تكون None إذا لم يوجد عمود الملاحظات،
+        ويُسجل ذلك في frame.attrs['has_notes'])
+    """
+    file.seek(0)
+    df = pd.read_excel(file, engine='openpyxl', dtype=object)
+
+    detected = detect_salary_columns(df.columns)
+    if 'employee_id' not in detected:
+        raise ValueError(f"Required columns missing: employee_id. Available columns: {[c for c in df.columns if not isinstance(c, datetime)]}")
+
+    frame = pd.DataFrame({'row_number': np.arange(len(df)) + 2})
+
+    employee_ids = df[detected['employee_id']]
+    numeric_ids = pd.to_numeric(employee_ids, errors='coerce')
+    whole_numbers = numeric_ids.notna() & (numeric_ids % 1 == 0)
+    employee_ids = employee_ids.where(~whole_numbers, numeric_ids[whole_numbers].astype('int64').astype(str))
+    employee_ids = employee_ids.where(employee_ids.notna(), '').astype(str).str.strip()
+    frame['employee_id'] = employee_ids.replace({'nan': '', 'None': ''}).to_numpy()
+
+    for field in SALARY_AMOUNT_FIELDS:
+        if field in detected:
+            frame[field] = pd.to_numeric(df[detected[field]], errors='coerce').fillna(0.0).astype(float).to_numpy()
+        else:
+            frame[field] = 0.0
+
+    if 'notes' in detected:
+        notes = df[detected['notes']]
+        notes = notes.where(notes.notna(), '').astype(str).str.strip()
+        frame['notes'] = notes.where(notes != '', None).to_numpy()
+    else:
+        frame['notes'] = None
+
+    # حذف الصفوف بدون رقم موظف (ومنها الصفوف الفارغة تماماً)
+    frame = frame[frame['employee_id'] != ''].reset_index(drop=True)
+    frame.attrs['has_notes'] = 'notes' in detected
+    return frame
+
+
 def parse_salary_excel(file, month, year):
     """
     Parse Excel file containing salary data
@@ -304,172 +394,18 @@ def parse_salary_excel(file, month, year):
         List of dictionaries containing salary data
     """
     try:
-        # Reset file pointer to beginning
-        file.seek(0)
-        
-        # Read the Excel file explicitly using openpyxl engine
-        df = pd.read_excel(file, engine='openpyxl')
-        
-        # Print column names for debugging
-        print(f"Salary Excel columns: {df.columns.tolist()}")
-        
-        # Create a mapping for column detection
-        column_mappings = {
-            'employee_id': ['employee_id', 'employee id', 'emp id', 'employee number', 'emp no', 'emp.id', 'emp.no', 'emp .n', 'رقم الموظف', 'معرف الموظف', 'الرقم الوظيفي'],
-            'basic_salary': ['basic_salary', 'basic salary', 'salary', 'راتب', 'الراتب', 'الراتب الأساسي'],
-            'allowances': ['allowances', 'بدل', 'بدلات', 'البدلات'],
-            'deductions': ['deductions', 'خصم', 'خصومات', 'الخصومات'],
-            'bonus': ['bonus', 'مكافأة', 'علاوة', 'مكافآت'],
-            'notes': ['notes', 'ملاحظات']
-        }
-        
-        # Map columns to their normalized names
-        detected_columns = {}
-        for col in df.columns:
-            if isinstance(col, datetime):
-                continue
-                
-            col_str = str(col).lower().strip()
-            
-            # Check for exact column name or common variations
-            for field, variations in column_mappings.items():
-                if col_str in variations or any(var in col_str for var in variations):
-                    detected_columns[field] = col
-                    print(f"Detected '{field}' column: {col}")
-                    break
-        
-        # Handle special case for Excel files with specific column names
-        explicit_mappings = {
-            'Employee ID': 'employee_id',
-            'Emp .N': 'employee_id',  # شكل آخر لرقم الموظف
-            'Basic Salary': 'basic_salary',
-            'Allowances': 'allowances',
-            'Deductions': 'deductions',
-            'Bonus': 'bonus',
-            'Notes': 'notes'
-        }
-        
-        for excel_col, field in explicit_mappings.items():
-            if excel_col in df.columns:
-                detected_columns[field] = excel_col
-                print(f"Explicitly mapped '{excel_col}' to '{field}'")
-        
-        # Print final column mapping
-        print(f"Final salary column mapping: {detected_columns}")
-        
-        # تقسيم الحقول المطلوبة إلى أساسية وغير أساسية
-        essential_fields = ['employee_id']  # رقم الموظف هو الأساسي الوحيد الضروري دائماً
-        other_fields = ['basic_salary', 'allowances', 'deductions', 'bonus']  # يمكن وضع قيم افتراضية لها
-        
-        # التحقق من الحقول الأساسية
-        missing_essential = [field for field in essential_fields if field not in detected_columns]
-        if missing_essential:
-            missing_str = ", ".join(missing_essential)
-            raise ValueError(f"Required columns missing: {missing_str}. Available columns: {[c for c in df.columns if not isinstance(c, datetime)]}")
-        
-        # بالنسبة للحقول غير الأساسية المفقودة، سننشئ أعمدة وهمية تحتوي على قيم افتراضية
-        for field in other_fields:
-            if field not in detected_columns:
-                print(f"Warning: Creating default column for: {field}")
-                dummy_column_name = f"__{field}__default"
-                df[dummy_column_name] = 0  # إنشاء عمود فارغ (0 للقيم المالية)
-                detected_columns[field] = dummy_column_name  # تعيين العمود الوهمي للحقل
-        
-        # Process each row
-        salaries = []
-        for idx, row in df.iterrows():
-            try:
-                # Skip completely empty rows
-                if row.isnull().all():
-                    continue
-                
-                # Get employee_id field
-                emp_id_col = detected_columns['employee_id']
-                emp_id = row[emp_id_col]
-                
-                # Skip rows with missing employee_id
-                if pd.isna(emp_id):
-                    print(f"Skipping row {idx+1} due to missing employee ID")
-                    continue
-                
-                # Try to convert employee_id to integer
-                try:
-                    employee_id = int(emp_id)
-                except (ValueError, TypeError):
-                    # If not convertible to int, use as string (could be employee code)
-                    employee_id = str(emp_id).strip()
-                
-                # Get basic_salary field
-                basic_salary_col = detected_columns['basic_salary']
-                basic_salary_val = row[basic_salary_col]
-                
-                # تعامل مع القيم المفقودة أو غير الرقمية للراتب الأساسي
-                if pd.isna(basic_salary_val) or not isinstance(basic_salary_val, (int, float)):
-                    print(f"Row {idx+1}: Using default value of 0 for basic salary")
-                    basic_salary_val = 0
-                
-                basic_salary = float(basic_salary_val)
-                
-                # Get optional fields with default values
-                allowances = 0.0
-                deductions = 0.0
-                bonus = 0.0
-                notes = ''
-                
-                # Extract allowances if column exists
-                if 'allowances' in detected_columns and not pd.isna(row[detected_columns['allowances']]):
-                    try:
-                        allowances = float(row[detected_columns['allowances']])
-                    except (ValueError, TypeError):
-                        allowances = 0.0
-                
-                # Extract deductions if column exists
-                if 'deductions' in detected_columns and not pd.isna(row[detected_columns['deductions']]):
-                    try:
-                        deductions = float(row[detected_columns['deductions']])
-                    except (ValueError, TypeError):
-                        deductions = 0.0
-                
-                # Extract bonus if column exists
-                if 'bonus' in detected_columns and not pd.isna(row[detected_columns['bonus']]):
-                    try:
-                        bonus = float(row[detected_columns['bonus']])
-                    except (ValueError, TypeError):
-                        bonus = 0.0
-                
-                # Extract notes if column exists
-                if 'notes' in detected_columns and not pd.isna(row[detected_columns['notes']]):
-                    notes = str(row[detected_columns['notes']])
-                
-                # Calculate net salary
-                net_salary = basic_salary + allowances + bonus - deductions
-                
-                # Create salary dictionary
-                salary = {
-                    'employee_id': employee_id,
-                    'month': month,
-                    'year': year,
-                    'basic_salary': basic_salary,
-                    'allowances': allowances,
-                    'deductions': deductions,
-                    'bonus': bonus,
-                    'net_salary': net_salary
-                }
-                
-                if notes:
-                    salary['notes'] = notes
-                
-                print(f"Processed salary for employee ID: {employee_id}")
-                salaries.append(salary)
-                
-            except Exception as e:
-                print(f"Error processing salary row {idx+1}: {str(e)}")
-                # Continue to next row instead of failing the entire import
-                continue
-        
-        if not salaries:
+        frame = read_salary_frame(file)
+        if frame.empty:
             raise ValueError("No valid salary records found in the Excel file")
-            
+
+        frame['net_salary'] = frame['basic_salary'] + frame['allowances'] + frame['bonus'] - frame['deductions']
+        salaries = []
+        for record in frame.drop(columns='row_number').to_dict('records'):
+            record['month'] = month
+            record['year'] = year
+            if not record['notes']:
+                del record['notes']
+            salaries.append(record)
         return salaries
     
     except Exception as e:
@@ -481,6 +417,9 @@ def parse_salary_excel(file, month, year):
 def generate_comprehensive_employee_report(db_session, department_id=None, employee_id=None, month=None, year=None):
     """
     إنشاء تقرير شامل للموظفين مع كامل تفاصيل الرواتب والبيانات
+
+    تُحسب إحصائيات الرواتب لكل موظف في قاعدة البيانات، وتُكتب الصفوف بشكل متدفق
+    (وضع constant_memory) من استعلامات تُقرأ على دفعات.
     
     Args:
         db_session: جلسة قاعدة البيانات
@@ -490,475 +429,314 @@ def generate_comprehensive_employee_report(db_session, department_id=None, emplo
         year: السنة (اختياري للتصفية)
         
     Returns:
-        كائن BytesIO يحتوي على ملف Excel
+        ملف مؤقت يحتوي على ملف Excel جاهز للإرسال
     """
     try:
-        from models import Employee, Department, Salary, Attendance, Document
-        from sqlalchemy import func
-        from datetime import datetime, timedelta
-        from dateutil.relativedelta import relativedelta
-        from openpyxl.styles import Alignment, Font, PatternFill, Border, Side, Color
-        from openpyxl.utils import get_column_letter
-        from openpyxl.styles.differential import DifferentialStyle
-        from openpyxl.formatting.rule import Rule
-        from openpyxl.chart import BarChart, Reference, Series
-        from openpyxl.chart.marker import DataPoint
-        from openpyxl.drawing.image import Image
+        from models import Employee, Department, Salary
+        from sqlalchemy import and_, func
+        from sqlalchemy.orm import aliased, joinedload, selectinload
+        from xlsxwriter.utility import xl_col_to_name
         
         # استعلام الموظفين مع التصفية المطلوبة
-        query = db_session.query(Employee).join(Department)
+        query = db_session.query(Employee).join(Department, Employee.department_id == Department.id)
         
         if department_id:
             query = query.filter(Employee.department_id == department_id)
         if employee_id:
             query = query.filter(Employee.id == employee_id)
-            
-        # الحصول على كل الموظفين المطلوبين
-        employees = query.all()
         
-        # البحث عن الرواتب المرتبطة بهذه الفترة
-        salary_query = db_session.query(Salary).filter(Salary.employee_id.in_([e.id for e in employees]))
+        # شروط الرواتب المرتبطة بهؤلاء الموظفين في الفترة المطلوبة
+        salary_filters = [Salary.employee_id.in_(query.with_entities(Employee.id))]
         if month:
-            salary_query = salary_query.filter(Salary.month == month)
+            salary_filters.append(Salary.month == month)
         if year:
-            salary_query = salary_query.filter(Salary.year == year)
-            
-        salaries = salary_query.all()
+            salary_filters.append(Salary.year == year)
+        
+        # إحصائيات الرواتب لكل موظف
+        stats = db_session.query(
+            Salary.employee_id.label('employee_id'),
+            func.avg(Salary.basic_salary).label('avg_basic'),
+            func.avg(Salary.net_salary).label('avg_net'),
+            func.max(Salary.net_salary).label('max_net'),
+            func.min(Salary.net_salary).label('min_net'),
+            func.count(Salary.id).label('salaries_count')
+        ).filter(*salary_filters).group_by(Salary.employee_id).subquery()
+        
+        # آخر راتب لكل موظف (حسب السنة والشهر تنازلياً)
+        ranked = db_session.query(
+            Salary.id.label('salary_id'),
+            Salary.employee_id.label('employee_id'),
+            func.row_number().over(
+                partition_by=Salary.employee_id,
+                order_by=(Salary.year.desc(), Salary.month.desc())
+            ).label('position')
+        ).filter(*salary_filters).subquery()
+        latest_salary = aliased(Salary, name='latest_salary')
+        
+        employees_rows = query.outerjoin(
+            stats, stats.c.employee_id == Employee.id
+        ).outerjoin(
+            ranked, and_(ranked.c.employee_id == Employee.id, ranked.c.position == 1)
+        ).outerjoin(
+            latest_salary, latest_salary.id == ranked.c.salary_id
+        ).add_columns(
+            stats.c.avg_basic, stats.c.avg_net, stats.c.max_net, stats.c.min_net, stats.c.salaries_count,
+            latest_salary
+        ).options(
+            selectinload(Employee.departments)
+        ).order_by(Department.name, Employee.name, Employee.id)
+        
+        # الإحصائيات العامة
+        employees_count = query.count()
+        salaries_count, avg_basic, avg_net, total_net = db_session.query(
+            func.count(Salary.id), func.avg(Salary.basic_salary), func.avg(Salary.net_salary), func.sum(Salary.net_salary)
+        ).filter(*salary_filters).one()
+        
+        workbook, output = open_workbook()
         
         # تحديد الألوان والتنسيقات
-        header_fill = PatternFill(start_color="1F4E78", end_color="1F4E78", fill_type="solid")
-        header_font = Font(name="Arial", size=12, bold=True, color="FFFFFF")
-        subheader_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        subheader_font = Font(name="Arial", size=11, bold=True, color="FFFFFF")
-        total_row_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
-        total_row_font = Font(name="Arial", size=12, bold=True)
-        
-        normal_font = Font(name="Arial", size=11)
-        highlight_font = Font(name="Arial", size=11, bold=True)
-        
-        thin_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
-        
-        thick_border = Border(
-            left=Side(style='medium', color='000000'),
-            right=Side(style='medium', color='000000'),
-            top=Side(style='medium', color='000000'),
-            bottom=Side(style='medium', color='000000')
-        )
-        
-        title_alignment = Alignment(horizontal='center', vertical='center')
-        header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-        cell_alignment = Alignment(horizontal='center', vertical='center')
-        text_alignment = Alignment(horizontal='right', vertical='center', wrap_text=True)
-        
-        # تنسيقات للخلايا المالية
-        money_format = '#,##0.00 "ر.س"'
-        percentage_format = '0.00%'
-        date_format = 'yyyy-mm-dd'
-        
-        # إعداد البيانات المجمعة للموظفين
-        employees_data = []
-        salaries_by_employee = {}
-        
-        # تجميع الرواتب حسب الموظف
-        for salary in salaries:
-            if salary.employee_id not in salaries_by_employee:
-                salaries_by_employee[salary.employee_id] = []
-            salaries_by_employee[salary.employee_id].append(salary)
-        
-        # تجميع بيانات الموظفين مع الرواتب
-        for employee in employees:
-            emp_salaries = salaries_by_employee.get(employee.id, [])
-            
-            # حساب متوسط الراتب وأعلى وأدنى راتب
-            basic_salaries = [s.basic_salary for s in emp_salaries] if emp_salaries else [0]
-            net_salaries = [s.net_salary for s in emp_salaries] if emp_salaries else [0]
-            
-            avg_basic = sum(basic_salaries) / len(basic_salaries) if basic_salaries else 0
-            avg_net = sum(net_salaries) / len(net_salaries) if net_salaries else 0
-            max_net = max(net_salaries) if net_salaries else 0
-            min_net = min(net_salaries) if net_salaries else 0
-            
-            # تجميع معلومات الموظف
-            emp_data = {
-                'معرف': employee.id,
-                'رقم الموظف': employee.employee_id,
-                'الاسم': employee.name,
-                'القسم': ', '.join([dept.name for dept in employee.departments]) if employee.departments else 'بدون قسم',
-                'الوظيفة': employee.job_title or '',
-                'تاريخ التعيين': employee.hire_date,
-                'الجنسية': employee.nationality or '',
-                'الهاتف': employee.phone or '',
-                'البريد الإلكتروني': employee.email or '',
-                'الرقم الوطني/الإقامة': employee.national_id or '',
-                'الحالة': employee.status or '',
-                'متوسط الراتب الأساسي': avg_basic,
-                'متوسط صافي الراتب': avg_net,
-                'أعلى راتب': max_net,
-                'أدنى راتب': min_net,
-                'عدد الرواتب المسجلة': len(emp_salaries),
-                'الملاحظات': employee.notes or ''
-            }
-            
-            # إضافة تفاصيل آخر راتب
-            if emp_salaries:
-                # ترتيب الرواتب حسب السنة والشهر (تنازلياً)
-                sorted_salaries = sorted(emp_salaries, key=lambda s: (s.year, s.month), reverse=True)
-                latest_salary = sorted_salaries[0]
-                
-                emp_data.update({
-                    'آخر راتب - الشهر': latest_salary.month,
-                    'آخر راتب - السنة': latest_salary.year,
-                    'آخر راتب - الأساسي': latest_salary.basic_salary,
-                    'آخر راتب - البدلات': latest_salary.allowances,
-                    'آخر راتب - الخصومات': latest_salary.deductions,
-                    'آخر راتب - المكافآت': latest_salary.bonus,
-                    'آخر راتب - الصافي': latest_salary.net_salary
-                })
-            
-            employees_data.append(emp_data)
+        title_format = workbook.add_format({
+            'font_name': 'Arial', 'font_size': 16, 'bold': True, 'font_color': '#1F4E78',
+            'align': 'center', 'valign': 'vcenter'
+        })
+        header_format = workbook.add_format({
+            'font_name': 'Arial', 'font_size': 12, 'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#1F4E78',
+            'align': 'center', 'valign': 'vcenter', 'text_wrap': True, 'border': 1
+        })
+        total_text_format = workbook.add_format({
+            'font_name': 'Arial', 'font_size': 12, 'bold': True, 'bg_color': '#DDEBF7', 'border': 2,
+            'align': 'right', 'valign': 'vcenter', 'text_wrap': True
+        })
+        total_money_format = workbook.add_format({
+            'font_name': 'Arial', 'font_size': 12, 'bold': True, 'bg_color': '#DDEBF7', 'border': 2,
+            'align': 'center', 'valign': 'vcenter', 'num_format': '#,##0.00 "ر.س"'
+        })
         
-        # إنشاء ملف Excel باستخدام openpyxl
-        output = BytesIO()
-        with pd.ExcelWriter(path=output, engine='openpyxl') as writer:
-            # ======= ورقة ملخص الموظفين =======
-            emp_df = pd.DataFrame(employees_data)
-            
-            # ترتيب الأعمدة للتقرير الشامل
-            columns_order = [
-                'معرف', 'رقم الموظف', 'الاسم', 'القسم', 'الوظيفة', 'تاريخ التعيين', 
-                'الجنسية', 'الرقم الوطني/الإقامة', 'الهاتف', 'البريد الإلكتروني', 'الحالة',
-                'متوسط الراتب الأساسي', 'متوسط صافي الراتب', 'أعلى راتب', 'أدنى راتب', 
-                'عدد الرواتب المسجلة',
-                'آخر راتب - الشهر', 'آخر راتب - السنة', 'آخر راتب - الأساسي', 
-                'آخر راتب - البدلات', 'آخر راتب - الخصومات', 'آخر راتب - المكافآت', 
-                'آخر راتب - الصافي', 'الملاحظات'
+        # تنسيقات الخلايا حسب النوع (نص، مبلغ، تاريخ) ولون الخلفية
+        cell_formats = {}
+        
+        def cell_format(kind, bg_color=None):
+            key = (kind, bg_color)
+            if key not in cell_formats:
+                properties = {'font_name': 'Arial', 'font_size': 11, 'border': 1, 'valign': 'vcenter'}
+                if bg_color:
+                    properties['bg_color'] = bg_color
+                if kind == 'money':
+                    properties.update(align='center', num_format='#,##0.00 "ر.س"')
+                elif kind == 'date':
+                    properties.update(align='center', num_format='yyyy-mm-dd')
+                else:
+                    properties.update(align='right', text_wrap=True)
+                cell_formats[key] = workbook.add_format(properties)
+            return cell_formats[key]
+        
+        def write_header(worksheet, row, columns):
+            for col_idx, column_name in enumerate(columns):
+                worksheet.write(row, col_idx, column_name, header_format)
+        
+        def department_label(employee):
+            return ', '.join([dept.name for dept in employee.departments]) if employee.departments else 'بدون قسم'
+        
+        money_columns = ['الراتب الأساسي', 'البدلات', 'الخصومات', 'المكافآت', 'صافي الراتب']
+        
+        # ======= ورقة ملخص الموظفين =======
+        summary_columns = [
+            'معرف', 'رقم الموظف', 'الاسم', 'القسم', 'الوظيفة', 'تاريخ التعيين',
+            'الجنسية', 'الرقم الوطني/الإقامة', 'الهاتف', 'البريد الإلكتروني', 'الحالة',
+            'متوسط الراتب الأساسي', 'متوسط صافي الراتب', 'أعلى راتب', 'أدنى راتب',
+            'عدد الرواتب المسجلة'
+        ]
+        latest_columns = [
+            'آخر راتب - الشهر', 'آخر راتب - السنة', 'آخر راتب - الأساسي',
+            'آخر راتب - البدلات', 'آخر راتب - الخصومات', 'آخر راتب - المكافآت',
+            'آخر راتب - الصافي'
+        ]
+        # أعمدة آخر راتب تظهر فقط عند وجود رواتب مسجلة
+        if salaries_count:
+            summary_columns += latest_columns
+        
+        def summary_kind(column_name):
+            if column_name == 'تاريخ التعيين':
+                return 'date'
+            if 'راتب' in column_name and column_name not in ('آخر راتب - الشهر', 'آخر راتب - السنة'):
+                return 'money'
+            return 'text'
+        
+        summary_kinds = [summary_kind(column_name) for column_name in summary_columns]
+        
+        summary_sheet = workbook.add_worksheet('ملخص الموظفين')
+        summary_sheet.merge_range(0, 0, 0, len(summary_columns) - 1, "التقرير الشامل للموظفين مع تفاصيل الرواتب", title_format)
+        write_header(summary_sheet, 2, summary_columns)
+        summary_widths = ColumnWidths(summary_columns)
+        
+        # إنشاء أوراق التفاصيل والرسوم البيانية مسبقاً للمحافظة على ترتيب الأوراق
+        salary_sheet = chart_sheet = None
+        if salaries_count:
+            salary_sheet = workbook.add_worksheet('تفاصيل الرواتب')
+            chart_sheet = workbook.add_worksheet('الرسوم البيانية')
+        
+        for row_idx, row in enumerate(stream_rows(employees_rows), 1):
+            employee = row[0]
+            latest = row.latest_salary
+            values = [
+                employee.id,
+                employee.employee_id,
+                employee.name,
+                department_label(employee),
+                employee.job_title or '',
+                employee.join_date,
+                employee.nationality or '',
+                employee.national_id or '',
+                employee.mobile or '',
+                employee.email or '',
+                employee.status or '',
+                row.avg_basic or 0,
+                row.avg_net or 0,
+                row.max_net or 0,
+                row.min_net or 0,
+                row.salaries_count or 0
             ]
+            if salaries_count:
+                if latest is not None:
+                    values += [latest.month, latest.year, latest.basic_salary, latest.allowances,
+                               latest.deductions, latest.bonus, latest.net_salary]
+                else:
+                    values += [None] * len(latest_columns)
             
-            # استبعاد الأعمدة غير الموجودة
-            actual_columns = [col for col in columns_order if col in emp_df.columns]
-            emp_df = emp_df[actual_columns]
-            
-            # كتابة البيانات إلى الملف
-            emp_df.to_excel(writer, sheet_name='ملخص الموظفين', index=False, startrow=2)
-            
-            # الحصول على ورقة العمل وتنسيقها
-            summary_sheet = writer.sheets['ملخص الموظفين']
-            
-            # إضافة عنوان للتقرير
-            summary_sheet.merge_cells(f'A1:{get_column_letter(len(actual_columns))}1')
-            title_cell = summary_sheet.cell(1, 1)
-            title_cell.value = "التقرير الشامل للموظفين مع تفاصيل الرواتب"
-            title_cell.font = Font(name="Arial", size=16, bold=True, color="1F4E78")
-            title_cell.alignment = title_alignment
-            
-            # تنسيق العناوين
-            for col_idx, column_name in enumerate(actual_columns, 1):
-                cell = summary_sheet.cell(3, col_idx)
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = header_alignment
-                cell.border = thin_border
-                
-                # ضبط عرض العمود
-                column_width = max((
-                    emp_df[column_name].astype(str).map(len).max() if len(emp_df) > 0 else 0, 
-                    len(column_name)
-                )) + 4
-                column_letter = get_column_letter(col_idx)
-                summary_sheet.column_dimensions[column_letter].width = column_width
-            
-            # تنسيق البيانات
-            for row_idx, (_, row) in enumerate(emp_df.iterrows(), 1):
-                for col_idx, column_name in enumerate(actual_columns, 1):
-                    cell = summary_sheet.cell(row_idx + 3, col_idx)
-                    value = row[column_name]
-                    cell.value = value
-                    
-                    # تنسيق خاص لأنواع البيانات المختلفة
-                    if 'راتب' in column_name:
-                        cell.number_format = money_format
-                        cell.alignment = cell_alignment
-                    elif 'تاريخ' in column_name and value:
-                        cell.number_format = date_format
-                        cell.alignment = cell_alignment
-                    else:
-                        cell.alignment = text_alignment
-                    
-                    # تنسيق صفوف بديلة
-                    if row_idx % 2 == 0:
-                        cell.fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-                    
-                    cell.font = normal_font
-                    cell.border = thin_border
-            
-            # ======= ورقة تفاصيل الرواتب لكل موظف =======
-            # تحضير بيانات الرواتب مفصلة حسب الموظف
-            all_salary_data = []
-            
-            for employee in employees:
-                emp_salaries = salaries_by_employee.get(employee.id, [])
-                
-                for salary in emp_salaries:
-                    all_salary_data.append({
-                        'معرف الموظف': employee.id,
-                        'رقم الموظف': employee.employee_id,
-                        'اسم الموظف': employee.name,
-                        'القسم': ', '.join([dept.name for dept in employee.departments]) if employee.departments else 'بدون قسم',
-                        'الشهر': salary.month,
-                        'السنة': salary.year,
-                        'الراتب الأساسي': salary.basic_salary,
-                        'البدلات': salary.allowances,
-                        'الخصومات': salary.deductions,
-                        'المكافآت': salary.bonus,
-                        'صافي الراتب': salary.net_salary,
-                        'ملاحظات': salary.notes or ''
-                    })
-            
-            if all_salary_data:
-                # إنشاء DataFrame للرواتب
-                salary_df = pd.DataFrame(all_salary_data)
-                
-                # ترتيب البيانات حسب القسم، الموظف، السنة، الشهر
-                salary_df = salary_df.sort_values(by=['القسم', 'اسم الموظف', 'السنة', 'الشهر'], ascending=[True, True, False, False])
-                
-                # كتابة البيانات إلى ورقة عمل جديدة
-                salary_df.to_excel(writer, sheet_name='تفاصيل الرواتب', index=False, startrow=2)
-                
-                # تنسيق ورقة تفاصيل الرواتب
-                salary_sheet = writer.sheets['تفاصيل الرواتب']
-                
-                # إضافة عنوان
-                salary_sheet.merge_cells(f'A1:{get_column_letter(len(salary_df.columns))}1')
-                title_cell = salary_sheet.cell(1, 1)
-                title_cell.value = "تفاصيل رواتب الموظفين"
-                title_cell.font = Font(name="Arial", size=16, bold=True, color="1F4E78")
-                title_cell.alignment = title_alignment
-                
-                # تنسيق العناوين
-                for col_idx, column_name in enumerate(salary_df.columns, 1):
-                    cell = salary_sheet.cell(3, col_idx)
-                    cell.value = column_name
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.alignment = header_alignment
-                    cell.border = thin_border
-                    
-                    # ضبط عرض العمود
-                    column_width = max(salary_df[column_name].astype(str).map(len).max(), len(column_name)) + 4
-                    column_letter = get_column_letter(col_idx)
-                    salary_sheet.column_dimensions[column_letter].width = column_width
-                
-                # تجميع الصفوف حسب الموظف بألوان مختلفة
-                current_employee = None
-                color_index = 0
-                colors = ["E6F2FF", "F2F2F2"]  # ألوان التناوب
-                
-                # تنسيق البيانات
-                for row_idx, (_, row) in enumerate(salary_df.iterrows(), 1):
-                    # تغيير اللون عند تغيير الموظف
-                    if current_employee != row['اسم الموظف']:
-                        current_employee = row['اسم الموظف']
-                        color_index = (color_index + 1) % 2
-                    
-                    row_fill = PatternFill(start_color=colors[color_index], end_color=colors[color_index], fill_type="solid")
-                    
-                    for col_idx, column_name in enumerate(salary_df.columns, 1):
-                        cell = salary_sheet.cell(row_idx + 3, col_idx)
-                        cell.value = row[column_name]
-                        
-                        # تنسيق خاص لأنواع البيانات المختلفة
-                        if column_name in ['الراتب الأساسي', 'البدلات', 'الخصومات', 'المكافآت', 'صافي الراتب']:
-                            cell.number_format = money_format
-                            cell.alignment = cell_alignment
-                        else:
-                            cell.alignment = text_alignment
-                        
-                        cell.fill = row_fill
-                        cell.font = normal_font
-                        cell.border = thin_border
-                
-                # إضافة صف للمجاميع في نهاية الجدول
-                total_row_idx = len(salary_df) + 4
-                salary_sheet.cell(total_row_idx, 1).value = "المجموع الكلي"
-                salary_sheet.cell(total_row_idx, 1).font = total_row_font
-                salary_sheet.cell(total_row_idx, 1).alignment = text_alignment
-                salary_sheet.cell(total_row_idx, 1).fill = total_row_fill
-                salary_sheet.cell(total_row_idx, 1).border = thick_border
-                
-                # دمج خلايا المجموع
-                merge_cols = 6  # دمج الخلايا الأولى للمجموع
-                salary_sheet.merge_cells(f'A{total_row_idx}:{get_column_letter(merge_cols)}{total_row_idx}')
-                
-                # تنسيق وحساب المجاميع
-                for col_idx, column_name in enumerate(salary_df.columns, 1):
-                    cell = salary_sheet.cell(total_row_idx, col_idx)
-                    cell.font = total_row_font
-                    cell.fill = total_row_fill
-                    cell.border = thick_border
-                    
-                    if col_idx <= merge_cols:
-                        continue  # تخطي الخلايا المدمجة
-                    
-                    # حساب المجاميع للأعمدة المالية
-                    if column_name in ['الراتب الأساسي', 'البدلات', 'الخصومات', 'المكافآت', 'صافي الراتب']:
-                        col_letter = get_column_letter(col_idx)
-                        cell.value = f"=SUM({col_letter}4:{col_letter}{total_row_idx-1})"
-                        cell.number_format = money_format
-                        cell.alignment = cell_alignment
-                
-                # إضافة رسم بياني للرواتب حسب القسم
-                try:
-                    chart_sheet = writer.book.create_sheet(title="الرسوم البيانية")
-                    
-                    # إعداد بيانات الرسم البياني - متوسط الراتب حسب القسم
-                    dept_avg_salary = salary_df.groupby('القسم')['صافي الراتب'].mean().reset_index()
-                    dept_avg_salary.to_excel(writer, sheet_name="الرسوم البيانية", startrow=1, startcol=1, index=False)
-                    
-                    chart_sheet.cell(1, 1).value = "متوسط الرواتب حسب القسم"
-                    chart_sheet.cell(1, 1).font = Font(name="Arial", size=14, bold=True)
-                    
-                    # إنشاء الرسم البياني
-                    chart = BarChart()
-                    chart.title = "متوسط الرواتب حسب القسم"
-                    chart.y_axis.title = "متوسط الراتب (ر.س)"
-                    chart.x_axis.title = "القسم"
-                    
-                    # تحديد نطاق البيانات
-                    data = Reference(chart_sheet, min_col=3, min_row=2, max_row=2+len(dept_avg_salary))
-                    cats = Reference(chart_sheet, min_col=2, min_row=3, max_row=2+len(dept_avg_salary))
-                    chart.add_data(data, titles_from_data=True)
-                    chart.set_categories(cats)
-                    
-                    # إضافة الرسم البياني إلى الورقة
-                    chart_sheet.add_chart(chart, "E5")
-                    
-                except Exception as chart_error:
-                    print(f"حدث خطأ أثناء إنشاء الرسم البياني: {chart_error}")
-            
-            # ======= ورقة معلومات التقرير =======
-            # إنشاء ورقة معلومات التقرير
-            info_data = []
-            
-            # إضافة معلومات عامة
-            info_data.append({
-                'المعلومة': 'تاريخ التصدير',
-                'القيمة': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            })
-            
-            # إضافة معلومات حول التصفية
-            if department_id:
-                dept = db_session.query(Department).get(department_id)
-                info_data.append({
-                    'المعلومة': 'تصفية حسب القسم',
-                    'القيمة': dept.name if dept else department_id
-                })
-            
-            if employee_id:
-                emp = db_session.query(Employee).get(employee_id)
-                info_data.append({
-                    'المعلومة': 'تصفية حسب الموظف',
-                    'القيمة': emp.name if emp else employee_id
-                })
-            
-            if month:
-                info_data.append({
-                    'المعلومة': 'تصفية حسب الشهر',
-                    'القيمة': month
-                })
-            
-            if year:
-                info_data.append({
-                    'المعلومة': 'تصفية حسب السنة',
-                    'القيمة': year
-                })
-            
-            # إضافة إحصائيات عامة
-            info_data.append({
-                'المعلومة': 'إجمالي عدد الموظفين',
-                'القيمة': len(employees)
-            })
-            
-            info_data.append({
-                'المعلومة': 'إجمالي عدد الرواتب المسجلة',
-                'القيمة': len(salaries)
+            # تنسيق صفوف بديلة
+            bg_color = '#F2F2F2' if row_idx % 2 == 0 else None
+            for col_idx, (kind, value) in enumerate(zip(summary_kinds, values)):
+                if value is None or value == '':
+                    summary_sheet.write_blank(row_idx + 2, col_idx, None, cell_format(kind, bg_color))
+                else:
+                    summary_sheet.write(row_idx + 2, col_idx, value, cell_format(kind, bg_color))
+            summary_widths.update(values)
+        summary_widths.apply(summary_sheet)
+        
+        # ======= ورقة تفاصيل الرواتب لكل موظف =======
+        if salary_sheet is not None:
+            salary_columns = [
+                'معرف الموظف', 'رقم الموظف', 'اسم الموظف', 'القسم', 'الشهر', 'السنة',
+                'الراتب الأساسي', 'البدلات', 'الخصومات', 'المكافآت', 'صافي الراتب', 'ملاحظات'
+            ]
+            salary_kinds = ['money' if column_name in money_columns else 'text' for column_name in salary_columns]
+            
+            salary_sheet.merge_range(0, 0, 0, len(salary_columns) - 1, "تفاصيل رواتب الموظفين", title_format)
+            write_header(salary_sheet, 2, salary_columns)
+            salary_widths = ColumnWidths(salary_columns)
+            
+            # الرواتب مرتبة حسب القسم ثم الموظف ثم الأحدث
+            salaries_rows = db_session.query(Salary).join(
+                Employee, Employee.id == Salary.employee_id
+            ).join(
+                Department, Employee.department_id == Department.id
+            ).filter(*salary_filters).options(
+                joinedload(Salary.employee).selectinload(Employee.departments)
+            ).order_by(Department.name, Employee.name, Employee.id, Salary.year.desc(), Salary.month.desc())
+            
+            # تجميع الصفوف حسب الموظف بألوان مختلفة
+            current_employee = None
+            color_index = 0
+            colors = ['#E6F2FF', '#F2F2F2']  # ألوان التناوب
+            
+            # متوسط صافي الراتب حسب القسم للرسم البياني
+            dept_net = {}
+            
+            row = 3
+            for salary in stream_rows(salaries_rows):
+                employee = salary.employee
+                if current_employee != employee.id:
+                    current_employee = employee.id
+                    color_index = (color_index + 1) % 2
+                
+                dept_name = department_label(employee)
+                values = [
+                    employee.id, employee.employee_id, employee.name, dept_name,
+                    salary.month, salary.year, salary.basic_salary, salary.allowances,
+                    salary.deductions, salary.bonus, salary.net_salary, salary.notes or ''
+                ]
+                for col_idx, (kind, value) in enumerate(zip(salary_kinds, values)):
+                    salary_sheet.write(row, col_idx, value, cell_format(kind, colors[color_index]))
+                salary_widths.update(values)
+                row += 1
+                
+                net_sum, net_count = dept_net.get(dept_name, (0, 0))
+                dept_net[dept_name] = (net_sum + (salary.net_salary or 0), net_count + 1)
+            
+            # صف المجموع الكلي مع دمج الخلايا الأولى
+            merge_cols = 6
+            salary_sheet.merge_range(row, 0, row, merge_cols - 1, "المجموع الكلي", total_text_format)
+            for col_idx in range(merge_cols, len(salary_columns)):
+                if salary_columns[col_idx] in money_columns:
+                    col_letter = xl_col_to_name(col_idx)
+                    salary_sheet.write_formula(row, col_idx, f"=SUM({col_letter}4:{col_letter}{row})", total_money_format)
+                else:
+                    salary_sheet.write_blank(row, col_idx, None, total_text_format)
+            salary_widths.apply(salary_sheet)
+            
+            # ======= رسم بياني لمتوسط الرواتب حسب القسم =======
+            chart_sheet.write(0, 0, "متوسط الرواتب حسب القسم", workbook.add_format({
+                'font_name': 'Arial', 'font_size': 14, 'bold': True
+            }))
+            chart_sheet.write(1, 1, 'القسم', header_format)
+            chart_sheet.write(1, 2, 'صافي الراتب', header_format)
+            for row_idx, dept_name in enumerate(sorted(dept_net), 2):
+                net_sum, net_count = dept_net[dept_name]
+                chart_sheet.write(row_idx, 1, dept_name)
+                chart_sheet.write(row_idx, 2, net_sum / net_count)
+            
+            last_row = 1 + len(dept_net)
+            chart = workbook.add_chart({'type': 'column'})
+            chart.add_series({
+                'name': ['الرسوم البيانية', 1, 2],
+                'categories': ['الرسوم البيانية', 2, 1, last_row, 1],
+                'values': ['الرسوم البيانية', 2, 2, last_row, 2]
             })
-            
-            # حساب متوسطات الرواتب
-            if salaries:
-                avg_basic = sum(s.basic_salary for s in salaries) / len(salaries)
-                avg_net = sum(s.net_salary for s in salaries) / len(salaries)
-                
-                info_data.append({
-                    'المعلومة': 'متوسط الراتب الأساسي',
-                    'القيمة': avg_basic
-                })
-                
-                info_data.append({
-                    'المعلومة': 'متوسط صافي الراتب',
-                    'القيمة': avg_net
-                })
-                
-                info_data.append({
-                    'المعلومة': 'إجمالي مصاريف الرواتب',
-                    'القيمة': sum(s.net_salary for s in salaries)
-                })
-            
-            # إنشاء DataFrame للمعلومات
-            info_df = pd.DataFrame(info_data)
-            info_df.to_excel(writer, sheet_name='معلومات التقرير', index=False, startrow=2)
-            
-            # تنسيق ورقة المعلومات
-            info_sheet = writer.sheets['معلومات التقرير']
-            
-            # إضافة عنوان للورقة
-            info_sheet.merge_cells('A1:B1')
-            info_sheet.cell(1, 1).value = "معلومات التقرير الشامل"
-            info_sheet.cell(1, 1).font = Font(name="Arial", size=16, bold=True, color="1F4E78")
-            info_sheet.cell(1, 1).alignment = title_alignment
-            
-            # تنسيق العناوين
-            for col_idx, col_name in enumerate(info_df.columns, 1):
-                info_sheet.cell(3, col_idx).value = col_name
-                info_sheet.cell(3, col_idx).font = header_font
-                info_sheet.cell(3, col_idx).fill = header_fill
-                info_sheet.cell(3, col_idx).alignment = header_alignment
-                info_sheet.cell(3, col_idx).border = thin_border
-                
-                # ضبط عرض العمود
-                column_width = max(info_df[col_name].astype(str).map(len).max(), len(col_name)) + 4
-                column_letter = get_column_letter(col_idx)
-                info_sheet.column_dimensions[column_letter].width = column_width
-            
-            # تنسيق البيانات
-            for row_idx, (_, row) in enumerate(info_df.iterrows(), 1):
-                for col_idx, col_name in enumerate(info_df.columns, 1):
-                    cell = info_sheet.cell(row_idx + 3, col_idx)
-                    cell.value = row[col_name]
-                    
-                    # تنسيق خاص للقيم المالية
-                    if 'متوسط' in row['المعلومة'] or 'إجمالي مصاريف' in row['المعلومة']:
-                        cell.number_format = money_format
-                        cell.alignment = cell_alignment
-                    else:
-                        cell.alignment = text_alignment
-                    
-                    # تنسيق صفوف بديلة
-                    if row_idx % 2 == 0:
-                        cell.fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-                    
-                    cell.font = normal_font
-                    cell.border = thin_border
-            
-            # تعيين الصفحة الأولى كصفحة نشطة
-            writer.book.active = writer.book.worksheets[0]
+            chart.set_title({'name': "متوسط الرواتب حسب القسم"})
+            chart.set_y_axis({'name': "متوسط الراتب (ر.س)"})
+            chart.set_x_axis({'name': "القسم"})
+            chart_sheet.insert_chart('E5', chart)
         
-        output.seek(0)
-        return output
+        # ======= ورقة معلومات التقرير =======
+        info_data = [['تاريخ التصدير', datetime.now().strftime('%Y-%m-%d %H:%M:%S')]]
+        
+        # إضافة معلومات حول التصفية
+        if department_id:
+            dept = db_session.get(Department, department_id)
+            info_data.append(['تصفية حسب القسم', dept.name if dept else department_id])
+        if employee_id:
+            emp = db_session.get(Employee, employee_id)
+            info_data.append(['تصفية حسب الموظف', emp.name if emp else employee_id])
+        if month:
+            info_data.append(['تصفية حسب الشهر', month])
+        if year:
+            info_data.append(['تصفية حسب السنة', year])
+        
+        # إضافة إحصائيات عامة
+        info_data.append(['إجمالي عدد الموظفين', employees_count])
+        info_data.append(['إجمالي عدد الرواتب المسجلة', salaries_count])
+        if salaries_count:
+            info_data.append(['متوسط الراتب الأساسي', avg_basic])
+            info_data.append(['متوسط صافي الراتب', avg_net])
+            info_data.append(['إجمالي مصاريف الرواتب', total_net])
+        
+        info_columns = ['المعلومة', 'القيمة']
+        info_sheet = workbook.add_worksheet('معلومات التقرير')
+        info_sheet.merge_range('A1:B1', "معلومات التقرير الشامل", title_format)
+        write_header(info_sheet, 2, info_columns)
+        info_widths = ColumnWidths(info_columns)
+        for row_idx, (label, value) in enumerate(info_data, 1):
+            bg_color = '#F2F2F2' if row_idx % 2 == 0 else None
+            kind = 'money' if 'متوسط' in label or 'إجمالي مصاريف' in label else 'text'
+            info_sheet.write(row_idx + 2, 0, label, cell_format('text', bg_color))
+            info_sheet.write(row_idx + 2, 1, value, cell_format(kind, bg_color))
+            info_widths.update([label, value])
+        info_widths.apply(info_sheet)
+        
+        # تعيين الصفحة الأولى كصفحة نشطة
+        summary_sheet.activate()
+        
+        return close_workbook(workbook, output)
     except Exception as e:
         import traceback
         print(traceback.format_exc())
@@ -1178,472 +956,254 @@ def generate_employee_salary_simple_excel(db_session, month=None, year=None, dep
 def generate_salary_excel(salaries, filter_description=None):
     """
     إنشاء ملف Excel من بيانات الرواتب مع تنظيم وتجميع حسب القسم وتنسيق ممتاز
+
+    تُقرأ الرواتب مرتين على دفعات: الأولى لحساب مجاميع الأقسام وعرض الأعمدة،
+    والثانية لكتابة الصفوف بشكل متدفق (وضع constant_memory).
     
     Args:
-        salaries: قائمة كائنات Salary 
+        salaries: استعلام (أو قائمة) كائنات Salary
         filter_description: وصف مرشحات البحث المستخدمة (اختياري)
         
     Returns:
-        كائن BytesIO يحتوي على ملف Excel
+        ملف مؤقت يحتوي على ملف Excel جاهز للإرسال
     """
     try:
         from datetime import datetime
-        from openpyxl.styles import Alignment, Font, PatternFill, Border, Side, Color
-        from openpyxl.utils import get_column_letter
-        from openpyxl.styles.differential import DifferentialStyle
-        from openpyxl.formatting.rule import Rule
-        from openpyxl.drawing.image import Image
-        
-        # تحديد الألوان والتنسيقات
-        header_fill = PatternFill(start_color="1F4E78", end_color="1F4E78", fill_type="solid")
-        header_font = Font(name="Arial", size=12, bold=True, color="FFFFFF")
-        total_row_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
-        total_row_font = Font(name="Arial", size=12, bold=True)
-        
-        normal_font = Font(name="Arial", size=11)
-        highlight_font = Font(name="Arial", size=11, bold=True)
-        
-        thin_border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
+        from xlsxwriter.utility import xl_col_to_name
+        
+        money_columns = ['الراتب الأساسي', 'البدلات', 'الخصومات', 'المكافآت', 'صافي الراتب']
+        
+        # ترتيب الأعمدة بشكل منطقي
+        ordered_columns = [
+            'معرف', 'اسم الموظف', 'رقم الموظف', 'الوظيفة', 'القسم',
+            'الشهر', 'السنة', 'الراتب الأساسي', 'البدلات', 'الخصومات',
+            'المكافآت', 'صافي الراتب', 'ملاحظات'
+        ]
+        
+        def department_label(salary):
+            return ', '.join([dept.name for dept in salary.employee.departments]) if salary.employee.departments else 'بدون قسم'
+        
+        def salary_row(salary, dept_name):
+            return [
+                salary.id,
+                salary.employee.name,
+                salary.employee.employee_id,
+                salary.employee.job_title or '',
+                dept_name,
+                salary.month,
+                salary.year,
+                salary.basic_salary,
+                salary.allowances,
+                salary.deductions,
+                salary.bonus,
+                salary.net_salary,
+                salary.notes or ''
+            ]
         
-        thick_border = Border(
-            left=Side(style='medium', color='000000'),
-            right=Side(style='medium', color='000000'),
-            top=Side(style='medium', color='000000'),
-            bottom=Side(style='medium', color='000000')
-        )
+        # المرور الأول: مجاميع الأقسام (بترتيب ظهورها) وأطوال القيم لضبط عرض الأعمدة
+        departments_totals = {}
+        all_widths = ColumnWidths(ordered_columns)
+        for salary in stream_rows(salaries):
+            dept_name = department_label(salary)
+            if dept_name not in departments_totals:
+                departments_totals[dept_name] = {
+                    'count': 0, 'basic': 0, 'allowances': 0, 'deductions': 0, 'bonus': 0, 'net': 0,
+                    'widths': ColumnWidths(ordered_columns)
+                }
+            totals = departments_totals[dept_name]
+            totals['count'] += 1
+            totals['basic'] += salary.basic_salary or 0
+            totals['allowances'] += salary.allowances or 0
+            totals['deductions'] += salary.deductions or 0
+            totals['bonus'] += salary.bonus or 0
+            totals['net'] += salary.net_salary or 0
+            
+            row = salary_row(salary, dept_name)
+            totals['widths'].update(row)
+            all_widths.update(row)
+        
+        total_salaries = sum(t['count'] for t in departments_totals.values())
+        total_basic = sum(t['basic'] for t in departments_totals.values())
+        total_allowances = sum(t['allowances'] for t in departments_totals.values())
+        total_deductions = sum(t['deductions'] for t in departments_totals.values())
+        total_bonus = sum(t['bonus'] for t in departments_totals.values())
+        total_net = sum(t['net'] for t in departments_totals.values())
+        
+        workbook, output = open_workbook()
         
-        title_alignment = Alignment(horizontal='center', vertical='center')
-        header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-        cell_alignment = Alignment(horizontal='center', vertical='center')
-        text_alignment = Alignment(horizontal='right', vertical='center', wrap_text=True)
+        # تحديد الألوان والتنسيقات
+        title_format = workbook.add_format({
+            'font_name': 'Arial', 'font_size': 16, 'bold': True, 'font_color': '#1F4E78',
+            'align': 'center', 'valign': 'vcenter'
+        })
+        filter_format = workbook.add_format({
+            'font_name': 'Arial', 'font_size': 12, 'italic': True, 'align': 'center', 'valign': 'vcenter'
+        })
+        header_format = workbook.add_format({
+            'font_name': 'Arial', 'font_size': 12, 'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#1F4E78',
+            'align': 'center', 'valign': 'vcenter', 'text_wrap': True, 'border': 1
+        })
         
-        # تنسيقات للخلايا المالية
+        # تنسيقات الخلايا: نصية أو مالية، عادية أو مظللة (للصفوف المتناوبة)
         money_format = '#,##0.00 "ر.س"'
-        percentage_format = '0.00%'
-        
-        # تجميع البيانات حسب القسم
-        departments_data = {}
-        for salary in salaries:
-            dept_name = ', '.join([dept.name for dept in salary.employee.departments]) if salary.employee.departments else 'بدون قسم'
-            if dept_name not in departments_data:
-                departments_data[dept_name] = []
-            
-            # إضافة بيانات الراتب إلى القسم المناسب
-            departments_data[dept_name].append({
-                'معرف': salary.id,
-                'اسم الموظف': salary.employee.name,
-                'رقم الموظف': salary.employee.employee_id,
-                'الوظيفة': salary.employee.job_title or '',
-                'القسم': dept_name,
-                'الشهر': salary.month,
-                'السنة': salary.year,
-                'الراتب الأساسي': salary.basic_salary,
-                'البدلات': salary.allowances,
-                'الخصومات': salary.deductions,
-                'المكافآت': salary.bonus,
-                'صافي الراتب': salary.net_salary,
-                'ملاحظات': salary.notes or ''
-            })
-        
-        # إنشاء ملف Excel باستخدام openpyxl
-        output = BytesIO()
-        with pd.ExcelWriter(path=output, engine='openpyxl') as writer:
-            # بيانات الملخص
-            summary_data = []
-            total_salaries = 0
-            total_basic = 0
-            total_allowances = 0
-            total_deductions = 0
-            total_bonus = 0
-            total_net = 0
-            
-            # حساب المجاميع لكل قسم
-            for dept_name, dept_salaries in departments_data.items():
-                dept_count = len(dept_salaries)
-                dept_basic_sum = sum(s['الراتب الأساسي'] for s in dept_salaries)
-                dept_allowances_sum = sum(s['البدلات'] for s in dept_salaries)
-                dept_deductions_sum = sum(s['الخصومات'] for s in dept_salaries)
-                dept_bonus_sum = sum(s['المكافآت'] for s in dept_salaries)
-                dept_net_sum = sum(s['صافي الراتب'] for s in dept_salaries)
-                
-                summary_data.append({
-                    'القسم': dept_name,
-                    'عدد الموظفين': dept_count,
-                    'إجمالي الرواتب الأساسية': dept_basic_sum,
-                    'إجمالي البدلات': dept_allowances_sum,
-                    'إجمالي الخصومات': dept_deductions_sum,
-                    'إجمالي المكافآت': dept_bonus_sum,
-                    'إجمالي صافي الرواتب': dept_net_sum
-                })
-                
-                # تحديث المجاميع الكلية
-                total_salaries += dept_count
-                total_basic += dept_basic_sum
-                total_allowances += dept_allowances_sum
-                total_deductions += dept_deductions_sum
-                total_bonus += dept_bonus_sum
-                total_net += dept_net_sum
-            
-            # إضافة صف المجموع الكلي
-            summary_data.append({
-                'القسم': 'الإجمالي',
-                'عدد الموظفين': total_salaries,
-                'إجمالي الرواتب الأساسية': total_basic,
-                'إجمالي البدلات': total_allowances,
-                'إجمالي الخصومات': total_deductions,
-                'إجمالي المكافآت': total_bonus,
-                'إجمالي صافي الرواتب': total_net
-            })
-            
-            # إنشاء DataFrame للملخص
-            summary_df = pd.DataFrame(summary_data)
-            summary_df.to_excel(writer, sheet_name='ملخص الرواتب', index=False)
-            
-            # تنسيق ورقة الملخص
-            summary_sheet = writer.sheets['ملخص الرواتب']
-            
-            # إضافة عنوان للتقرير
-            summary_sheet.merge_cells('A1:G1')
-            summary_sheet.cell(1, 1).value = "تقرير ملخص الرواتب"
-            summary_sheet.cell(1, 1).font = Font(name="Arial", size=16, bold=True, color="1F4E78")
-            summary_sheet.cell(1, 1).alignment = title_alignment
-            
-            # إضافة معلومات الفلترة تحت العنوان
-            if filter_description:
-                summary_sheet.merge_cells('A2:G2')
-                summary_sheet.cell(2, 1).value = "مرشحات البحث: " + " - ".join(filter_description)
-                summary_sheet.cell(2, 1).font = Font(name="Arial", size=12, italic=True)
-                summary_sheet.cell(2, 1).alignment = title_alignment
-                
-                # ضبط العنوان ليبدأ من الصف الثالث
-                title_row_offset = 3
-            else:
-                # ضبط العنوان ليبدأ من الصف الثاني
-                title_row_offset = 2
-            
-            # الحصول على عدد الصفوف والأعمدة في البيانات
-            num_rows = len(summary_data) + 1  # +1 للعنوان
-            num_cols = len(summary_df.columns)
-            
-            # تنسيق الترويسات
-            for col_idx, column_name in enumerate(summary_df.columns, 1):
-                cell = summary_sheet.cell(title_row_offset, col_idx)
-                cell.value = column_name
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = header_alignment
-                cell.border = thin_border
-                
-                # ضبط عرض العمود
-                column_width = max(summary_df[column_name].astype(str).map(len).max(), len(column_name)) + 4
-                column_letter = get_column_letter(col_idx)
-                summary_sheet.column_dimensions[column_letter].width = column_width
-            
-            # تنسيق البيانات
-            for row_idx, row in enumerate(summary_data, 1):
-                is_total_row = row_idx == len(summary_data)
-                
-                for col_idx, (column_name, value) in enumerate(zip(summary_df.columns, row.values()), 1):
-                    cell = summary_sheet.cell(title_row_offset + row_idx, col_idx)
-                    cell.value = value
-                    
-                    # تنسيق خاص للصف الأخير (الإجمالي)
-                    if is_total_row:
-                        cell.font = total_row_font
-                        cell.fill = total_row_fill
-                        cell.border = thick_border
-                    else:
-                        cell.font = normal_font
-                        cell.border = thin_border
-                    
-                    # تنسيق خاص للأعمدة المالية
-                    if 'إجمالي' in column_name or column_name in ['الراتب الأساسي', 'البدلات', 'الخصومات', 'المكافآت', 'صافي الراتب']:
-                        cell.number_format = money_format
-                        cell.alignment = cell_alignment
-                    else:
-                        cell.alignment = text_alignment
-            
-            # إنشاء ورقة عمل مفصلة لكل قسم
-            for dept_name, dept_salaries in departments_data.items():
-                dept_df = pd.DataFrame(dept_salaries)
-                
-                # ترتيب الأعمدة بشكل منطقي
-                ordered_columns = [
-                    'معرف', 'اسم الموظف', 'رقم الموظف', 'الوظيفة', 'القسم',
-                    'الشهر', 'السنة', 'الراتب الأساسي', 'البدلات', 'الخصومات',
-                    'المكافآت', 'صافي الراتب', 'ملاحظات'
-                ]
-                
-                # إعادة ترتيب الأعمدة واستبعاد الأعمدة غير الموجودة
-                actual_columns = [col for col in ordered_columns if col in dept_df.columns]
-                dept_df = dept_df[actual_columns]
-                
-                # إضافة ورقة العمل للقسم
-                sheet_name = dept_name[:31]  # تقليص اسم الورقة إلى 31 حرف (أقصى طول مسموح في Excel)
-                dept_df.to_excel(writer, sheet_name=sheet_name, index=False, startrow=2)  # بدء من الصف الثالث لإتاحة مساحة للعنوان
-                
-                # الحصول على sheet وتنسيق عنوان القسم
-                dept_sheet = writer.sheets[sheet_name]
-                
-                # دمج الخلايا للعنوان
-                num_dept_cols = len(actual_columns)
-                dept_sheet.merge_cells(f'A1:{get_column_letter(num_dept_cols)}1')
-                title_cell = dept_sheet.cell(1, 1)
-                title_cell.value = f"تفاصيل رواتب قسم {dept_name}"
-                title_cell.font = Font(name="Arial", size=16, bold=True, color="1F4E78")
-                title_cell.alignment = title_alignment
-                
-                # تنسيق الترويسات
-                for col_idx, column_name in enumerate(actual_columns, 1):
-                    cell = dept_sheet.cell(3, col_idx)
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.alignment = header_alignment
-                    cell.border = thin_border
-                    
-                    # ضبط عرض العمود
-                    column_width = max(dept_df[column_name].astype(str).map(len).max(), len(column_name)) + 4
-                    column_letter = get_column_letter(col_idx)
-                    dept_sheet.column_dimensions[column_letter].width = column_width
-                
-                # تنسيق بيانات الموظفين
-                for row_idx in range(len(dept_df)):
-                    for col_idx, column_name in enumerate(actual_columns, 1):
-                        cell = dept_sheet.cell(row_idx + 4, col_idx)  # +4 للترويسة والعنوان
-                        
-                        # تنسيق خاص للخلايا المالية
-                        if column_name in ['الراتب الأساسي', 'البدلات', 'الخصومات', 'المكافآت', 'صافي الراتب']:
-                            cell.number_format = money_format
-                            cell.alignment = cell_alignment
-                        else:
-                            cell.alignment = text_alignment
-                        
-                        cell.font = normal_font
-                        cell.border = thin_border
-                
-                # إضافة صف للمجاميع في نهاية جدول القسم
-                total_row_idx = len(dept_df) + 4
-                dept_sheet.cell(total_row_idx, 1).value = "المجموع"
-                dept_sheet.cell(total_row_idx, 1).font = total_row_font
-                dept_sheet.cell(total_row_idx, 1).alignment = text_alignment
-                
-                # تنسيق صف المجموع وحساب المجاميع للأعمدة المالية
-                for col_idx, column_name in enumerate(actual_columns, 1):
-                    cell = dept_sheet.cell(total_row_idx, col_idx)
-                    cell.font = total_row_font
-                    cell.fill = total_row_fill
-                    cell.border = thick_border
-                    
-                    # حساب المجاميع للأعمدة المالية
-                    if column_name in ['الراتب الأساسي', 'البدلات', 'الخصومات', 'المكافآت', 'صافي الراتب']:
-                        col_letter = get_column_letter(col_idx)
-                        cell.value = f"=SUM({col_letter}4:{col_letter}{total_row_idx-1})"
-                        cell.number_format = money_format
-                        cell.alignment = cell_alignment
-                
-                # إضافة قواعد تنسيق شرطية للخلايا
-                # تلوين الخلايا ذات القيم السالبة باللون الأحمر
-                red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-                red_font = Font(color="9C0006")
-                
-                # تلوين الخلايا ذات القيم الموجبة باللون الأخضر
-                green_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-                green_font = Font(color="006100")
-                
-                # تطبيق التنسيق الشرطي على أعمدة المال
-                for col_idx, column_name in enumerate(actual_columns, 1):
-                    if column_name in ['الراتب الأساسي', 'البدلات', 'المكافآت', 'صافي الراتب']:
-                        col_letter = get_column_letter(col_idx)
-                        
-                        # قاعدة للقيم العالية (أعلى من المتوسط)
-                        high_rule = Rule(
-                            type="cellIs",
-                            operator="greaterThan",
-                            formula=[f"AVERAGE({col_letter}4:{col_letter}{total_row_idx-1})"],
-                            dxf=DifferentialStyle(fill=green_fill, font=green_font)
-                        )
-                        dept_sheet.conditional_formatting.add(f"{col_letter}4:{col_letter}{total_row_idx-1}", high_rule)
-                    
-                    elif column_name == 'الخصومات':
-                        col_letter = get_column_letter(col_idx)
-                        
-                        # قاعدة للخصومات العالية
-                        high_deduction_rule = Rule(
-                            type="cellIs",
-                            operator="greaterThan",
-                            formula=[f"AVERAGE({col_letter}4:{col_letter}{total_row_idx-1})"],
-                            dxf=DifferentialStyle(fill=red_fill, font=red_font)
-                        )
-                        dept_sheet.conditional_formatting.add(f"{col_letter}4:{col_letter}{total_row_idx-1}", high_deduction_rule)
-            
-            # إنشاء ورقة لجميع الرواتب
-            all_data = []
-            for dept_salaries in departments_data.values():
-                all_data.extend(dept_salaries)
-            
-            if all_data:
-                all_df = pd.DataFrame(all_data)
-                
-                # ترتيب الأعمدة بشكل منطقي
-                all_columns = [col for col in ordered_columns if col in all_df.columns]
-                all_df = all_df[all_columns]
-                
-                # إضافة ورقة كل الرواتب
-                all_df.to_excel(writer, sheet_name='جميع الرواتب', index=False, startrow=2)
-                
-                # تنسيق ورقة كل الرواتب
-                all_sheet = writer.sheets['جميع الرواتب']
-                
-                # دمج الخلايا للعنوان
-                num_all_cols = len(all_columns)
-                all_sheet.merge_cells(f'A1:{get_column_letter(num_all_cols)}1')
-                title_cell = all_sheet.cell(1, 1)
-                title_cell.value = "قائمة كاملة بالرواتب"
-                title_cell.font = Font(name="Arial", size=16, bold=True, color="1F4E78")
-                title_cell.alignment = title_alignment
-                
-                # تنسيق الترويسات
-                for col_idx, column_name in enumerate(all_columns, 1):
-                    cell = all_sheet.cell(3, col_idx)
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.alignment = header_alignment
-                    cell.border = thin_border
-                    
-                    # ضبط عرض العمود
-                    column_width = max(all_df[column_name].astype(str).map(len).max(), len(column_name)) + 4
-                    column_letter = get_column_letter(col_idx)
-                    all_sheet.column_dimensions[column_letter].width = column_width
-                
-                # تنسيق كافة البيانات
-                for row_idx in range(len(all_df)):
-                    for col_idx, column_name in enumerate(all_columns, 1):
-                        cell = all_sheet.cell(row_idx + 4, col_idx)  # +4 للترويسة والعنوان
-                        
-                        # تنسيق خاص للخلايا المالية
-                        if column_name in ['الراتب الأساسي', 'البدلات', 'الخصومات', 'المكافآت', 'صافي الراتب']:
-                            cell.number_format = money_format
-                            cell.alignment = cell_alignment
-                        else:
-                            cell.alignment = text_alignment
-                        
-                        # تمييز الصفوف بألوان متناوبة
-                        if row_idx % 2 == 0:
-                            cell.fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-                        
-                        cell.font = normal_font
-                        cell.border = thin_border
-                
-                # إضافة صف للمجاميع في نهاية الجدول
-                total_row_idx = len(all_df) + 4
-                all_sheet.cell(total_row_idx, 1).value = "المجموع الكلي"
-                all_sheet.cell(total_row_idx, 1).font = total_row_font
-                all_sheet.cell(total_row_idx, 1).alignment = text_alignment
-                
-                # تنسيق صف المجموع وحساب المجاميع للأعمدة المالية
-                for col_idx, column_name in enumerate(all_columns, 1):
-                    cell = all_sheet.cell(total_row_idx, col_idx)
-                    cell.font = total_row_font
-                    cell.fill = total_row_fill
-                    cell.border = thick_border
-                    
-                    # حساب المجاميع للأعمدة المالية
-                    if column_name in ['الراتب الأساسي', 'البدلات', 'الخصومات', 'المكافآت', 'صافي الراتب']:
-                        col_letter = get_column_letter(col_idx)
-                        cell.value = f"=SUM({col_letter}4:{col_letter}{total_row_idx-1})"
-                        cell.number_format = money_format
-                        cell.alignment = cell_alignment
-            
-            # إنشاء ورقة معلومات التقرير بتنسيق مميز
-            info_data = []
-            
-            # إضافة معلومات التصفية
-            if filter_description:
-                info_data.append({
-                    'المعلومة': 'مرشحات البحث',
-                    'القيمة': ' - '.join(filter_description)
+        cell_formats = {}
+        for striped in (False, True):
+            base = {'font_name': 'Arial', 'font_size': 11, 'border': 1, 'valign': 'vcenter'}
+            if striped:
+                base['bg_color'] = '#F2F2F2'
+            cell_formats[('text', striped)] = workbook.add_format(dict(base, align='right', text_wrap=True))
+            cell_formats[('money', striped)] = workbook.add_format(dict(base, align='center', num_format=money_format))
+        
+        total_text_format = workbook.add_format({
+            'font_name': 'Arial', 'font_size': 12, 'bold': True, 'bg_color': '#DDEBF7', 'border': 2,
+            'align': 'right', 'valign': 'vcenter', 'text_wrap': True
+        })
+        total_money_format = workbook.add_format({
+            'font_name': 'Arial', 'font_size': 12, 'bold': True, 'bg_color': '#DDEBF7', 'border': 2,
+            'align': 'center', 'valign': 'vcenter', 'num_format': money_format
+        })
+        green_format = workbook.add_format({'bg_color': '#C6EFCE', 'font_color': '#006100'})
+        red_format = workbook.add_format({'bg_color': '#FFC7CE', 'font_color': '#9C0006'})
+        
+        def write_row(worksheet, row, columns, values, striped=False):
+            for col_idx, (column_name, value) in enumerate(zip(columns, values)):
+                kind = 'money' if column_name in money_columns or 'إجمالي' in column_name else 'text'
+                worksheet.write(row, col_idx, value, cell_formats[(kind, striped)])
+        
+        def write_header(worksheet, row, columns):
+            for col_idx, column_name in enumerate(columns):
+                worksheet.write(row, col_idx, column_name, header_format)
+        
+        def write_totals_row(worksheet, row, columns, label, first_data_row):
+            # صف المجاميع في نهاية الجدول مع معادلات للأعمدة المالية
+            for col_idx, column_name in enumerate(columns):
+                if col_idx == 0:
+                    worksheet.write(row, col_idx, label, total_text_format)
+                elif column_name in money_columns:
+                    col_letter = xl_col_to_name(col_idx)
+                    worksheet.write_formula(row, col_idx, f"=SUM({col_letter}{first_data_row + 1}:{col_letter}{row})", total_money_format)
+                else:
+                    worksheet.write_blank(row, col_idx, None, total_text_format)
+        
+        # ======= ورقة الملخص =======
+        summary_columns = [
+            'القسم', 'عدد الموظفين', 'إجمالي الرواتب الأساسية', 'إجمالي البدلات',
+            'إجمالي الخصومات', 'إجمالي المكافآت', 'إجمالي صافي الرواتب'
+        ]
+        summary_data = [
+            [dept_name, t['count'], t['basic'], t['allowances'], t['deductions'], t['bonus'], t['net']]
+            for dept_name, t in departments_totals.items()
+        ]
+        summary_total = ['الإجمالي', total_salaries, total_basic, total_allowances, total_deductions, total_bonus, total_net]
+        
+        summary_sheet = workbook.add_worksheet('ملخص الرواتب')
+        summary_sheet.merge_range('A1:G1', "تقرير ملخص الرواتب", title_format)
+        
+        # إضافة معلومات الفلترة تحت العنوان
+        header_row = 1
+        if filter_description:
+            summary_sheet.merge_range('A2:G2', "مرشحات البحث: " + " - ".join(filter_description), filter_format)
+            header_row = 2
+        
+        write_header(summary_sheet, header_row, summary_columns)
+        summary_widths = ColumnWidths(summary_columns)
+        for row_idx, values in enumerate(summary_data, header_row + 1):
+            write_row(summary_sheet, row_idx, summary_columns, values)
+            summary_widths.update(values)
+        
+        # صف الإجمالي الكلي
+        total_row = header_row + 1 + len(summary_data)
+        for col_idx, value in enumerate(summary_total):
+            summary_sheet.write(total_row, col_idx, value, total_money_format if col_idx > 1 else total_text_format)
+        summary_widths.update(summary_total)
+        summary_widths.apply(summary_sheet)
+        
+        # ======= أوراق الأقسام وورقة جميع الرواتب =======
+        # البيانات تبدأ من الصف الرابع (بعد العنوان وسطر فارغ والترويسة)
+        first_data_row = 3
+        dept_sheets = {}
+        for dept_name, totals in departments_totals.items():
+            dept_sheet = workbook.add_worksheet(sheet_name(dept_name))
+            dept_sheet.merge_range(0, 0, 0, len(ordered_columns) - 1, f"تفاصيل رواتب قسم {dept_name}", title_format)
+            write_header(dept_sheet, 2, ordered_columns)
+            totals['widths'].apply(dept_sheet)
+            dept_sheets[dept_name] = [dept_sheet, first_data_row]
+        
+        all_sheet = None
+        if total_salaries:
+            all_sheet = workbook.add_worksheet('جميع الرواتب')
+            all_sheet.merge_range(0, 0, 0, len(ordered_columns) - 1, "قائمة كاملة بالرواتب", title_format)
+            write_header(all_sheet, 2, ordered_columns)
+            all_widths.apply(all_sheet)
+        
+        # المرور الثاني: كتابة الصفوف بالترتيب
+        all_row = first_data_row
+        for salary in stream_rows(salaries):
+            dept_name = department_label(salary)
+            row = salary_row(salary, dept_name)
+            
+            dept_sheet, dept_row = dept_sheets[dept_name]
+            write_row(dept_sheet, dept_row, ordered_columns, row)
+            dept_sheets[dept_name][1] += 1
+            
+            # تمييز الصفوف بألوان متناوبة
+            write_row(all_sheet, all_row, ordered_columns, row, striped=(all_row - first_data_row) % 2 == 0)
+            all_row += 1
+        
+        for dept_name, (dept_sheet, total_row) in dept_sheets.items():
+            write_totals_row(dept_sheet, total_row, ordered_columns, "المجموع", first_data_row)
+            
+            # تلوين القيم الأعلى من المتوسط: بالأخضر للمبالغ وبالأحمر للخصومات
+            for col_idx, column_name in enumerate(ordered_columns):
+                if column_name not in money_columns:
+                    continue
+                col_letter = xl_col_to_name(col_idx)
+                cell_range = f"{col_letter}{first_data_row + 1}:{col_letter}{total_row}"
+                dept_sheet.conditional_format(cell_range, {
+                    'type': 'cell',
+                    'criteria': '>',
+                    'value': f"AVERAGE({cell_range})",
+                    'format': red_format if column_name == 'الخصومات' else green_format
                 })
-            
-            # إضافة معلومات عامة
-            info_data.append({
-                'المعلومة': 'تاريخ التصدير',
-                'القيمة': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            })
-            
-            info_data.append({
-                'المعلومة': 'إجمالي عدد الرواتب',
-                'القيمة': len(salaries)
-            })
-            
-            info_data.append({
-                'المعلومة': 'عدد الأقسام',
-                'القيمة': len(departments_data)
-            })
-            
-            # إضافة إحصائيات عامة
-            info_data.append({
-                'المعلومة': 'متوسط صافي الراتب',
-                'القيمة': total_net / total_salaries if total_salaries > 0 else 0
-            })
-            
-            info_data.append({
-                'المعلومة': 'إجمالي مصاريف الرواتب',
-                'القيمة': total_net
-            })
-            
-            info_df = pd.DataFrame(info_data)
-            info_df.to_excel(writer, sheet_name='معلومات التقرير', index=False, startrow=2)
-            
-            # تنسيق ورقة المعلومات
-            info_sheet = writer.sheets['معلومات التقرير']
-            
-            # دمج الخلايا للعنوان
-            info_sheet.merge_cells('A1:B1')
-            title_cell = info_sheet.cell(1, 1)
-            title_cell.value = "معلومات التقرير"
-            title_cell.font = Font(name="Arial", size=16, bold=True, color="1F4E78")
-            title_cell.alignment = title_alignment
-            
-            # تنسيق الترويسات
-            for col_idx, column_name in enumerate(info_df.columns, 1):
-                cell = info_sheet.cell(3, col_idx)
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = header_alignment
-                cell.border = thin_border
-                
-                # ضبط عرض العمود
-                column_width = max(info_df[column_name].astype(str).map(len).max(), len(column_name)) + 4
-                column_letter = get_column_letter(col_idx)
-                info_sheet.column_dimensions[column_letter].width = column_width
-            
-            # تنسيق بيانات المعلومات
-            for row_idx in range(len(info_data)):
-                for col_idx, column_name in enumerate(info_df.columns, 1):
-                    cell = info_sheet.cell(row_idx + 4, col_idx)  # +4 للترويسة والعنوان
-                    
-                    # تنسيق خاص للقيم المالية
-                    if row_idx >= 4:  # الصفين الأخيرين (متوسط الراتب وإجمالي المصاريف)
-                        cell.number_format = money_format
-                    
-                    cell.alignment = text_alignment
-                    cell.font = normal_font
-                    cell.border = thin_border
-                    
-                    # تمييز الصفوف بألوان متناوبة
-                    if row_idx % 2 == 0:
-                        cell.fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-            
-            # تعيين الصفحة الأولى كصفحة نشطة
-            writer.book.active = writer.book.worksheets[0]
         
-        output.seek(0)
-        return output
+        if all_sheet is not None:
+            write_totals_row(all_sheet, all_row, ordered_columns, "المجموع الكلي", first_data_row)
+        
+        # ======= ورقة معلومات التقرير =======
+        info_data = []
+        
+        # إضافة معلومات التصفية
+        if filter_description:
+            info_data.append(['مرشحات البحث', ' - '.join(filter_description)])
+        
+        # إضافة معلومات عامة
+        info_data.append(['تاريخ التصدير', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
+        info_data.append(['إجمالي عدد الرواتب', total_salaries])
+        info_data.append(['عدد الأقسام', len(departments_totals)])
+        
+        # إضافة إحصائيات عامة (القيم المالية)
+        money_info = [
+            ['متوسط صافي الراتب', total_net / total_salaries if total_salaries > 0 else 0],
+            ['إجمالي مصاريف الرواتب', total_net]
+        ]
+        
+        info_columns = ['المعلومة', 'القيمة']
+        info_sheet = workbook.add_worksheet('معلومات التقرير')
+        info_sheet.merge_range('A1:B1', "معلومات التقرير", title_format)
+        write_header(info_sheet, 2, info_columns)
+        info_widths = ColumnWidths(info_columns)
+        for row_idx, values in enumerate(info_data + money_info):
+            kind = 'money' if row_idx >= len(info_data) else 'text'
+            striped = row_idx % 2 == 0
+            info_sheet.write(first_data_row + row_idx, 0, values[0], cell_formats[('text', striped)])
+            info_sheet.write(first_data_row + row_idx, 1, values[1], cell_formats[(kind, striped)])
+            info_widths.update(values)
+        info_widths.apply(info_sheet)
+        
+        # تعيين الصفحة الأولى كصفحة نشطة
+        summary_sheet.activate()
+        
+        return close_workbook(workbook, output)
     
     except Exception as e:
         raise Exception(f"خطأ في إنشاء ملف Excel: {str(e)}")
@@ -2138,20 +1698,21 @@ def export_attendance_by_department(employees, attendances, start_date, end_date
     حيث تكون معلومات الموظفين في الأعمدة الأولى
     وتواريخ الحضور في الأعمدة الباقية مع استخدام P للحضور
 
+    تُكتب الصفوف بشكل متدفق (وضع constant_memory) بحيث لا يُحمَّل في الذاكرة
+    أكثر من موظف واحد وسجلات حضوره في كل مرة.
+
     Args:
-        employees: قائمة بجميع الموظفين
-        attendances: قائمة بسجلات الحضور
+        employees: استعلام (أو قائمة) الموظفين مرتباً حسب الاسم ثم المعرف
+        attendances: استعلام (أو قائمة) سجلات الحضور (employee_id, date, status)
+            مرتباً بنفس ترتيب الموظفين ثم حسب التاريخ
         start_date: تاريخ البداية
         end_date: تاريخ النهاية (اختياري، إذا لم يتم تحديده سيتم استخدام تاريخ البداية فقط)
 
     Returns:
-        BytesIO: كائن يحتوي على ملف اكسل
+        ملف مؤقت يحتوي على ملف اكسل جاهز للإرسال
     """
     try:
-        output = BytesIO()
-        
-        # إنشاء ملف إكسل جديد باستخدام xlsxwriter
-        workbook = xlsxwriter.Workbook(output)
+        workbook, output = open_workbook()
         
         # تعريف التنسيقات
         header_format = workbook.add_format({
@@ -2180,12 +1741,6 @@ def export_attendance_by_department(employees, attendances, start_date, end_date
             'valign': 'vcenter'
         })
         
-        right_aligned_format = workbook.add_format({
-            'border': 1,
-            'align': 'right',
-            'valign': 'vcenter'
-        })
-        
         present_format = workbook.add_format({
             'border': 1,
             'align': 'center',
@@ -2216,6 +1771,14 @@ def export_attendance_by_department(employees, attendances, start_date, end_date
             'font_color': '#0070C0'  # اللون الأزرق لحرف S
         })
         
+        # رمز وتنسيق كل حالة حضور
+        status_cells = {
+            'present': ("P", present_format),
+            'absent': ("A", absent_format),
+            'leave': ("L", leave_format),
+            'sick': ("S", sick_format)
+        }
+        
         # تحديد الفترة الزمنية
         if end_date is None:
             end_date = start_date
@@ -2227,56 +1790,16 @@ def export_attendance_by_department(employees, attendances, start_date, end_date
             date_list.append(current_date)
             current_date += timedelta(days=1)
         
-        # تنظيم الموظفين حسب الأقسام
-        departments = {}
-        for employee in employees:
-            dept_name = ', '.join([dept.name for dept in employee.departments]) if employee.departments else 'بدون قسم'
-            if dept_name not in departments:
-                departments[dept_name] = []
-            departments[dept_name].append(employee)
-        
-        # تنظيم بيانات الحضور حسب الموظفين
-        attendance_data = {}
-        for attendance in attendances:
-            emp_id = attendance.employee_id
-            if emp_id not in attendance_data:
-                attendance_data[emp_id] = {}
-            
-            # تخزين حالة الحضور لهذا اليوم
-            attendance_data[emp_id][attendance.date] = {
-                'status': attendance.status
-            }
-        
         # عمل قائمة بأيام الأسبوع للعناوين
         weekdays = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
         
-        # إنشاء ورقة عمل لكل قسم
-        for dept_name, dept_employees in departments.items():
-            # تحويل الاسم ليكون صالحًا كاسم ورقة Excel
-            sheet_name = dept_name[:31]  # Excel يدعم حد أقصى 31 حرف لأسماء الأوراق
-            worksheet = workbook.add_worksheet(sheet_name)
-            
-            # تحديد أسماء الأعمدة الثابتة وترتيبها كما في الصورة
-            col_headers = ["Name", "ID Number", "Emp. No.", "Job Title", "No. Mobile", "Car", "Location", "Project", "Total"]
-            
-            # كتابة العناوين الرئيسية
-            for col_idx, header in enumerate(col_headers):
-                worksheet.write(1, col_idx, header, header_format)
-            
-            # كتابة عناوين أيام الأسبوع
-            first_date_col = len(col_headers)
-            
-            # إنشاء الصف الأول بعناوين أيام الأسبوع
-            for col_idx, date in enumerate(date_list):
-                # تنسيق عنوان اليوم ليظهر كما في الصورة المرفقة: يوم الأسبوع مع التاريخ (مثال: Mon 01/04/2025)
-                day_of_week = weekdays[date.weekday()]
-                date_str = date.strftime("%d/%m/%Y")
-                day_header = f"{day_of_week}\n{date_str}"
-                
-                col = first_date_col + col_idx
-                worksheet.write(0, col, day_header, date_header_format)
-                
-                # لم نعد بحاجة لكتابة التاريخ في صف منفصل لأننا دمجناه مع اسم اليوم
+        # تحديد أسماء الأعمدة الثابتة وترتيبها كما في الصورة
+        col_headers = ["Name", "ID Number", "Emp. No.", "Job Title", "No. Mobile", "Car", "Location", "Project", "Total"]
+        first_date_col = len(col_headers)
+        
+        def add_department_sheet(dept_name):
+            """إنشاء ورقة عمل للقسم مع صفي العناوين"""
+            worksheet = workbook.add_worksheet(sheet_name(dept_name))
             
             # ضبط عرض الأعمدة
             worksheet.set_column(0, 0, 30)  # عمود الاسم
@@ -2290,71 +1813,65 @@ def export_attendance_by_department(employees, attendances, start_date, end_date
             worksheet.set_column(8, 8, 8)   # عمود Total
             worksheet.set_column(first_date_col, first_date_col + len(date_list) - 1, 5)  # أعمدة التواريخ
             
-            # كتابة بيانات الموظفين وسجلات الحضور
-            for row_idx, employee in enumerate(sorted(dept_employees, key=lambda e: e.name)):
-                row = row_idx + 2  # صف البيانات (بعد صفي العناوين)
-                
-                # استخراج رقم الهاتف من المعلومات الإضافية إن وجد
-                phone_number = ""
-                if hasattr(employee, 'phone'):
-                    phone_number = employee.phone
-                
-                # كتابة معلومات الموظف
-                worksheet.write(row, 0, employee.name, normal_format)  # Name
-                worksheet.write(row, 1, employee.national_id or "", normal_format)  # ID Number
-                worksheet.write(row, 2, employee.employee_id or "", normal_format)  # Emp. No.
-                worksheet.write(row, 3, employee.job_title or "courier", normal_format)  # Job Title
-                worksheet.write(row, 4, phone_number, normal_format)  # No. Mobile
-                
-                # معلومات إضافية (قد تحتاج لتكييفها حسب هيكل البيانات الفعلي)
-                car = ""  # يمكن إضافة منطق لاستخراج رقم السيارة إن وجد
-                worksheet.write(row, 5, car, normal_format)  # Car
-                
-                # أحضر اسم الموقع من القسم
-                location = "AL QASSIM"  # قيمة افتراضية أو استخراجها من الموظف
-                if employee.departments:
-                    location = employee.departments[0].name[:20]  # استخدام اسم أول قسم كموقع
-                worksheet.write(row, 6, location, normal_format)  # Location
-                
-                # اسم المشروع
-                project = "ARAMEX"  # قيمة افتراضية، يمكن استخراجها من بيانات الموظف
-                worksheet.write(row, 7, project, normal_format)  # Project
-                
-                # عداد للحضور
-                present_days = 0
-                
-                # كتابة سجلات الحضور لكل يوم
-                for col_idx, date in enumerate(date_list):
-                    col = first_date_col + col_idx  # بداية أعمدة التواريخ
-                    cell_value = ""  # القيمة الافتراضية فارغة
-                    cell_format = normal_format
-                    
-                    if employee.id in attendance_data and date in attendance_data[employee.id]:
-                        att_data = attendance_data[employee.id][date]
-                        
-                        if att_data['status'] == 'present':
-                            cell_value = "P"  # استخدام حرف P للحضور
-                            cell_format = present_format
-                            present_days += 1
-                        elif att_data['status'] == 'absent':
-                            cell_value = "A"  # استخدام حرف A للغياب
-                            cell_format = absent_format
-                        elif att_data['status'] == 'leave':
-                            cell_value = "L"  # استخدام حرف L للإجازة
-                            cell_format = leave_format
-                        elif att_data['status'] == 'sick':
-                            cell_value = "S"  # استخدام حرف S للمرض
-                            cell_format = sick_format
-                    else:
-                        # إذا لم يوجد سجل لهذا اليوم، نفترض أنه حاضر (كما في الصورة المرفقة)
-                        cell_value = "P"
-                        cell_format = present_format
-                        present_days += 1
-                    
-                    worksheet.write(row, col, cell_value, cell_format)
-                
-                # كتابة إجمالي أيام الحضور
-                worksheet.write(row, 8, present_days, normal_format)  # Total
+            # الصف الأول: يوم الأسبوع مع التاريخ (مثال: Mon 01/04/2025)
+            for col_idx, date in enumerate(date_list):
+                day_header = f"{weekdays[date.weekday()]}\n{date.strftime('%d/%m/%Y')}"
+                worksheet.write(0, first_date_col + col_idx, day_header, date_header_format)
+            
+            # الصف الثاني: العناوين الرئيسية
+            for col_idx, header in enumerate(col_headers):
+                worksheet.write(1, col_idx, header, header_format)
+            
+            return worksheet
+        
+        # ورقة عمل لكل قسم مع رقم الصف التالي فيها (صفوف البيانات تبدأ بعد صفي العناوين)
+        sheets = {}
+        attendance_rows = stream_rows(attendances)
+        pending = next(attendance_rows, None)
+        
+        for employee in stream_rows(employees):
+            # سجلات حضور الموظف الحالي (السجلات مرتبة بنفس ترتيب الموظفين)
+            employee_days = {}
+            while pending is not None and pending.employee_id == employee.id:
+                employee_days[pending.date] = pending.status
+                pending = next(attendance_rows, None)
+            
+            dept_name = ', '.join([dept.name for dept in employee.departments]) if employee.departments else 'بدون قسم'
+            key = sheet_name(dept_name)
+            if key not in sheets:
+                sheets[key] = [add_department_sheet(dept_name), 2]
+            worksheet, row = sheets[key]
+            sheets[key][1] += 1
+            
+            # كتابة معلومات الموظف
+            worksheet.write(row, 0, employee.name, normal_format)  # Name
+            worksheet.write(row, 1, employee.national_id or "", normal_format)  # ID Number
+            worksheet.write(row, 2, employee.employee_id or "", normal_format)  # Emp. No.
+            worksheet.write(row, 3, employee.job_title or "courier", normal_format)  # Job Title
+            worksheet.write(row, 4, employee.mobile or "", normal_format)  # No. Mobile
+            worksheet.write(row, 5, "", normal_format)  # Car
+            
+            # أحضر اسم الموقع من القسم
+            location = "AL QASSIM"  # قيمة افتراضية أو استخراجها من الموظف
+            if employee.departments:
+                location = employee.departments[0].name[:20]  # استخدام اسم أول قسم كموقع
+            worksheet.write(row, 6, location, normal_format)  # Location
+            worksheet.write(row, 7, "ARAMEX", normal_format)  # Project
+            
+            # عداد للحضور
+            present_days = 0
+            
+            # كتابة سجلات الحضور لكل يوم
+            for col_idx, date in enumerate(date_list):
+                # إذا لم يوجد سجل لهذا اليوم، نفترض أنه حاضر (كما في الصورة المرفقة)
+                status = employee_days.get(date, 'present')
+                cell_value, cell_format = status_cells.get(status, ("", normal_format))
+                if status == 'present':
+                    present_days += 1
+                worksheet.write(row, first_date_col + col_idx, cell_value, cell_format)
+            
+            # كتابة إجمالي أيام الحضور
+            worksheet.write(row, 8, present_days, normal_format)  # Total
         
         # إضافة تفسير للرموز المستخدمة في صفحة منفصلة
         legend_sheet = workbook.add_worksheet('دليل الرموز')
@@ -2395,9 +1912,7 @@ def export_attendance_by_department(employees, attendances, start_date, end_date
         legend_sheet.write(5, 1, 'مرضي (Sick Leave)', description_format)
         
         # إغلاق الملف وإعادة المخرجات
-        workbook.close()
-        output.seek(0)
-        return output
+        return close_workbook(workbook, output)
     
     except Exception as e:
         import traceback
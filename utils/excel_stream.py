@@ -0,0 +1,84 @@
+"""
+محرك تصدير Excel المتدفق للتقارير الكبيرة (الحضور والرواتب)
+
+تُقرأ السجلات على دفعات من مؤشر الخادم (yield_per) وتُكتب صفاً بصف بوضع
+constant_memory في xlsxwriter، ويُجمَّع الملف في ملف مؤقت على القرص ثم يُرسل
+منه على أجزاء؛ فيبقى استهلاك الذاكرة ثابتاً مهما كان عدد الموظفين أو طول الفترة.
+
+ملاحظة: في وضع constant_memory يجب كتابة صفوف كل ورقة بترتيب تصاعدي، ويمكن
+التنقل بين الأوراق أثناء الكتابة.
+"""
+import tempfile
+import xlsxwriter
+from flask import send_file
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# عدد السجلات التي تُجلب من قاعدة البيانات في كل دفعة
+STREAM_BATCH_SIZE = 1000
+
+# أقصى طول لاسم ورقة العمل في Excel
+MAX_SHEET_NAME_LENGTH = 31
+
+
+def stream_rows(rows, batch_size=STREAM_BATCH_SIZE):
+    """
+    تكرار نتائج استعلام على دفعات من مؤشر الخادم، أو تكرار القائمة كما هي
+
+    :param rows: استعلام SQLAlchemy أو أي كائن قابل للتكرار
+    :param batch_size: عدد السجلات في كل دفعة
+    """
+    if hasattr(rows, 'yield_per'):
+        return iter(rows.execution_options(stream_results=True).yield_per(batch_size))
+    return iter(rows)
+
+
+def open_workbook():
+    """
+    إنشاء مصنف xlsxwriter بوضع الذاكرة الثابتة يُكتب في ملف مؤقت
+
+    :return: (workbook, output) حيث output ملف مؤقت يُحذف تلقائياً عند إغلاقه
+    """
+    output = tempfile.TemporaryFile(suffix='.xlsx')
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    return workbook, output
+
+
+def close_workbook(workbook, output):
+    """إغلاق المصنف وإرجاع الملف المؤقت جاهزاً للقراءة من بدايته"""
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+def sheet_name(name):
+    """اسم ورقة صالح في Excel (31 حرفاً كحد أقصى)"""
+    return name[:MAX_SHEET_NAME_LENGTH]
+
+
+def xlsx_response(output, download_name):
+    """
+    إرسال ملف Excel كتنزيل على أجزاء من الملف المؤقت دون تحميله في الذاكرة
+
+    :param output: الملف الناتج من close_workbook (أو أي كائن ملف)
+    :param download_name: اسم الملف عند التحميل
+    """
+    return send_file(output, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=download_name)
+
+
+class ColumnWidths:
+    """تتبع أطول قيمة في كل عمود لضبط عرض الأعمدة بعد الكتابة المتدفقة"""
+
+    def __init__(self, headers, padding=4):
+        self.padding = padding
+        self.widths = [len(str(header)) for header in headers]
+
+    def update(self, values):
+        for index, value in enumerate(values):
+            length = len(str(value)) if value is not None else 0
+            if length > self.widths[index]:
+                self.widths[index] = length
+
+    def apply(self, worksheet):
+        for index, width in enumerate(self.widths):
+            worksheet.set_column(index, index, width + self.padding)
@@ -5,8 +5,7 @@
 from io import BytesIO
 import os
 from datetime import datetime
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from fpdf import FPDF
 
 class ArabicPDF(FPDF):
@@ -64,10 +63,8 @@ class ArabicPDF(FPDF):
         try:
             # تحويل النص إلى سلسلة نصية للتأكد من أنه ليس رقم
             txt_str = str(txt)
-            # استخدام arabic_reshaper لتحويل النص العربي
-            reshaped_text = arabic_reshaper.reshape(txt_str)
-            # استخدام get_display لعكس اتجاه النص ليظهر بشكل صحيح
-            bidi_text = get_display(reshaped_text)
+            # تشكيل النص العربي وعكس اتجاهه ليظهر بشكل صحيح
+            bidi_text = shape_arabic(txt_str)
         except Exception as e:
             # في حالة حدوث أي خطأ في التحويل، استخدم النص الأصلي
             print(f"خطأ في تحويل النص العربي: {e}")
@@ -248,8 +245,8 @@ def generate_salary_notification_pdf(data):
 
         # إضافة عنوان محاذى للوسط
         title_y = pdf.get_y()
-        # استخدام get_display لضمان عرض النص العربي بشكل صحيح
-        pdf.cell(0, 10, get_display(arabic_reshaper.reshape("ملخص الراتب")), 0, 1, 'C')
+        # تشكيل النص العربي لضمان عرضه بشكل صحيح
+        pdf.cell(0, 10, shape_arabic("ملخص الراتب"), 0, 1, 'C')
         
         # خط أفقي تحت العنوان عبر الصفحة
         pdf.set_draw_color(*pdf.primary_color)
@@ -274,8 +271,8 @@ def generate_salary_notification_pdf(data):
         pdf.set_font('Arial', 'B', 12)
         
         # رسم رأس الجدول - لكن عكس ترتيب الأعمدة ليتناسب مع اللغة العربية
-        pdf.cell(float(amount_width), float(row_height), get_display(arabic_reshaper.reshape("المبلغ")), 1, 0, 'C', True)
-        pdf.cell(float(item_width), float(row_height), get_display(arabic_reshaper.reshape("البيان")), 1, 1, 'C', True)
+        pdf.cell(float(amount_width), float(row_height), shape_arabic("المبلغ"), 1, 0, 'C', True)
+        pdf.cell(float(item_width), float(row_height), shape_arabic("البيان"), 1, 1, 'C', True)
         
         # تنسيق الأرقام
         basic_salary_str = f"{basic_salary:.2f}"
@@ -315,7 +312,7 @@ def generate_salary_notification_pdf(data):
             # رسم الصف بشكل صحيح - ضبط كامل للمحاذاة
             pdf.set_xy(float(x_start), float(pdf.get_y()))
             pdf.cell(float(amount_width), float(row_height), item[1], 1, 0, 'C', fill)
-            pdf.cell(float(item_width), float(row_height), get_display(arabic_reshaper.reshape(item[0])), 1, 1, 'R', fill)
+            pdf.cell(float(item_width), float(row_height), shape_arabic(item[0]), 1, 1, 'R', fill)
         
         # إعادة ضبط نمط النص
         pdf.set_text_color(0, 0, 0)
@@ -334,7 +331,7 @@ def generate_salary_notification_pdf(data):
             # إطار للملاحظات
             pdf.rect(20.0, float(notes_y) + 5.0, 170.0, 20.0)
             pdf.set_xy(25.0, float(notes_y) + 10.0)
-            pdf.multi_cell(160.0, 5.0, get_display(arabic_reshaper.reshape(notes)), 0, 'R')
+            pdf.multi_cell(160.0, 5.0, shape_arabic(notes), 0, 'R')
         
         # التوقيعات
         signature_y = float(pdf.get_y()) + 30.0
@@ -344,9 +341,9 @@ def generate_salary_notification_pdf(data):
         pdf.set_xy(20.0, float(signature_y))
         pdf.set_font('Arial', 'B', 11)
         pdf.set_text_color(*pdf.secondary_color)
-        pdf.cell(50.0, 10.0, get_display(arabic_reshaper.reshape("توقيع الموظف")), 0, 0, 'C')
+        pdf.cell(50.0, 10.0, shape_arabic("توقيع الموظف"), 0, 0, 'C')
         pdf.cell(70.0, 10.0, "", 0, 0, 'C')  # فراغ في الوسط
-        pdf.cell(50.0, 10.0, get_display(arabic_reshaper.reshape("توقيع المدير المالي")), 0, 1, 'C')
+        pdf.cell(50.0, 10.0, shape_arabic("توقيع المدير المالي"), 0, 1, 'C')
         
         pdf.set_xy(20.0, float(pdf.get_y()))
         pdf.cell(50.0, 10.0, "________________", 0, 0, 'C')
@@ -428,7 +425,7 @@ def generate_salary_report_pdf(salaries_data, month_name, year):
         
         for i, header in reversed(list(enumerate(headers))):
             pdf.set_xy(float(x_pos), float(y_pos))
-            pdf.cell(float(col_widths[i]), 10.0, get_display(arabic_reshaper.reshape(header)), 1, 0, 'C', True)
+            pdf.cell(float(col_widths[i]), 10.0, shape_arabic(header), 1, 0, 'C', True)
             x_pos += float(col_widths[i])
         
         # بيانات الجدول
@@ -458,7 +455,7 @@ def generate_salary_report_pdf(salaries_data, month_name, year):
             for i, cell_data in reversed(list(enumerate(row_data))):
                 pdf.set_xy(float(x_pos), float(y_pos))
                 if i == 1 or i == 2:  # اسم الموظف والرقم الوظيفي
-                    text = get_display(arabic_reshaper.reshape(str(cell_data)))
+                    text = shape_arabic(str(cell_data))
                     align = 'R'
                 else:
                     text = str(cell_data)  # تحويل إلى نص بغض النظر عن النوع
@@ -488,7 +485,7 @@ def generate_salary_report_pdf(salaries_data, month_name, year):
         for i, cell_data in reversed(list(enumerate(summary_data))):
             pdf.set_xy(float(x_pos), float(y_pos))
             if i == 1:  # نص "المجموع"
-                text = get_display(arabic_reshaper.reshape(str(cell_data)))
+                text = shape_arabic(str(cell_data))
                 align = 'R'
             else:
                 text = str(cell_data)  # تحويل إلى نص بغض النظر عن النوع
@@ -550,8 +547,8 @@ def generate_salary_report_pdf(salaries_data, month_name, year):
         pdf.set_fill_color(*pdf.primary_color)
         pdf.set_text_color(255, 255, 255)  # لون أبيض للنص
         pdf.set_xy(float(summary_table_x), float(summary_y))
-        pdf.cell(float(col1_width), 10.0, get_display(arabic_reshaper.reshape(summary_headers[1])), 1, 0, 'C', True)
-        pdf.cell(float(col2_width), 10.0, get_display(arabic_reshaper.reshape(summary_headers[0])), 1, 1, 'C', True)
+        pdf.cell(float(col1_width), 10.0, shape_arabic(summary_headers[1]), 1, 0, 'C', True)
+        pdf.cell(float(col2_width), 10.0, shape_arabic(summary_headers[0]), 1, 1, 'C', True)
         
         # بيانات جدول الملخص
         pdf.set_text_color(0, 0, 0)  # إعادة النص للون الأسود
@@ -572,7 +569,7 @@ def generate_salary_report_pdf(salaries_data, month_name, year):
             # استخدام summary_table_x الذي تم تعريفه للجدول
             pdf.set_xy(float(summary_table_x), pdf.get_y())
             pdf.cell(float(col1_width), 10.0, item[1], 1, 0, 'C', fill)
-            pdf.cell(float(col2_width), 10.0, get_display(arabic_reshaper.reshape(item[0])), 1, 1, 'R', fill)
+            pdf.cell(float(col2_width), 10.0, shape_arabic(item[0]), 1, 1, 'R', fill)
         
         # معلومات التقرير - جعلها في عمود منفصل وواضح
         pdf.set_text_color(0, 0, 0)
@@ -6,8 +6,7 @@ import os
 import io
 from datetime import datetime
 from fpdf import FPDF
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 
 # تعريف مسار المجلد الحالي
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -72,8 +71,7 @@ class ProfessionalArabicPDF(FPDF):
         
         try:
             # إعادة تشكيل النص العربي وتحويله إلى النمط المناسب للعرض
-            reshaped_text = arabic_reshaper.reshape(txt)
-            bidi_text = get_display(reshaped_text)
+            bidi_text = shape_arabic(txt)
             return bidi_text
         except Exception as e:
             print(f"خطأ في معالجة النص العربي: {e}")
@@ -14,8 +14,7 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.platypus.flowables import Flowable
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from arabic_reshaper import reshape
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from reportlab.lib.units import mm
 
 def register_fonts():
@@ -75,10 +74,8 @@ def arabic_text(text):
     try:
         # تحويل النص إلى سلسلة أحرف
         text_str = str(text)
-        # إعادة تشكيل النص باستخدام arabic_reshaper
-        reshaped_text = reshape(text_str)
-        # تطبيق خوارزمية BIDI لدعم اتجاه الكتابة من اليمين إلى اليسار
-        bidi_text = get_display(reshaped_text)
+        # إعادة تشكيل النص وترتيب اتجاهه
+        bidi_text = shape_arabic(text_str)
         return bidi_text
     except Exception as e:
         print(f"خطأ في معالجة النص العربي: {str(e)}")
@@ -0,0 +1,111 @@
+"""
+توليد نسخ مصغرة من الصور المرفوعة (مصغرة للمعارض، متوسطة للعرض، للطباعة في PDF)
+
+تعمل هذه الوحدة داخل عمليات معالجة الصور (services/image_pipeline_service.py)
+ولا تعتمد على التطبيق أو قاعدة البيانات: تقرأ الصورة الأصلية من المجلد static،
+وتطبق اتجاه EXIF (صور الجوال)، وتكتب كل حجم بصيغتي WebP و JPEG تحت
+static/uploads/_derived/<الحجم>/ بنفس المسار النسبي للصورة الأصلية مضافاً إليه امتداد النسخة.
+"""
+import os
+import uuid
+from PIL import Image, ImageOps
+
+try:
+    from pillow_heif import register_heif_opener
+    # صور HEIC من الآيفون
+    register_heif_opener()
+except ImportError:
+    pass
+
+# الأحجام المولدة: الاسم -> أقصى طول للضلع الأكبر بالبكسل (من الأكبر إلى الأصغر)
+IMAGE_SIZES = {
+    'print': 2000,
+    'medium': 1024,
+    'thumb': 320
+}
+
+# مجلد النسخ المولدة نسبةً إلى المجلد static
+DERIVED_FOLDER = os.path.join('uploads', '_derived')
+
+DERIVED_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True})
+}
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'heic', 'heif', 'webp', 'bmp', 'tiff'}
+
+
+def is_image_path(path):
+    """هل امتداد الملف امتداد صورة يمكن توليد نسخ منها"""
+    return bool(path) and path.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+
+
+def derivative_relpath(relpath, size, fmt='webp'):
+    """
+    مسار النسخة المولدة نسبةً إلى المجلد static
+
+    يُبقى امتداد الأصل في الاسم (x.jpg.webp) حتى لا تكتب x.jpg و x.png في المجلد نفسه
+    فوق نسخ بعضهما.
+    """
+    return os.path.join(DERIVED_FOLDER, size, f'{relpath}.{fmt}')
+
+
+def _to_rgb(img):
+    """تحويل الصورة إلى RGB مع وضع الشفافية على خلفية بيضاء"""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def _save_atomic(img, path, fmt):
+    image_format, options = DERIVED_FORMATS[fmt]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        img.save(temp_path, image_format, **options)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def generate_derivatives(static_root, relpath):
+    """
+    توليد جميع أحجام الصورة
+
+    :param static_root: المسار المطلق للمجلد static
+    :param relpath: مسار الصورة الأصلية نسبةً إلى static
+    :return: قائمة مسارات النسخ المولدة (نسبةً إلى static)
+    """
+    source = os.path.join(static_root, relpath)
+    written = []
+    with Image.open(source) as original:
+        # تصغير أثناء فك ترميز JPEG (draft) يوفر معظم الوقت مع صور الجوال الكبيرة
+        largest = max(IMAGE_SIZES.values())
+        original.draft('RGB', (largest, largest))
+        img = _to_rgb(ImageOps.exif_transpose(original))
+
+        # كل حجم يُصغَّر من الحجم الأكبر السابق بدلاً من الأصل
+        for size, max_side in sorted(IMAGE_SIZES.items(), key=lambda item: -item[1]):
+            if img.width > max_side or img.height > max_side:
+                img = img.copy()
+                img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            for fmt in DERIVED_FORMATS:
+                target = derivative_relpath(relpath, size, fmt)
+                _save_atomic(img, os.path.join(static_root, target), fmt)
+                written.append(target)
+    return written
+
+
+def remove_derivatives(static_root, relpath):
+    """حذف النسخ المولدة لصورة (عند حذف الصورة الأصلية)"""
+    for size in IMAGE_SIZES:
+        for fmt in DERIVED_FORMATS:
+            path = os.path.join(static_root, derivative_relpath(relpath, size, fmt))
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,158 @@
+"""
+حفظ صور التواقيع ومخطط الأضرار المرسلة مع نموذج التسليم والاستلام
+
+يرسل النموذج كل توقيع ومخطط كجزء ملف ثنائي في multipart (يحفظه Werkzeug في ملف
+مؤقت عند كبر حجمه) فيُنسخ إلى مجلد الرفع على دفعات، ويبقى دعم القيمة القديمة
+(data URL بصيغة Base64 في حقل نصي) بفك تشفيرها على دفعات إلى الملف مباشرة؛ فلا
+تُحمَّل الصورة كاملة في الذاكرة في الحالتين.
+
+لكل جزء حد أقصى للحجم، والتواقيع تُحفظ باسم بصمة محتواها (SHA-256) فالتوقيع
+المتكرر نفسه لا يُكتب إلا مرة واحدة.
+"""
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import uuid
+from flask import current_app, request
+
+logger = logging.getLogger(__name__)
+
+# الحجم الافتراضي الأقصى لكل جزء بالبايت (يمكن تغييره من الإعدادات)
+DEFAULT_SIGNATURE_MAX_BYTES = 2 * 1024 * 1024
+DEFAULT_DIAGRAM_MAX_BYTES = 10 * 1024 * 1024
+
+# حجم الدفعة عند النسخ، وعدد أحرف Base64 المقابل (مضاعف 4)
+CHUNK_SIZE = 64 * 1024
+BASE64_CHUNK_CHARS = CHUNK_SIZE // 3 * 4
+
+# بداية الملف -> الامتداد، لقبول الصور فقط
+_IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+)
+
+
+class ImagePartTooLarge(ValueError):
+    """حجم التوقيع أو المخطط أكبر من الحد المسموح"""
+
+
+def _upload_folder(subfolder):
+    folder = os.path.join(current_app.static_folder, 'uploads', subfolder)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _image_extension(head):
+    for magic, ext in _IMAGE_SIGNATURES:
+        if head.startswith(magic):
+            return ext
+    # RIFF حاوية عامة (WAV و AVI أيضاً)، ونوعها في البايتات 8-12
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def _write_chunks(chunks, subfolder, max_bytes, dedupe):
+    """
+    كتابة الدفعات إلى ملف مؤقت مع حساب البصمة والحجم، ثم نقله إلى اسمه النهائي
+
+    :return: المسار النسبي داخل uploads، أو None إذا لم يكن المحتوى صورة
+    """
+    folder = _upload_folder(subfolder)
+    temp_path = os.path.join(folder, f'.{uuid.uuid4().hex}.part')
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    try:
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImagePartTooLarge(f'حجم الصورة أكبر من الحد المسموح ({max_bytes // 1024} كيلوبايت)')
+                if len(head) < 16:
+                    head += chunk[:16]
+                digest.update(chunk)
+                f.write(chunk)
+
+        ext = _image_extension(head)
+        if ext is None:
+            return None
+
+        if dedupe:
+            filename = f'{digest.hexdigest()}.{ext}'
+            file_path = os.path.join(folder, filename)
+            if os.path.exists(file_path):
+                return os.path.join(subfolder, filename)
+        else:
+            filename = f'{uuid.uuid4().hex}.{ext}'
+            file_path = os.path.join(folder, filename)
+        os.replace(temp_path, file_path)
+        return os.path.join(subfolder, filename)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _base64_chunks(encoded):
+    for start in range(0, len(encoded), BASE64_CHUNK_CHARS):
+        yield base64.b64decode(encoded[start:start + BASE64_CHUNK_CHARS])
+
+
+def _stream_chunks(stream):
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def store_base64_image(data_url, subfolder, max_bytes=DEFAULT_DIAGRAM_MAX_BYTES, dedupe=False):
+    """
+    حفظ صورة من data URL بصيغة Base64 بفك تشفيرها على دفعات
+
+    :return: المسار النسبي داخل uploads، أو None إذا كانت القيمة فارغة أو غير صالحة
+    """
+    if not data_url or not data_url.startswith('data:image/'):
+        return None
+    encoded = data_url.partition(',')[2]
+    if not encoded:
+        return None
+    # رفض الحجم الزائد قبل فك التشفير (كل 4 أحرف = 3 بايت)
+    if len(encoded) // 4 * 3 > max_bytes + 2:
+        raise ImagePartTooLarge(f'حجم الصورة أكبر من الحد المسموح ({max_bytes // 1024} كيلوبايت)')
+    try:
+        return _write_chunks(_base64_chunks(encoded), subfolder, max_bytes, dedupe)
+    except binascii.Error as e:
+        logger.warning(f"بيانات Base64 غير صالحة للصورة في {subfolder}: {str(e)}")
+        return None
+
+
+def store_image_file(file, subfolder, max_bytes=DEFAULT_DIAGRAM_MAX_BYTES, dedupe=False):
+    """حفظ صورة من جزء ملف في multipart (FileStorage) بنسخها على دفعات"""
+    if not file:
+        return None
+    return _write_chunks(_stream_chunks(file.stream), subfolder, max_bytes, dedupe)
+
+
+def save_image_part(field_name, subfolder, signature=False):
+    """
+    حفظ توقيع أو مخطط من الطلب الحالي سواء أُرسل كجزء ملف أو كـ data URL
+
+    :param field_name: اسم الحقل في النموذج (مثل supervisor_signature_data)
+    :param subfolder: المجلد داخل uploads (signatures أو diagrams)
+    :param signature: التواقيع تُحفظ باسم بصمة المحتوى وتُشارك بين السجلات
+    :return: المسار النسبي داخل uploads، أو None إذا لم يُرسل الحقل
+    """
+    if signature:
+        max_bytes = current_app.config.get('HANDOVER_SIGNATURE_MAX_BYTES') or DEFAULT_SIGNATURE_MAX_BYTES
+    else:
+        max_bytes = current_app.config.get('HANDOVER_DIAGRAM_MAX_BYTES') or DEFAULT_DIAGRAM_MAX_BYTES
+
+    file = request.files.get(field_name)
+    if file and file.filename:
+        return store_image_file(file, subfolder, max_bytes, dedupe=signature)
+    return store_base64_image(request.form.get(field_name), subfolder, max_bytes, dedupe=signature)
@@ -16,8 +16,7 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.enums import TA_RIGHT, TA_CENTER, TA_LEFT
 from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas
-from arabic_reshaper import reshape
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 
 def register_fonts():
     """تسجيل الخطوط العربية للتقارير بطريقة صحيحة"""
@@ -129,12 +128,8 @@ def arabic_text(text):
         if not any('\u0600' <= c <= '\u06FF' for c in text_str):
             return text_str
         
-        # معالجة النص العربي بالطريقة الصحيحة
-        # إعادة تشكيل النص أولاً
-        reshaped_text = reshape(text_str)
-        
-        # تطبيق خوارزمية البيدي للاتجاه الصحيح من اليمين لليسار
-        bidi_text = get_display(reshaped_text, base_dir='R')
+        # إعادة تشكيل النص وتطبيق خوارزمية البيدي للاتجاه الصحيح من اليمين لليسار
+        bidi_text = shape_arabic(text_str, base_dir='R')
         
         return bidi_text
         
@@ -142,8 +137,7 @@ def arabic_text(text):
         print(f"خطأ في معالجة النص العربي: {str(e)}")
         # في حالة الفشل، نحاول طريقة بسيطة
         try:
-            reshaped_text = reshape(text_str)
-            return get_display(reshaped_text)
+            return shape_arabic(text_str)
         except:
             return str(text)
 
@@ -0,0 +1,33 @@
+"""
+ترميز مؤشرات الصفحات (keyset pagination) كنص آمن للروابط
+
+المؤشر هو قيم أعمدة الترتيب لآخر صف في الصفحة (وآخرها المعرف لفك التعادل)،
+ويُستخدم في الصفحة التالية كشرط مقارنة على هذه الأعمدة بدلاً من OFFSET.
+"""
+import base64
+import json
+from datetime import date
+
+
+def encode_cursor(*values):
+    """ترميز قيم الترتيب لآخر صف في الصفحة كنص آمن للروابط (التواريخ بصيغة ISO)"""
+    values = [value.isoformat() if isinstance(value, date) else value for value in values]
+    payload = json.dumps(values, ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+
+def decode_cursor(cursor, *converters):
+    """
+    فك ترميز المؤشر
+
+    :param cursor: النص الناتج عن encode_cursor
+    :param converters: دالة تحويل لكل قيمة بنفس الترتيب (مثل str أو int أو date.fromisoformat)
+    :return: صف القيم بعد التحويل، أو None إذا كان المؤشر غير صالح
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(converters):
+            return None
+        return tuple(convert(value) for convert, value in zip(converters, values))
+    except (ValueError, TypeError):
+        return None
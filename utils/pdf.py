@@ -10,8 +10,7 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.units import cm
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 
 # تسجيل الخطوط المستخدمة
 def register_fonts():
@@ -75,8 +74,7 @@ def arabic_text(text):
     if not text:
         return ""
     
-    reshaped_text = arabic_reshaper.reshape(str(text))
-    bidi_text = get_display(reshaped_text)
+    bidi_text = shape_arabic(str(text))
     return bidi_text
 
 # إنشاء ملف PDF
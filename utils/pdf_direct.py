@@ -4,8 +4,7 @@
 """
 import os
 from io import BytesIO
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib import colors
@@ -53,9 +52,7 @@ def reshape_arabic_text(text):
         return ""
     try:
         # تشكيل النص العربي
-        reshaped_text = arabic_reshaper.reshape(str(text))
-        # عكس النص لدعم اللغة العربية (من اليمين إلى اليسار)
-        bidi_text = get_display(reshaped_text)
+        bidi_text = shape_arabic(str(text))
         return bidi_text
     except Exception as e:
         print(f"Error reshaping text: {str(e)}")
@@ -26,8 +26,7 @@ def generate_salary_report_pdf(salaries, month, year, department_name, totals):
         from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
         from reportlab.pdfbase import pdfmetrics
         from reportlab.pdfbase.ttfonts import TTFont
-        import arabic_reshaper
-        from bidi.algorithm import get_display
+        from utils.arabic_shaping import shape_arabic
         from utils.date_converter import get_month_name_ar
         
         # التأكد من تحويل الشهر والسنة إلى قيم عددية
@@ -87,7 +86,7 @@ def generate_salary_report_pdf(salaries, month, year, department_name, totals):
         
         # إضافة اسم الشركة
         company_name = "نُظم - نظام إدارة متكامل"
-        company_name = get_display(arabic_reshaper.reshape(company_name))
+        company_name = shape_arabic(company_name)
         company_style = ParagraphStyle(
             name='CompanyTitle',
             parent=styles['Title'],
@@ -102,13 +101,13 @@ def generate_salary_report_pdf(salaries, month, year, department_name, totals):
         # إضافة العنوان
         title = f"كشف رواتب شهر {get_month_name_ar(month)} {year} - {department_name}"
         # تهيئة النص العربي للعرض في PDF
-        title = get_display(arabic_reshaper.reshape(title))
+        title = shape_arabic(title)
         elements.append(Paragraph(title, title_style))
         elements.append(Spacer(1, 20))
         
         # إضافة تاريخ التقرير
         date_text = f"تاريخ التقرير: {datetime.now().strftime('%Y-%m-%d')}"
-        date_text = get_display(arabic_reshaper.reshape(date_text))
+        date_text = shape_arabic(date_text)
         elements.append(Paragraph(date_text, arabic_style))
         elements.append(Spacer(1, 20))
         
@@ -117,7 +116,7 @@ def generate_salary_report_pdf(salaries, month, year, department_name, totals):
         data = []
         
         # إضافة الرؤوس
-        headers_display = [get_display(arabic_reshaper.reshape(h)) for h in headers]
+        headers_display = [shape_arabic(h) for h in headers]
         data.append(headers_display)
         
         # إضافة بيانات الرواتب
@@ -125,7 +124,7 @@ def generate_salary_report_pdf(salaries, month, year, department_name, totals):
             if salary_item['has_salary']:
                 employee = salary_item['employee']
                 row = [
-                    get_display(arabic_reshaper.reshape(employee.name)),
+                    shape_arabic(employee.name),
                     employee.employee_id,
                     f"{salary_item['basic_salary']:.2f}",
                     f"{salary_item['allowances']:.2f}",
@@ -168,17 +167,17 @@ def generate_salary_report_pdf(salaries, month, year, department_name, totals):
             # إضافة صف الإجماليات
             elements.append(Spacer(1, 20))
             totals_text = f"الإجماليات: الراتب الأساسي: {totals['basic']:.2f} - البدلات: {totals['allowances']:.2f} - الخصومات: {totals['deductions']:.2f} - المكافآت: {totals['bonus']:.2f} - صافي الرواتب: {totals['net']:.2f}"
-            totals_text = get_display(arabic_reshaper.reshape(totals_text))
+            totals_text = shape_arabic(totals_text)
             elements.append(Paragraph(totals_text, arabic_style))
         else:
             no_data_text = "لا توجد بيانات رواتب لهذه الفترة"
-            no_data_text = get_display(arabic_reshaper.reshape(no_data_text))
+            no_data_text = shape_arabic(no_data_text)
             elements.append(Paragraph(no_data_text, arabic_style))
         
         # إضافة معلومات التقرير في أسفل الصفحة
         elements.append(Spacer(1, 20))
         footer_text = f"تاريخ إنشاء التقرير: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-        footer_text = get_display(arabic_reshaper.reshape(footer_text))
+        footer_text = shape_arabic(footer_text)
         elements.append(Paragraph(footer_text, arabic_style))
         
         # بناء المستند
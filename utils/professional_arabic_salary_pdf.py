@@ -5,8 +5,7 @@
 
 from fpdf import FPDF
 from datetime import datetime
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 import os
 from io import BytesIO
 
@@ -60,8 +59,7 @@ class ProfessionalArabicSalaryPDF(FPDF):
                 return ""
             text_str = str(text)
             # تحويل النص العربي
-            reshaped_text = arabic_reshaper.reshape(text_str)
-            bidi_text = get_display(reshaped_text)
+            bidi_text = shape_arabic(text_str)
             return bidi_text
         except Exception:
             return str(text) if text else ""
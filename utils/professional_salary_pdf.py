@@ -5,8 +5,7 @@
 
 from fpdf import FPDF
 from datetime import datetime
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from io import BytesIO
 import os
 
@@ -22,8 +21,7 @@ class ProfessionalSalaryPDF(FPDF):
         if not text:
             return ""
         try:
-            reshaped_text = arabic_reshaper.reshape(str(text))
-            return get_display(reshaped_text)
+            return shape_arabic(str(text))
         except:
             return str(text)
     
@@ -42,7 +42,10 @@ def generate_batch_salary_notifications(department_id=None, month=None, year=Non
     Returns:
         قائمة بأسماء الموظفين الذين تم إنشاء إشعارات لهم
     """
+    from sqlalchemy.orm import joinedload
     from models import Salary, Employee
+    from services.pdf_cache_service import PdfCacheService
+    from services.pdf_render_service import PdfRenderService
     
     # التأكد من تحويل البيانات إلى النوع المناسب
     month = int(month) if month is not None and not isinstance(month, int) else month
@@ -59,19 +62,22 @@ def generate_batch_salary_notifications(department_id=None, month=None, year=Non
         salary_query = salary_query.filter(Salary.employee_id.in_(employee_ids))
         
     # تنفيذ الاستعلام
-    salaries = salary_query.all()
+    salaries = salary_query.options(joinedload(Salary.employee)).all()
+    salaries_by_id = {salary.id: salary for salary in salaries}
     
     # قائمة بأسماء الموظفين الذين تم إنشاء إشعارات لهم
     processed_employees = []
     
-    # إنشاء إشعار لكل موظف
-    for salary in salaries:
-        try:
-            # إنشاء إشعار وإضافة اسم الموظف إلى القائمة
-            generate_salary_notification_pdf(salary)
-            processed_employees.append(salary.employee.name)
-        except Exception as e:
+    # إنشاء الإشعارات موزعة على عمليات التوليد، وتخزينها ليُرسل الملف مباشرة عند طلبه
+    for salary_id, pdf, error in PdfRenderService.render_many('salary_notification', list(salaries_by_id)):
+        salary = salaries_by_id[salary_id]
+        if error is not None or not pdf:
             # تسجيل الخطأ
-            print(f"خطأ في إنشاء إشعار للموظف {salary.employee.name}: {str(e)}")
+            print(f"خطأ في إنشاء إشعار للموظف {salary.employee.name}: {str(error)}")
+            continue
+        key = PdfCacheService.cache_key('salary_notification', salary.id,
+                                        (salary.updated_at, salary.employee.updated_at))
+        PdfCacheService.get_or_render('salary', salary.id, key, lambda: pdf)
+        processed_employees.append(salary.employee.name)
             
-    return processed_employees
\ No newline at end of file
+    return processed_employees
@@ -5,8 +5,7 @@
 # salary_pdf_generator.py
 from fpdf import FPDF
 from datetime import datetime
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 import os
 from io import BytesIO
 
@@ -33,7 +32,7 @@ class SalaryPDF(FPDF):
         
 
     def reshape(self, text):
-        return get_display(arabic_reshaper.reshape(str(text)))
+        return shape_arabic(str(text))
 
     def header(self):
         # Header - ترويسة الصفحة مع الشعار والألوان
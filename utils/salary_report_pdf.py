@@ -7,8 +7,7 @@ from reportlab.lib import colors
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.units import inch
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from datetime import datetime
 
 # --- !!! هام جداً !!! ---
@@ -34,8 +33,7 @@ def arabic_text(text):
     """يعالج النص العربي للعرض الصحيح في PDF."""
     if not text:
         return ""
-    reshaped_text = arabic_reshaper.reshape(str(text))
-    bidi_text = get_display(reshaped_text)
+    bidi_text = shape_arabic(str(text))
     return bidi_text
 
 def generate_salary_report_pdf(salaries, report_params=None):
@@ -12,8 +12,7 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 
 # تسجيل الخطوط العربية
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -45,8 +44,7 @@ def get_arabic_text(text):
     
     try:
         # إعادة تشكيل النص العربي وترتيبه بشكل صحيح
-        reshaped_text = arabic_reshaper.reshape(str(text))
-        bidi_text = get_display(reshaped_text)
+        bidi_text = shape_arabic(str(text))
         return bidi_text
     except Exception as e:
         import logging
@@ -5,8 +5,7 @@
 
 from fpdf import FPDF
 from datetime import datetime
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 from io import BytesIO
 
 class SimpleSalaryPDF(FPDF):
@@ -22,8 +21,7 @@ class SimpleSalaryPDF(FPDF):
             return ""
         try:
             # تجربة تشكيل النص العربي
-            reshaped_text = arabic_reshaper.reshape(str(text))
-            return get_display(reshaped_text)
+            return shape_arabic(str(text))
         except:
             # في حالة فشل التشكيل، إرجاع النص كما هو
             return str(text)
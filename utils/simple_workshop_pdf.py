@@ -14,8 +14,7 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
 
 # استيراد المكتبات اللازمة للغة العربية
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 
 def arabic_text(text):
     """تحويل النص العربي ليعرض بشكل صحيح في PDF"""
@@ -23,8 +22,7 @@ def arabic_text(text):
         return ""
     text = str(text)
     try:
-        reshaped_text = arabic_reshaper.reshape(text)
-        bidi_text = get_display(reshaped_text)
+        bidi_text = shape_arabic(text)
         return bidi_text
     except Exception as e:
         import logging
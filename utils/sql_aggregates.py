@@ -0,0 +1,9 @@
+"""
+تعبيرات تجميع SQL مشتركة بين خدمات الإحصائيات
+"""
+from sqlalchemy import case, func
+
+
+def count_when(condition):
+    """عدّ الصفوف التي يتحقق فيها الشرط داخل التجميع (0 إذا لم توجد صفوف)"""
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
@@ -5,6 +5,7 @@ from typing import Dict, List, Optional, Tuple, Union
 from app import db
 from flask import abort, flash, g
 from models import Module, Permission, User, UserPermission, UserRole, Employee
+from services.permission_cache_service import PermissionCacheService
 from utils.audit_helpers import log_create, log_update, log_delete
 
 # إعداد التسجيل
@@ -271,6 +272,7 @@ def update_user(
         if update_permissions and old_role != role:
             # حذف الصلاحيات الحالية
             UserPermission.query.filter_by(user_id=user.id).delete()
+            PermissionCacheService.bump_version(user.id)
             db.session.commit()
             
             # إنشاء صلاحيات جديدة إذا لم يكن المستخدم مديرًا
@@ -369,6 +371,7 @@ def update_user_permissions(user_id: int, permissions_data: Dict[str, int]) -> L
     
     # حذف الصلاحيات الحالية
     UserPermission.query.filter_by(user_id=user.id).delete()
+    PermissionCacheService.bump_version(user.id)
     db.session.commit()
     
     permissions = []
@@ -426,11 +429,7 @@ def check_module_access(user: User, module: Module, permission: int = Permission
         return True
     
     # البحث عن صلاحيات الوحدة
-    for user_permission in user.permissions:
-        if user_permission.module == module:
-            return bool(user_permission.permissions & permission)
-    
-    return False
+    return bool(user.permission_map.get(module, 0) & permission)
 
 def require_module_access(module: Module, permission: int = Permission.VIEW):
     """
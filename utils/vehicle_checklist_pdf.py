@@ -12,8 +12,7 @@ from reportlab.platypus import Table, TableStyle
 from reportlab.lib.units import inch
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-import arabic_reshaper
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 
 def setup_arabic_font():
     """إعداد الخط العربي"""
@@ -35,9 +34,7 @@ def process_arabic_text(text):
     
     try:
         # تشكيل النص العربي
-        reshaped_text = arabic_reshaper.reshape(str(text))
-        # ترتيب النص من اليمين لليسار
-        bidi_text = get_display(reshaped_text)
+        bidi_text = shape_arabic(str(text))
         return bidi_text
     except:
         return str(text)
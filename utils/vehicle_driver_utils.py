@@ -1,109 +1,123 @@
 """وظائف مساعدة لإدارة السائقين المحسنة"""
 
+from sqlalchemy import func, or_, select
 from models import VehicleHandover, OperationRequest, Vehicle, Employee
 from app import db
 
 
+# أنواع سجلات التسليم التي تحدد السائق الحالي
+DELIVERY_HANDOVER_TYPES = ['delivery', 'تسليم', 'handover']
+
+# أنواع سجلات الاستلام (إرجاع السيارة)
+RETURN_HANDOVER_TYPES = ['return', 'استلام', 'receive']
+
+
+def official_handover_condition():
+    """
+    شرط السجلات "الرسمية" لجدول التسليم والاستلام
+
+    السجل يعتبر رسمياً إذا تمت الموافقة على طلب العملية المرتبط به،
+    أو إذا كان قديماً (ليس له طلب عملية أصلاً).
+    """
+    handover_requests = select(OperationRequest.id).where(
+        OperationRequest.operation_type == 'handover',
+        OperationRequest.vehicle_id == VehicleHandover.vehicle_id,
+        OperationRequest.related_record_id == VehicleHandover.id
+    )
+    return or_(
+        handover_requests.where(OperationRequest.status == 'approved').exists(),
+        ~handover_requests.exists()
+    )
+
+
+def _latest_delivery_subquery(vehicle_ids=None, approved_only=False):
+    """
+    استعلام فرعي يرتب سجلات التسليم لكل سيارة (الأحدث أولاً) باستخدام ROW_NUMBER
+
+    الصف رقم 1 لكل سيارة هو آخر سجل تسليم لها.
+    """
+    row_number = func.row_number().over(
+        partition_by=VehicleHandover.vehicle_id,
+        order_by=(
+            VehicleHandover.handover_date.desc(),
+            VehicleHandover.handover_time.desc().nulls_last(),
+            VehicleHandover.id.desc()
+        )
+    ).label('row_number')
+
+    ranked = db.session.query(
+        VehicleHandover.vehicle_id.label('vehicle_id'),
+        VehicleHandover.employee_id.label('employee_id'),
+        row_number
+    ).filter(
+        VehicleHandover.handover_type.in_(DELIVERY_HANDOVER_TYPES)
+    )
+
+    if vehicle_ids is not None:
+        ranked = ranked.filter(VehicleHandover.vehicle_id.in_(set(vehicle_ids)))
+
+    if approved_only:
+        # إما أن يكون السجل معتمد، أو لا يوجد له operation request (سجل قديم)
+        ranked = ranked.filter(official_handover_condition())
+
+    return ranked.subquery()
+
+
+def get_vehicles_current_employee_ids(vehicle_ids=None, approved_only=False):
+    """
+    الحصول على معرف الموظف الحالي لمجموعة من السيارات باستعلام واحد
+
+    :param vehicle_ids: قائمة معرفات السيارات (None لجميع السيارات)
+    :param approved_only: اعتماد السجلات المعتمدة فقط (أو القديمة التي ليس لها طلب عملية)
+    :return: قاموس {vehicle_id: employee_id}
+    """
+    if vehicle_ids is not None and not vehicle_ids:
+        return {}
+
+    ranked = _latest_delivery_subquery(vehicle_ids, approved_only)
+    rows = db.session.query(ranked.c.vehicle_id, ranked.c.employee_id).filter(
+        ranked.c.row_number == 1
+    ).all()
+
+    return {vehicle_id: employee_id for vehicle_id, employee_id in rows if employee_id}
+
+
+def get_vehicles_current_employees(vehicle_ids=None, approved_only=False):
+    """
+    الحصول على كائن الموظف الحالي لمجموعة من السيارات باستعلام واحد
+
+    :return: قاموس {vehicle_id: Employee}
+    """
+    if vehicle_ids is not None and not vehicle_ids:
+        return {}
+
+    ranked = _latest_delivery_subquery(vehicle_ids, approved_only)
+    rows = db.session.query(ranked.c.vehicle_id, Employee).join(
+        Employee, Employee.id == ranked.c.employee_id
+    ).filter(
+        ranked.c.row_number == 1
+    ).all()
+
+    return {vehicle_id: employee for vehicle_id, employee in rows}
+
+
 def get_vehicle_current_employee_id_approved(vehicle_id):
     """الحصول على معرف الموظف الحالي للسيارة باستخدام السجلات المعتمدة"""
     try:
-        # استخدام نفس منطق الفلترة المستخدم في view
-        approved_handover_ids = []
-        approved_operations = OperationRequest.query.filter_by(
-            vehicle_id=vehicle_id, 
-            operation_type='handover',
-            status='approved'
-        ).all()
-        
-        for operation in approved_operations:
-            approved_handover_ids.append(operation.related_record_id)
-        
-        all_handover_operations = OperationRequest.query.filter_by(
-            vehicle_id=vehicle_id, 
-            operation_type='handover'
-        ).all()
-        all_handover_operation_ids = [op.related_record_id for op in all_handover_operations]
-        
-        # جلب آخر سجل تسليم معتمد
-        latest_delivery = VehicleHandover.query.filter(
-            VehicleHandover.vehicle_id == vehicle_id,
-            VehicleHandover.handover_type.in_(['delivery', 'تسليم', 'handover']),
-            # إما أن يكون السجل معتمد، أو لا يوجد له operation request (سجل قديم)
-            (VehicleHandover.id.in_(approved_handover_ids)) | 
-            (~VehicleHandover.id.in_(all_handover_operation_ids))
-        ).order_by(VehicleHandover.handover_date.desc()).first()
-
-        if latest_delivery and latest_delivery.employee_id:
-            return latest_delivery.employee_id
-        return None
-        
+        return get_vehicles_current_employee_ids([vehicle_id], approved_only=True).get(vehicle_id)
     except Exception as e:
         print(f"خطأ في الحصول على معرف الموظف الحالي: {e}")
         return None
 
 
 def update_vehicle_driver_approved(vehicle_id):
-    """تحديث اسم السائق في جدول السيارات بناءً على آخر سجل تسليم معتمد"""
-    try:
-        # جلب السجلات المعتمدة فقط مثلما نفعل في دالة view  
-        
-        # جلب operation IDs المعتمدة للتسليم والاستلام
-        approved_handover_ids = []
-        approved_operations = OperationRequest.query.filter_by(
-            vehicle_id=vehicle_id, 
-            operation_type='handover',
-            status='approved'
-        ).all()
-        
-        for operation in approved_operations:
-            approved_handover_ids.append(operation.related_record_id)
-        
-        # جلب جميع operation requests للمركبة من نوع handover
-        all_handover_operations = OperationRequest.query.filter_by(
-            vehicle_id=vehicle_id, 
-            operation_type='handover'
-        ).all()
-        all_handover_operation_ids = [op.related_record_id for op in all_handover_operations]
-        
-        # جلب سجلات التسليم المعتمدة فقط
-        delivery_records = VehicleHandover.query.filter(
-            VehicleHandover.vehicle_id == vehicle_id,
-            VehicleHandover.handover_type.in_(['delivery', 'تسليم', 'handover']),
-            # إما أن يكون السجل معتمد، أو لا يوجد له operation request (سجل قديم)
-            (VehicleHandover.id.in_(approved_handover_ids)) | 
-            (~VehicleHandover.id.in_(all_handover_operation_ids))
-        ).order_by(VehicleHandover.handover_date.desc()).all()
-
-        if delivery_records:
-            # أخذ أحدث سجل تسليم (delivery) معتمد
-            latest_delivery = delivery_records[0]
-
-            # تحديد اسم السائق (إما من جدول الموظفين أو من اسم الشخص المدخل يدوياً)
-            driver_name = None
-            if latest_delivery.employee_id:
-                employee = Employee.query.get(latest_delivery.employee_id)
-                if employee:
-                    driver_name = employee.name
-
-            # إذا لم يكن هناك موظف معين، استخدم اسم الشخص المدخل يدوياً
-            if not driver_name and latest_delivery.person_name:
-                driver_name = latest_delivery.person_name
-
-            # تحديث اسم السائق في جدول السيارات
-            vehicle = Vehicle.query.get(vehicle_id)
-            if vehicle:
-                vehicle.driver_name = driver_name
-                db.session.commit()
-                print(f"تم تحديث السائق للسيارة {vehicle_id} إلى: {driver_name}")
-        else:
-            # إذا لم يكن هناك سجلات تسليم معتمدة، امسح اسم السائق
-            vehicle = Vehicle.query.get(vehicle_id)
-            if vehicle:
-                vehicle.driver_name = None
-                db.session.commit()
-                print(f"تم مسح السائق للسيارة {vehicle_id}")
+    """تحديث السائق الحالي في جدول السيارات بناءً على آخر سجل تسليم معتمد"""
+    from services.vehicle_assignment_service import VehicleAssignmentService
 
+    try:
+        VehicleAssignmentService.sync(db.session.connection(), [vehicle_id])
+        db.session.commit()
     except Exception as e:
+        db.session.rollback()
         print(f"خطأ في تحديث اسم السائق: {e}")
         # لا نريد أن يؤثر هذا الخطأ على العملية الأساسية
-        pass
\ No newline at end of file
@@ -14,8 +14,7 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from arabic_reshaper import reshape
-from bidi.algorithm import get_display
+from utils.arabic_shaping import shape_arabic
 import pandas as pd
 from fpdf import FPDF
 
@@ -54,8 +53,7 @@ class ArabicPDF(FPDF):
             return txt
         
         # إعادة تشكيل النص العربي وتحويله إلى النمط المناسب للعرض
-        reshaped_text = arabic_reshaper.reshape(txt)
-        bidi_text = get_display(reshaped_text)
+        bidi_text = shape_arabic(txt)
         return bidi_text
     
     def cell(self, w=0, h=0, txt='', border=0, ln=0, align='', fill=False, link=''):
@@ -134,97 +134,140 @@ def send_salary_deduction_notification_whatsapp(employee, salary, deduction_reas
         return False, f"حدث خطأ أثناء إرسال إشعار الخصم: {str(e)}"
 
 
-def send_batch_salary_notifications_whatsapp(department_id=None, month=None, year=None):
+# قوالب WhatsApp Cloud API المعتمدة للإشعارات المجمعة (بنفس متغيرات قالب Twilio)
+WHATSAPP_SALARY_TEMPLATE = os.environ.get("WHATSAPP_SALARY_TEMPLATE", "salary_notification")
+WHATSAPP_DEDUCTION_TEMPLATE = os.environ.get("WHATSAPP_DEDUCTION_TEMPLATE", "salary_deduction_notification")
+WHATSAPP_TEMPLATE_LANGUAGE = os.environ.get("WHATSAPP_TEMPLATE_LANGUAGE", "ar")
+
+MONTH_NAMES = {
+    1: 'يناير', 2: 'فبراير', 3: 'مارس', 4: 'أبريل',
+    5: 'مايو', 6: 'يونيو', 7: 'يوليو', 8: 'أغسطس',
+    9: 'سبتمبر', 10: 'أكتوبر', 11: 'نوفمبر', 12: 'ديسمبر'
+}
+
+
+def format_whatsapp_number(mobile):
+    """
+    تحويل رقم الجوال إلى صيغة WhatsApp Cloud API (رمز الدولة بدون +)، مع افتراض +966
+    للأرقام المحلية. يُرجع None إذا لم يوجد رقم.
+    """
+    if not mobile or not str(mobile).strip():
+        return None
+    phone = str(mobile).strip().replace(' ', '')
+    if phone.startswith('+'):
+        return phone[1:]
+    if phone.startswith('0'):
+        return "966" + phone[1:]
+    return "966" + phone
+
+
+def _batch_salaries_query(month, year, department_id=None):
+    """رواتب الشهر مع موظفيها في استعلام واحد، مع تصفية اختيارية حسب القسم"""
+    from app import db
+    from models import Salary, Employee
+
+    salary_query = Salary.query.filter_by(month=month, year=year).options(db.joinedload(Salary.employee))
+    if department_id:
+        salary_query = salary_query.filter(
+            Salary.employee_id.in_(db.session.query(Employee.id).filter(Employee.department_id == department_id))
+        )
+    return salary_query
+
+
+def _template_message(salary, template_name, parameters):
+    """رسالة قالبية لموظف الراتب جاهزة لقائمة انتظار محرك الإرسال"""
+    from whatsapp_client import WhatsAppWrapper
+
+    recipient = format_whatsapp_number(salary.employee.mobile)
+    components = [{
+        "type": "body",
+        "parameters": [{"type": "text", "text": str(value)} for value in parameters]
+    }]
+    return {
+        'employee_id': salary.employee_id,
+        'salary_id': salary.id,
+        'recipient': recipient,
+        'payload': WhatsAppWrapper.template_payload(recipient, template_name, WHATSAPP_TEMPLATE_LANGUAGE, components)
+    }
+
+
+def _deliver_batch(kind, messages, failure_label, progress=None):
+    """حفظ رسائل الدفعة وإرسالها عبر محرك الإرسال، وإرجاع النتيجة بصيغة الدوال المجمعة"""
+    from services.whatsapp_delivery_service import WhatsAppDeliveryService
+
+    batch_id = WhatsAppDeliveryService.queue(kind, messages)
+    result = WhatsAppDeliveryService.deliver(batch_id, progress=progress)
+    error_messages = [
+        f"{failure_label} {employee_name or employee_id}: {error}"
+        for employee_id, employee_name, error in result.failures
+    ]
+    return result.sent, result.failed, error_messages
+
+
+def send_batch_salary_notifications_whatsapp(department_id=None, month=None, year=None, progress=None):
     """
     إرسال إشعارات رواتب مجمعة لموظفي قسم معين أو لكل الموظفين عبر WhatsApp
     
+    تُرسل الرسائل عبر محرك الإرسال (WhatsAppDeliveryService) بالتوازي مع تحديد المعدل
+    وإعادة المحاولة، وتُحفظ حالة كل رسالة في جدول whatsapp_message.
+    
     Args:
         department_id: معرف القسم (اختياري)
         month: رقم الشهر (إلزامي)
         year: السنة (إلزامي)
+        progress: دالة تُستدعى بـ (المنجز، الإجمالي) أثناء الإرسال (اختياري)
         
     Returns:
         tuple: (عدد الإشعارات الناجحة، عدد الإشعارات الفاشلة، قائمة برسائل الأخطاء)
     """
-    from models import Salary, Employee
-    
-    success_count = 0
-    failure_count = 0
-    error_messages = []
-    
     try:
-        # بناء الاستعلام
-        salary_query = Salary.query.filter_by(month=month, year=year)
+        date_string = f"{MONTH_NAMES.get(month, str(month))}/{year}"
+        time_string = datetime.now().strftime("%I:%M%p")
         
-        # إذا تم تحديد قسم معين
-        if department_id:
-            employees = Employee.query.filter_by(department_id=department_id).all()
-            employee_ids = [emp.id for emp in employees]
-            salary_query = salary_query.filter(Salary.employee_id.in_(employee_ids))
-            
-        # تنفيذ الاستعلام
-        salaries = salary_query.all()
+        messages = [
+            _template_message(salary, WHATSAPP_SALARY_TEMPLATE, [date_string, time_string])
+            for salary in _batch_salaries_query(month, year, department_id)
+        ]
+        if not messages:
+            return 0, 0, []
         
-        # إرسال إشعار لكل موظف
-        for salary in salaries:
-            employee = salary.employee
-            success, message = send_salary_notification_whatsapp(employee, salary)
-            
-            if success:
-                success_count += 1
-            else:
-                failure_count += 1
-                error_messages.append(f"فشل إرسال إشعار للموظف {employee.name}: {message}")
-        
-        return success_count, failure_count, error_messages
+        return _deliver_batch('salary', messages, "فشل إرسال إشعار للموظف", progress)
             
     except Exception as e:
         return 0, 0, [f"حدث خطأ عام أثناء إرسال الإشعارات: {str(e)}"]
 
 
-def send_batch_deduction_notifications_whatsapp(department_id=None, month=None, year=None):
+def send_batch_deduction_notifications_whatsapp(department_id=None, month=None, year=None, progress=None):
     """
     إرسال إشعارات خصومات مجمعة لموظفي قسم معين أو لكل الموظفين عبر WhatsApp
     
+    تُرسل الرسائل عبر محرك الإرسال (WhatsAppDeliveryService) بالتوازي مع تحديد المعدل
+    وإعادة المحاولة، وتُحفظ حالة كل رسالة في جدول whatsapp_message.
+    
     Args:
         department_id: معرف القسم (اختياري)
         month: رقم الشهر (إلزامي)
         year: السنة (إلزامي)
+        progress: دالة تُستدعى بـ (المنجز، الإجمالي) أثناء الإرسال (اختياري)
         
     Returns:
         tuple: (عدد الإشعارات الناجحة، عدد الإشعارات الفاشلة، قائمة برسائل الأخطاء)
     """
-    from models import Salary, Employee
-    
-    success_count = 0
-    failure_count = 0
-    error_messages = []
+    from models import Salary
     
     try:
-        # بناء الاستعلام - الرواتب التي تحتوي على خصومات
-        salary_query = Salary.query.filter_by(month=month, year=year).filter(Salary.deductions > 0)
+        date_string = f"{MONTH_NAMES.get(month, str(month))}/{year}"
         
-        # إذا تم تحديد قسم معين
-        if department_id:
-            employees = Employee.query.filter_by(department_id=department_id).all()
-            employee_ids = [emp.id for emp in employees]
-            salary_query = salary_query.filter(Salary.employee_id.in_(employee_ids))
-            
-        # تنفيذ الاستعلام
-        salaries = salary_query.all()
-        
-        # إرسال إشعار لكل موظف
-        for salary in salaries:
-            employee = salary.employee
-            success, message = send_salary_deduction_notification_whatsapp(employee, salary)
-            
-            if success:
-                success_count += 1
-            else:
-                failure_count += 1
-                error_messages.append(f"فشل إرسال إشعار الخصم للموظف {employee.name}: {message}")
+        # الرواتب التي تحتوي على خصومات
+        salaries = _batch_salaries_query(month, year, department_id).filter(Salary.deductions > 0)
+        messages = [
+            _template_message(salary, WHATSAPP_DEDUCTION_TEMPLATE, [date_string, f"{salary.deductions:.2f}"])
+            for salary in salaries
+        ]
+        if not messages:
+            return 0, 0, []
         
-        return success_count, failure_count, error_messages
+        return _deliver_batch('deduction', messages, "فشل إرسال إشعار الخصم للموظف", progress)
             
     except Exception as e:
         return 0, 0, [f"حدث خطأ عام أثناء إرسال إشعارات الخصم: {str(e)}"]
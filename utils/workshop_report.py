@@ -15,8 +15,7 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.enums import TA_RIGHT, TA_CENTER
 from reportlab.lib.units import mm
-from arabic_reshaper import reshape
-from bidi.algorithm import get_display
+from utils.arabic_shaping import reshape_arabic
 
 def register_fonts():
     """تسجيل الخطوط العربية للتقارير بطريقة صحيحة"""
@@ -131,7 +130,7 @@ def arabic_text(text):
         
         # نستخدم فقط إعادة تشكيل النص دون تغيير ترتيب الأحرف
         # لأن المشكلة تظهر من استخدام get_display الذي يعكس النص
-        reshaped_text = reshape(text_str)
+        reshaped_text = reshape_arabic(text_str)
         
         # طريقة بديلة - قائمة مصطلحات شائعة في السياق
         common_terms = {
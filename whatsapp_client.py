@@ -1,9 +1,11 @@
 # whatsapp_client.py
 
 import os
+import threading
 import requests
 import json
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
 # تحميل متغيرات البيئة من ملف .env
 load_dotenv()
@@ -15,37 +17,70 @@ class WhatsAppWrapper:
     
     API_URL = "https://graph.facebook.com"
 
-    def __init__(self):
+    # مهلة الاتصال ومهلة انتظار الرد بالثواني
+    TIMEOUT = (5, 30)
+
+    def __init__(self, pool_size=10):
         """
         عند إنشاء نسخة من الكلاس، يتم تحميل الإعدادات من متغيرات البيئة.
+
+        Args:
+            pool_size (int, optional): عدد الاتصالات المفتوحة (keep-alive) التي يحتفظ بها كل خيط.
         """
         self.access_token = os.getenv("WHATSAPP_ACCESS_TOKEN")
         self.phone_number_id = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
         self.api_version = os.getenv("WHATSAPP_API_VERSION", "v19.0") # "v19.0" كقيمة افتراضية
+        # يمكن توجيه الطلبات إلى خادم محلي للتجربة (whatsapp_stub.py)
+        self.api_url = os.getenv("WHATSAPP_API_URL", self.API_URL).rstrip("/")
+        self.pool_size = pool_size
+        self._local = threading.local()
 
         if not all([self.access_token, self.phone_number_id]):
             raise ValueError(
                 "يرجى التأكد من تعيين WHATSAPP_ACCESS_TOKEN و WHATSAPP_PHONE_NUMBER_ID في ملف .env"
             )
 
-        self.base_url = f"{self.API_URL}/{self.api_version}/{self.phone_number_id}"
+        self.base_url = f"{self.api_url}/{self.api_version}/{self.phone_number_id}"
         self.headers = {
             "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json",
         }
 
+    @property
+    def session(self):
+        """
+        جلسة HTTP لكل خيط تعيد استخدام الاتصالات المفتوحة بدلاً من فتح اتصال لكل رسالة.
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(self.headers)
+            self._local.session = session
+        return session
+
+    def post_message(self, payload):
+        """
+        إرسال رسالة وإرجاع الاستجابة كما هي دون معالجة الأخطاء.
+
+        Returns:
+            requests.Response: استجابة API (يثير requests.exceptions.RequestException عند فشل الاتصال).
+        """
+        return self.session.post(f"{self.base_url}/messages", data=json.dumps(payload), timeout=self.TIMEOUT)
+
     def _send_request(self, payload):
         """
         دالة داخلية لإرسال الطلبات إلى API.
         """
-        url = f"{self.base_url}/messages"
         try:
-            response = requests.post(url, headers=self.headers, data=json.dumps(payload))
+            response = self.post_message(payload)
             response.raise_for_status()  # يثير استثناء إذا كان هناك خطأ في الطلب (e.g., 4xx or 5xx)
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"حدث خطأ أثناء إرسال الطلب إلى واتساب: {e}")
-            print(f"Response content: {e.response.text if e.response else 'No response'}")
+            print(f"Response content: {e.response.text if e.response is not None else 'No response'}")
             return None
 
     def send_template_message(self, recipient_number, template_name, language_code="ar", components=None):
@@ -58,6 +93,15 @@ class WhatsAppWrapper:
             language_code (str, optional): رمز اللغة (مثل "ar" أو "en_US"). Defaults to "ar".
             components (list, optional): قائمة بالمكونات للمتغيرات في القالب (header, body, buttons).
         """
+        payload = self.template_payload(recipient_number, template_name, language_code, components)
+        print(f"Sending template '{template_name}' to {recipient_number}...")
+        return self._send_request(payload)
+
+    @staticmethod
+    def template_payload(recipient_number, template_name, language_code="ar", components=None):
+        """
+        بناء محتوى طلب رسالة قالبية دون إرسالها.
+        """
         payload = {
             "messaging_product": "whatsapp",
             "to": recipient_number,
@@ -71,9 +115,7 @@ class WhatsAppWrapper:
         }
         if components:
             payload["template"]["components"] = components
-            
-        print(f"Sending template '{template_name}' to {recipient_number}...")
-        return self._send_request(payload)
+        return payload
 
     def send_text_message(self, recipient_number, message_text, preview_url=False):
         """
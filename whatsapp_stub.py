@@ -0,0 +1,81 @@
+# whatsapp_stub.py
+
+"""
+خادم محلي يحاكي endpoint إرسال الرسائل في WhatsApp Cloud API لتجربة الإرسال المجمع
+دون إرسال رسائل حقيقية.
+
+التشغيل:
+    python whatsapp_stub.py --port 5055 --fail-rate 0.1 --rate-limit-rate 0.05 --latency 0.2
+
+ثم توجيه التطبيق إليه في ملف .env:
+    WHATSAPP_API_URL=http://127.0.0.1:5055
+"""
+import argparse
+import random
+import threading
+import time
+import uuid
+from flask import Flask, request, jsonify
+
+
+def create_stub_app(fail_rate=0.0, rate_limit_rate=0.0, latency=0.0):
+    """
+    إنشاء تطبيق المحاكاة.
+
+    Args:
+        fail_rate (float): نسبة الطلبات التي تُرجع خطأ 503 مؤقتاً.
+        rate_limit_rate (float): نسبة الطلبات التي تُرجع خطأ تجاوز المعدل (130429).
+        latency (float): زمن الاستجابة بالثواني لكل طلب.
+    """
+    app = Flask(__name__)
+    lock = threading.Lock()
+    app.config['STUB_MESSAGES'] = []
+
+    @app.route("/<version>/<phone_number_id>/messages", methods=["POST"])
+    def send_message(version, phone_number_id):
+        if latency:
+            time.sleep(latency)
+
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return jsonify({"error": {"message": "Invalid OAuth access token.", "type": "OAuthException", "code": 190}}), 401
+
+        payload = request.get_json(silent=True) or {}
+        if not payload.get("to"):
+            return jsonify({"error": {"message": "(#100) Invalid parameter", "type": "OAuthException", "code": 100}}), 400
+
+        roll = random.random()
+        if roll < rate_limit_rate:
+            return jsonify({"error": {"message": "(#130429) Rate limit hit", "type": "OAuthException", "code": 130429}}), 400
+        if roll < rate_limit_rate + fail_rate:
+            return jsonify({"error": {"message": "Service temporarily unavailable", "code": 2}}), 503
+
+        message_id = f"wamid.stub.{uuid.uuid4().hex}"
+        with lock:
+            app.config['STUB_MESSAGES'].append({"id": message_id, "phone_number_id": phone_number_id, "payload": payload})
+        return jsonify({
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": payload["to"], "wa_id": payload["to"]}],
+            "messages": [{"id": message_id}]
+        })
+
+    @app.route("/stub/messages", methods=["GET"])
+    def list_messages():
+        """الرسائل التي استقبلها الخادم (للتحقق في التجارب)"""
+        with lock:
+            return jsonify(app.config['STUB_MESSAGES'])
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WhatsApp Cloud API stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    create_stub_app(args.fail_rate, args.rate_limit_rate, args.latency).run(
+        host=args.host, port=args.port, threaded=True
+    )